@@ -43,6 +43,7 @@ class AgentConfig(BaseSettings):
     host: str = Field(default="0.0.0.0", description="HTTP 服务地址")
     port: int = Field(default=8088, description="HTTP 服务端口")
     max_iterations: int = Field(default=20, description="Agent 最大迭代次数（防止死循环）")
+    devices_cache_ttl: float = Field(default=5.0, description="设备列表缓存时间（秒），过期后先返回缓存再后台刷新")
 
 
 class Settings(BaseSettings):
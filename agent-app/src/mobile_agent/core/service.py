@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import time
 from pathlib import Path
@@ -59,6 +60,10 @@ class MobileAgentService:
         }
         # 运行时 system prompt 覆盖
         self._runtime_system_prompt: str = ""
+        # 设备列表缓存（过期后先返回旧列表，后台刷新）
+        self._devices_cache: list[dict[str, Any]] | None = None
+        self._devices_cached_at: float = 0.0
+        self._devices_refresh: asyncio.Task[list[dict[str, Any]]] | None = None
 
     @property
     def is_ready(self) -> bool:
@@ -98,6 +103,9 @@ class MobileAgentService:
             checkpointer=self._checkpointer,
         )
 
+        # 5. 后台预取设备列表，首次查询设备时直接读缓存
+        self._devices_refresh = asyncio.create_task(self._refresh_devices())
+
         logger.info("MobileAgentService 初始化完成")
 
     async def _init_checkpointer(self) -> Any:
@@ -126,6 +134,10 @@ class MobileAgentService:
             await self._mcp_manager.disconnect()
             self._mcp_manager = None
         self._agent = None
+        if self._devices_refresh is not None:
+            self._devices_refresh.cancel()
+            self._devices_refresh = None
+        self._devices_cache = None
         await self._storage.close()
         if self._checkpointer is not None:
             try:
@@ -284,10 +296,31 @@ class MobileAgentService:
     # ── Devices ─────────────────────────────────────────────
 
     async def get_devices(self) -> list[dict[str, Any]]:
-        """通过 MCP 工具获取真实设备信息"""
+        """获取设备列表（优先返回缓存；过期时先返回缓存，同时在后台刷新）"""
         if not self._mcp_manager or not self._mcp_manager.is_connected:
             return []
 
+        if self._devices_refresh is None or self._devices_refresh.done():
+            age = time.time() - self._devices_cached_at
+            if self._devices_cache is None or age >= self._settings.agent.devices_cache_ttl:
+                self._devices_refresh = asyncio.create_task(self._refresh_devices())
+        if self._devices_cache is None:
+            return await asyncio.shield(self._devices_refresh)
+        return self._devices_cache
+
+    async def _refresh_devices(self) -> list[dict[str, Any]]:
+        """通过 MCP 工具读取设备列表并更新缓存（失败时保留旧缓存）"""
+        devices = await self._fetch_devices()
+        if devices is not None:
+            self._devices_cache = devices
+            self._devices_cached_at = time.time()
+        return self._devices_cache or []
+
+    async def _fetch_devices(self) -> list[dict[str, Any]] | None:
+        """通过 MCP 工具获取真实设备信息（失败返回 None）"""
+        if not self._mcp_manager or not self._mcp_manager.is_connected:
+            return None
+
         # 查找 mobile_list_devices 工具
         tool = None
         for t in self._mcp_manager.tools:
@@ -323,7 +356,7 @@ class MobileAgentService:
             return devices
         except Exception as e:
             logger.warning("获取设备列表失败: %s", e)
-            return []
+            return None
 
     # ── Screenshot ────────────────────────────────────────────
 
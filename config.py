@@ -92,6 +92,14 @@ class Config:
     # HTTP服务器默认主机
     HTTP_SERVER_HOST: str = os.getenv("HTTP_SERVER_HOST", "0.0.0.0")
     
+    # ==================== MCP 服务器 ====================
+    # 执行工具调用的线程数（设备操作在线程池里执行，不阻塞事件循环）
+    # 多设备并行时至少设为设备数
+    MCP_TOOL_WORKERS: int = int(os.getenv("MCP_TOOL_WORKERS", "8"))
+    
+    # 单次工具调用默认超时（秒），等待类工具按参数另算
+    MCP_TOOL_TIMEOUT: float = float(os.getenv("MCP_TOOL_TIMEOUT", "120"))
+    
     # ==================== 日志 ====================
     # 日志级别
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -163,6 +171,10 @@ class Config:
                 "default_device_id": cls.DEFAULT_DEVICE_ID,
                 "lock_orientation": cls.LOCK_SCREEN_ORIENTATION,
             },
+            "mcp_server": {
+                "tool_workers": cls.MCP_TOOL_WORKERS,
+                "tool_timeout": cls.MCP_TOOL_TIMEOUT,
+            },
             "token_optimization": {
                 "enabled": cls.TOKEN_OPTIMIZATION_ENABLED,
                 "max_elements": cls.MAX_ELEMENTS_RETURN,
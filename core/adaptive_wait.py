@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应等待 - 按 应用 × 动作 学习操作后页面稳定所需的时间，替代固定 sleep
+
+功能：
+1. 观察：操作后连续 dump 控件树，页面指纹和操作前不同、且保持不变一小段时间即认为稳定，记录稳定耗时
+2. 学习：每个 (包名, 动作) 保留最近的稳定耗时样本，按分位数（默认 P90）给出等待时间
+3. 等待：样本足够后直接等待学到的时间（不再 dump）；每隔若干次重新观察一次，跟上页面变化
+4. 原来的固定等待时间作为上限，任何情况下都不会等得更久
+5. 统计实际等待与固定等待的差值，便于评估整套用例省下的时间
+
+说明：
+    观察用的 dump 会写入设备级控件树快照，操作后的下一次读取直接复用，不算额外开销。
+    没有操作前的指纹时无法区分"已稳定"和"还没开始变化"，dump 太慢（两次 dump 超过上限）时
+    无法在上限内判断稳定，这两种情况都直接按上限等待、不记录样本。
+    上限内页面一直没变化（或一直在变）时记录为上限，学到的等待时间不会低于实际需要。
+
+用法:
+    waited = client.waits.settle("click", 0.3, package="com.example.app", before=fingerprint)
+    client.waits.stats()        # 每个 (包名, 动作) 的分位数、样本数，以及总共省下的等待时间
+"""
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from .dynamic_config import DynamicConfig
+
+
+# 每个 (包名, 动作) 保留的最近样本数
+MAX_SAMPLES = 50
+
+# 观察时两次 dump 之间的最短间隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class SettleStats:
+    """单个 (包名, 动作) 的稳定耗时样本（滑动窗口，按分位数取等待时间）"""
+
+    __slots__ = ("samples", "count", "censored")
+
+    def __init__(self):
+        self.samples: Deque[float] = deque(maxlen=MAX_SAMPLES)
+        self.count = 0       # 等待次数（含直接按学到的时间等待）
+        self.censored = 0    # 到上限仍未稳定的观察次数
+
+    def add(self, seconds: float, censored: bool = False):
+        self.samples.append(seconds)
+        if censored:
+            self.censored += 1
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        pos = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[pos]
+
+    def to_dict(self, q: float) -> Dict:
+        return {
+            "samples": len(self.samples),
+            "waits": self.count,
+            "censored": self.censored,
+            "p50_ms": round(self.quantile(0.5) * 1000),
+            f"p{int(q * 100)}_ms": round(self.quantile(q) * 1000),
+        }
+
+
+class AdaptiveWaitEngine:
+    """
+    设备级自适应等待
+
+    每个 MobileClient 持有一个实例（client.waits）。同一设备同一时间只执行一个工具，
+    但统计可能被其他线程读取，所以读写都加锁。
+    """
+
+    def __init__(self, mobile_client):
+        self.client = mobile_client
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], SettleStats] = {}
+
+        # 统计：实际等待 / 固定等待（上限）总和
+        self._waited_total = 0.0
+        self._baseline_total = 0.0
+        self._observations = 0
+
+    def settle(self, action: str, upper: float, package: Optional[str] = None, before=None) -> float:
+        """
+        操作后等待页面稳定
+
+        Args:
+            action: 动作名（click / input / long_press / launch_app ...）
+            upper: 原来的固定等待时间，作为上限
+            package: 操作所在应用的包名（None 表示未知，单独统计）
+            before: 操作前的页面指纹（PageFingerprint，或返回它的无参函数，只在需要观察时才调用），
+                    没有时只按学到的时间或上限等待
+
+        Returns:
+            实际等待的秒数
+        """
+        if upper <= 0:
+            return 0.0
+
+        key = (package or "", action)
+        with self._lock:
+            stats = self._stats.setdefault(key, SettleStats())
+            stats.count += 1
+            learned = None
+            if len(stats.samples) >= max(1, DynamicConfig.adaptive_wait_min_samples):
+                learned = stats.quantile(DynamicConfig.adaptive_wait_percentile)
+            explore_every = DynamicConfig.adaptive_wait_explore_every
+            explore = learned is None or (explore_every > 0 and stats.count % explore_every == 0)
+
+        if not DynamicConfig.adaptive_wait_enabled:
+            waited = upper
+            time.sleep(upper)
+        elif explore and before is not None and self._can_observe(upper):
+            if callable(before):
+                before = before()
+            waited, sample, censored = self._observe(upper, before)
+            with self._lock:
+                stats.add(sample, censored)
+                self._observations += 1
+        else:
+            waited = upper if learned is None else min(upper, learned)
+            time.sleep(waited)
+
+        with self._lock:
+            self._waited_total += waited
+            self._baseline_total += upper
+        return waited
+
+    def learned_wait(self, action: str, package: Optional[str] = None) -> Optional[float]:
+        """学到的等待时间（样本不足时返回 None）"""
+        with self._lock:
+            stats = self._stats.get((package or "", action))
+            if stats is None or len(stats.samples) < max(1, DynamicConfig.adaptive_wait_min_samples):
+                return None
+            return stats.quantile(DynamicConfig.adaptive_wait_percentile)
+
+    # ==================== 统计 ====================
+
+    def stats(self) -> Dict:
+        """各 (包名, 动作) 的分位数和总共省下的等待时间"""
+        q = DynamicConfig.adaptive_wait_percentile
+        with self._lock:
+            return {
+                "enabled": DynamicConfig.adaptive_wait_enabled,
+                "waited_ms": round(self._waited_total * 1000),
+                "baseline_ms": round(self._baseline_total * 1000),
+                "saved_ms": round((self._baseline_total - self._waited_total) * 1000),
+                "observations": self._observations,
+                "actions": {
+                    f"{package or '-'}:{action}": stats.to_dict(q)
+                    for (package, action), stats in self._stats.items()
+                },
+            }
+
+    def reset(self):
+        """清空学到的样本和统计"""
+        with self._lock:
+            self._stats.clear()
+            self._waited_total = 0.0
+            self._baseline_total = 0.0
+            self._observations = 0
+            print("  🧹 自适应等待样本已清空", file=sys.stderr)
+
+    # ==================== 内部实现 ====================
+
+    def _can_observe(self, upper: float) -> bool:
+        """能否在上限内观察到稳定（需要 Android 控件树，且两次 dump 不超过上限）"""
+        if getattr(self.client, 'platform', 'android') != 'android' or getattr(self.client, 'u2', None) is None:
+            return False
+        hierarchy = getattr(self.client, 'hierarchy', None)
+        if hierarchy is None:
+            return False
+        dump_ms = hierarchy.stats()["dump_ms_avg"]
+        return dump_ms * 2 / 1000 <= upper
+
+    def _observe(self, upper: float, before) -> Tuple[float, float, bool]:
+        """
+        连续 dump 直到页面已变化（与 before 不同）且指纹保持不变一小段时间，或到达上限
+
+        稳定窗口取 page_stable_threshold 与上限的 1/4 中较小者：点击类短等待看两次相同即可，
+        启动 App 等长等待要求闪屏等中间页面保持更久才算稳定。
+
+        Returns:
+            (实际等待秒数, 稳定耗时样本, 是否到上限仍未稳定)
+        """
+        hierarchy = self.client.hierarchy
+        window = min(DynamicConfig.page_stable_threshold, upper / 4)
+        start = time.time()
+        run_fp = None     # 当前这段不变页面的指纹
+        run_at = 0.0      # 这段不变页面第一次被看到的时间（即稳定耗时样本）
+        dump_s = 0.0
+        while True:
+            elapsed = time.time() - start
+            if elapsed + dump_s > upper:
+                break
+            try:
+                fp = hierarchy.get(max_age=0).fingerprint
+            except Exception as e:
+                print(f"  ⚠️ 自适应等待观察失败: {e}", file=sys.stderr)
+                break
+            now = time.time() - start
+            dump_s = now - elapsed
+            if run_fp is None or not run_fp.same_as(fp):
+                run_fp, run_at = fp, elapsed
+            elif not fp.same_as(before) and now - run_at >= window:
+                return now, run_at, False
+            time.sleep(POLL_INTERVAL)
+
+        remaining = upper - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return max(upper, time.time() - start), upper, True
@@ -18,6 +18,9 @@ from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 
+from ..utils.xml_parser import parse_bounds
+from .screenshot_pipeline import ScreenshotCache
+
 # Token 优化配置（只精简格式，不限制数量，确保准确度）
 try:
     from mobile_mcp.config import Config
@@ -43,11 +46,26 @@ class BasicMobileToolsLite:
         self.screenshot_dir = project_root / "screenshots"
         self.screenshot_dir.mkdir(parents=True, exist_ok=True)
         
+        # 截图去重缓存（画面未变化时复用上次编码/标注结果）
+        self._screenshot_cache = ScreenshotCache()
+        # 最近一帧原始截图（增量截图与它对比）
+        self._last_frame = None
+        
         # 操作历史（用于生成 pytest 脚本）
         self.operation_history: List[Dict] = []
         
         # 目标应用包名（用于监测应用跳转）
         self.target_package: Optional[str] = None
+        
+        # 批量执行嵌套层数（> 0 时所有读取共用一份控件树快照）
+        self._batch_depth = 0
+        
+        # 自适应等待：操作前的页面快照（失效时暂存），以及本次调用累计的实际/固定等待时间
+        self._pre_action_snapshot = None
+        self._pre_action_reason = ""
+        self._settled = None  # (动作, 等待时观察到的快照)：刚按该动作等待过，快照已是操作后的页面
+        self._waited = 0.0
+        self._wait_baseline = 0.0
     
     def _is_ios(self) -> bool:
         """判断当前是否为 iOS 平台"""
@@ -61,6 +79,101 @@ class BasicMobileToolsLite:
             return self.client.wda
         return None
     
+    def _get_hierarchy(self, compressed: bool = False):
+        """获取当前设备的控件树快照（同一页面内多次读取只 dump 一次）"""
+        service = getattr(self.client, 'hierarchy', None)
+        if service is None:
+            from .hierarchy_snapshot import HierarchySnapshotService
+            service = HierarchySnapshotService(self.client)
+            self.client.hierarchy = service
+        if self._batch_depth:
+            # 批量执行：共用一份非压缩快照，不按 TTL 过期，只在页面变化操作使其失效后才重新 dump
+            return service.get(compressed=False, max_age=float('inf'))
+        return service.get(compressed=compressed)
+    
+    def _invalidate_hierarchy(self, reason: str = ""):
+        """页面可能已变化（点击/滑动/输入/按键等），使控件树快照和前台包名失效
+        
+        在操作之前调用：同时暂存操作前的页面快照，供操作后的自适应等待判断页面是否已变化。
+        操作后 _settle 已按同一原因失效并重新观察过时（如 _record_click），快照就是操作后的页面，不再丢弃。
+        """
+        service = getattr(self.client, 'hierarchy', None)
+        settled = self._settled is not None and self._settled[0] == reason
+        if settled and service is not None:
+            # 等待之后又 dump 过（快照已不是等待时观察到的那份）就按普通失效处理
+            settled = service.peek(max_age=float('inf')) is self._settled[1]
+        self._settled = None
+        if service is not None and not settled:
+            # 只认 TTL 内的快照（批量执行中不按 TTL 过期），太旧的不能代表操作前的页面
+            max_age = float('inf') if self._batch_depth else None
+            self._pre_action_snapshot = service.peek(max_age=max_age)
+            self._pre_action_reason = reason
+            service.invalidate(reason)
+        profile = getattr(self.client, 'profile', None)
+        if profile is not None:
+            profile.notify(reason)
+    
+    def _get_wait_engine(self):
+        """获取当前设备的自适应等待引擎"""
+        engine = getattr(self.client, 'waits', None)
+        if engine is None:
+            from .adaptive_wait import AdaptiveWaitEngine
+            engine = AdaptiveWaitEngine(self.client)
+            self.client.waits = engine
+        return engine
+    
+    def _settle(self, action: str, upper: Optional[float] = None) -> float:
+        """操作后等待页面稳定：按 应用×动作 学到的时间等待，upper（原固定等待时间）为上限
+        
+        操作前应已调用 _invalidate_hierarchy(action)；没有调用时在这里补上（操作后还没有 dump 过，
+        缓存里仍是操作前的页面）。观察时 dump 的快照留在缓存中，随后的 _record_click 等不会再丢弃它。
+        
+        Args:
+            action: 动作名，与 _invalidate_hierarchy 的原因一致（click / input / long_press ...）
+            upper: 等待上限（秒），None 时点击用 DynamicConfig.wait_after_click、输入用 wait_after_input
+        
+        Returns:
+            实际等待的秒数（同时累计到本次调用的等待报告）
+        """
+        if upper is None:
+            from .dynamic_config import DynamicConfig
+            upper = DynamicConfig.wait_after_input if action == 'input' else DynamicConfig.wait_after_click
+        service = getattr(self.client, 'hierarchy', None)
+        if service is not None and (self._pre_action_reason != action
+                                    or service.peek(max_age=float('inf')) is not None):
+            self._invalidate_hierarchy(action)
+        snapshot = self._pre_action_snapshot if self._pre_action_reason == action else None
+        # 指纹要解析整棵树，只在引擎决定观察时才计算（按学到的时间等待时不需要）
+        before = (lambda: snapshot.fingerprint) if snapshot is not None else None
+        self._pre_action_snapshot = None
+        self._pre_action_reason = ""
+        
+        profile = getattr(self.client, 'profile', None)
+        package = (profile.last_package if profile is not None else None) or self.target_package
+        waited = self._get_wait_engine().settle(action, upper, package=package, before=before)
+        self._waited += waited
+        self._wait_baseline += upper
+        self._settled = (action, service.peek(max_age=float('inf')) if service is not None else None)
+        return waited
+    
+    def take_wait_report(self) -> Optional[Dict]:
+        """取出并清空本次调用累计的等待时间（没有等待时返回 None）"""
+        if not self._wait_baseline:
+            return None
+        report = {"waited_ms": round(self._waited * 1000), "max_wait_ms": round(self._wait_baseline * 1000)}
+        self._waited = 0.0
+        self._wait_baseline = 0.0
+        return report
+    
+    def _get_profile(self):
+        """获取当前设备的信息缓存（屏幕尺寸/方向/前台包名，避免每次调用都请求设备）"""
+        service = getattr(self.client, 'profile', None)
+        if service is None:
+            from .device_profile import DeviceProfileService
+            service = DeviceProfileService(self.client)
+            self.client.profile = service
+        return service
+    
     def _record_operation(self, action: str, **kwargs):
         """记录操作到历史（旧接口，保持兼容）"""
         record = {
@@ -69,6 +182,7 @@ class BasicMobileToolsLite:
             **kwargs
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy(action)
     
     def _record_click(self, locator_type: str, locator_value: str, 
                       x_percent: float = 0, y_percent: float = 0,
@@ -94,6 +208,7 @@ class BasicMobileToolsLite:
             'element_desc': element_desc or locator_value,
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy('click')
     
     def _record_long_press(self, locator_type: str, locator_value: str,
                            duration: float = 1.0,
@@ -112,6 +227,7 @@ class BasicMobileToolsLite:
             'element_desc': element_desc or locator_value,
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy('long_press')
     
     def _record_input(self, text: str, locator_type: str = '', locator_value: str = '',
                       x_percent: float = 0, y_percent: float = 0):
@@ -126,6 +242,7 @@ class BasicMobileToolsLite:
             'y_percent': y_percent,
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy('input')
     
     def _record_swipe(self, direction: str):
         """记录滑动操作"""
@@ -135,6 +252,7 @@ class BasicMobileToolsLite:
             'direction': direction,
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy('swipe')
     
     def _record_key(self, key: str):
         """记录按键操作"""
@@ -144,20 +262,11 @@ class BasicMobileToolsLite:
             'key': key,
         }
         self.operation_history.append(record)
+        self._invalidate_hierarchy('press_key')
     
     def _get_current_package(self) -> Optional[str]:
-        """获取当前前台应用的包名/Bundle ID"""
-        try:
-            if self._is_ios():
-                ios_client = self._get_ios_client()
-                if ios_client and hasattr(ios_client, 'wda'):
-                    app_info = ios_client.wda.session().app_current()
-                    return app_info.get('bundleId')
-            else:
-                info = self.client.u2.app_current()
-                return info.get('package')
-        except Exception:
-            return None
+        """获取当前前台应用的包名/Bundle ID（页面变化操作后自动重新读取）"""
+        return self._get_profile().current_package()
 
     def _normalize_resource_id(self, resource_id: str) -> str:
         """标准化 resource-id，支持前端只传简写 id 时自动补全包名
@@ -278,6 +387,7 @@ class BasicMobileToolsLite:
                     time.sleep(0.5)
                     # 然后启动目标应用
                     ios_client.wda.app_activate(self.target_package)
+                    self._invalidate_hierarchy('launch_app')
                 else:
                     return {
                         'success': False,
@@ -287,7 +397,8 @@ class BasicMobileToolsLite:
             else:
                 # Android: 先按返回键
                 self.client.u2.press('back')
-                time.sleep(0.5)
+                self._invalidate_hierarchy('back')
+                self._settle('back', 0.5)
                 
                 # 检查是否已返回
                 current = self._get_current_package()
@@ -300,7 +411,8 @@ class BasicMobileToolsLite:
                 
                 # 如果还在其他应用，启动目标应用
                 self.client.u2.app_start(self.target_package)
-                time.sleep(1)
+                self._invalidate_hierarchy('launch_app')
+                self._settle('launch_app', 1.0)
             
             # 验证是否成功返回
             current = self._get_current_package()
@@ -326,13 +438,124 @@ class BasicMobileToolsLite:
     
     # ==================== 截图 ====================
     
+    def _capture_screen(self, default_width: int = 0, default_height: int = 0, timer=None):
+        """截图到内存（同时记为最近一帧，调用方不要在原图上直接绘制）
+        
+        Returns:
+            (PIL Image, 屏幕宽, 屏幕高)，iOS 未初始化时返回 None
+        """
+        from .screenshot_pipeline import capture
+        
+        if self._is_ios():
+            ios_client = self._get_ios_client()
+            if not (ios_client and hasattr(ios_client, 'wda')):
+                return None
+            img = capture(self.client, ios_client, timer=timer)
+            self._last_frame = img
+            size = self._get_profile().window_size()
+            return img, size[0], size[1]
+        
+        img = capture(self.client, timer=timer)
+        self._last_frame = img
+        width, height = self._get_profile().screen_size(default_width, default_height)
+        return img, width, height
+    
+    def _output_screenshot(self, encoded, filename: str, save: bool = True,
+                           return_base64: bool = False, timer=None) -> Dict:
+        """输出已编码的截图：最多写盘一次，可选直接返回 base64，附带各阶段耗时"""
+        output = {}
+        if save:
+            if encoded.path is not None and encoded.path.exists():
+                # 复用的截图已经写过盘
+                path = encoded.path
+            else:
+                start = time.perf_counter()
+                path = encoded.save(self.screenshot_dir / filename)
+                if timer is not None:
+                    timer.add("write", (time.perf_counter() - start) * 1000)
+            output["screenshot_path"] = str(path)
+        if return_base64:
+            output["image_base64"] = encoded.base64()
+            output["mime_type"] = encoded.mime_type
+        if timer is not None:
+            output["timings_ms"] = timer.to_dict()
+        return output
+    
+    def _diff_screenshot(self, previous, img, platform: str, timestamp: str,
+                         save: bool, return_base64: bool, timer) -> Dict:
+        """增量截图：与上一帧分块对比，只编码变化区域"""
+        from .screenshot_pipeline import changed_regions, submit_image
+        
+        with timer.stage("diff"):
+            boxes = changed_regions(previous, img)
+        
+        if not boxes:
+            return {
+                "success": True,
+                "changed": False,
+                "regions": [],
+                "message": "📸 画面与上一帧相比没有变化",
+                "timings_ms": timer.to_dict()
+            }
+        
+        # 各区域先全部提交到处理池并行编码，再依次取结果
+        # 局部区域不压缩，保持清晰度（与局部裁剪截图一致）
+        pending = [submit_image(img.crop(box), fmt="PNG") for box in boxes]
+        
+        regions = []
+        changed_area = 0
+        for i, ((x1, y1, x2, y2), job) in enumerate(zip(boxes, pending), 1):
+            changed_area += (x2 - x1) * (y2 - y1)
+            encoded = job.result(timer)
+            region = {
+                "image_width": x2 - x1,
+                "image_height": y2 - y1,
+                "crop_offset_x": x1,
+                "crop_offset_y": y1
+            }
+            region.update(self._output_screenshot(
+                encoded, f"screenshot_{platform}_diff{i}_{timestamp}.png", save, return_base64))
+            regions.append(region)
+        
+        return {
+            "success": True,
+            "changed": True,
+            "regions": regions,
+            "changed_ratio": round(changed_area / max(1, img.width * img.height), 3),
+            "hint": "点击区域内的坐标时，只需传入该区域的 crop_offset_x/crop_offset_y",
+            "timings_ms": timer.to_dict()
+        }
+    
+    def _lookup_screenshot(self, kind: str, params: tuple, img, timer, fingerprint=None):
+        """计算原始画面的精确摘要，查找可复用的截图
+        
+        摘要一致（标注依赖控件树时页面指纹也一致）才复用。
+        
+        Returns:
+            (原始帧摘要, 可复用的 CachedScreenshot 或 None)
+        """
+        from .screenshot_pipeline import frame_digest
+        
+        with timer.stage("hash"):
+            digest = frame_digest(img)
+        return digest, self._screenshot_cache.lookup(kind, params, digest, fingerprint)
+    
+    def _reuse_screenshot(self, cached, save: bool, return_base64: bool, timer) -> Dict:
+        """画面与上一张相同：直接返回上次的编码/标注结果，不再做任何编码"""
+        result = dict(cached.result)
+        result.update(self._output_screenshot(cached.encoded, cached.filename, save, return_base64, timer))
+        result["reused"] = True
+        result["message"] = "📸 画面与上一张截图相同，已复用上次结果（无需重复查看）"
+        return result
+    
     def take_screenshot(self, description: str = "", compress: bool = True, 
                         max_width: int = 720, quality: int = 75,
-                        crop_x: int = 0, crop_y: int = 0, crop_size: int = 0) -> Dict:
+                        crop_x: int = 0, crop_y: int = 0, crop_size: int = 0,
+                        save: bool = True, return_base64: bool = False, diff: bool = False) -> Dict:
         """截图（支持压缩和局部裁剪）
         
         压缩原理：
-        1. 先截取原始 PNG 图片
+        1. 截图直接进内存（PIL Image，不写临时文件）
         2. 缩小尺寸（如 1080p → 720p）
         3. 转换为 JPEG 格式 + 降低质量（如 100% → 75%）
         4. 最终文件从 2MB 压缩到约 80KB（节省 96%）
@@ -343,6 +566,11 @@ class BasicMobileToolsLite:
         - 局部区域不压缩，保持清晰度，AI 可精确识别
         - 返回 crop_offset_x/y 用于坐标换算
         
+        增量截图（diff=True，用于操作后观察变化）：
+        - 与上一帧分块对比，只返回变化区域的局部截图（不压缩），每个区域带 crop_offset_x/y
+        - 画面无变化时不返回图片；没有上一帧（或尺寸变化）时按其余参数返回普通截图（裁剪参数照常生效），
+          结果带 diff: "no_previous_frame" / "size_changed"
+        
         Args:
             description: 截图描述（可选）
             compress: 是否压缩（默认 True，推荐开启省 token）
@@ -351,6 +579,9 @@ class BasicMobileToolsLite:
             crop_x: 裁剪中心点 X 坐标（屏幕坐标，0 表示不裁剪）
             crop_y: 裁剪中心点 Y 坐标（屏幕坐标，0 表示不裁剪）
             crop_size: 裁剪区域大小（默认 0 不裁剪，推荐 200-400）
+            save: 是否写入 screenshot_dir（默认 True）
+            return_base64: 是否在结果中直接返回 base64 编码的图片
+            diff: 是否只返回与上一帧相比变化的区域
         
         压缩效果示例：
             原图 PNG: 2048KB
@@ -359,36 +590,36 @@ class BasicMobileToolsLite:
         """
         try:
             from PIL import Image
+            from .screenshot_pipeline import StageTimer, FILE_EXTENSIONS, normalize_format, process
+            from .dynamic_config import DynamicConfig
             
+            timer = StageTimer()
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             platform = "ios" if self._is_ios() else "android"
             
-            # 第1步：截图保存为临时 PNG
-            temp_filename = f"temp_{timestamp}.png"
-            temp_path = self.screenshot_dir / temp_filename
-            
-            # 获取屏幕尺寸并截图
-            screen_width, screen_height = 0, 0
-            if self._is_ios():
-                ios_client = self._get_ios_client()
-                if ios_client and hasattr(ios_client, 'wda'):
-                    ios_client.wda.screenshot(str(temp_path))
-                    size = ios_client.wda.window_size()
-                    screen_width, screen_height = size[0], size[1]
-                else:
-                    return {"success": False, "msg": "iOS未初始化"}
-            else:
-                self.client.u2.screenshot(str(temp_path))
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 0)
-                screen_height = info.get('displayHeight', 0)
-            
-            original_size = temp_path.stat().st_size
-            
-            # 第2步：打开图片
-            img = Image.open(temp_path)
-            
-            # 第2.5步：局部裁剪（如果指定了裁剪参数）
+            # 第1步：截图到内存
+            previous_frame = self._last_frame
+            captured = self._capture_screen(timer=timer)
+            if captured is None:
+                return {"success": False, "msg": "iOS未初始化"}
+            img, screen_width, screen_height = captured
+            
+            # 增量截图：只输出变化区域；没有可对比的上一帧时按普通截图处理，并在结果中说明
+            diff_fallback = None
+            if diff:
+                if previous_frame is not None and previous_frame.size == img.size:
+                    return self._diff_screenshot(previous_frame, img, platform, timestamp,
+                                                 save, return_base64, timer)
+                diff_fallback = "no_previous_frame" if previous_frame is None else "size_changed"
+            
+            # 画面与上一张相同时直接复用（不再裁剪/缩放/编码）
+            cache_params = (compress, max_width, quality, crop_x, crop_y, crop_size,
+                            DynamicConfig.screenshot_format)
+            digest, cached = self._lookup_screenshot("plain", cache_params, img, timer)
+            if cached is not None and not diff:
+                return self._reuse_screenshot(cached, save, return_base64, timer)
+            
+            # 第2步：局部裁剪（如果指定了裁剪参数）
             crop_offset_x, crop_offset_y = 0, 0
             is_cropped = False
             
@@ -408,34 +639,24 @@ class BasicMobileToolsLite:
                 img = img.crop((left, top, right, bottom))
                 is_cropped = True
             
+            if description:
+                safe_desc = re.sub(r'[^\w\s-]', '', description).strip().replace(' ', '_')
+                name_part = f"{platform}_crop_{safe_desc}" if is_cropped else f"{platform}_{safe_desc}"
+            else:
+                name_part = f"{platform}_crop" if is_cropped else platform
+            
             # ========== 情况1：局部裁剪截图（不压缩，保持清晰度）==========
             if is_cropped:
-                # 生成文件名
-                if description:
-                    safe_desc = re.sub(r'[^\w\s-]', '', description).strip().replace(' ', '_')
-                    filename = f"screenshot_{platform}_crop_{safe_desc}_{timestamp}.png"
-                else:
-                    filename = f"screenshot_{platform}_crop_{timestamp}.png"
-                
-                final_path = self.screenshot_dir / filename
-                
-                # 保存为 PNG（保持清晰度）
-                img.save(str(final_path), "PNG")
-                
-                # 删除临时文件
-                temp_path.unlink()
-                
-                cropped_size = final_path.stat().st_size
-                
-                # 返回结果
-                return {
+                # 编码为 PNG（保持清晰度）
+                encoded = process(img, fmt="PNG", timer=timer)
+                result = {
                     "success": True,
-                    "screenshot_path": str(final_path),
                     "image_width": img.width,
                     "image_height": img.height,
                     "crop_offset_x": crop_offset_x,
                     "crop_offset_y": crop_offset_y
                 }
+                filename = f"screenshot_{name_part}_{timestamp}.png"
             
             # ========== 情况2：全屏压缩截图 ==========
             elif compress:
@@ -444,84 +665,42 @@ class BasicMobileToolsLite:
                 original_img_width = img.width
                 original_img_height = img.height
                 
-                # 第3步：缩小尺寸（保持宽高比）
-                image_width, image_height = img.width, img.height
-                
-                if img.width > max_width:
-                    ratio = max_width / img.width
-                    new_w = max_width
-                    new_h = int(img.height * ratio)
-                    # 兼容不同版本的 Pillow
-                    try:
-                        resample = Image.Resampling.LANCZOS
-                    except AttributeError:
-                        try:
-                            resample = Image.LANCZOS
-                        except AttributeError:
-                            resample = Image.ANTIALIAS
-                    img = img.resize((new_w, new_h), resample)
-                    image_width, image_height = new_w, new_h
-                
-                # 生成文件名（JPEG 格式）
-                if description:
-                    safe_desc = re.sub(r'[^\w\s-]', '', description).strip().replace(' ', '_')
-                    filename = f"screenshot_{platform}_{safe_desc}_{timestamp}.jpg"
-                else:
-                    filename = f"screenshot_{platform}_{timestamp}.jpg"
-                
-                final_path = self.screenshot_dir / filename
-                
-                # 保存为 JPEG（处理透明通道）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert("RGB")
-                
-                img.save(str(final_path), "JPEG", quality=quality)
-                temp_path.unlink()
-                
-                compressed_size = final_path.stat().st_size
-                saved_percent = (1 - compressed_size / original_size) * 100
-                
-                # 返回结果
-                return {
+                # 第3步：缩小尺寸（保持宽高比）+ 编码（JPEG/WebP，在处理池中完成）
+                fmt = normalize_format(DynamicConfig.screenshot_format)
+                encoded = process(img, max_width=max_width, fmt=fmt, quality=quality, timer=timer)
+                result = {
                     "success": True,
-                    "screenshot_path": str(final_path),
-                    "image_width": image_width,
-                    "image_height": image_height,
+                    "image_width": encoded.width,
+                    "image_height": encoded.height,
                     "original_img_width": original_img_width,
                     "original_img_height": original_img_height
                 }
+                filename = f"screenshot_{name_part}_{timestamp}.{FILE_EXTENSIONS.get(fmt, 'jpg')}"
             
             # ========== 情况3：全屏不压缩截图 ==========
             else:
-                if description:
-                    safe_desc = re.sub(r'[^\w\s-]', '', description).strip().replace(' ', '_')
-                    filename = f"screenshot_{platform}_{safe_desc}_{timestamp}.png"
-                else:
-                    filename = f"screenshot_{platform}_{timestamp}.png"
-                
-                final_path = self.screenshot_dir / filename
-                temp_path.rename(final_path)
-                
-                # 返回结果（不压缩时尺寸相同）
-                return {
+                encoded = process(img, fmt="PNG", timer=timer)
+                # 不压缩时尺寸相同
+                result = {
                     "success": True,
-                    "screenshot_path": str(final_path),
                     "image_width": img.width,
                     "image_height": img.height
                 }
+                filename = f"screenshot_{name_part}_{timestamp}.png"
+            
+            self._screenshot_cache.store("plain", cache_params, digest, encoded, result, filename)
+            result.update(self._output_screenshot(encoded, filename, save, return_base64, timer))
+            if diff_fallback:
+                result["diff"] = diff_fallback  # 本次不是增量结果，下次起才返回变化区域
+            return result
         except ImportError:
             # 如果没有 PIL，回退到原始方式（不压缩）
             return self._take_screenshot_no_compress(description)
         except Exception as e:
             return {"success": False, "message": f"❌ 截图失败: {e}"}
     
-    def take_screenshot_with_grid(self, grid_size: int = 100, show_popup_hints: bool = False) -> Dict:
+    def take_screenshot_with_grid(self, grid_size: int = 100, show_popup_hints: bool = False,
+                                  save: bool = True, return_base64: bool = False) -> Dict:
         """截图并添加网格坐标标注（用于精确定位元素）
         
         在截图上绘制网格线和坐标刻度，帮助快速定位元素位置。
@@ -530,6 +709,8 @@ class BasicMobileToolsLite:
         Args:
             grid_size: 网格间距（像素），默认 100。建议值：50-200
             show_popup_hints: 是否显示弹窗关闭按钮提示位置，默认 True
+            save: 是否写入 screenshot_dir（默认 True）
+            return_base64: 是否在结果中直接返回 base64 编码的图片
         
         Returns:
             包含标注截图路径和弹窗信息的字典
@@ -538,29 +719,33 @@ class BasicMobileToolsLite:
             from PIL import Image, ImageDraw, ImageFont
             import re
             
+            from .screenshot_pipeline import StageTimer, process
+            
+            timer = StageTimer()
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             platform = "ios" if self._is_ios() else "android"
             
-            # 第1步：截图
-            temp_filename = f"temp_grid_{timestamp}.png"
-            temp_path = self.screenshot_dir / temp_filename
+            # 第1步：截图到内存
+            captured = self._capture_screen(720, 1280, timer=timer)
+            if captured is None:
+                return {"success": False, "msg": "iOS未初始化"}
+            img, screen_width, screen_height = captured
             
-            screen_width, screen_height = 0, 0
-            if self._is_ios():
-                ios_client = self._get_ios_client()
-                if ios_client and hasattr(ios_client, 'wda'):
-                    ios_client.wda.screenshot(str(temp_path))
-                    size = ios_client.wda.window_size()
-                    screen_width, screen_height = size[0], size[1]
-                else:
-                    return {"success": False, "msg": "iOS未初始化"}
-            else:
-                self.client.u2.screenshot(str(temp_path))
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 720)
-                screen_height = info.get('displayHeight', 1280)
-            
-            img = Image.open(temp_path)
+            # 画面与上一张网格截图相同时直接复用标注结果（弹窗提示来自控件树，页面指纹也要一致）
+            snapshot = None
+            if show_popup_hints and not self._is_ios():
+                try:
+                    snapshot = self._get_hierarchy()
+                except Exception:
+                    pass
+            fingerprint = snapshot.fingerprint if snapshot is not None else None
+            cache_params = (grid_size, show_popup_hints)
+            digest, cached = self._lookup_screenshot("grid", cache_params, img, timer, fingerprint)
+            if cached is not None:
+                return self._reuse_screenshot(cached, save, return_base64, timer)
+            
+            # 在副本上标注，原始帧留给增量截图对比
+            img = img.copy()
             draw = ImageDraw.Draw(img, 'RGBA')
             
             # 尝试加载字体
@@ -593,15 +778,13 @@ class BasicMobileToolsLite:
             popup_info = None
             close_positions = []
             
-            if show_popup_hints and not self._is_ios():
+            if snapshot is not None:
                 try:
-                    import xml.etree.ElementTree as ET
-                    xml_string = self.client.u2.dump_hierarchy(compressed=False)
-                    root = ET.fromstring(xml_string)
+                    table = snapshot.table
                     
                     # 使用严格的弹窗检测（置信度 >= 0.6 才认为是弹窗）
                     popup_bounds, popup_confidence = self._detect_popup_with_confidence(
-                        root, screen_width, screen_height
+                        table, screen_width, screen_height
                     )
                     
                     if popup_bounds and popup_confidence >= 0.6:
@@ -647,26 +830,12 @@ class BasicMobileToolsLite:
                 except Exception as e:
                     pass  # 弹窗检测失败不影响主功能
             
-            # 第4步：保存标注后的截图
+            # 第4步：编码一次并输出标注后的截图
             filename = f"screenshot_{platform}_grid_{timestamp}.jpg"
-            final_path = self.screenshot_dir / filename
-            
-            # 转换为 RGB 并保存
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert("RGB")
-            
-            img.save(str(final_path), "JPEG", quality=85)
-            temp_path.unlink()
+            encoded = process(img, fmt="JPEG", quality=85, timer=timer)
             
             result = {
                 "success": True,
-                "screenshot_path": str(final_path),
                 "image_width": img_width,
                 "image_height": img_height,
                 "grid_size": grid_size
@@ -678,6 +847,9 @@ class BasicMobileToolsLite:
                 if close_positions:
                     result["close_hints"] = [(p['x'], p['y']) for p in close_positions[:3]]
             
+            self._screenshot_cache.store("grid", cache_params, digest, encoded, result, filename,
+                                         fingerprint)
+            result.update(self._output_screenshot(encoded, filename, save, return_base64, timer))
             return result
             
         except ImportError:
@@ -685,12 +857,16 @@ class BasicMobileToolsLite:
         except Exception as e:
             return {"success": False, "message": f"❌ 网格截图失败: {e}"}
     
-    def take_screenshot_with_som(self) -> Dict:
+    def take_screenshot_with_som(self, save: bool = True, return_base64: bool = False) -> Dict:
         """Set-of-Mark 截图：给每个可点击元素标上数字（超级好用！）
         
         在截图上给每个可点击元素画框并标上数字编号。
         AI 看图后直接说"点击 3 号"，然后调用 click_by_som(3) 即可。
         
+        Args:
+            save: 是否写入 screenshot_dir（默认 True）
+            return_base64: 是否在结果中直接返回 base64 编码的图片
+        
         Returns:
             包含标注截图和元素列表的字典
         """
@@ -698,29 +874,32 @@ class BasicMobileToolsLite:
             from PIL import Image, ImageDraw, ImageFont
             import re
             
+            from .screenshot_pipeline import StageTimer, process
+            
+            timer = StageTimer()
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             platform = "ios" if self._is_ios() else "android"
             
-            # 第1步：截图
-            temp_filename = f"temp_som_{timestamp}.png"
-            temp_path = self.screenshot_dir / temp_filename
+            # 第1步：截图到内存
+            captured = self._capture_screen(720, 1280, timer=timer)
+            if captured is None:
+                return {"success": False, "msg": "iOS未初始化"}
+            img, screen_width, screen_height = captured
             
-            screen_width, screen_height = 0, 0
-            if self._is_ios():
-                ios_client = self._get_ios_client()
-                if ios_client and hasattr(ios_client, 'wda'):
-                    ios_client.wda.screenshot(str(temp_path))
-                    size = ios_client.wda.window_size()
-                    screen_width, screen_height = size[0], size[1]
-                else:
-                    return {"success": False, "msg": "iOS未初始化"}
-            else:
-                self.client.u2.screenshot(str(temp_path))
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 720)
-                screen_height = info.get('displayHeight', 1280)
+            # 画面和控件树都与上一张 SoM 截图相同时直接复用（编号和 self._som_elements 仍然有效）
+            snapshot = None
+            if not self._is_ios():
+                try:
+                    snapshot = self._get_hierarchy()
+                except Exception:
+                    pass
+            fingerprint = snapshot.fingerprint if snapshot is not None else None
+            digest, cached = self._lookup_screenshot("som", (), img, timer, fingerprint)
+            if cached is not None and getattr(self, '_som_elements', None):
+                return self._reuse_screenshot(cached, save, return_base64, timer)
             
-            img = Image.open(temp_path)
+            # 在副本上标注，原始帧留给增量截图对比
+            img = img.copy()
             draw = ImageDraw.Draw(img, 'RGBA')
             img_width, img_height = img.size
             
@@ -739,26 +918,17 @@ class BasicMobileToolsLite:
                 pass
             else:
                 try:
-                    import xml.etree.ElementTree as ET
-                    xml_string = self.client.u2.dump_hierarchy(compressed=False)
-                    root = ET.fromstring(xml_string)
+                    table = (snapshot or self._get_hierarchy()).table
                     
-                    for elem in root.iter():
-                        clickable = elem.attrib.get('clickable', 'false') == 'true'
-                        bounds_str = elem.attrib.get('bounds', '')
-                        text = elem.attrib.get('text', '')
-                        content_desc = elem.attrib.get('content-desc', '')
-                        resource_id = elem.attrib.get('resource-id', '')
-                        class_name = elem.attrib.get('class', '')
-                        
-                        if not clickable or not bounds_str:
-                            continue
-                        
-                        match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                        if not match:
+                    for node in table:
+                        if not node.clickable or not node.bounds:
                             continue
                         
-                        x1, y1, x2, y2 = map(int, match.groups())
+                        text = node.text
+                        content_desc = node.content_desc
+                        resource_id = node.resource_id
+                        class_name = node.class_name
+                        x1, y1, x2, y2 = node.bounds
                         width = x2 - x1
                         height = y2 - y1
                         
@@ -781,8 +951,19 @@ class BasicMobileToolsLite:
                             'center': (center_x, center_y),
                             'text': text,
                             'desc': desc,
-                            'resource_id': resource_id
+                            'resource_id': resource_id,
+                            'labelled': bool(text or content_desc)
                         })
+                    
+                    # 去掉几乎重合的可点击框（可点击容器包着可点击子控件），优先保留有文字的、面积小的
+                    if len(elements) > 1:
+                        from .nms import nms
+                        screen_area = screen_width * screen_height
+                        scores = [(2 * screen_area if e['labelled'] else 0)
+                                  - (e['bounds'][2] - e['bounds'][0]) * (e['bounds'][3] - e['bounds'][1])
+                                  for e in elements]
+                        keep = nms([e['bounds'] for e in elements], scores, iou_threshold=0.85)
+                        elements = [elements[i] for i in sorted(keep)]
                 except Exception as e:
                     pass
             
@@ -835,7 +1016,7 @@ class BasicMobileToolsLite:
                 try:
                     # 使用严格的弹窗检测（置信度 >= 0.6 才认为是弹窗）
                     popup_bounds, popup_confidence = self._detect_popup_with_confidence(
-                        root, screen_width, screen_height
+                        table, screen_width, screen_height
                     )
                     
                     # 如果检测到弹窗，标注弹窗边界（不再猜测X按钮位置）
@@ -854,35 +1035,27 @@ class BasicMobileToolsLite:
                 except Exception as e:
                     pass  # 弹窗检测失败不影响主功能
             
-            # 保存到实例变量，供 click_by_som 使用
+            # 保存到实例变量，供 click_by_som 使用（空间索引用于点击时的命中检测）
+            from .spatial_index import SpatialIndex
             self._som_elements = som_elements
+            self._som_index = SpatialIndex((i + 1, elem['bounds']) for i, elem in enumerate(elements))
             
-            # 第4步：保存标注后的截图
+            # 第4步：编码一次并输出标注后的截图
             filename = f"screenshot_{platform}_som_{timestamp}.jpg"
-            final_path = self.screenshot_dir / filename
-            
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert("RGB")
-            
-            img.save(str(final_path), "JPEG", quality=85)
-            temp_path.unlink()
+            encoded = process(img, fmt="JPEG", quality=85, timer=timer)
             
             # 返回结果（Token 优化：不返回 elements 列表，已存储在 self._som_elements）
-            return {
+            result = {
                 "success": True,
-                "screenshot_path": str(final_path),
                 "screen_width": screen_width,
                 "screen_height": screen_height,
                 "element_count": len(som_elements),
                 "popup_detected": popup_bounds is not None,
                 "hint": "查看截图上的编号，用 click_by_som(编号) 点击"
             }
+            self._screenshot_cache.store("som", (), digest, encoded, result, filename, fingerprint)
+            result.update(self._output_screenshot(encoded, filename, save, return_base64, timer))
+            return result
             
         except ImportError:
             return {"success": False, "message": "❌ 需要安装 Pillow: pip install Pillow"}
@@ -908,12 +1081,8 @@ class BasicMobileToolsLite:
                     "message": "❌ 请先调用 mobile_screenshot_with_som 获取元素列表"
                 }
             
-            # 查找对应编号的元素
-            target = None
-            for elem in self._som_elements:
-                if elem['index'] == index:
-                    target = elem
-                    break
+            # 编号从 1 开始连续分配，直接按下标取
+            target = self._som_elements[index - 1] if 1 <= index <= len(self._som_elements) else None
             
             if not target:
                 return {
@@ -921,21 +1090,20 @@ class BasicMobileToolsLite:
                     "message": f"❌ 未找到编号 {index} 的元素，有效范围: 1-{len(self._som_elements)}"
                 }
             
-            # 点击
-            cx, cy = target['center']
+            # 点击（中心被嵌套的其他编号框盖住时换一个点，避免点到子控件上）
+            cx, cy = self._som_click_point(target)
+            self._invalidate_hierarchy('click')
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
                     ios_client.wda.click(cx, cy)
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     screen_width, screen_height = size[0], size[1]
             else:
                 self.client.u2.click(cx, cy)
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 0)
-                screen_height = info.get('displayHeight', 0)
+                screen_width, screen_height = self._get_profile().screen_size()
 
-            time.sleep(0.3)
+            self._settle('click')
             
             # 计算百分比坐标用于跨设备兼容
             x_percent = round(cx / screen_width * 100, 1) if screen_width > 0 else 0
@@ -960,7 +1128,7 @@ class BasicMobileToolsLite:
                 self._record_click('percent', f"{x_percent}%,{y_percent}%", x_percent, y_percent,
                                   element_desc=f"[{index}]{elem_desc}")
 
-            return {
+            result = {
                 "success": True,
                 "clicked": {
                     "index": index,
@@ -969,10 +1137,35 @@ class BasicMobileToolsLite:
                     "bounds": target['bounds']
                 }
             }
+            if (cx, cy) != tuple(target['center']):
+                result["hint"] = "元素中心被内部的其他可点击元素覆盖，已改点未覆盖的位置"
+            return result
             
         except Exception as e:
             return {"success": False, "message": f"❌ 点击失败: {e}\n💡 如果页面已变化，请重新调用 mobile_screenshot_with_som 刷新元素列表"}
     
+    def _som_click_point(self, target: Dict) -> tuple:
+        """SoM 元素的点击点：优先中心；中心落在嵌套的其他编号框内时，取框内第一个未被覆盖的点"""
+        center = tuple(target['center'])
+        som_index = getattr(self, '_som_index', None)
+        index = target['index']
+        if som_index is None or index not in som_index:
+            return center
+        
+        bounds = som_index.bounds(index)
+        nested = set(som_index.contained_in(bounds)) - {index}
+        if not nested:
+            return center
+        
+        x1, y1, x2, y2 = bounds
+        for fy in (0.5, 0.2, 0.8):
+            for fx in (0.5, 0.2, 0.8):
+                x = int(x1 + (x2 - x1) * fx)
+                y = int(y1 + (y2 - y1) * fy)
+                if not nested.intersection(som_index.at_point(x, y)):
+                    return (x, y) if (fx, fy) != (0.5, 0.5) else center
+        return center
+    
     def _take_screenshot_no_compress(self, description: str = "") -> Dict:
         """截图（不压缩，PIL 不可用时的备用方案）"""
         try:
@@ -992,15 +1185,13 @@ class BasicMobileToolsLite:
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
                     ios_client.wda.screenshot(str(screenshot_path))
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     width, height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
                 self.client.u2.screenshot(str(screenshot_path))
-                info = self.client.u2.info
-                width = info.get('displayWidth', 0)
-                height = info.get('displayHeight', 0)
+                width, height = self._get_profile().screen_size()
             
             # 不压缩时，图片尺寸 = 屏幕尺寸
             return {
@@ -1023,7 +1214,7 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     return {
                         "success": True,
                         "width": size[0],
@@ -1031,9 +1222,7 @@ class BasicMobileToolsLite:
                         "size": f"{size[0]}x{size[1]}"
                     }
             else:
-                info = self.client.u2.info
-                width = info.get('displayWidth', 0)
-                height = info.get('displayHeight', 0)
+                width, height = self._get_profile().screen_size()
                 return {
                     "success": True,
                     "width": width,
@@ -1070,14 +1259,12 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     screen_width, screen_height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 0)
-                screen_height = info.get('displayHeight', 0)
+                screen_width, screen_height = self._get_profile().screen_size()
             
             # 🎯 坐标转换
             original_x, original_y = x, y
@@ -1105,13 +1292,14 @@ class BasicMobileToolsLite:
                         conversion_type = "scale"
             
             # 执行点击
+            self._invalidate_hierarchy('click')
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 ios_client.wda.click(x, y)
             else:
                 self.client.u2.click(x, y)
             
-            time.sleep(0.3)
+            self._settle('click')
             
             # 计算百分比坐标（用于跨设备兼容）
             x_percent = round(x / screen_width * 100, 1) if screen_width > 0 else 0
@@ -1185,14 +1373,12 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     width, height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
-                info = self.client.u2.info
-                width = info.get('displayWidth', 0)
-                height = info.get('displayHeight', 0)
+                width, height = self._get_profile().screen_size()
             
             if width == 0 or height == 0:
                 return {"success": False, "msg": "无法获取屏幕尺寸"}
@@ -1203,12 +1389,13 @@ class BasicMobileToolsLite:
             y = int(height * y_percent / 100)
             
             # 第3步：执行点击
+            self._invalidate_hierarchy('click')
             if self._is_ios():
                 ios_client.wda.click(x, y)
             else:
                 self.client.u2.click(x, y)
             
-            time.sleep(0.3)
+            self._settle('click')
             
             # 第4步：使用标准记录格式
             self._record_click('percent', f"{x_percent}%,{y_percent}%", x_percent, y_percent,
@@ -1222,7 +1409,8 @@ class BasicMobileToolsLite:
             return {"success": False, "message": f"❌ 百分比点击失败: {e}"}
     
     def click_by_text(self, text: str, timeout: float = 3.0, position: Optional[str] = None, 
-                       verify: Optional[str] = None) -> Dict:
+                       verify: Optional[str] = None, fast: Optional[bool] = None,
+                       verify_selector: Optional[bool] = None) -> Dict:
         """通过文本点击 - 先查 XML 树，再精准匹配
         
         Args:
@@ -1232,7 +1420,16 @@ class BasicMobileToolsLite:
                 - 垂直方向: "top"/"upper"/"上", "bottom"/"lower"/"下", "middle"/"center"/"中"
                 - 水平方向: "left"/"左", "right"/"右", "center"/"中"
             verify: 可选，点击后验证的文本。如果指定，会检查该文本是否出现在页面上
+            fast: 快速点击（Android）：直接点快照中控件的中心，None 使用 DynamicConfig.fast_click（默认关闭）；
+                  点击后的 page_texts 只取等待时观察到的快照，没有就不返回（不为它单独 dump）
+            verify_selector: 快速点击前先用设备端选择器确认控件仍在，None 使用 DynamicConfig.fast_click_verify_selector
         """
+        from .dynamic_config import DynamicConfig
+        if fast is None:
+            fast = DynamicConfig.fast_click
+        if verify_selector is None:
+            verify_selector = DynamicConfig.fast_click_verify_selector
+        
         try:
             if self._is_ios():
                 ios_client = self._get_ios_client()
@@ -1241,8 +1438,9 @@ class BasicMobileToolsLite:
                     if not elem.exists:
                         elem = ios_client.wda(label=text)
                     if elem.exists:
+                        self._invalidate_hierarchy('click')
                         elem.click()
-                        time.sleep(0.3)
+                        self._settle('click')
                         self._record_click('text', text, element_desc=text, locator_attr='text')
                         # 验证逻辑
                         if verify:
@@ -1256,7 +1454,7 @@ class BasicMobileToolsLite:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
                 # 获取屏幕尺寸用于计算百分比
-                screen_width, screen_height = self.client.u2.window_size()
+                screen_width, screen_height = self._get_profile().window_size()
                 
                 # 🔍 先查 XML 树，找到元素及其属性
                 found_elem = self._find_element_in_tree(text, position=position)
@@ -1274,65 +1472,80 @@ class BasicMobileToolsLite:
                         x_pct = round(cx / screen_width * 100, 1)
                         y_pct = round(cy / screen_height * 100, 1)
                     
-                    # 如果有位置参数，直接使用坐标点击
-                    if position and bounds:
+                    # 有位置参数或快速点击：直接点快照中控件的中心（不再让设备端用选择器重新搜索控件树）
+                    if bounds and (position or fast):
+                        if not position and verify_selector:
+                            elem = self._text_selector(attr_type, attr_value)
+                            if elem is not None and not elem.exists(timeout=1):
+                                return {"success": False, "msg": f"'{text}' 已不在当前页面（选择器校验失败）",
+                                        "hint": "页面已变化，先 list_elements 确认"}
                         x = (bounds[0] + bounds[2]) // 2
                         y = (bounds[1] + bounds[3]) // 2
+                        self._invalidate_hierarchy('click')
                         self.client.u2.click(x, y)
-                        time.sleep(0.3)
+                        self._settle('click')
+                        element_desc = f"{text}({position})" if position else text
                         self._record_click('text', attr_value, x_pct, y_pct, 
-                                          element_desc=f"{text}({position})", locator_attr=attr_type)
+                                          element_desc=element_desc, locator_attr=attr_type)
                         # 验证逻辑
                         if verify:
                             return self._verify_after_click(verify)
                         # 返回页面文本摘要
-                        page_texts = self._get_page_texts(10)
-                        return {"success": True, "page_texts": page_texts}
+                        return self._click_result(fast)
                     
                     # 没有位置参数时，使用选择器定位
-                    if attr_type == 'text':
-                        elem = self.client.u2(text=attr_value)
-                    elif attr_type == 'textContains':
-                        elem = self.client.u2(textContains=attr_value)
-                    elif attr_type == 'description':
-                        elem = self.client.u2(description=attr_value)
-                    elif attr_type == 'descriptionContains':
-                        elem = self.client.u2(descriptionContains=attr_value)
-                    else:
-                        elem = None
+                    elem = self._text_selector(attr_type, attr_value)
                     
                     if elem and elem.exists(timeout=1):
+                        self._invalidate_hierarchy('click')
                         elem.click()
-                        time.sleep(0.3)
+                        self._settle('click')
                         self._record_click('text', attr_value, x_pct, y_pct,
                                           element_desc=text, locator_attr=attr_type)
                         # 验证逻辑
                         if verify:
                             return self._verify_after_click(verify)
                         # 返回页面文本摘要
-                        page_texts = self._get_page_texts(10)
-                        return {"success": True, "page_texts": page_texts}
+                        return self._click_result(fast)
                     
                     # 选择器失败，用控件中心坐标点兜底
                     if bounds:
                         x = (bounds[0] + bounds[2]) // 2
                         y = (bounds[1] + bounds[3]) // 2
+                        self._invalidate_hierarchy('click')
                         self.client.u2.click(x, y)
-                        time.sleep(0.3)
+                        self._settle('click')
                         self._record_click('coords', f"{x},{y}", x_pct, y_pct,
                                           element_desc=text)
                         # 验证逻辑
                         if verify:
                             return self._verify_after_click(verify)
                         # 返回页面文本摘要
-                        page_texts = self._get_page_texts(10)
-                        return {"success": True, "page_texts": page_texts}
+                        return self._click_result(fast)
                 
                 # 控件树找不到，提示用视觉识别
                 return {"success": False, "fallback": "vision", "msg": f"未找到'{text}'，用截图点击"}
         except Exception as e:
             return {"success": False, "msg": str(e)}
     
+    def _click_result(self, fast: bool) -> Dict:
+        """点击成功的返回值（附页面文本摘要）
+        
+        快速点击只用操作后等待时观察到的快照；按学到的时间直接等待时没有快照，不为摘要单独 dump。
+        """
+        if fast:
+            service = getattr(self.client, 'hierarchy', None)
+            max_age = float('inf') if self._batch_depth else None
+            if service is None or service.peek(max_age=max_age) is None:
+                return {"success": True, "msg": "已点击（快速模式未读取页面文本，需要时用 verify 确认）"}
+        return {"success": True, "page_texts": self._get_page_texts(10)}
+    
+    def _text_selector(self, attr_type: str, attr_value: str):
+        """按 _find_element_in_tree 返回的属性类型构造 u2 选择器（不支持的类型返回 None）"""
+        if attr_type in ('text', 'textContains', 'description', 'descriptionContains'):
+            return self.client.u2(**{attr_type: attr_value})
+        return None
+    
     def _verify_after_click(self, verify_text: str, ios: bool = False, timeout: float = 2.0) -> Dict:
         """点击后验证期望文本是否出现
         
@@ -1383,98 +1596,33 @@ class BasicMobileToolsLite:
                         False=只进行包含匹配（用于验证元素）
         """
         try:
-            xml = self.client.u2.dump_hierarchy(compressed=False)
-            import xml.etree.ElementTree as ET
-            root = ET.fromstring(xml)
+            snapshot = self._get_hierarchy()
             
-            # 获取屏幕尺寸
-            screen_width, screen_height = self.client.u2.window_size()
+            # 没有位置要求且快照还未解析时，流式解析，命中决定性结果即停止
+            if not position and not snapshot.is_parsed:
+                return self._stream_find_element(snapshot, text, exact_match)
             
-            # 存储所有匹配的元素（包括不可点击的）
-            matched_elements = []
+            # 通过快照索引查找（精确匹配走哈希表，包含匹配走倒排索引）
+            index = snapshot.index
             
-            for elem in root.iter():
-                elem_text = elem.attrib.get('text', '')
-                elem_desc = elem.attrib.get('content-desc', '')
-                bounds_str = elem.attrib.get('bounds', '')
-                clickable = elem.attrib.get('clickable', 'false').lower() == 'true'
-                
-                # 解析 bounds
-                bounds = None
-                if bounds_str:
-                    import re
-                    match = re.findall(r'\d+', bounds_str)
-                    if len(match) == 4:
-                        bounds = [int(x) for x in match]
-                
-                # 判断是否匹配
-                is_match = False
-                attr_type = None
-                attr_value = None
-                
-                if exact_match:
-                    # 精确匹配模式（用于定位元素）：优先精确匹配
-                    # 精确匹配 text
-                    if elem_text == text:
-                        is_match = True
-                        attr_type = 'text'
-                        attr_value = text
-                    # 精确匹配 content-desc
-                    elif elem_desc == text:
-                        is_match = True
-                        attr_type = 'description'
-                        attr_value = text
-                    # 精确匹配找不到时，再尝试包含匹配（作为兜底）
-                    elif text in elem_text:
-                        is_match = True
-                        attr_type = 'textContains'
-                        attr_value = text
-                    # 包含匹配 content-desc
-                    elif text in elem_desc:
-                        is_match = True
-                        attr_type = 'descriptionContains'
-                        attr_value = text
-                else:
-                    # 包含匹配模式（用于验证元素）：只进行包含匹配
-                    # 包含匹配 text
-                    if text in elem_text:
-                        is_match = True
-                        attr_type = 'textContains'
-                        attr_value = text
-                    # 包含匹配 content-desc
-                    elif text in elem_desc:
-                        is_match = True
-                        attr_type = 'descriptionContains'
-                        attr_value = text
-                
-                if is_match and bounds:
-                    # 计算元素的中心点坐标
-                    center_x = (bounds[0] + bounds[2]) / 2
-                    center_y = (bounds[1] + bounds[3]) / 2
-                    
-                    matched_elements.append({
-                        'attr_type': attr_type,
-                        'attr_value': attr_value,
-                        'bounds': bounds,
-                        'clickable': clickable,
-                        'center_x': center_x,
-                        'center_y': center_y
-                    })
+            # 精确匹配模式下，精确匹配的元素（text/description）在前，包含匹配的元素在后
+            # 包含匹配模式（用于验证元素）只返回 textContains/descriptionContains
+            matched_elements = []
+            for node, attr_type in index.find(text, exact_match=exact_match):
+                if not node.bounds:
+                    continue
+                matched_elements.append({
+                    'attr_type': attr_type,
+                    'attr_value': text,
+                    'bounds': list(node.bounds),
+                    'clickable': node.clickable,
+                    'center_x': (node.bounds[0] + node.bounds[2]) / 2,
+                    'center_y': (node.bounds[1] + node.bounds[3]) / 2
+                })
             
             if not matched_elements:
                 return None
             
-            # 精确匹配模式下，优先返回精确匹配的元素（text/description），再返回包含匹配的元素
-            if exact_match:
-                exact_matches = [m for m in matched_elements if m['attr_type'] in ['text', 'description']]
-                contains_matches = [m for m in matched_elements if m['attr_type'] in ['textContains', 'descriptionContains']]
-                # 如果有精确匹配，优先使用精确匹配的结果
-                if exact_matches:
-                    matched_elements = exact_matches + contains_matches
-                # 如果没有精确匹配，使用包含匹配的结果
-                else:
-                    matched_elements = contains_matches
-            
             # 如果有位置信息，根据位置筛选
             if position and len(matched_elements) > 1:
                 position_lower = position.lower()
@@ -1494,6 +1642,7 @@ class BasicMobileToolsLite:
                     matched_elements = sorted(matched_elements, key=lambda x: x['center_x'], reverse=True)
                 elif position_lower in ['middle', 'center', '中', '中间']:
                     # 选择最接近屏幕中心的
+                    screen_width, screen_height = self._get_profile().window_size()
                     screen_mid_x = screen_width / 2
                     screen_mid_y = screen_height / 2
                     matched_elements = sorted(
@@ -1537,6 +1686,53 @@ class BasicMobileToolsLite:
             traceback.print_exc()
             return None
     
+    def _stream_find_element(self, snapshot, text: str, exact_match: bool = True) -> Optional[Dict]:
+        """流式查找文本元素（无位置要求时使用，结果与索引查找一致）
+        
+        结果顺序为"精确匹配在前、包含匹配在后，各自按文档顺序"，取第一个可点击的，
+        因此遇到第一个可点击的精确匹配（包含模式下为第一个可点击的包含匹配）即可停止解析。
+        """
+        first_exact = None
+        first_contains = None
+        first_clickable_contains = None
+        
+        for node in snapshot.iter_nodes():
+            if not node.bounds:
+                continue
+            node_text = node.text
+            node_desc = node.content_desc
+            
+            if exact_match and (node_text == text or node_desc == text):
+                match = (node, 'text' if node_text == text else 'description')
+                if node.clickable:
+                    first_exact = match
+                    break
+                if first_exact is None:
+                    first_exact = match
+            elif text in node_text or text in node_desc:
+                match = (node, 'textContains' if text in node_text else 'descriptionContains')
+                if node.clickable and first_clickable_contains is None:
+                    first_clickable_contains = match
+                    if not exact_match:
+                        break
+                if first_contains is None:
+                    first_contains = match
+        
+        # 可点击的精确匹配 > 可点击的包含匹配 > 第一个精确匹配 > 第一个包含匹配
+        if first_exact is not None and first_exact[0].clickable:
+            best = first_exact
+        else:
+            best = first_clickable_contains or first_exact or first_contains
+        if best is None:
+            return None
+        
+        node, attr_type = best
+        return {
+            'attr_type': attr_type,
+            'attr_value': text,
+            'bounds': list(node.bounds)
+        }
+    
     def click_by_id(self, resource_id: str, index: int = 0) -> Dict:
         """通过 resource-id 点击"""
         try:
@@ -1549,8 +1745,9 @@ class BasicMobileToolsLite:
                     if elem.exists:
                         elements = elem.find_elements()
                         if index < len(elements):
+                            self._invalidate_hierarchy('click')
                             elements[index].click()
-                            time.sleep(0.3)
+                            self._settle('click')
                             self._record_click('id', resource_id, element_desc=resource_id)
                             return {"success": True}
                         else:
@@ -1560,12 +1757,28 @@ class BasicMobileToolsLite:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
                 normalized_id = self._normalize_resource_id(resource_id)
+                
+                # 先查快照索引：命中则直接点击中心点，省去 exists/count/click 多次 RPC
+                nodes = self._get_hierarchy().index.find_by_resource_id(normalized_id)
+                if nodes:
+                    if index >= len(nodes):
+                        return {"success": False, "msg": f"索引{index}超出范围(共{len(nodes)}个)"}
+                    node = nodes[index]
+                    if node.center:
+                        self._invalidate_hierarchy('click')
+                        self.client.u2.click(*node.center)
+                        self._settle('click')
+                        self._record_click('id', normalized_id, element_desc=resource_id)
+                        return {"success": True}
+                
+                # 索引未命中（页面可能还在加载），回退到选择器等待
                 elem = self.client.u2(resourceId=normalized_id)
                 if elem.exists(timeout=0.5):
                     count = elem.count
                     if index < count:
+                        self._invalidate_hierarchy('click')
                         elem[index].click()
-                        time.sleep(0.3)
+                        self._settle('click')
                         # 记录时同时保留原始入参和实际使用的 id 信息
                         self._record_click('id', normalized_id, element_desc=resource_id)
                         return {"success": True}
@@ -1608,14 +1821,12 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     screen_width, screen_height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 0)
-                screen_height = info.get('displayHeight', 0)
+                screen_width, screen_height = self._get_profile().screen_size()
             
             # 🎯 坐标转换
             original_x, original_y = x, y
@@ -1652,7 +1863,7 @@ class BasicMobileToolsLite:
             else:
                 self.client.u2.long_click(x, y, duration=duration)
             
-            time.sleep(0.3)
+            self._settle('long_press', 0.3)
             
             # 计算百分比坐标（用于跨设备兼容）
             x_percent = round(x / screen_width * 100, 1) if screen_width > 0 else 0
@@ -1694,14 +1905,12 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     width, height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
-                info = self.client.u2.info
-                width = info.get('displayWidth', 0)
-                height = info.get('displayHeight', 0)
+                width, height = self._get_profile().screen_size()
             
             if width == 0 or height == 0:
                 return {"success": False, "msg": "无法获取屏幕尺寸"}
@@ -1720,7 +1929,7 @@ class BasicMobileToolsLite:
             else:
                 self.client.u2.long_click(x, y, duration=duration)
             
-            time.sleep(0.3)
+            self._settle('long_press', 0.3)
             
             # 第4步：使用标准记录格式
             self._record_long_press('percent', f"{x_percent}%,{y_percent}%", duration,
@@ -1754,13 +1963,13 @@ class BasicMobileToolsLite:
                             ios_client.wda.tap_hold(x, y, duration=duration)
                         else:
                             ios_client.wda.swipe(x, y, x, y, duration=duration)
-                        time.sleep(0.3)
+                        self._settle('long_press', 0.3)
                         self._record_long_press('text', text, duration, element_desc=text, locator_attr='text')
                         return {"success": True}
                     return {"success": False, "msg": f"未找到'{text}'"}
             else:
                 # 获取屏幕尺寸用于计算百分比
-                screen_width, screen_height = self.client.u2.window_size()
+                screen_width, screen_height = self._get_profile().window_size()
                 
                 # 先查 XML 树，找到元素
                 found_elem = self._find_element_in_tree(text)
@@ -1792,7 +2001,7 @@ class BasicMobileToolsLite:
                     
                     if elem and elem.exists(timeout=1):
                         elem.long_click(duration=duration)
-                        time.sleep(0.3)
+                        self._settle('long_press', 0.3)
                         self._record_long_press('text', attr_value, duration, x_pct, y_pct,
                                                element_desc=text, locator_attr=attr_type)
                         return {"success": True}
@@ -1802,7 +2011,7 @@ class BasicMobileToolsLite:
                         x = (bounds[0] + bounds[2]) // 2
                         y = (bounds[1] + bounds[3]) // 2
                         self.client.u2.long_click(x, y, duration=duration)
-                        time.sleep(0.3)
+                        self._settle('long_press', 0.3)
                         self._record_long_press('percent', f"{x_pct}%,{y_pct}%", duration, x_pct, y_pct,
                                                element_desc=text)
                         return {"success": True}
@@ -1833,16 +2042,28 @@ class BasicMobileToolsLite:
                             ios_client.wda.tap_hold(x, y, duration=duration)
                         else:
                             ios_client.wda.swipe(x, y, x, y, duration=duration)
-                        time.sleep(0.3)
+                        self._settle('long_press', 0.3)
                         self._record_long_press('id', resource_id, duration, element_desc=resource_id)
                         return {"success": True}
                     return {"success": False, "msg": f"未找到'{resource_id}'"}
             else:
                 normalized_id = self._normalize_resource_id(resource_id)
+                
+                # 先查快照索引：命中则直接长按中心点
+                nodes = self._get_hierarchy().index.find_by_resource_id(normalized_id)
+                if nodes and nodes[0].center:
+                    self.client.u2.long_click(*nodes[0].center, duration=duration)
+                    self._settle('long_press', 0.3)
+                    self._record_long_press('id', normalized_id, duration, element_desc=resource_id)
+                    return {
+                        "success": True,
+                        "message": f"✅ 长按成功: {resource_id} (实际匹配: {normalized_id}) 持续 {duration}s"
+                    }
+                
                 elem = self.client.u2(resourceId=normalized_id)
                 if elem.exists(timeout=0.5):
                     elem.long_click(duration=duration)
-                    time.sleep(0.3)
+                    self._settle('long_press', 0.3)
                     self._record_long_press('id', normalized_id, duration, element_desc=resource_id)
                     return {
                         "success": True,
@@ -1875,7 +2096,7 @@ class BasicMobileToolsLite:
                         elem = ios_client.wda(name=resource_id)
                     if elem.exists:
                         elem.set_text(text)
-                        time.sleep(0.3)
+                        self._settle('input')
                         self._record_input(text, 'id', resource_id)
                         
                         # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -1904,14 +2125,18 @@ class BasicMobileToolsLite:
                 normalized_id = self._normalize_resource_id(resource_id)
                 elements = self.client.u2(resourceId=normalized_id)
                 
+                # 先查快照索引（免去 exists/count/info 多次 RPC），未命中再用选择器等待
+                index = self._get_hierarchy().index
+                indexed = index.find_by_resource_id(normalized_id)
+                
                 # 检查是否存在
-                if elements.exists(timeout=0.5):
-                    count = elements.count
+                if indexed or elements.exists(timeout=0.5):
+                    count = len(indexed) if indexed else elements.count
                     
                     # 只有 1 个元素，直接输入
                     if count == 1:
                         elements.set_text(text)
-                        time.sleep(0.3)
+                        self._settle('input')
                         self._record_input(text, 'id', normalized_id)
                         
                         # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -1941,11 +2166,15 @@ class BasicMobileToolsLite:
                         for i in range(count):
                             try:
                                 elem = elements[i]
-                                info = elem.info
+                                if indexed:
+                                    editable = indexed[i].editable or indexed[i].focusable
+                                else:
+                                    info = elem.info
+                                    editable = info.get('editable') or info.get('focusable')
                                 # 优先选择可编辑的
-                                if info.get('editable') or info.get('focusable'):
+                                if editable:
                                     elem.set_text(text)
-                                    time.sleep(0.3)
+                                    self._settle('input')
                                     self._record_input(text, 'id', resource_id)
                                     
                                     # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -1973,7 +2202,7 @@ class BasicMobileToolsLite:
                                 continue
                         # 没找到可编辑的，用第一个
                         elements[0].set_text(text)
-                        time.sleep(0.3)
+                        self._settle('input')
                         self._record_input(text, 'id', resource_id)
                         
                         # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -2000,11 +2229,12 @@ class BasicMobileToolsLite:
                 
                 # ID 不可靠（不存在或太多），改用 EditText 类型定位
                 edit_texts = self.client.u2(className='android.widget.EditText')
-                if edit_texts.exists(timeout=0.5):
-                    et_count = edit_texts.count
+                edit_nodes = index.find_by_class('android.widget.EditText')
+                if edit_nodes or edit_texts.exists(timeout=0.5):
+                    et_count = len(edit_nodes) if edit_nodes else edit_texts.count
                     if et_count == 1:
                         edit_texts.set_text(text)
-                        time.sleep(0.3)
+                        self._settle('input')
                         self._record_input(text, 'class', 'EditText')
                         
                         # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -2031,20 +2261,25 @@ class BasicMobileToolsLite:
                     
                     # 多个 EditText，选择最靠上的
                     best_elem = None
-                    min_top = 9999
-                    for i in range(et_count):
-                        try:
-                            elem = edit_texts[i]
-                            top = elem.info.get('bounds', {}).get('top', 9999)
-                            if top < min_top:
-                                min_top = top
-                                best_elem = elem
-                        except:
-                            continue
+                    if edit_nodes:
+                        best_i = min(range(et_count),
+                                     key=lambda i: edit_nodes[i].bounds[1] if edit_nodes[i].bounds else 9999)
+                        best_elem = edit_texts[best_i]
+                    else:
+                        min_top = 9999
+                        for i in range(et_count):
+                            try:
+                                elem = edit_texts[i]
+                                top = elem.info.get('bounds', {}).get('top', 9999)
+                                if top < min_top:
+                                    min_top = top
+                                    best_elem = elem
+                            except:
+                                continue
                     
                     if best_elem:
                         best_elem.set_text(text)
-                        time.sleep(0.3)
+                        self._settle('input')
                         self._record_input(text, 'class', 'EditText')
                         
                         # 🎯 关键步骤：检查应用是否跳转，如果跳转则自动返回目标应用
@@ -2081,19 +2316,18 @@ class BasicMobileToolsLite:
             screen_width, screen_height = 0, 0
             
             # 先点击聚焦
+            self._invalidate_hierarchy('click')
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
                     ios_client.wda.click(x, y)
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     screen_width, screen_height = size[0], size[1]
             else:
                 self.client.u2.click(x, y)
-                info = self.client.u2.info
-                screen_width = info.get('displayWidth', 0)
-                screen_height = info.get('displayHeight', 0)
+                screen_width, screen_height = self._get_profile().screen_size()
             
-            time.sleep(0.3)
+            self._settle('click')
             
             # 输入文本
             if self._is_ios():
@@ -2103,7 +2337,7 @@ class BasicMobileToolsLite:
             else:
                 self.client.u2.send_keys(text)
             
-            time.sleep(0.3)
+            self._settle('input')
             
             # 计算百分比坐标
             x_percent = round(x / screen_width * 100, 1) if screen_width > 0 else 0
@@ -2155,12 +2389,12 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 ios_client = self._get_ios_client()
                 if ios_client and hasattr(ios_client, 'wda'):
-                    size = ios_client.wda.window_size()
+                    size = self._get_profile().window_size()
                     width, height = size[0], size[1]
                 else:
                     return {"success": False, "msg": "iOS未初始化"}
             else:
-                width, height = self.client.u2.window_size()
+                width, height = self._get_profile().window_size()
             
             center_x, center_y = width // 2, height // 2
             
@@ -2339,7 +2573,7 @@ class BasicMobileToolsLite:
                                     continue
                             
                             # 如果没有找到按钮，尝试点击键盘以外的区域
-                            size = ios_client.wda.window_size()
+                            size = self._get_profile().window_size()
                             # 点击屏幕顶部区域（通常不会被键盘遮挡）
                             ios_client.wda.click(size[0] // 2, 50)
                             return {"success": True, "message": "✅ 键盘已收起 (iOS - 点击空白区域)"}
@@ -2362,7 +2596,8 @@ class BasicMobileToolsLite:
                     if 'mInputShown=true' in result:
                         # 键盘正在显示，按返回键收起
                         self.client.u2.shell('input keyevent 4')  # KEYCODE_BACK
-                        time.sleep(0.3)
+                        self._invalidate_hierarchy('hide_keyboard')
+                        self._settle('hide_keyboard', 0.3)
                         
                         # 验证键盘是否已收起
                         shell_result_after = self.client.u2.shell('dumpsys input_method | grep mInputShown')
@@ -2372,17 +2607,17 @@ class BasicMobileToolsLite:
                             return {"success": True, "message": "✅ 键盘已收起 (Android - back键)"}
                         else:
                             # 如果 back 键没效果，尝试点击空白区域
-                            info = self.client.u2.info
-                            height = info.get('displayHeight', 1920)
-                            width = info.get('displayWidth', 1080)
+                            width, height = self._get_profile().screen_size(1080, 1920)
                             # 点击标题栏区域
                             self.client.u2.click(width // 2, 100)
+                            self._invalidate_hierarchy('hide_keyboard')
                             return {"success": True, "message": "✅ 键盘已收起 (Android - 点击空白区域)"}
                     else:
                         return {"success": True, "message": "💡 键盘未显示，无需收起"}
                 except Exception as e:
                     # 备用方案：直接按返回键
                     self.client.u2.shell('input keyevent 4')
+                    self._invalidate_hierarchy('hide_keyboard')
                     return {"success": True, "message": f"✅ 键盘收起完成 (Android - back键，备用方案: {e})"}
         except Exception as e:
             return {"success": False, "message": f"❌ 收起键盘失败: {e}"}
@@ -2390,14 +2625,168 @@ class BasicMobileToolsLite:
     def wait(self, seconds: float) -> Dict:
         """等待指定时间"""
         time.sleep(seconds)
-        # 记录等待操作
+        self._record_wait(seconds)
+        return {"success": True}
+    
+    def _record_wait(self, seconds: float):
+        """记录等待操作"""
         record = {
             'action': 'wait',
             'timestamp': datetime.now().isoformat(),
             'seconds': seconds,
         }
         self.operation_history.append(record)
-        return {"success": True}
+    
+    # ==================== 批量执行 ====================
+    
+    # 批量执行支持的动作
+    BATCH_ACTIONS = ('click_by_text', 'input_text_by_id', 'swipe', 'press_key', 'wait', 'assert_text')
+    
+    # 各动作的必填参数（执行前检查，缺失时返回明确的错误而不是 KeyError）
+    BATCH_REQUIRED = {
+        'click_by_text': ('text',),
+        'input_text_by_id': ('resource_id', 'text'),
+        'swipe': ('direction',),
+        'press_key': ('key',),
+        'wait': (),
+        'assert_text': ('text',),
+    }
+    
+    async def run_batch(self, actions: List[Dict], stop_on_failure: bool = True) -> Dict:
+        """按顺序批量执行动作（一次调用完成多步操作）
+        
+        所有动作共用一份控件树快照：只读动作（assert_text、守卫条件）直接复用，
+        点击/输入/滑动/按键/等待之后快照失效，下一次读取时才重新 dump。
+        
+        Args:
+            actions: 动作列表，每项如 {"action": "click_by_text", "text": "登录"}
+                - click_by_text: text, position, verify
+                - input_text_by_id: resource_id, text
+                - swipe: direction, y, y_percent, distance, distance_percent
+                - press_key: key
+                - wait: seconds
+                - assert_text: text, exists（默认 True，False 表示断言不存在）
+                守卫（可选）：if_text 页面有该文本才执行，unless_text 页面有该文本则跳过；
+                optional: True 表示失败不中断
+            stop_on_failure: 非 optional 动作失败时停止后续动作
+        
+        Returns:
+            {"success", "completed", "total", "dumps", "total_ms", "results": [...]}
+            results 每项: {"i", "action", "ok", "ms"}，失败时带 msg，跳过时带 skipped
+        """
+        service = getattr(self.client, 'hierarchy', None)
+        misses_before = service.stats()["misses"] if service is not None else 0
+        start = time.time()
+        results = []
+        success = True
+        
+        self._batch_depth += 1
+        waited_ms = 0
+        max_wait_ms = 0
+        self.take_wait_report()
+        try:
+            for i, spec in enumerate(actions):
+                action = spec.get("action", "")
+                item = {"i": i, "action": action}
+                action_start = time.time()
+                try:
+                    spec_error = self._batch_spec_error(action, spec)
+                    skip_reason = "" if spec_error else self._batch_guard(spec)
+                    if spec_error:
+                        item.update(ok=False, msg=spec_error)
+                    elif skip_reason:
+                        item.update(ok=True, skipped=skip_reason)
+                    else:
+                        result = await self._run_batch_action(action, spec)
+                        item["ok"] = bool(result.get("success"))
+                        if not item["ok"]:
+                            item["msg"] = result.get("msg") or result.get("message") or result.get("error") or ""
+                except Exception as e:
+                    item.update(ok=False, msg=str(e))
+                item["ms"] = round((time.time() - action_start) * 1000)
+                wait_report = self.take_wait_report()
+                if wait_report:
+                    item["wait_ms"] = wait_report["waited_ms"]
+                    waited_ms += wait_report["waited_ms"]
+                    max_wait_ms += wait_report["max_wait_ms"]
+                results.append(item)
+                
+                if not item["ok"] and not spec.get("optional"):
+                    success = False
+                    if stop_on_failure:
+                        break
+        finally:
+            self._batch_depth -= 1
+        
+        service = getattr(self.client, 'hierarchy', None)
+        misses_after = service.stats()["misses"] if service is not None else 0
+        return {
+            "success": success,
+            "completed": len(results),
+            "total": len(actions),
+            "dumps": misses_after - misses_before,
+            "total_ms": round((time.time() - start) * 1000),
+            "wait": {"waited_ms": waited_ms, "max_wait_ms": max_wait_ms},
+            "results": results,
+        }
+    
+    def _batch_spec_error(self, action: str, spec: Dict) -> str:
+        """检查动作名和必填参数，返回错误信息（空字符串表示有效）"""
+        if action not in self.BATCH_REQUIRED:
+            return f"不支持的动作: {action or '(未指定)'}，可用: {', '.join(self.BATCH_ACTIONS)}"
+        missing = [key for key in self.BATCH_REQUIRED[action] if spec.get(key) is None]
+        if missing:
+            return f"{action} 缺少必填参数: {', '.join(missing)}"
+        return ""
+    
+    def _batch_guard(self, spec: Dict) -> str:
+        """检查守卫条件，返回跳过原因（空字符串表示执行）"""
+        if spec.get("if_text") and not self._page_has_text(spec["if_text"]):
+            return f"无'{spec['if_text']}'"
+        if spec.get("unless_text") and self._page_has_text(spec["unless_text"]):
+            return f"有'{spec['unless_text']}'"
+        return ""
+    
+    def _page_has_text(self, text: str) -> bool:
+        """页面是否包含文本（text 或 content-desc 包含匹配）"""
+        if self._is_ios():
+            return bool(self.assert_text(text).get("found"))
+        for node in self._get_hierarchy().iter_nodes():
+            if text in node.text or text in node.content_desc:
+                return True
+        return False
+    
+    async def _run_batch_action(self, action: str, spec: Dict) -> Dict:
+        """执行单个批量动作"""
+        if action == "click_by_text":
+            return self.click_by_text(spec["text"], position=spec.get("position"), verify=spec.get("verify"))
+        if action == "input_text_by_id":
+            return self.input_text_by_id(spec["resource_id"], spec["text"])
+        if action == "swipe":
+            return await self.swipe(
+                spec["direction"],
+                y=spec.get("y"),
+                y_percent=spec.get("y_percent"),
+                distance=spec.get("distance"),
+                distance_percent=spec.get("distance_percent")
+            )
+        if action == "press_key":
+            return await self.press_key(spec["key"])
+        if action == "wait":
+            # 不阻塞事件循环；等待期间页面可能加载完成，之后重新读取控件树
+            await asyncio.sleep(spec.get("seconds", 1))
+            self._record_wait(spec.get("seconds", 1))
+            self._invalidate_hierarchy("wait")
+            return {"success": True}
+        if action == "assert_text":
+            result = self.assert_text(spec["text"])
+            if not result.get("success"):
+                return result
+            expected = spec.get("exists", True)
+            if result.get("found") != expected:
+                return {"success": False, "msg": f"文本'{spec['text']}' {'不存在' if expected else '仍存在'}"}
+            return {"success": True}
+        return {"success": False, "msg": f"不支持的动作: {action}，可用: {', '.join(self.BATCH_ACTIONS)}"}
     
     async def drag_progress_bar(self, direction: str = "right", distance_percent: float = 30.0, 
                                 y_percent: Optional[float] = None, y: Optional[int] = None) -> Dict:
@@ -2414,7 +2803,6 @@ class BasicMobileToolsLite:
             y: 进度条的垂直位置坐标（像素），如果未指定则自动检测
         """
         try:
-            import xml.etree.ElementTree as ET
             import re
             
             if self._is_ios():
@@ -2423,21 +2811,19 @@ class BasicMobileToolsLite:
             if direction not in ['left', 'right']:
                 return {"success": False, "message": f"❌ 拖动方向必须是 'left' 或 'right': {direction}"}
             
-            screen_width, screen_height = self.client.u2.window_size()
+            screen_width, screen_height = self._get_profile().window_size()
             
             # 获取 XML 查找进度条
-            xml_string = self.client.u2.dump_hierarchy(compressed=False)
-            root = ET.fromstring(xml_string)
+            table = self._get_hierarchy().table
             
             progress_bar_found = False
             progress_bar_y = None
             progress_bar_y_percent = None
             
             # 查找进度条元素（SeekBar、ProgressBar）
-            for elem in root.iter():
-                class_name = elem.attrib.get('class', '')
-                resource_id = elem.attrib.get('resource-id', '')
-                bounds_str = elem.attrib.get('bounds', '')
+            for node in table:
+                class_name = node.class_name
+                resource_id = node.resource_id
                 
                 # 检查是否是进度条
                 is_progress_bar = (
@@ -2447,32 +2833,29 @@ class BasicMobileToolsLite:
                     'seek' in resource_id.lower()
                 )
                 
-                if is_progress_bar and bounds_str:
-                    # 解析 bounds 获取进度条位置
-                    match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                    if match:
-                        x1, y1, x2, y2 = map(int, match.groups())
-                        center_y = (y1 + y2) // 2
-                        progress_bar_y = center_y
-                        progress_bar_y_percent = round(center_y / screen_height * 100, 1)
-                        progress_bar_found = True
-                        break
+                if is_progress_bar and node.bounds:
+                    # 使用节点表中已解析的 bounds 获取进度条位置
+                    x1, y1, x2, y2 = node.bounds
+                    center_y = (y1 + y2) // 2
+                    progress_bar_y = center_y
+                    progress_bar_y_percent = round(center_y / screen_height * 100, 1)
+                    progress_bar_found = True
+                    break
             
             # 如果未找到进度条，尝试点击播放区域显示控制栏
             if not progress_bar_found:
                 # 点击屏幕中心显示控制栏
                 center_x, center_y = screen_width // 2, screen_height // 2
                 self.client.u2.click(center_x, center_y)
-                time.sleep(0.5)
+                self._invalidate_hierarchy('click')
+                self._settle('click', 0.5)
                 
                 # 再次查找进度条
-                xml_string = self.client.u2.dump_hierarchy(compressed=False)
-                root = ET.fromstring(xml_string)
+                table = self._get_hierarchy().table
                 
-                for elem in root.iter():
-                    class_name = elem.attrib.get('class', '')
-                    resource_id = elem.attrib.get('resource-id', '')
-                    bounds_str = elem.attrib.get('bounds', '')
+                for node in table:
+                    class_name = node.class_name
+                    resource_id = node.resource_id
                     
                     is_progress_bar = (
                         'SeekBar' in class_name or 
@@ -2481,15 +2864,13 @@ class BasicMobileToolsLite:
                         'seek' in resource_id.lower()
                     )
                     
-                    if is_progress_bar and bounds_str:
-                        match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                        if match:
-                            x1, y1, x2, y2 = map(int, match.groups())
-                            center_y = (y1 + y2) // 2
-                            progress_bar_y = center_y
-                            progress_bar_y_percent = round(center_y / screen_height * 100, 1)
-                            progress_bar_found = True
-                            break
+                    if is_progress_bar and node.bounds:
+                        x1, y1, x2, y2 = node.bounds
+                        center_y = (y1 + y2) // 2
+                        progress_bar_y = center_y
+                        progress_bar_y_percent = round(center_y / screen_height * 100, 1)
+                        progress_bar_found = True
+                        break
             
             # 确定使用的高度位置
             if y_percent is not None:
@@ -2526,7 +2907,7 @@ class BasicMobileToolsLite:
             
             # 执行拖动
             self.client.u2.swipe(start_x, swipe_y, end_x, swipe_y, duration=0.5)
-            time.sleep(0.3)
+            self._settle('swipe', 0.3)
             
             # 记录操作
             self._record_swipe(direction)
@@ -2574,8 +2955,9 @@ class BasicMobileToolsLite:
                     ios_client.wda.app_activate(package_name)
             else:
                 self.client.u2.app_start(package_name)
+                self._invalidate_hierarchy('launch_app')
             
-            await asyncio.sleep(2)
+            await asyncio.get_running_loop().run_in_executor(None, self._settle, 'launch_app', 2.0)
             
             # 记录目标应用包名（用于后续监测应用跳转）
             self.target_package = package_name
@@ -2603,6 +2985,7 @@ class BasicMobileToolsLite:
                     ios_client.wda.app_terminate(package_name)
             else:
                 self.client.u2.app_stop(package_name)
+                self._invalidate_hierarchy('terminate_app')
             return {"success": True}
         except Exception as e:
             return {"success": False, "msg": str(e)}
@@ -2635,24 +3018,19 @@ class BasicMobileToolsLite:
     # ==================== 设备管理 ====================
     
     def list_devices(self) -> Dict:
-        """列出已连接设备"""
+        """列出已连接设备（读设备发现缓存，后台定期刷新）"""
         try:
+            from .device_discovery import get_discovery
             platform = "ios" if self._is_ios() else "android"
-            
-            if platform == "ios":
-                from .ios_device_manager_wda import IOSDeviceManagerWDA
-                manager = IOSDeviceManagerWDA()
-                devices = manager.list_devices()
-            else:
-                from .device_manager import DeviceManager
-                manager = DeviceManager()
-                devices = manager.list_devices()
+            discovery = get_discovery()
+            devices = discovery.devices(platform)
             
             return {
                 "success": True,
                 "platform": platform,
                 "devices": devices,
-                "count": len(devices)
+                "count": len(devices),
+                "cache_age": discovery.stats()["age"],
             }
         except Exception as e:
             return {"success": False, "message": f"❌ 获取设备列表失败: {e}"}
@@ -2687,8 +3065,7 @@ class BasicMobileToolsLite:
                     return ios_client.list_elements()
                 return [{"error": "iOS 暂不支持元素列表，建议使用截图"}]
             else:
-                xml_string = self.client.u2.dump_hierarchy(compressed=False)
-                elements = self.client.xml_parser.parse(xml_string)
+                elements = self._get_hierarchy().elements
                 
                 # 功能控件类型（需要保留）
                 FUNCTIONAL_WIDGETS = {
@@ -2915,14 +3292,13 @@ class BasicMobileToolsLite:
                 return []
             else:
                 # Android: 快速扫描 XML 获取文本
-                xml_string = self.client.u2.dump_hierarchy(compressed=True)
-                import xml.etree.ElementTree as ET
-                root = ET.fromstring(xml_string)
+                # 与按文本/ID 查找共用非压缩快照：这次 dump 就是下一次工具调用要用的快照，不会再 dump 一次
+                table = self._get_hierarchy().table
                 
                 texts = set()
-                for elem in root.iter():
-                    text = elem.get('text', '').strip()
-                    desc = elem.get('content-desc', '').strip()
+                for node in table:
+                    text = node.text.strip()
+                    desc = node.content_desc.strip()
                     # 只收集有意义的文本（长度2-30，非纯数字）
                     for t in [text, desc]:
                         if t and 2 <= len(t) <= 30 and not t.isdigit():
@@ -3014,9 +3390,9 @@ class BasicMobileToolsLite:
         # 规则5：有 resource_id 或 content_desc 的小图标可能可点击
         # （纯 ImageView 不加判断，误判率太高）
         if class_name in ('ImageView', 'Image') and (resource_id or content_desc) and bounds:
-            match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds)
-            if match:
-                x1, y1, x2, y2 = map(int, match.groups())
+            parsed = parse_bounds(bounds)
+            if parsed:
+                x1, y1, x2, y2 = parsed
                 w, h = x2 - x1, y2 - y1
                 # 小图标（20-100px）更可能是按钮
                 if 20 <= w <= 100 and 20 <= h <= 100:
@@ -3043,17 +3419,14 @@ class BasicMobileToolsLite:
                 return {"success": False, "msg": "iOS暂不支持"}
             
             # 获取屏幕尺寸
-            screen_width = self.client.u2.info.get('displayWidth', 720)
-            screen_height = self.client.u2.info.get('displayHeight', 1280)
+            screen_width, screen_height = self._get_profile().screen_size(720, 1280)
             
             # 获取元素列表
-            xml_string = self.client.u2.dump_hierarchy(compressed=False)
-            import xml.etree.ElementTree as ET
-            root = ET.fromstring(xml_string)
+            table = self._get_hierarchy().table
             
             # 🔴 先检测是否有弹窗，避免误识别普通页面的按钮
             popup_bounds, popup_confidence = self._detect_popup_with_confidence(
-                root, screen_width, screen_height
+                table, screen_width, screen_height
             )
             
             if popup_bounds is None or popup_confidence < 0.5:
@@ -3063,21 +3436,16 @@ class BasicMobileToolsLite:
             close_texts = ['×', 'X', 'x', '关闭', '取消', 'close', 'Close', '跳过', '知道了', '我知道了']
             candidates = []
             
-            for elem in root.iter():
-                text = elem.attrib.get('text', '')
-                content_desc = elem.attrib.get('content-desc', '')
-                bounds_str = elem.attrib.get('bounds', '')
-                class_name = elem.attrib.get('class', '')
-                clickable = elem.attrib.get('clickable', 'false') == 'true'
-                
-                if not bounds_str:
+            for node in table:
+                if not node.bounds:
                     continue
                 
-                match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                if not match:
-                    continue
-                
-                x1, y1, x2, y2 = map(int, match.groups())
+                text = node.text
+                content_desc = node.content_desc
+                bounds_str = node.bounds_str
+                class_name = node.class_name
+                clickable = node.clickable
+                x1, y1, x2, y2 = node.bounds
                 width = x2 - x1
                 height = y2 - y1
                 center_x = (x1 + x2) // 2
@@ -3198,11 +3566,10 @@ class BasicMobileToolsLite:
             if self._is_ios():
                 return {"success": False, "msg": "iOS暂不支持"}
             
-            screen_width = self.client.u2.info.get('displayWidth', 720)
-            screen_height = self.client.u2.info.get('displayHeight', 1280)
+            screen_width, screen_height = self._get_profile().screen_size(720, 1280)
             
-            # 获取原始 XML
-            xml_string = self.client.u2.dump_hierarchy(compressed=False)
+            # 获取控件树快照
+            snapshot = self._get_hierarchy()
             
             # 关闭按钮的文本特征
             close_texts = ['×', 'X', 'x', '关闭', '取消', 'close', 'Close', 'CLOSE', '跳过', '知道了']
@@ -3211,20 +3578,21 @@ class BasicMobileToolsLite:
             close_candidates = []
             all_clickable_elements = []  # 所有可点击元素（用于兜底策略）
             popup_confidence = 0.0
+            popup_subtree = range(0)  # 检测到的弹窗子树（节点下标范围）
             
             # 解析 XML
             try:
-                root = ET.fromstring(xml_string)
-                all_elements = list(root.iter())
+                table = snapshot.table
+                all_elements = table.nodes
                 
                 # ===== 第一步：检测弹窗区域（如果AI未传入完整弹窗信息）=====
                 if popup_bounds is None:
                     # 无论popup_detected是否传入，都需要检测bounds来定位弹窗区域
-                    detected_bounds, detected_confidence = self._detect_popup_with_confidence(
-                        root, screen_width, screen_height
-                    )
-                    popup_bounds = detected_bounds
-                    popup_confidence = detected_confidence
+                    popup = self._detect_popup(table, screen_width, screen_height)
+                    popup_bounds = popup.bounds if popup and popup.detected else None
+                    popup_confidence = popup.confidence if popup else 0
+                    if popup_bounds:
+                        popup_subtree = popup.subtree
                     
                     # 如果AI未传入popup_detected，根据检测结果判断
                     if popup_detected is None:
@@ -3245,23 +3613,17 @@ class BasicMobileToolsLite:
                 # 避免误点击普通页面的右上角图标
                 
                 # ===== 第二步：在弹窗范围内查找关闭按钮 =====
-                for idx, elem in enumerate(all_elements):
-                    text = elem.attrib.get('text', '')
-                    content_desc = elem.attrib.get('content-desc', '')
-                    bounds_str = elem.attrib.get('bounds', '')
-                    class_name = elem.attrib.get('class', '')
-                    clickable = elem.attrib.get('clickable', 'false') == 'true'
-                    resource_id = elem.attrib.get('resource-id', '')
-                    
-                    if not bounds_str:
-                        continue
-                    
-                    # 解析 bounds
-                    match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                    if not match:
+                for idx, node in enumerate(all_elements):
+                    if not node.bounds:
                         continue
                     
-                    x1, y1, x2, y2 = map(int, match.groups())
+                    text = node.text
+                    content_desc = node.content_desc
+                    bounds_str = node.bounds_str
+                    class_name = node.class_name
+                    clickable = node.clickable
+                    resource_id = node.resource_id
+                    x1, y1, x2, y2 = node.bounds
                     width = x2 - x1
                     height = y2 - y1
                     center_x = (x1 + x2) // 2
@@ -3301,6 +3663,11 @@ class BasicMobileToolsLite:
                         in_popup = (px1 - margin_side <= center_x <= px2 + margin_side and 
                                    py1 - margin_top <= center_y <= py2 + margin_bottom)
                         
+                        # 弹窗子树内的节点（控件树上属于弹窗，即使浮在弹窗范围外）
+                        if idx in popup_subtree:
+                            in_popup = True
+                            popup_edge_bonus += 1.0
+                        
                         # 【新增】兼容第三方广告页面：右上角的 ImageView 即使不在弹窗范围内，也可能是在弹窗上方的关闭按钮
                         # 判断条件：ImageView 位于屏幕右上角（rel_x > 0.85, rel_y < 0.15）且尺寸合适
                         is_top_right_imageview = (
@@ -3338,7 +3705,7 @@ class BasicMobileToolsLite:
                             
                             # 在弹窗边缘 100 像素内的元素加分
                             if min_dist < 100:
-                                popup_edge_bonus = 3.0 * (1 - min_dist / 100)
+                                popup_edge_bonus += 3.0 * (1 - min_dist / 100)
                         
                         # 浮动关闭按钮（在弹窗上方外侧）给予高额加分
                         if is_floating_close:
@@ -3457,7 +3824,7 @@ class BasicMobileToolsLite:
                 if popup_detected and popup_bounds and len(all_clickable_elements) == 1:
                     single_element = all_clickable_elements[0]
                     self.client.u2.click(single_element['center_x'], single_element['center_y'])
-                    time.sleep(0.5)
+                    self._settle('close_popup', 0.5)
                     
                     # 检查应用是否跳转
                     app_check = self._check_app_switched()
@@ -3488,7 +3855,7 @@ class BasicMobileToolsLite:
                     # 如果元素占据屏幕 20% 以上，认为是可能的弹窗
                     if element_area_ratio > 0.2:
                         self.client.u2.click(single_element['center_x'], single_element['center_y'])
-                        time.sleep(0.5)
+                        self._settle('close_popup', 0.5)
                         
                         # 检查应用是否跳转
                         app_check = self._check_app_switched()
@@ -3521,7 +3888,7 @@ class BasicMobileToolsLite:
             
             # 点击
             self.client.u2.click(best['center_x'], best['center_y'])
-            time.sleep(0.5)
+            self._settle('close_popup', 0.5)
             
             # 🎯 关键步骤：检查应用是否跳转，如果跳转说明弹窗去除失败，需要返回目标应用
             app_check = self._check_app_switched()
@@ -3590,7 +3957,7 @@ class BasicMobileToolsLite:
         else:  # 中间区域
             return 0.5
 
-    def _detect_popup_with_confidence(self, root, screen_width: int, screen_height: int) -> tuple:
+    def _detect_popup_with_confidence(self, table, screen_width: int, screen_height: int) -> tuple:
         """严格的弹窗检测 - 使用置信度评分，避免误识别普通页面
         
         真正的弹窗特征：
@@ -3598,291 +3965,30 @@ class BasicMobileToolsLite:
         2. resource-id 包含 dialog/popup/alert/modal（强特征）
         3. 有遮罩层（大面积半透明 View 在弹窗之前）
         4. 居中显示且非全屏
-        5. XML 层级靠后且包含可交互元素
+        5. XML 层级靠后（绘制在最上层）且子树内包含可交互元素
+        
+        基于控件树父子关系分析（见 popup_analyzer.py），需要弹窗子树时用 _detect_popup
+        
+        Args:
+            table: 控件树节点表（NodeTable）
+            screen_width: 屏幕宽度
+            screen_height: 屏幕高度
         
         Returns:
             (popup_bounds, confidence) 或 (None, 0)
             confidence >= 0.6 才认为是弹窗
         """
-        import re
-        
-        screen_area = screen_width * screen_height
-        
-        # 收集所有元素信息
-        all_elements = []
-        for idx, elem in enumerate(root.iter()):
-            bounds_str = elem.attrib.get('bounds', '')
-            if not bounds_str:
-                continue
-            
-            match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-            if not match:
-                continue
-            
-            x1, y1, x2, y2 = map(int, match.groups())
-            width = x2 - x1
-            height = y2 - y1
-            area = width * height
-            
-            class_name = elem.attrib.get('class', '')
-            resource_id = elem.attrib.get('resource-id', '')
-            clickable = elem.attrib.get('clickable', 'false') == 'true'
-            
-            # 检查是否是关闭按钮
-            is_close_button = (
-                'close' in resource_id.lower() or 
-                'dismiss' in resource_id.lower() or
-                'cancel' in resource_id.lower() or
-                '×' in elem.attrib.get('text', '') or
-                'X' in elem.attrib.get('text', '')
-            )
-            
-            all_elements.append({
-                'idx': idx,
-                'bounds': (x1, y1, x2, y2),
-                'width': width,
-                'height': height,
-                'area': area,
-                'area_ratio': area / screen_area if screen_area > 0 else 0,
-                'class': class_name,
-                'resource_id': resource_id,
-                'clickable': clickable,
-                'center_x': (x1 + x2) // 2,
-                'center_y': (y1 + y2) // 2,
-                'is_close_button': is_close_button,
-            })
-        
-        if not all_elements:
-            return None, 0
-        
-        # 弹窗检测关键词
-        dialog_class_keywords = ['Dialog', 'Popup', 'Alert', 'Modal', 'BottomSheet', 'PopupWindow']
-        dialog_id_keywords = ['dialog', 'popup', 'alert', 'modal', 'bottom_sheet', 'overlay', 'mask']
-        # 广告弹窗关键词（全屏广告、激励视频等）
-        ad_popup_keywords = ['ad_close', 'ad_button', 'full_screen', 'interstitial', 'reward', 'close_icon', 'close_btn']
-        
-        popup_candidates = []
-        has_mask_layer = False
-        mask_idx = -1
-        
-        for elem in all_elements:
-            x1, y1, x2, y2 = elem['bounds']
-            class_name = elem['class']
-            resource_id = elem['resource_id']
-            area_ratio = elem['area_ratio']
-            
-            # 检测遮罩层（大面积、几乎全屏、通常是 FrameLayout/View）
-            if area_ratio > 0.85 and elem['width'] >= screen_width * 0.95:
-                # 可能是遮罩层，记录位置
-                if 'FrameLayout' in class_name or 'View' in class_name:
-                    has_mask_layer = True
-                    mask_idx = elem['idx']
-            
-            # 先检查是否有强弹窗特征（用于后续判断）
-            has_strong_popup_feature = (
-                any(kw in class_name for kw in dialog_class_keywords) or
-                any(kw in resource_id.lower() for kw in dialog_id_keywords) or
-                any(kw in resource_id.lower() for kw in ad_popup_keywords)  # 广告弹窗关键词
-            )
-            
-            # 检查是否有子元素是关闭按钮（作为弹窗特征）
-            has_close_button_child = False
-            elem_bounds = elem['bounds']
-            for other_elem in all_elements:
-                if other_elem['idx'] == elem['idx']:
-                    continue
-                if other_elem['is_close_button']:
-                    # 检查关闭按钮是否在这个元素范围内
-                    ox1, oy1, ox2, oy2 = other_elem['bounds']
-                    ex1, ey1, ex2, ey2 = elem_bounds
-                    if ex1 <= ox1 and ey1 <= oy1 and ex2 >= ox2 and ey2 >= oy2:
-                        has_close_button_child = True
-                        break
-            
-            # 检查是否有右上角的 ImageView 关闭按钮（全屏广告页常见）
-            has_top_right_close = False
-            if area_ratio > 0.9:  # 全屏元素才检查
-                for other_elem in all_elements:
-                    if other_elem['idx'] == elem['idx']:
-                        continue
-                    # 检查是否是右上角的 ImageView
-                    ox1, oy1, ox2, oy2 = other_elem['bounds']
-                    o_center_x = other_elem['center_x']
-                    o_center_y = other_elem['center_y']
-                    o_width = other_elem['width']
-                    o_height = other_elem['height']
-                    o_class = other_elem['class']
-                    
-                    rel_x = o_center_x / screen_width
-                    rel_y = o_center_y / screen_height
-                    
-                    # 右上角的 ImageView（即使 clickable="false"）
-                    if ('Image' in o_class and
-                        rel_x > 0.85 and rel_y < 0.15 and
-                        15 <= o_width <= 120 and 15 <= o_height <= 120):
-                        # 检查是否在当前元素范围内或附近
-                        if (ex1 <= ox1 and ey1 <= oy1 and ex2 >= ox2 and ey2 >= oy2) or \
-                           (abs(ex2 - ox1) < 50 and abs(ey1 - oy2) < 50):  # 在元素右上角附近
-                            has_top_right_close = True
-                            break
-            
-            # 【特殊处理】全屏广告页：如果面积 > 90% 但有关闭按钮或广告特征，也识别为弹窗
-            is_fullscreen_ad = (
-                area_ratio > 0.9 and
-                (
-                    # 有关闭按钮作为子元素
-                    has_close_button_child or
-                    # 有右上角的 ImageView 关闭按钮
-                    has_top_right_close or
-                    # 有广告相关的强特征
-                    any(kw in resource_id.lower() for kw in ad_popup_keywords)
-                )
-            )
-            
-            # 如果不是全屏广告页，跳过全屏元素
-            if area_ratio > 0.9 and not is_fullscreen_ad:
-                continue
-            
-            # 跳过太小的元素
-            if area_ratio < 0.05:
-                continue
-            
-            # 跳过状态栏区域
-            if y1 < 50:
-                continue
-            
-            # 【非弹窗特征】如果元素包含底部导航栏（底部tab），则不是弹窗
-            # 底部导航栏通常在屏幕底部，高度约100-200像素
-            if y2 > screen_height * 0.85:
-                # 检查是否包含tab相关的resource-id或class
-                if 'tab' in resource_id.lower() or 'Tab' in class_name or 'navigation' in resource_id.lower():
-                    continue  # 跳过底部导航栏
-            
-            # 【非弹窗特征】如果元素包含顶部搜索栏，则不是弹窗
-            if y1 < screen_height * 0.15:
-                if 'search' in resource_id.lower() or 'Search' in class_name:
-                    continue  # 跳过顶部搜索栏
-            
-            # 【非弹窗特征】如果元素包含明显的页面内容特征，则不是弹窗
-            # 检查是否包含视频播放器、内容列表等页面元素
-            page_content_keywords = ['video', 'player', 'recycler', 'list', 'scroll', 'viewpager', 'fragment']
-            if any(kw in resource_id.lower() or kw in class_name.lower() for kw in page_content_keywords):
-                # 如果面积很大且没有强弹窗特征，则不是弹窗
-                if area_ratio > 0.6 and not has_strong_popup_feature:
-                    continue
-            
-            # 【非弹窗特征】如果元素面积过大（接近全屏），即使居中也不应该是弹窗
-            # 真正的弹窗通常不会超过屏幕的60%
-            # 对于面积 > 0.6 的元素，如果没有强特征，直接跳过（避免误判首页内容区域）
-            if area_ratio > 0.6 and not has_strong_popup_feature:
-                continue  # 跳过大面积非弹窗元素（接近全屏的内容区域，如首页视频播放区域）
-            
-            # 对于面积 > 0.7 的元素，即使有强特征也要更严格
-            if area_ratio > 0.7:
-                # 需要非常强的特征才认为是弹窗
-                if not has_strong_popup_feature:
-                    continue
-            
-            confidence = 0.0
-            
-            # 【强特征】class 名称包含弹窗关键词 (+0.5)
-            if any(kw in class_name for kw in dialog_class_keywords):
-                confidence += 0.5
-            
-            # 【强特征】resource-id 包含弹窗关键词 (+0.4)
-            if any(kw in resource_id.lower() for kw in dialog_id_keywords):
-                confidence += 0.4
-            
-            # 【强特征】resource-id 包含广告弹窗关键词 (+0.4)
-            if any(kw in resource_id.lower() for kw in ad_popup_keywords):
-                confidence += 0.4
-            
-            # 【强特征】包含关闭按钮作为子元素 (+0.3)
-            if has_close_button_child:
-                confidence += 0.3
-            
-            # 【强特征】全屏广告页且有右上角关闭按钮 (+0.4)
-            if is_fullscreen_ad and has_top_right_close:
-                confidence += 0.4
-            
-            # 【中等特征】居中显示 (+0.2)
-            # 但如果没有强特征，降低权重
-            center_x = elem['center_x']
-            center_y = elem['center_y']
-            is_centered_x = abs(center_x - screen_width / 2) < screen_width * 0.15
-            is_centered_y = abs(center_y - screen_height / 2) < screen_height * 0.25
-            
-            has_strong_feature = (
-                any(kw in class_name for kw in dialog_class_keywords) or
-                any(kw in resource_id.lower() for kw in dialog_id_keywords) or
-                any(kw in resource_id.lower() for kw in ad_popup_keywords) or
-                has_close_button_child or
-                (is_fullscreen_ad and has_top_right_close)  # 全屏广告页且有右上角关闭按钮
-            )
-            
-            if is_centered_x and is_centered_y:
-                if has_strong_feature:
-                    confidence += 0.2
-                else:
-                    confidence += 0.1  # 没有强特征时降低权重
-            elif is_centered_x:
-                if has_strong_feature:
-                    confidence += 0.1
-                else:
-                    confidence += 0.05  # 没有强特征时降低权重
-            
-            # 【中等特征】非全屏但有一定大小 (+0.15)
-            # 但如果没有强特征，降低权重
-            if 0.15 < area_ratio < 0.75:
-                if has_strong_feature:
-                    confidence += 0.15
-                else:
-                    confidence += 0.08  # 没有强特征时降低权重
-            
-            # 【弱特征】XML 顺序靠后（在视图层级上层）(+0.1)
-            if elem['idx'] > len(all_elements) * 0.5:
-                confidence += 0.1
-            
-            # 【弱特征】有遮罩层且在遮罩层之后 (+0.15)
-            if has_mask_layer and elem['idx'] > mask_idx:
-                confidence += 0.15
-            
-            # 只有达到阈值才加入候选
-            if confidence >= 0.3:
-                popup_candidates.append({
-                    'bounds': elem['bounds'],
-                    'confidence': confidence,
-                    'class': class_name,
-                    'resource_id': resource_id,
-                    'idx': elem['idx']
-                })
-        
-        if not popup_candidates:
+        popup = self._detect_popup(table, screen_width, screen_height)
+        if popup is None:
             return None, 0
-        
-        # 选择置信度最高的
-        popup_candidates.sort(key=lambda x: (x['confidence'], x['idx']), reverse=True)
-        best = popup_candidates[0]
-        
-        # 更严格的阈值：只有置信度 >= 0.7 才返回弹窗
-        # 如果没有强特征（class或resource-id包含弹窗关键词），需要更高的置信度
-        has_strong_feature = (
-            any(kw in best['class'] for kw in dialog_class_keywords) or
-            any(kw in best['resource_id'].lower() for kw in dialog_id_keywords) or
-            any(kw in best['resource_id'].lower() for kw in ad_popup_keywords)
-        )
-        
-        if has_strong_feature:
-            # 有强特征时，阈值0.7
-            threshold = 0.7
-        else:
-            # 没有强特征时，阈值0.85（更严格）
-            threshold = 0.85
-        
-        if best['confidence'] >= threshold:
-            return best['bounds'], best['confidence']
-        
-        return None, best['confidence']
+        if popup.detected:
+            return popup.bounds, popup.confidence
+        return None, popup.confidence
+    
+    def _detect_popup(self, table, screen_width: int, screen_height: int):
+        """弹窗检测，返回 PopupResult（弹窗子树根节点、置信度、子树内的关闭按钮）或 None"""
+        from .popup_analyzer import PopupAnalyzer
+        return PopupAnalyzer(table).detect(screen_width, screen_height)
     
     def start_toast_watch(self) -> Dict:
         """开始监听 Toast（仅 Android）
@@ -4061,12 +4167,17 @@ class BasicMobileToolsLite:
                         exists = True
                         match_type = "包含匹配"
             else:
-                # Android: 先尝试精确匹配
-                if self.client.u2(text=text).exists():
-                    exists = True
-                    match_type = "精确匹配"
-                # 再尝试包含匹配
-                elif self.client.u2(textContains=text).exists():
+                # Android: 基于控件树快照匹配（与 u2(text=...) / u2(textContains=...) 语义一致）
+                # 流式遍历，遇到精确匹配立即停止；只有包含匹配时才需要扫完整棵树
+                contains_found = False
+                for node in self._get_hierarchy().iter_nodes():
+                    if node.text == text:
+                        exists = True
+                        match_type = "精确匹配"
+                        break
+                    if not contains_found and text in node.text:
+                        contains_found = True
+                if not exists and contains_found:
                     exists = True
                     match_type = "包含匹配"
             
@@ -4461,15 +4572,17 @@ class BasicMobileToolsLite:
         try:
             from .template_matcher import TemplateMatcher
             
-            # 如果没有提供截图，先截图
+            # 如果没有提供截图，先截图（当前画面才能用控件树和历史点击确定优先搜索区域）
+            regions = None
             if screenshot_path is None:
                 screenshot_result = self.take_screenshot(description="模板匹配", compress=False)
                 screenshot_path = screenshot_result.get("screenshot_path")
                 if not screenshot_path:
                     return {"success": False, "error": "截图失败"}
+                regions = self._close_button_regions()
             
             matcher = TemplateMatcher()
-            result = matcher.find_close_buttons(screenshot_path, threshold)
+            result = matcher.find_close_buttons(screenshot_path, threshold, regions=regions)
             
             return result
             
@@ -4509,6 +4622,8 @@ class BasicMobileToolsLite:
             
             # 点击
             click_result = self.click_by_percent(x_percent, y_percent)
+            if click_result.get("success"):
+                self._remember_close_click()
             
             return {
                 "success": True,
@@ -4605,17 +4720,13 @@ class BasicMobileToolsLite:
             return {"success": False, "error": "iOS 暂不支持此功能"}
         
         try:
-            import xml.etree.ElementTree as ET
-            
             # ========== 第0步：先检测是否有弹窗 ==========
-            xml_string = self.client.u2.dump_hierarchy(compressed=False)
-            root = ET.fromstring(xml_string)
+            table = self._get_hierarchy().table
             
-            screen_width = self.client.u2.info.get('displayWidth', 1440)
-            screen_height = self.client.u2.info.get('displayHeight', 3200)
+            screen_width, screen_height = self._get_profile().screen_size(1440, 3200)
             
             popup_bounds, popup_confidence = self._detect_popup_with_confidence(
-                root, screen_width, screen_height
+                table, screen_width, screen_height
             )
             
             # 如果没有检测到弹窗，直接返回"无弹窗"
@@ -4635,21 +4746,16 @@ class BasicMobileToolsLite:
             
             close_candidates = []
             
-            for elem in root.iter():
-                text = elem.attrib.get('text', '').strip()
-                content_desc = elem.attrib.get('content-desc', '').strip()
-                clickable = elem.attrib.get('clickable', 'false') == 'true'
-                bounds_str = elem.attrib.get('bounds', '')
-                resource_id = elem.attrib.get('resource-id', '')
-                
-                if not bounds_str:
+            for node in table:
+                if not node.bounds:
                     continue
                 
-                match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-                if not match:
-                    continue
-                
-                x1, y1, x2, y2 = map(int, match.groups())
+                text = node.text.strip()
+                content_desc = node.content_desc.strip()
+                clickable = node.clickable
+                bounds_str = node.bounds_str
+                resource_id = node.resource_id
+                x1, y1, x2, y2 = node.bounds
                 width = x2 - x1
                 height = y2 - y1
                 cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
@@ -4673,9 +4779,6 @@ class BasicMobileToolsLite:
                 
                 # 小尺寸可点击元素（可能是 X 按钮）
                 if clickable and 30 < width < 200 and 30 < height < 200:
-                    screen_width = self.client.u2.info.get('displayWidth', 1440)
-                    screen_height = self.client.u2.info.get('displayHeight', 3200)
-                    
                     # 在屏幕右半边上半部分，很可能是 X
                     if cx > screen_width * 0.6 and cy < screen_height * 0.5:
                         score += 5
@@ -4718,6 +4821,8 @@ class BasicMobileToolsLite:
                 if app_check['switched']:
                     # 应用已跳转，说明弹窗去除失败，尝试返回目标应用
                     return_result = self._return_to_target_app()
+                else:
+                    self._remember_close_click()
                 
                 result["success"] = True
                 result["method"] = "控件树"
@@ -4751,7 +4856,10 @@ class BasicMobileToolsLite:
                 
                 if screenshot_path:
                     matcher = TemplateMatcher()
-                    match_result = matcher.find_close_buttons(screenshot_path, threshold=0.75)
+                    # 优先只搜索弹窗四角/底部等区域，找不到再全屏
+                    regions = self._close_button_regions(screen_width, screen_height, popup_bounds)
+                    match_result = matcher.find_close_buttons(screenshot_path, threshold=0.75,
+                                                              regions=regions)
                     
                     # 直接使用最佳匹配（已按置信度排序）
                     if match_result.get("success") and match_result.get("best_match"):
@@ -4768,6 +4876,8 @@ class BasicMobileToolsLite:
                         
                         if app_check['switched']:
                             return_result = self._return_to_target_app()
+                        else:
+                            self._remember_close_click()
                         
                         result["success"] = True
                         result["method"] = "模板匹配"
@@ -4803,32 +4913,70 @@ class BasicMobileToolsLite:
         except Exception as e:
             return {"success": False, "error": f"关闭弹窗失败: {e}"}
     
-    def _detect_popup_region(self, root) -> tuple:
+    def _close_button_regions(self, screen_width: int = 0, screen_height: int = 0,
+                              popup_bounds: Optional[tuple] = None) -> list:
+        """模板匹配的优先搜索区域：弹窗四角/正下方 + 屏幕右上角/底部中间 + 该应用配置和历史的关闭位置
+        
+        Returns:
+            区域列表（比例坐标），无法确定时返回空列表（全屏搜索）
+        """
+        try:
+            from .template_matcher import close_button_regions
+            from .dynamic_config import DynamicConfig
+            
+            if not screen_width or not screen_height:
+                screen_width, screen_height = self._get_profile().screen_size(1440, 3200)
+            
+            if popup_bounds is None:
+                popup_bounds, confidence = self._detect_popup_with_confidence(
+                    self._get_hierarchy().table, screen_width, screen_height
+                )
+                if confidence < 0.5:
+                    popup_bounds = None
+            
+            package = self._get_current_package()
+            configured = [tuple(p) for p in DynamicConfig.close_button_priors.get(package, [])] if package else []
+            learned = [
+                (op['x_percent'], op['y_percent']) for op in reversed(self.operation_history)
+                if op.get('purpose') == 'close_popup' and op.get('package') == package
+                and op.get('x_percent') and op.get('y_percent')
+            ]
+            # 配置的位置优先，其次是最近的成功点击；同一位置只算一次，每个应用最多 close_button_priors_max 个
+            points = []
+            for point in configured + learned:
+                if len(points) >= DynamicConfig.close_button_priors_max:
+                    break
+                if all(abs(point[0] - p[0]) > 1 or abs(point[1] - p[1]) > 1 for p in points):
+                    points.append(point)
+            return close_button_regions(screen_width, screen_height, popup_bounds, points)
+        except Exception:
+            return []
+    
+    def _remember_close_click(self):
+        """把刚记录的点击标记为"关闭弹窗"，之后模板匹配优先搜索该应用的这个位置"""
+        if self.operation_history and self.operation_history[-1].get('action') == 'click':
+            record = self.operation_history[-1]
+            record['purpose'] = 'close_popup'
+            record['package'] = self._get_current_package()
+    
+    def _detect_popup_region(self, table) -> tuple:
         """从控件树中检测弹窗区域
         
         Args:
-            root: 控件树根元素
+            table: 控件树节点表（NodeTable）
             
         Returns:
             弹窗边界 (x1, y1, x2, y2) 或 None
         """
-        import re
-        
-        screen_width = self.client.u2.info.get('displayWidth', 1440)
-        screen_height = self.client.u2.info.get('displayHeight', 3200)
+        screen_width, screen_height = self._get_profile().screen_size(1440, 3200)
         
         popup_candidates = []
         
-        for elem in root.iter():
-            bounds_str = elem.attrib.get('bounds', '')
-            if not bounds_str:
-                continue
-            
-            match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-            if not match:
+        for node in table:
+            if not node.bounds:
                 continue
             
-            x1, y1, x2, y2 = map(int, match.groups())
+            x1, y1, x2, y2 = node.bounds
             width = x2 - x1
             height = y2 - y1
             
@@ -4862,91 +5010,52 @@ class BasicMobileToolsLite:
         
         return None
 
-    def _auto_learn_template(self, screenshot_path: str, bounds: tuple, threshold: float = 0.6) -> str:
+    def _auto_learn_template(self, screenshot_path: str, bounds: tuple, threshold: float = 0.85) -> str:
         """自动学习：检查 X 按钮是否已在模板库，不在就添加
         
+        查重使用模板索引（感知哈希 + 缩略图相关系数，一次矩阵运算），
+        添加后超过模板库上限会自动淘汰从未命中的自动学习模板。
+        
         Args:
             screenshot_path: 截图路径
             bounds: X 按钮的边界 (x1, y1, x2, y2)
-            threshold: 判断是否已存在的阈值（高于此值认为已存在）
+            threshold: 判断是否已存在的阈值（与已有模板缩略图相关系数高于此值认为已存在）
             
         Returns:
             新模板名称，如果是新模板的话；已存在或失败返回 None
         """
         try:
             from .template_matcher import TemplateMatcher
-            from PIL import Image
-            import time
+            import cv2
             
             x1, y1, x2, y2 = bounds
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
             width = x2 - x1
             height = y2 - y1
             
             # 扩展一点边界，确保裁剪完整
             padding = max(10, int(max(width, height) * 0.2))
             
-            # 打开截图
-            img = Image.open(screenshot_path)
+            img = cv2.imread(screenshot_path)
+            if img is None:
+                return None
             
             # 裁剪 X 按钮区域
+            img_height, img_width = img.shape[:2]
             crop_x1 = max(0, x1 - padding)
             crop_y1 = max(0, y1 - padding)
-            crop_x2 = min(img.width, x2 + padding)
-            crop_y2 = min(img.height, y2 + padding)
-            
-            cropped = img.crop((crop_x1, crop_y1, crop_x2, crop_y2))
-            
-            # 保存临时文件用于匹配检查
-            temp_path = self.screenshot_dir / "temp_new_x.png"
-            cropped.save(str(temp_path))
-            
-            # 检查是否已在模板库中（用模板匹配检测相似度）
-            matcher = TemplateMatcher()
+            crop_x2 = min(img_width, x2 + padding)
+            crop_y2 = min(img_height, y2 + padding)
             
-            import cv2
-            new_img = cv2.imread(str(temp_path), cv2.IMREAD_GRAYSCALE)
-            if new_img is None:
+            cropped = img[crop_y1:crop_y2, crop_x1:crop_x2]
+            if cropped.size == 0:
                 return None
             
-            is_new = True
-            for template_file in matcher.template_dir.glob("*.png"):
-                template = cv2.imread(str(template_file), cv2.IMREAD_GRAYSCALE)
-                if template is None:
-                    continue
-                
-                # 将两个图都调整到合适大小，然后用小模板在大图中搜索
-                # 这样比较更接近实际匹配场景
-                
-                # 新图作为搜索区域（稍大一点）
-                new_resized = cv2.resize(new_img, (100, 100))
-                # 模板调整到较小尺寸
-                template_resized = cv2.resize(template, (60, 60))
-                
-                # 在新图中搜索模板
-                result = cv2.matchTemplate(new_resized, template_resized, cv2.TM_CCOEFF_NORMED)
-                _, max_val, _, _ = cv2.minMaxLoc(result)
-                
-                if max_val >= threshold:
-                    is_new = False
-                    break
-            
-            # 清理临时文件
-            if temp_path.exists():
-                temp_path.unlink()
+            matcher = TemplateMatcher()
+            result = matcher.learn_template(cropped, threshold)
             
-            if is_new:
-                # 生成唯一模板名
-                timestamp = time.strftime("%m%d_%H%M%S")
-                template_name = f"auto_x_{timestamp}.png"
-                template_path = matcher.template_dir / template_name
-                
-                # 保存新模板
-                cropped.save(str(template_path))
-                
-                return template_name
-            else:
-                return None  # 已存在类似模板
+            if result.get("learned"):
+                return f"{result['template_name']}.png"
+            return None  # 已存在类似模板
                 
         except Exception as e:
             return None  # 学习失败，不影响主流程
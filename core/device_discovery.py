@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备发现 - 并发查询 adb / usbmux / simctl，缓存设备列表并通知变化
+
+功能：
+1. 扫描：adb devices、tidevice（usbmux）、xcrun simctl 三个来源并发查询（asyncio 子进程 / 线程），
+   总耗时取最慢的一个，而不是依次相加
+2. 缓存：列出设备、检测平台都直接读缓存（毫秒级），后台线程按 DynamicConfig.device_discovery_ttl 定期刷新；
+   只有进程内第一次读取且还没扫描完成时才等待一次
+3. 变化通知：设备接入 / 断开 / 健康状态变化时回调订阅者
+4. 健康探测：已连接的设备并行做轻量探测（Android: u2 info，iOS: WDA status），结果随设备列表返回
+5. 某个来源失败（超时、命令不存在）时保留该来源上一次的结果，不会误报设备断开
+
+用法:
+    discovery = get_discovery()
+    discovery.start()                              # 服务启动时调用，后台扫描，不阻塞
+    devices = discovery.devices("android")         # 读缓存
+    discovery.subscribe(lambda event, device: ...) # event: added / removed / changed
+    discovery.attach_client(device_id, client, lock)  # 连接后登记（带设备锁），参与健康探测
+    discovery.stats()                              # 各来源耗时、扫描次数、缓存命中次数
+"""
+import asyncio
+import json
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .dynamic_config import DynamicConfig
+
+
+# 各来源的超时（秒）
+ADB_TIMEOUT = 5.0
+USBMUX_TIMEOUT = 10.0
+SIMCTL_TIMEOUT = 10.0
+
+# 健康探测超时（秒）
+PROBE_TIMEOUT = 5.0
+
+# 健康探测等待设备锁的时间（秒）：设备正在执行工具时跳过本轮探测，不和工具抢同一个 u2 连接
+PROBE_LOCK_TIMEOUT = 0.5
+
+# 第一次读取时最多等待扫描完成的时间（秒）
+FIRST_SCAN_WAIT = max(ADB_TIMEOUT, USBMUX_TIMEOUT, SIMCTL_TIMEOUT) + 1.0
+
+# 设备字段中参与"是否变化"比较的字段（不含探测耗时等易变字段）
+_COMPARE_FIELDS = ("platform", "type", "state", "name", "healthy")
+
+
+class DeviceDiscoveryService:
+    """
+    进程级设备发现缓存（通过 get_discovery() 获取共享实例）
+
+    扫描在独立线程的事件循环中执行，读取只访问内存，可在任意线程调用。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._devices: Dict[str, Dict] = {}          # device_id -> 设备信息（含 source）
+        self._sources: Dict[str, Dict] = {}          # 来源 -> {ms, count, error}
+        self._clients: Dict[str, tuple] = {}         # device_id -> (已连接的 MobileClient, 设备锁或 None)
+        self._listeners: List[Callable[[str, Dict], None]] = []
+        self._updated_at = 0.0
+        self._adb_path: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None  # 探测 / usbmux 查询线程（超时的调用不阻塞扫描结束）
+
+        self._scanning = False
+        self._scan_done = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # 统计
+        self._scans = 0
+        self._hits = 0
+        self._last_scan_ms = 0.0
+
+    # ==================== 读取 ====================
+
+    def devices(self, platform: Optional[str] = None) -> List[Dict]:
+        """
+        缓存中的设备列表（不访问设备）
+
+        Args:
+            platform: "android" / "ios"，None 表示全部
+        """
+        if not self._scan_done.is_set():
+            self.refresh(wait=True, timeout=FIRST_SCAN_WAIT)
+        elif self.age >= DynamicConfig.device_discovery_ttl and not self.polling:
+            self.refresh()
+        with self._lock:
+            self._hits += 1
+            return [dict(d) for d in self._devices.values()
+                    if platform is None or d.get('platform') == platform]
+
+    def platform_of(self, device_id: Optional[str] = None) -> Optional[str]:
+        """
+        设备所在平台（未找到返回 None）
+
+        Args:
+            device_id: 设备ID，None 表示"自动选择"：有 iOS 设备时返回 "ios"（与原检测逻辑一致）
+        """
+        devices = self.devices()
+        if device_id is None:
+            return "ios" if any(d.get('platform') == "ios" for d in devices) else None
+        for d in devices:
+            if d.get('id') == device_id:
+                return d.get('platform')
+        return None
+
+    def is_healthy(self, device_id: Optional[str], max_age: Optional[float] = None) -> bool:
+        """最近一次健康探测是否通过（max_age 秒内，None 使用 device_discovery_ttl）"""
+        if not device_id:
+            return False
+        ttl = DynamicConfig.device_discovery_ttl if max_age is None else max_age
+        with self._lock:
+            device = self._devices.get(device_id)
+            return bool(device and device.get('healthy')
+                        and time.time() - device.get('checked_at', 0) < ttl)
+
+    @property
+    def age(self) -> float:
+        """缓存年龄（秒），从未扫描时为无穷大"""
+        return time.time() - self._updated_at if self._updated_at else float("inf")
+
+    @property
+    def polling(self) -> bool:
+        return self._poller is not None and self._poller.is_alive()
+
+    # ==================== 刷新 ====================
+
+    def refresh(self, wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        在后台线程扫描一次（已有扫描在进行时不重复启动）
+
+        Args:
+            wait: 是否等待扫描完成
+            timeout: 等待的最长时间（秒）
+
+        Returns:
+            wait=True 时返回是否在超时前完成；否则返回 True
+        """
+        with self._lock:
+            if not self._scanning:
+                self._scanning = True
+                self._scan_done.clear()
+                threading.Thread(target=self._scan_thread, name="device-discovery", daemon=True).start()
+        if wait:
+            return self._scan_done.wait(timeout)
+        return True
+
+    def start(self):
+        """启动后台定期扫描（立即返回；重复调用无副作用）"""
+        with self._lock:
+            if self.polling:
+                return
+            self._stop.clear()
+            self._poller = threading.Thread(target=self._poll_loop, name="device-discovery-poller", daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        """停止后台定期扫描"""
+        self._stop.set()
+
+    async def scan(self) -> List[Dict]:
+        """并发查询所有来源并探测已连接设备的健康状态，更新缓存并通知变化"""
+        start = time.time()
+        ios_enabled = self._ios_enabled()
+        sources = {
+            "adb": self._scan_adb(),
+            "usbmux": self._scan_usbmux() if ios_enabled else self._skip(),
+            "simctl": self._scan_simctl() if ios_enabled and shutil.which("xcrun") else self._skip(),
+        }
+        results = await asyncio.gather(*sources.values())
+
+        found: Dict[str, Dict] = {}
+        source_stats: Dict[str, Dict] = {}
+        with self._lock:
+            previous = {k: dict(v) for k, v in self._devices.items()}
+        for source, (devices, ms, error) in zip(sources, results):
+            if error is not None:
+                # 来源失败：沿用上一次的结果
+                devices = [dict(d) for d in previous.values() if d.get('source') == source]
+            for device in devices:
+                device['source'] = source
+                found.setdefault(device['id'], device)
+            source_stats[source] = {"ms": round(ms), "count": len(devices), "error": error}
+
+        await self._probe(found)
+
+        with self._lock:
+            self._devices = found
+            self._sources = source_stats
+            self._updated_at = time.time()
+            self._scans += 1
+            self._last_scan_ms = (time.time() - start) * 1000
+        self._notify(previous, found)
+        return [dict(d) for d in found.values()]
+
+    # ==================== 订阅 / 已连接设备 ====================
+
+    def subscribe(self, callback: Callable[[str, Dict], None]) -> Callable[[], None]:
+        """
+        订阅设备变化
+
+        Args:
+            callback: callback(event, device)，event 为 added / removed / changed（在扫描线程中调用）
+
+        Returns:
+            取消订阅的函数
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+    def attach_client(self, device_id: Optional[str], client, lock=None):
+        """
+        登记已连接设备的客户端，之后每次扫描对它做健康探测
+
+        Args:
+            lock: 该设备的工具锁（threading.Lock）；探测前限时获取，拿不到（设备正忙）就跳过本轮
+        """
+        if not device_id or client is None:
+            return
+        with self._lock:
+            self._clients[device_id] = (client, lock)
+
+    def detach_client(self, device_id: Optional[str]):
+        """连接断开 / 重连前移除登记"""
+        with self._lock:
+            self._clients.pop(device_id, None)
+            device = self._devices.get(device_id)
+            if device is not None:
+                for key in ("healthy", "checked_at", "probe_ms"):
+                    device.pop(key, None)
+
+    # ==================== 统计 ====================
+
+    def stats(self) -> Dict:
+        """各来源耗时、扫描次数、缓存命中次数"""
+        with self._lock:
+            age = self.age
+            return {
+                "devices": len(self._devices),
+                "scans": self._scans,
+                "hits": self._hits,
+                "last_scan_ms": round(self._last_scan_ms),
+                "age": round(age, 1) if age != float("inf") else None,
+                "polling": self.polling,
+                "sources": {k: dict(v) for k, v in self._sources.items()},
+                "probed": len(self._clients),
+            }
+
+    # ==================== 内部实现：扫描 ====================
+
+    def _scan_thread(self):
+        try:
+            asyncio.run(self.scan())
+        except Exception as e:
+            print(f"  ⚠️ 设备扫描失败: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._scanning = False
+            self._scan_done.set()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            self.refresh(wait=True, timeout=FIRST_SCAN_WAIT)
+            self._stop.wait(max(0.5, DynamicConfig.device_discovery_ttl))
+
+    @staticmethod
+    async def _skip():
+        return [], 0.0, None
+
+    @staticmethod
+    async def _run(cmd: List[str], timeout: float) -> str:
+        """执行命令并返回 stdout（超时终止进程）"""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise RuntimeError(f"{cmd[0]} 超时（{timeout:.0f}s）")
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.decode(errors='ignore').strip() or f"{cmd[0]} 返回 {proc.returncode}")
+        return stdout.decode(errors='ignore')
+
+    async def _scan_adb(self):
+        start = time.time()
+        try:
+            if self._adb_path is None:
+                from .device_manager import DeviceManager
+                loop = asyncio.get_running_loop()
+                self._adb_path = await loop.run_in_executor(None, lambda: DeviceManager().adb_path)
+            output = await self._run([self._adb_path, "devices"], ADB_TIMEOUT)
+        except Exception as e:
+            return [], (time.time() - start) * 1000, str(e)
+
+        devices = []
+        for line in output.strip().split('\n')[1:]:  # 跳过第一行标题
+            parts = line.strip().split('\t')
+            if len(parts) >= 2 and parts[1].strip() == 'device':  # 只返回已连接的设备
+                device_id = parts[0].strip()
+                devices.append({
+                    'id': device_id,
+                    'status': 'device',
+                    'platform': 'android',
+                    'type': 'emulator' if device_id.startswith('emulator-') else 'device',
+                    'state': 'connected',
+                })
+        return devices, (time.time() - start) * 1000, None
+
+    async def _scan_usbmux(self):
+        start = time.time()
+
+        def list_usbmux():
+            import tidevice
+            return [(d.udid, getattr(d, 'name', None) or 'iOS Device') for d in tidevice.Usbmux().device_list()]
+
+        try:
+            loop = asyncio.get_running_loop()
+            found = await asyncio.wait_for(loop.run_in_executor(self._get_executor(), list_usbmux), USBMUX_TIMEOUT)
+        except ImportError:
+            return [], (time.time() - start) * 1000, None  # 未安装 tidevice：没有 iOS 真机来源
+        except Exception as e:
+            return [], (time.time() - start) * 1000, str(e) or type(e).__name__
+        devices = [{
+            'id': udid,
+            'name': name,
+            'platform': 'ios',
+            'type': 'device',
+            'state': 'connected',
+        } for udid, name in found]
+        return devices, (time.time() - start) * 1000, None
+
+    async def _scan_simctl(self):
+        start = time.time()
+        try:
+            output = await self._run(['xcrun', 'simctl', 'list', 'devices', 'booted', '--json'], SIMCTL_TIMEOUT)
+            data = json.loads(output) if output.strip() else {}
+        except Exception as e:
+            return [], (time.time() - start) * 1000, str(e)
+        devices = []
+        for runtime, sims in data.get('devices', {}).items():
+            for sim in sims:
+                if sim.get('state') == 'Booted':
+                    devices.append({
+                        'id': sim.get('udid', ''),
+                        'name': sim.get('name', 'Simulator'),
+                        'platform': 'ios',
+                        'type': 'simulator',
+                        'runtime': runtime,
+                        'state': 'Booted',
+                    })
+        return devices, (time.time() - start) * 1000, None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="device-probe")
+            return self._executor
+
+    @staticmethod
+    def _ios_enabled() -> bool:
+        try:
+            from mobile_mcp.config import Config
+            return Config.IOS_SUPPORT_ENABLED
+        except ImportError:
+            return True
+
+    # ==================== 内部实现：健康探测 ====================
+
+    async def _probe(self, found: Dict[str, Dict]):
+        """已登记客户端且仍在列表中的设备并行探测（每台设备一个线程）"""
+        with self._lock:
+            clients = {k: v for k, v in self._clients.items() if k in found}
+        if not clients:
+            return
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        ids = list(clients)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(loop.run_in_executor(executor, self._probe_client, *clients[i]), PROBE_TIMEOUT)
+              for i in ids),
+            return_exceptions=True)
+        now = time.time()
+        with self._lock:
+            previous = {i: dict(self._devices.get(i) or {}) for i in ids}
+        for device_id, result in zip(ids, results):
+            if result is None:
+                # 设备正忙，沿用上一次的探测结果（checked_at 不更新，过期后按连接检查处理）
+                for key in ("healthy", "checked_at", "probe_ms"):
+                    if key in previous[device_id]:
+                        found[device_id][key] = previous[device_id][key]
+                continue
+            healthy, ms = (False, PROBE_TIMEOUT * 1000) if isinstance(result, BaseException) else result
+            found[device_id].update(healthy=healthy, probe_ms=round(ms), checked_at=now)
+
+    @staticmethod
+    def _probe_client(client, lock=None):
+        """
+        轻量探测：Android 读 u2 info（顺带刷新设备信息缓存），iOS 读 WDA status
+
+        持有设备锁时探测，和工具调用串行；设备正忙（限时拿不到锁）返回 None。
+        """
+        if lock is not None and not lock.acquire(timeout=PROBE_LOCK_TIMEOUT):
+            return None
+        start = time.time()
+        try:
+            if getattr(client, 'platform', 'android') == 'ios':
+                ios_client = getattr(client, '_ios_client', None)
+                wda = getattr(ios_client, 'wda', None) or getattr(client, 'wda', None)
+                if wda is None:
+                    return False, 0.0
+                wda.status()
+            else:
+                profile = getattr(client, 'profile', None)
+                if profile is not None:
+                    profile.refresh()
+                else:
+                    client.u2.info
+            return True, (time.time() - start) * 1000
+        except Exception:
+            return False, (time.time() - start) * 1000
+        finally:
+            if lock is not None:
+                lock.release()
+
+    # ==================== 内部实现：变化通知 ====================
+
+    def _notify(self, previous: Dict[str, Dict], current: Dict[str, Dict]):
+        events = []
+        for device_id, device in current.items():
+            old = previous.get(device_id)
+            if old is None:
+                events.append(("added", device))
+            elif any(old.get(k) != device.get(k) for k in _COMPARE_FIELDS):
+                events.append(("changed", device))
+        for device_id, device in previous.items():
+            if device_id not in current:
+                events.append(("removed", device))
+        if not events:
+            return
+
+        with self._lock:
+            listeners = list(self._listeners)
+        for event, device in events:
+            if event != "changed":
+                icon = "🔌" if event == "added" else "⏏️"
+                print(f"  {icon} 设备{'接入' if event == 'added' else '断开'}: {device['id']} ({device.get('platform')})",
+                      file=sys.stderr)
+            for callback in listeners:
+                try:
+                    callback(event, dict(device))
+                except Exception as e:
+                    print(f"  ⚠️ 设备变化回调失败: {e}", file=sys.stderr)
+
+
+_discovery: Optional[DeviceDiscoveryService] = None
+_discovery_guard = threading.Lock()
+
+
+def get_discovery() -> DeviceDiscoveryService:
+    """进程内共享的设备发现服务"""
+    global _discovery
+    with _discovery_guard:
+        if _discovery is None:
+            _discovery = DeviceDiscoveryService()
+        return _discovery
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备信息缓存 - 按设备缓存屏幕尺寸、方向、密度、系统版本、型号和前台应用
+
+功能：
+1. 工具换算坐标时不再每次读 u2.info / u2.window_size()（每次都是一次到设备端 agent 的 HTTP 请求）
+2. 旋转时刷新：控件树 dump 的根节点带 rotation 属性，与缓存不一致时重新读取
+3. 切换 App 时刷新：点击、按键、启动/停止 App 等操作后前台包名失效（另按控件树快照的 TTL 过期）
+4. TTL 兜底（DynamicConfig.device_profile_ttl），并统计省下的请求次数
+
+用法:
+    w, h = client.profile.screen_size()       # displayWidth / displayHeight
+    w, h = client.profile.window_size()       # 同 u2.window_size()（按当前方向）
+    pkg = client.profile.current_package()    # 前台包名 / Bundle ID
+    info = client.profile.get().to_dict()     # 完整信息（含 density / sdk / model）
+    client.profile.notify("launch_app")       # 页面/前台应用可能变化
+    client.profile.stats()                    # 命中次数、实际请求次数、省下的请求次数
+"""
+import re
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .dynamic_config import DynamicConfig
+
+
+# 控件树根节点的旋转属性：<hierarchy rotation="1">
+_ROTATION_RE = re.compile(r'<hierarchy[^>]*\brotation="(\d)"')
+
+# 会改变屏幕方向的操作（显示信息失效）
+ROTATION_REASONS = {"rotation", "orientation"}
+
+
+class DeviceProfile:
+    """一次读取的设备信息（只读）"""
+
+    __slots__ = ("platform", "display_width", "display_height", "rotation", "density",
+                 "sdk", "model", "brand", "timestamp")
+
+    def __init__(self, platform: str, display_width: int, display_height: int, rotation: int = 0,
+                 density: Optional[int] = None, sdk: Optional[int] = None,
+                 model: str = "", brand: str = ""):
+        self.platform = platform
+        self.display_width = display_width
+        self.display_height = display_height
+        self.rotation = rotation
+        self.density = density
+        self.sdk = sdk
+        self.model = model
+        self.brand = brand
+        self.timestamp = time.time()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    @property
+    def landscape(self) -> bool:
+        return self.rotation in (1, 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            "platform": self.platform,
+            "width": self.display_width,
+            "height": self.display_height,
+            "rotation": self.rotation,
+            "density": self.density,
+            "sdk": self.sdk,
+            "model": self.model,
+            "brand": self.brand,
+        }
+
+
+class DeviceProfileService:
+    """
+    设备级设备信息缓存
+
+    每个 MobileClient 持有一个实例（client.profile）。显示信息（尺寸/方向/密度）按 TTL 复用，
+    旋转时刷新；前台包名在会改变页面的操作后失效，和控件树快照一样只短暂复用；型号、品牌只读一次。
+    """
+
+    def __init__(self, mobile_client):
+        self.client = mobile_client
+        self._lock = threading.RLock()
+        self._profile: Optional[DeviceProfile] = None
+        self._static: Optional[Dict] = None  # 型号 / 品牌（连接期间不变）
+        self._package: Optional[str] = None
+        self._package_at = 0.0
+        self._package_valid = False
+
+        # 统计
+        self._hits = 0
+        self._rpcs = 0
+        self._refreshes = 0
+        self._invalidations = 0
+        self._last_invalidate_reason = ""
+
+    # ==================== 读取 ====================
+
+    def get(self, max_age: Optional[float] = None) -> DeviceProfile:
+        """
+        获取设备信息（命中缓存则不访问设备）
+
+        Args:
+            max_age: 可接受的最大年龄（秒），None 使用 DynamicConfig 中的 TTL；传 0 表示强制刷新
+        """
+        ttl = DynamicConfig.device_profile_ttl if max_age is None else max_age
+        with self._lock:
+            profile = self._profile
+            if profile is not None and profile.age < ttl:
+                self._hits += 1
+                return profile
+            return self._fetch()
+
+    def refresh(self) -> DeviceProfile:
+        """强制从设备重新读取（读取失败时抛出异常，可兼作连接检查）"""
+        with self._lock:
+            return self._fetch()
+
+    def screen_size(self, default_width: int = 0, default_height: int = 0) -> Tuple[int, int]:
+        """屏幕尺寸（Android: displayWidth/displayHeight；iOS: window_size）"""
+        profile = self.get()
+        return profile.display_width or default_width, profile.display_height or default_height
+
+    def window_size(self) -> Tuple[int, int]:
+        """按当前方向的窗口尺寸（与 u2.window_size() 一致：横屏时宽 > 高）"""
+        profile = self.get()
+        w, h = profile.display_width, profile.display_height
+        if profile.platform == "android" and w != h and (w > h) != profile.landscape:
+            w, h = h, w
+        return w, h
+
+    def current_package(self, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        前台应用包名 / Bundle ID（读取失败返回 None）
+
+        Args:
+            max_age: 可接受的最大年龄（秒），None 与控件树快照相同（DynamicConfig.hierarchy_snapshot_ttl）；
+                     轮询等待 App 切换时传 0
+        """
+        ttl = DynamicConfig.hierarchy_snapshot_ttl if max_age is None else max_age
+        with self._lock:
+            if self._package_valid and time.time() - self._package_at < ttl:
+                self._hits += 1
+                return self._package
+            try:
+                self._rpcs += 1
+                if self._is_ios():
+                    wda = self._wda()
+                    package = wda.session().app_current().get('bundleId') if wda else None
+                else:
+                    package = self.client.u2.app_current().get('package')
+            except Exception:
+                return None
+            self._set_package(package)
+            return package
+
+    @property
+    def last_package(self) -> Optional[str]:
+        """最近一次读到的前台包名（可能已过期，不访问设备）"""
+        return self._package
+
+    def static_info(self) -> Dict:
+        """型号、品牌等不变信息（只读一次）"""
+        with self._lock:
+            if self._static is not None:
+                self._hits += 1
+                return self._static
+            static = {"model": "", "brand": ""}
+            try:
+                if not self._is_ios():
+                    self._rpcs += 1
+                    info = self.client.u2.device_info or {}
+                    static = {"model": info.get('model', ''), "brand": info.get('brand', '')}
+            except Exception as e:
+                print(f"  ⚠️ 读取设备型号失败: {e}", file=sys.stderr)
+            self._static = static
+            return static
+
+    # ==================== 刷新信号 ====================
+
+    def observe_hierarchy(self, xml: str):
+        """从新 dump 的控件树读取旋转角度，和缓存不一致时使显示信息失效（不额外访问设备）"""
+        match = _ROTATION_RE.search(xml, 0, 512)
+        if not match:
+            return
+        with self._lock:
+            profile = self._profile
+            if profile is not None and profile.platform == "android" and profile.rotation != int(match.group(1)):
+                self._profile = None
+                self._invalidations += 1
+                self._last_invalidate_reason = "rotation"
+
+    def notify(self, reason: str = ""):
+        """
+        页面可能已变化：前台包名失效；旋转类操作同时使显示信息失效
+
+        Args:
+            reason: 操作名（如 click / launch_app / rotation），用于统计和判断失效范围
+        """
+        with self._lock:
+            if self._package_valid or (reason in ROTATION_REASONS and self._profile is not None):
+                self._invalidations += 1
+                self._last_invalidate_reason = reason
+            self._package_valid = False
+            if reason in ROTATION_REASONS:
+                self._profile = None
+
+    def invalidate(self, reason: str = ""):
+        """使所有信息失效（重新连接设备等）"""
+        with self._lock:
+            if self._profile is not None or self._package_valid or self._static is not None:
+                self._invalidations += 1
+            self._profile = None
+            self._static = None
+            self._package_valid = False
+            self._last_invalidate_reason = reason
+
+    # ==================== 统计 ====================
+
+    def stats(self) -> Dict:
+        """命中 / 请求次数统计（每次命中省下一次设备请求）"""
+        with self._lock:
+            profile = self._profile
+            return {
+                "hits": self._hits,
+                "rpcs": self._rpcs,
+                "avoided_rpcs": self._hits,
+                "refreshes": self._refreshes,
+                "invalidations": self._invalidations,
+                "last_invalidate_reason": self._last_invalidate_reason,
+                "profile_age": round(profile.age, 1) if profile is not None else None,
+            }
+
+    def reset_stats(self):
+        """清空统计"""
+        with self._lock:
+            self._hits = 0
+            self._rpcs = 0
+            self._refreshes = 0
+            self._invalidations = 0
+            self._last_invalidate_reason = ""
+            print("  🧹 设备信息缓存统计已清空", file=sys.stderr)
+
+    # ==================== 内部实现 ====================
+
+    def _is_ios(self) -> bool:
+        return getattr(self.client, 'platform', 'android') == 'ios'
+
+    def _wda(self):
+        ios_client = getattr(self.client, '_ios_client', None)
+        if ios_client is not None and getattr(ios_client, 'wda', None):
+            return ios_client.wda
+        return getattr(self.client, 'wda', None)
+
+    def _fetch(self) -> DeviceProfile:
+        """从设备读取显示信息（调用方持有锁）"""
+        self._rpcs += 1
+        self._refreshes += 1
+        static = self._static or {}
+        if self._is_ios():
+            wda = self._wda()
+            if wda is None:
+                raise RuntimeError("iOS未初始化")
+            size = wda.window_size()
+            width, height = size[0], size[1]
+            profile = DeviceProfile("ios", width, height, rotation=0 if height >= width else 1)
+        else:
+            info = self.client.u2.info or {}
+            width = info.get('displayWidth', 0)
+            height = info.get('displayHeight', 0)
+            dp_x = info.get('displaySizeDpX')
+            density = round(width * 160 / dp_x) if width and dp_x else None
+            profile = DeviceProfile(
+                "android", width, height,
+                rotation=info.get('displayRotation', 0) or 0,
+                density=density,
+                sdk=info.get('sdkInt'),
+                model=static.get('model', '') or info.get('productName', ''),
+                brand=static.get('brand', ''),
+            )
+        self._profile = profile
+        return profile
+
+    def _set_package(self, package: Optional[str]):
+        self._package = package
+        self._package_at = time.time()
+        self._package_valid = package is not None
@@ -14,7 +14,7 @@
 - 运行时可修改（无需重启）
 """
 import sys
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 
 class DynamicConfig:
@@ -41,6 +41,18 @@ class DynamicConfig:
     # 页面变化检测超时（秒）
     page_change_timeout: float = 2.0
     
+    # 自适应等待：按 应用×动作 学习页面稳定时间，上面的固定等待时间只作为上限
+    adaptive_wait_enabled: bool = True
+    
+    # 取学到的稳定耗时的哪个分位数作为等待时间
+    adaptive_wait_percentile: float = 0.9
+    
+    # 样本数达到多少后才按学到的时间等待（之前都观察页面稳定）
+    adaptive_wait_min_samples: int = 5
+    
+    # 每等待多少次重新观察一次（0 = 学到后不再观察）
+    adaptive_wait_explore_every: int = 10
+    
     # ==================== 验证策略 ====================
     
     # 是否验证点击操作
@@ -80,11 +92,40 @@ class DynamicConfig:
     # 最多点击多少个关闭按钮（避免误点击）
     max_close_buttons: int = 1
     
+    # 模板匹配并行线程数（按 模板×尺度 分片；0/1 = 串行）
+    template_match_workers: int = 4
+    
+    # 各应用关闭按钮位置先验 {包名: [[x百分比, y百分比], ...]}，模板匹配优先搜索这些位置附近
+    close_button_priors: Dict[str, List[List[float]]] = {}
+    
+    # 每个应用最多保留的关闭按钮位置（配置 + 最近成功点击，超出部分丢弃，避免搜索区域越积越多）
+    close_button_priors_max: int = 8
+    
+    # 模板库上限（超过后淘汰从未命中/最久未命中的自动学习模板）
+    template_library_max: int = 60
+    
     # ==================== 截图策略 ====================
     
     # 截图策略：always(总是), on_failure(失败时), never(从不), smart(智能)
     screenshot_strategy: str = "smart"
     
+    # 压缩截图格式：jpeg / webp
+    screenshot_format: str = "jpeg"
+    
+    # 缩放滤镜：lanczos(最清晰) / bicubic / bilinear(快) / reduce(整数倍快速缩小 + bilinear)
+    screenshot_resample: str = "lanczos"
+    
+    # PNG 压缩级别（0-9）- 截图 PNG 只是中间产物，1 级速度最快、体积可接受
+    screenshot_png_compress_level: int = 1
+    
+    # 图片处理池（所有设备的截图缩放 + 编码共用；增量截图的各个变化区域并行编码）：
+    # worker 数（0 = 全部在请求线程处理）和类型 thread / process
+    screenshot_workers: int = 2
+    screenshot_worker_mode: str = "thread"
+    
+    # 截图去重：原始帧摘要一致（标注依赖控件树时页面指纹也一致）才复用上次结果
+    screenshot_dedup: bool = True
+    
     # ==================== 重试策略 ====================
     
     # 操作失败时的最大重试次数
@@ -93,6 +134,33 @@ class DynamicConfig:
     # 重试间隔（秒）
     retry_delay: float = 1.0
     
+    # ==================== 控件树快照 ====================
+    
+    # 控件树快照最长复用时间（秒）- 操作后会主动失效，TTL 只是兜底
+    hierarchy_snapshot_ttl: float = 1.0
+    
+    # ==================== 快速点击 ====================
+    
+    # click_by_text 直接点快照中控件的中心，不再让设备端用选择器重新搜索控件树（默认关闭：
+    # 开启后点击改为按坐标，且按学到的时间等待时结果不带 page_texts）
+    fast_click: bool = False
+    
+    # 快速点击前先用设备端选择器确认控件仍在（多一次设备端搜索，页面变化频繁时开启）
+    fast_click_verify_selector: bool = False
+    
+    # ==================== 设备信息缓存 ====================
+    
+    # 屏幕尺寸/方向/密度等设备信息最长复用时间（秒）- 旋转、切换 App 时会主动刷新，TTL 只是兜底
+    device_profile_ttl: float = 60.0
+    
+    # 设备列表缓存的刷新间隔（秒）- 后台定期扫描 adb / usbmux / simctl，列出设备时直接读缓存
+    device_discovery_ttl: float = 5.0
+    
+    # ==================== 页面变化事件 ====================
+    
+    # 是否订阅无障碍事件判断页面变化（Android）- 关闭或不可用时退回 dump 轮询
+    page_events_enabled: bool = True
+    
     # ==================== 配置管理 ====================
     
     @classmethod
@@ -136,6 +204,18 @@ class DynamicConfig:
             if "page_change_timeout" in wait:
                 cls.page_change_timeout = float(wait["page_change_timeout"])
                 updated.append(f"page_change_timeout={cls.page_change_timeout}")
+            if "adaptive" in wait:
+                cls.adaptive_wait_enabled = bool(wait["adaptive"])
+                updated.append(f"adaptive_wait_enabled={cls.adaptive_wait_enabled}")
+            if "adaptive_percentile" in wait:
+                cls.adaptive_wait_percentile = min(1.0, max(0.0, float(wait["adaptive_percentile"])))
+                updated.append(f"adaptive_wait_percentile={cls.adaptive_wait_percentile}")
+            if "adaptive_min_samples" in wait:
+                cls.adaptive_wait_min_samples = int(wait["adaptive_min_samples"])
+                updated.append(f"adaptive_wait_min_samples={cls.adaptive_wait_min_samples}")
+            if "adaptive_explore_every" in wait:
+                cls.adaptive_wait_explore_every = int(wait["adaptive_explore_every"])
+                updated.append(f"adaptive_wait_explore_every={cls.adaptive_wait_explore_every}")
         
         # 处理验证策略
         if "verify_strategy" in config:
@@ -162,6 +242,21 @@ class DynamicConfig:
             if "max_close_buttons" in ad:
                 cls.max_close_buttons = int(ad["max_close_buttons"])
                 updated.append(f"max_close_buttons={cls.max_close_buttons}")
+            if "template_match_workers" in ad:
+                cls.template_match_workers = int(ad["template_match_workers"])
+                updated.append(f"template_match_workers={cls.template_match_workers}")
+            if "close_button_priors_max" in ad:
+                cls.close_button_priors_max = max(0, int(ad["close_button_priors_max"]))
+                updated.append(f"close_button_priors_max={cls.close_button_priors_max}")
+            if "close_button_priors" in ad:
+                cls.close_button_priors = {
+                    package: [list(p) for p in points][:cls.close_button_priors_max]
+                    for package, points in dict(ad["close_button_priors"]).items()
+                }
+                updated.append(f"close_button_priors={list(cls.close_button_priors)}")
+            if "template_library_max" in ad:
+                cls.template_library_max = int(ad["template_library_max"])
+                updated.append(f"template_library_max={cls.template_library_max}")
         
         # 处理重试策略
         if "retry_strategy" in config:
@@ -180,6 +275,18 @@ class DynamicConfig:
             "screen_orientation": (str, "screen_orientation"),
             "lock_screen_orientation": (bool, "lock_screen_orientation"),
             "screenshot_strategy": (str, "screenshot_strategy"),
+            "screenshot_format": (str, "screenshot_format"),
+            "screenshot_resample": (str, "screenshot_resample"),
+            "screenshot_png_compress_level": (int, "screenshot_png_compress_level"),
+            "screenshot_workers": (int, "screenshot_workers"),
+            "screenshot_worker_mode": (str, "screenshot_worker_mode"),
+            "screenshot_dedup": (bool, "screenshot_dedup"),
+            "hierarchy_snapshot_ttl": (float, "hierarchy_snapshot_ttl"),
+            "device_profile_ttl": (float, "device_profile_ttl"),
+            "device_discovery_ttl": (float, "device_discovery_ttl"),
+            "fast_click": (bool, "fast_click"),
+            "fast_click_verify_selector": (bool, "fast_click_verify_selector"),
+            "page_events_enabled": (bool, "page_events_enabled"),
         }
         
         for key, (type_cast, attr_name) in simple_configs.items():
@@ -210,6 +317,10 @@ class DynamicConfig:
                 "page_stable_wait": cls.wait_page_stable,
                 "element_timeout": cls.element_wait_timeout,
                 "page_change_timeout": cls.page_change_timeout,
+                "adaptive": cls.adaptive_wait_enabled,
+                "adaptive_percentile": cls.adaptive_wait_percentile,
+                "adaptive_min_samples": cls.adaptive_wait_min_samples,
+                "adaptive_explore_every": cls.adaptive_wait_explore_every,
             },
             "verify_strategy": {
                 "verify_clicks": cls.verify_clicks,
@@ -228,8 +339,28 @@ class DynamicConfig:
                 "auto_close": cls.auto_close_ads,
                 "wait_before_close": cls.wait_before_close_ad,
                 "max_close_buttons": cls.max_close_buttons,
+                "template_match_workers": cls.template_match_workers,
+                "close_button_priors": cls.close_button_priors,
+                "close_button_priors_max": cls.close_button_priors_max,
+                "template_library_max": cls.template_library_max,
             },
             "screenshot_strategy": cls.screenshot_strategy,
+            "screenshot_pipeline": {
+                "format": cls.screenshot_format,
+                "resample": cls.screenshot_resample,
+                "png_compress_level": cls.screenshot_png_compress_level,
+                "workers": cls.screenshot_workers,
+                "worker_mode": cls.screenshot_worker_mode,
+                "dedup": cls.screenshot_dedup,
+            },
+            "hierarchy_snapshot_ttl": cls.hierarchy_snapshot_ttl,
+            "device_profile_ttl": cls.device_profile_ttl,
+            "device_discovery_ttl": cls.device_discovery_ttl,
+            "fast_click": {
+                "enabled": cls.fast_click,
+                "verify_selector": cls.fast_click_verify_selector,
+            },
+            "page_events_enabled": cls.page_events_enabled,
             "retry_strategy": {
                 "max_retries": cls.max_retries,
                 "retry_delay": cls.retry_delay,
@@ -249,6 +380,10 @@ class DynamicConfig:
         cls.wait_page_stable = 0.8
         cls.element_wait_timeout = 10.0
         cls.page_change_timeout = 2.0
+        cls.adaptive_wait_enabled = True
+        cls.adaptive_wait_percentile = 0.9
+        cls.adaptive_wait_min_samples = 5
+        cls.adaptive_wait_explore_every = 10
         cls.verify_clicks = True
         cls.verify_inputs = False
         cls.verify_keys = True
@@ -259,9 +394,25 @@ class DynamicConfig:
         cls.auto_close_ads = True
         cls.wait_before_close_ad = 0.3
         cls.max_close_buttons = 1
+        cls.template_match_workers = 4
+        cls.close_button_priors = {}
+        cls.close_button_priors_max = 8
+        cls.template_library_max = 60
         cls.screenshot_strategy = "smart"
+        cls.screenshot_format = "jpeg"
+        cls.screenshot_resample = "lanczos"
+        cls.screenshot_png_compress_level = 1
+        cls.screenshot_workers = 2
+        cls.screenshot_worker_mode = "thread"
+        cls.screenshot_dedup = True
         cls.max_retries = 3
         cls.retry_delay = 1.0
+        cls.hierarchy_snapshot_ttl = 1.0
+        cls.device_profile_ttl = 60.0
+        cls.device_discovery_ttl = 5.0
+        cls.fast_click = False
+        cls.fast_click_verify_selector = False
+        cls.page_events_enabled = True
         
         print("  ✅ 配置已重置为默认值", file=sys.stderr)
         
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+元素索引 - 每个控件树快照只构建一次，定位查询 O(1)
+
+功能：
+1. text / content-desc / resource-id / class 精确匹配：哈希表直查
+2. textContains / descriptionContains：二元组（bigram）倒排索引 + 子串校验
+3. 直接复用节点表（NodeTable）中已解析的 bounds / 中心点，定位后可直接点击
+
+说明：
+    倒排索引用二元组而非三元组，因为中文文案常见 2 字查询（如"登录"、"确定"）。
+
+用法:
+    index = client.hierarchy.get().index
+    nodes = index.find_by_resource_id("com.app:id/btn_login")
+    matches = index.find("登录", exact_match=True)   # [(node, attr_type), ...]
+"""
+from typing import Dict, List, Set, Tuple
+
+from ..utils.xml_parser import NodeTable, UINode
+
+
+class ElementIndex:
+    """控件树元素索引（只读，随快照一起失效）"""
+
+    NGRAM = 2
+
+    def __init__(self, table: NodeTable):
+        self.table = table
+        self.nodes: List[UINode] = table.nodes
+
+        self._by_text: Dict[str, List[UINode]] = {}
+        self._by_desc: Dict[str, List[UINode]] = {}
+        self._by_resource_id: Dict[str, List[UINode]] = {}
+        self._by_class: Dict[str, List[UINode]] = {}
+        self._text_grams: Dict[str, Set[int]] = {}
+        self._desc_grams: Dict[str, Set[int]] = {}
+
+        for node in self.nodes:
+            if node.text:
+                self._by_text.setdefault(node.text, []).append(node)
+                self._add_grams(self._text_grams, node.text, node.index)
+            if node.content_desc:
+                self._by_desc.setdefault(node.content_desc, []).append(node)
+                self._add_grams(self._desc_grams, node.content_desc, node.index)
+            if node.resource_id:
+                self._by_resource_id.setdefault(node.resource_id, []).append(node)
+            if node.class_name:
+                self._by_class.setdefault(node.class_name, []).append(node)
+
+    # ==================== 精确查询 ====================
+
+    def find_by_text(self, text: str) -> List[UINode]:
+        if not text:
+            return [n for n in self.nodes if not n.text]
+        return self._by_text.get(text, [])
+
+    def find_by_desc(self, desc: str) -> List[UINode]:
+        if not desc:
+            return [n for n in self.nodes if not n.content_desc]
+        return self._by_desc.get(desc, [])
+
+    def find_by_resource_id(self, resource_id: str) -> List[UINode]:
+        return self._by_resource_id.get(resource_id, [])
+
+    def find_by_class(self, class_name: str) -> List[UINode]:
+        return self._by_class.get(class_name, [])
+
+    # ==================== 包含查询 ====================
+
+    def find_text_contains(self, sub: str) -> List[UINode]:
+        return self._contains(sub, self._text_grams, self._by_text, 'text')
+
+    def find_desc_contains(self, sub: str) -> List[UINode]:
+        return self._contains(sub, self._desc_grams, self._by_desc, 'content_desc')
+
+    def find(self, text: str, exact_match: bool = True) -> List[Tuple[UINode, str]]:
+        """
+        按文本查找元素（语义与逐节点比较 text / content-desc 完全一致）
+
+        Args:
+            text: 要查找的文本
+            exact_match: True=精确匹配在前、包含匹配在后；False=只做包含匹配
+
+        Returns:
+            [(node, attr_type), ...]，attr_type 为 text / description / textContains / descriptionContains，
+            同一类内部按文档顺序排列
+        """
+        results = []
+        seen = set()
+
+        if exact_match:
+            exact = {n.index: n for n in self.find_by_text(text)}
+            for n in self.find_by_desc(text):
+                exact.setdefault(n.index, n)
+            for order in sorted(exact):
+                node = exact[order]
+                results.append((node, 'text' if node.text == text else 'description'))
+                seen.add(order)
+
+        contains = {n.index: n for n in self.find_text_contains(text)}
+        for n in self.find_desc_contains(text):
+            contains.setdefault(n.index, n)
+        for order in sorted(contains):
+            if order in seen:
+                continue
+            node = contains[order]
+            results.append((node, 'textContains' if text in node.text else 'descriptionContains'))
+
+        return results
+
+    # ==================== 内部方法 ====================
+
+    @classmethod
+    def _add_grams(cls, grams: Dict[str, Set[int]], value: str, order: int):
+        n = cls.NGRAM
+        for i in range(len(value) - n + 1):
+            grams.setdefault(value[i:i + n], set()).add(order)
+
+    def _contains(self, sub: str, grams: Dict[str, Set[int]],
+                  exact_map: Dict[str, List[UINode]], attr: str) -> List[UINode]:
+        if not sub:
+            # 空串包含于任何字符串（与 `'' in s` 一致）
+            return list(self.nodes)
+
+        if len(sub) < self.NGRAM:
+            # 单字符查询：只扫描去重后的文本
+            orders = [n.index for value, nodes in exact_map.items() if sub in value for n in nodes]
+            return [self.nodes[o] for o in sorted(orders)]
+
+        postings = []
+        for i in range(len(sub) - self.NGRAM + 1):
+            posting = grams.get(sub[i:i + self.NGRAM])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return []
+
+        # 二元组命中不等于子串命中，逐个校验
+        return [self.nodes[o] for o in sorted(candidates) if sub in getattr(self.nodes[o], attr)]
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+控件树快照服务 - 按设备缓存 dump_hierarchy 结果
+
+功能：
+1. 一次 dump，多处复用（原始 XML / 解析后的树 / 节点表 / 元素列表 / 元素索引）
+2. 点击、滑动、输入、按键、启动 App 等操作后自动失效
+3. 统计命中/未命中次数和 dump 耗时，便于评估优化效果
+
+用法:
+    snapshot = client.hierarchy.get()
+    root = snapshot.root            # ElementTree 根节点（懒解析）
+    table = snapshot.table          # NodeTable 紧凑节点表（bounds 已解析）
+    elements = snapshot.elements    # XMLParser 解析结果（懒解析）
+    index = snapshot.index          # ElementIndex 定位索引（懒构建）
+    fp = snapshot.fingerprint       # PageFingerprint 页面指纹（懒构建）
+    spatial = snapshot.spatial      # SpatialIndex 空间索引（懒构建）
+    client.hierarchy.invalidate("click")
+"""
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional
+
+from .dynamic_config import DynamicConfig
+
+
+class HierarchySnapshot:
+    """
+    单次 dump 的控件树快照（只读）
+
+    raw XML 在创建时就有；ElementTree、节点表、元素列表和索引在第一次访问时才构建，
+    同一快照上的多次访问共享同一份解析结果。
+    """
+
+    def __init__(self, xml: str, compressed: bool = False, dump_ms: float = 0.0):
+        self.xml = xml
+        self.compressed = compressed
+        self.dump_ms = dump_ms
+        self.timestamp = time.time()
+        self._root = None
+        self._table = None
+        self._elements = None
+        self._index = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    @property
+    def root(self):
+        """ElementTree 根节点（懒解析）"""
+        if self._root is None:
+            with self._lock:
+                if self._root is None:
+                    self._root = ET.fromstring(self.xml)
+        return self._root
+
+    @property
+    def table(self):
+        """NodeTable 紧凑节点表（懒构建，复用已解析的 ElementTree）"""
+        if self._table is None:
+            root = self.root
+            with self._lock:
+                if self._table is None:
+                    from ..utils.xml_parser import XMLParser
+                    self._table = XMLParser().build_table(root)
+        return self._table
+
+    @property
+    def elements(self) -> List[Dict]:
+        """XMLParser 格式的有意义元素列表（懒构建）"""
+        if self._elements is None:
+            table = self.table
+            with self._lock:
+                if self._elements is None:
+                    self._elements = table.to_elements()
+        return self._elements
+
+    @property
+    def index(self):
+        """ElementIndex 定位索引（懒构建，每个快照只构建一次）"""
+        if self._index is None:
+            table = self.table
+            with self._lock:
+                if self._index is None:
+                    from .element_index import ElementIndex
+                    self._index = ElementIndex(table)
+        return self._index
+
+    @property
+    def fingerprint(self):
+        """PageFingerprint 页面指纹（懒构建，用于判断页面是否变化）"""
+        if self._fingerprint is None:
+            table = self.table
+            with self._lock:
+                if self._fingerprint is None:
+                    from .page_fingerprint import PageFingerprint
+                    self._fingerprint = PageFingerprint(table)
+        return self._fingerprint
+
+    @property
+    def spatial(self):
+        """SpatialIndex 空间索引（懒构建，包含/重叠/点命中查询）"""
+        from .spatial_index import table_index
+        return table_index(self.table)
+
+    @property
+    def is_parsed(self) -> bool:
+        """是否已构建节点表（已构建则直接查表，否则走流式解析更快）"""
+        return self._table is not None
+
+    def iter_nodes(self):
+        """
+        按先序遍历节点：已有节点表则直接遍历，否则流式解析（调用方可提前 break）
+        """
+        if self._table is not None:
+            return iter(self._table)
+        from ..utils.xml_parser import XMLParser
+        return XMLParser().iter_nodes(self.xml)
+
+    @property
+    def age(self) -> float:
+        """快照已存在的秒数"""
+        return time.time() - self.timestamp
+
+
+class HierarchySnapshotService:
+    """
+    设备级控件树快照服务
+
+    每个 MobileClient 持有一个实例（即每台设备一份缓存）。
+    所有读控件树的工具都通过 get() 获取快照；会改变页面的操作调用 invalidate()。
+    另有 TTL 兜底（DynamicConfig.hierarchy_snapshot_ttl），防止页面自行变化
+    （动画、弹窗自动出现等）时读到过期数据。
+    """
+
+    def __init__(self, mobile_client):
+        self.client = mobile_client
+        # 按 compressed 参数分别缓存（压缩/非压缩 dump 内容不同）
+        self._snapshots: Dict[bool, HierarchySnapshot] = {}
+        self._lock = threading.RLock()
+
+        # 统计
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._dump_ms_total = 0.0
+        self._last_dump_ms = 0.0
+        self._last_invalidate_reason = ""
+
+    def get(self, compressed: bool = False, max_age: Optional[float] = None) -> HierarchySnapshot:
+        """
+        获取控件树快照（命中缓存则不再 dump）
+
+        Args:
+            compressed: 是否使用压缩 dump（与 u2.dump_hierarchy 参数一致）
+            max_age: 可接受的最大快照年龄（秒），None 使用 DynamicConfig 中的 TTL；
+                     传 0 表示强制重新 dump
+
+        Returns:
+            HierarchySnapshot
+        """
+        ttl = DynamicConfig.hierarchy_snapshot_ttl if max_age is None else max_age
+
+        with self._lock:
+            snapshot = self._snapshots.get(compressed)
+            if snapshot is not None and snapshot.age < ttl:
+                self._hits += 1
+                return snapshot
+
+            self._misses += 1
+            start = time.time()
+            xml = self.client.u2.dump_hierarchy(compressed=compressed)
+            if not isinstance(xml, str):
+                xml = str(xml)
+            dump_ms = (time.time() - start) * 1000
+
+            self._dump_ms_total += dump_ms
+            self._last_dump_ms = dump_ms
+
+            snapshot = HierarchySnapshot(xml, compressed=compressed, dump_ms=dump_ms)
+            self._snapshots[compressed] = snapshot
+
+            # 根节点带屏幕旋转角度，顺便告诉设备信息缓存（旋转后刷新屏幕尺寸）
+            profile = getattr(self.client, 'profile', None)
+            if profile is not None:
+                profile.observe_hierarchy(xml)
+            return snapshot
+
+    def get_xml(self, compressed: bool = False, max_age: Optional[float] = None) -> str:
+        """获取原始 XML"""
+        return self.get(compressed=compressed, max_age=max_age).xml
+
+    def get_root(self, compressed: bool = False, max_age: Optional[float] = None):
+        """获取 ElementTree 根节点"""
+        return self.get(compressed=compressed, max_age=max_age).root
+
+    def peek(self, compressed: bool = False, max_age: Optional[float] = None) -> Optional[HierarchySnapshot]:
+        """
+        返回当前缓存的快照（不触发 dump，也不计入统计）
+
+        Args:
+            max_age: 可接受的最大快照年龄（秒），None 使用 DynamicConfig 中的 TTL；超过则返回 None
+        """
+        ttl = DynamicConfig.hierarchy_snapshot_ttl if max_age is None else max_age
+        with self._lock:
+            snapshot = self._snapshots.get(compressed)
+        if snapshot is None or snapshot.age >= ttl:
+            return None
+        return snapshot
+
+    def invalidate(self, reason: str = ""):
+        """
+        使快照失效
+
+        Args:
+            reason: 失效原因（如 click / swipe / input），仅用于统计和排查
+        """
+        with self._lock:
+            if self._snapshots:
+                self._invalidations += 1
+            self._snapshots.clear()
+            self._last_invalidate_reason = reason
+
+    def stats(self) -> Dict:
+        """命中率和耗时统计"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+                "invalidations": self._invalidations,
+                "last_invalidate_reason": self._last_invalidate_reason,
+                "dump_ms_total": round(self._dump_ms_total, 1),
+                "dump_ms_avg": round(self._dump_ms_total / self._misses, 1) if self._misses else 0.0,
+                "dump_ms_last": round(self._last_dump_ms, 1),
+                # 命中一次约等于省下一次 dump
+                "dump_ms_saved": round(self._hits * (self._dump_ms_total / self._misses), 1) if self._misses else 0.0,
+            }
+
+    def reset_stats(self):
+        """清空统计"""
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._invalidations = 0
+            self._dump_ms_total = 0.0
+            self._last_dump_ms = 0.0
+            self._last_invalidate_reason = ""
+            print("  🧹 控件树快照统计已清空", file=sys.stderr)
@@ -19,6 +19,7 @@ import time
 from typing import Dict, Optional, List
 
 from .ios_device_manager_wda import IOSDeviceManagerWDA
+from ..utils.xml_parser import parse_bounds
 
 
 class IOSClientWDA:
@@ -462,10 +463,9 @@ class IOSClientWDA:
         Returns:
             (x, y) 中心点坐标
         """
-        import re
-        match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-        if match:
-            x1, y1, x2, y2 = map(int, match.groups())
+        bounds = parse_bounds(bounds_str)
+        if bounds:
+            x1, y1, x2, y2 = bounds
             return ((x1 + x2) // 2, (y1 + y2) // 2)
         return (0, 0)
     
@@ -20,10 +20,14 @@ import time
 from typing import Dict, Optional, List
 
 from .device_manager import DeviceManager
-from ..utils.xml_parser import XMLParser
+from ..utils.xml_parser import XMLParser, parse_bounds
 from ..utils.xml_formatter import XMLFormatter
 from .utils.smart_wait import SmartWait
+from .utils.page_events import PageEventMonitor, U2WindowUpdateEventSource
 from .dynamic_config import DynamicConfig
+from .hierarchy_snapshot import HierarchySnapshotService
+from .device_profile import DeviceProfileService
+from .adaptive_wait import AdaptiveWaitEngine
 
 
 class MobileClient:
@@ -75,10 +79,17 @@ class MobileClient:
         self.xml_parser = XMLParser()
         self.xml_formatter = XMLFormatter()
         
-        # 缓存
-        self._snapshot_cache = None
-        self._cache_timestamp = 0
-        self._cache_ttl = 1  # 缓存1秒
+        # 控件树快照（设备级，所有工具共享；操作后失效）
+        self.hierarchy = HierarchySnapshotService(self)
+        # 设备信息缓存（屏幕尺寸/方向/密度/前台包名，旋转或切换 App 时刷新）
+        self.profile = DeviceProfileService(self)
+        # 自适应等待（按 应用×动作 学习操作后页面稳定时间）
+        self.waits = AdaptiveWaitEngine(self)
+        # 最近一次页面变化检测的差异（FingerprintDiff）
+        self.last_page_diff = None
+        
+        # 页面变化事件（首次等待时才启动事件源；测试可直接替换为 FakeEventSource）
+        self.page_events: Optional[PageEventMonitor] = None
         
         # 操作历史（用于录制）
         self.operation_history: List[Dict] = []
@@ -111,6 +122,7 @@ class MobileClient:
             import time
             time.sleep(0.5)
             
+            self.profile.notify("rotation")
             if result.returncode == 0:
                 print(f"  🔒 已锁定屏幕方向为竖屏", file=sys.stderr)
             else:
@@ -133,6 +145,7 @@ class MobileClient:
             
             import time
             time.sleep(0.5)
+            self.profile.notify("rotation")
             print(f"  🔄 已强制旋转回竖屏", file=sys.stderr)
         except Exception as e:
             print(f"  ⚠️  强制旋转失败: {e}", file=sys.stderr)
@@ -150,6 +163,7 @@ class MobileClient:
                 timeout=5
             )
             
+            self.profile.notify("rotation")
             if result.returncode == 0:
                 print(f"  🔓 已解锁屏幕方向（允许自动旋转）", file=sys.stderr)
             else:
@@ -161,20 +175,14 @@ class MobileClient:
         """
         获取页面XML结构（类似Web的snapshot）
         
+        Android 读取共享的控件树快照（self.hierarchy），操作后自动失效，不再单独缓存。
+        
         Args:
-            use_cache: 是否使用缓存
+            use_cache: 是否允许复用快照（False 时强制重新 dump）
             
         Returns:
             格式化后的页面结构字符串（AI可理解的格式）
         """
-        import time
-        
-        # 检查缓存
-        if use_cache and self._snapshot_cache:
-            current_time = time.time()
-            if current_time - self._cache_timestamp < self._cache_ttl:
-                return self._snapshot_cache
-        
         # iOS平台使用不同的实现
         if self.platform == "ios":
             if not self.driver:
@@ -183,55 +191,19 @@ class MobileClient:
             xml_string = self.driver.page_source
             if not isinstance(xml_string, str):
                 xml_string = str(xml_string)
-            # iOS的XML格式可能不同，直接返回或简单格式化
-            self._snapshot_cache = xml_string
-            self._cache_timestamp = time.time()
+            # iOS的XML格式可能不同，直接返回
             return xml_string
         
-        # Android平台
-        # 获取XML - 优先使用 ADB 直接 dump（更完整，包含 NAF 元素）
-        xml_string = None
-        try:
-            # 方法1: 使用 ADB 直接 dump（获取最完整的 UI 树，包括 NAF 元素）
-            import subprocess
-            import tempfile
-            import os
-            
-            # 在设备上执行 dump
-            self.u2.shell('uiautomator dump /sdcard/ui_dump.xml')
-            
-            # 读取文件内容
-            result = self.u2.shell('cat /sdcard/ui_dump.xml')
-            if result and isinstance(result, str) and result.strip().startswith('<?xml'):
-                xml_string = result.strip()
-                # 清理临时文件
-                self.u2.shell('rm /sdcard/ui_dump.xml')
-        except Exception as e:
-            print(f"  ⚠️  ADB dump 失败，使用 uiautomator2: {e}", file=sys.stderr)
-        
-        # 方法2: 回退到 uiautomator2 的 dump_hierarchy
-        if not xml_string:
-            xml_string = self.u2.dump_hierarchy(compressed=False)
-        
-        # 确保xml_string是字符串类型
-        if not isinstance(xml_string, str):
-            xml_string = str(xml_string)
-        
-        # 解析XML
-        elements = self.xml_parser.parse(xml_string)
+        # Android平台：元素列表在快照上只解析一次
+        snapshot = self.hierarchy.get(max_age=None if use_cache else 0)
+        elements = snapshot.elements
         
         # 确保elements是列表类型
         if not isinstance(elements, list):
             raise ValueError(f"XML解析返回了非列表类型: {type(elements)}")
         
         # 格式化成AI可理解的格式
-        formatted = self.xml_formatter.format(elements)
-        
-        # 更新缓存
-        self._snapshot_cache = formatted
-        self._cache_timestamp = time.time()
-        
-        return formatted
+        return self.xml_formatter.format(elements)
     
     async def click(self, element: str, ref: Optional[str] = None, verify: bool = True):
         """
@@ -455,11 +427,10 @@ class MobileClient:
             if verify:
                 # 获取点击前页面状态
                 try:
-                    initial_xml = self.u2.dump_hierarchy(compressed=False)
-                    initial_length = len(initial_xml)
+                    initial_fp = self._page_fingerprint()
                     
                     # 等待页面变化
-                    page_changed = await self._verify_page_change(initial_length, timeout=2.0)
+                    page_changed = await self._verify_page_change(initial_fp, timeout=2.0)
                     
                     if not page_changed:
                         print(f"  ⚠️  点击后页面未变化，可能点击未生效", file=sys.stderr)
@@ -754,7 +725,7 @@ class MobileClient:
         
         # Android平台
         # 获取屏幕尺寸
-        width, height = self.u2.window_size()
+        width, height = self.profile.window_size()
         
         # 计算滑动坐标
         center_x = width // 2
@@ -774,12 +745,10 @@ class MobileClient:
         
         try:
             # 验证滑动（可选）
-            initial_xml = None
-            initial_length = 0
+            initial_fp = None
             if verify:
                 try:
-                    initial_xml = self.u2.dump_hierarchy(compressed=False)
-                    initial_length = len(initial_xml)
+                    initial_fp = self._page_fingerprint()
                 except Exception as e:
                     print(f"  ⚠️  获取初始页面状态失败: {e}", file=sys.stderr)
             
@@ -788,9 +757,9 @@ class MobileClient:
             
             # 验证滑动效果
             page_changed = False
-            if verify and initial_xml is not None:
+            if verify and initial_fp is not None:
                 # 等待页面内容变化
-                page_changed = await self._verify_page_change(initial_length, timeout=1.5, change_threshold=0.03)
+                page_changed = await self._verify_page_change(initial_fp, timeout=1.5, change_threshold=0.03)
                 
                 if page_changed:
                     print(f"  ✅ 滑动成功，页面内容已变化: {direction}", file=sys.stderr)
@@ -803,6 +772,8 @@ class MobileClient:
             if verify:
                 result['verified'] = True
                 result['page_changed'] = page_changed
+                if self.last_page_diff is not None:
+                    result['page_diff'] = self.last_page_diff.to_dict()
                 if not page_changed:
                     result['warning'] = "滑动命令执行但页面内容未变化，可能已到列表边界"
             
@@ -873,6 +844,7 @@ class MobileClient:
             # 传统方式（快速启动，不等待加载）
             print(f"  📱 启动App: {package_name}", file=sys.stderr)
             self.u2.app_start(package_name)
+            self.profile.notify("launch_app")
             
             # 等待App启动，并验证是否成功
             for i in range(wait_time):
@@ -930,6 +902,7 @@ class MobileClient:
             
             # Android平台
             self.u2.app_stop(package_name)
+            self.profile.notify("terminate_app")
             print(f"  ✅ App已停止: {package_name}", file=sys.stderr)
             return {"success": True}
         except Exception as e:
@@ -949,8 +922,8 @@ class MobileClient:
                     return None
                 return self.driver.current_package
             else:
-                info = self.u2.app_current()
-                return info.get('package')
+                # 轮询等待 App 启动时需要最新值；读取结果同时更新缓存供工具复用
+                return self.profile.current_package(max_age=0)
         except:
             return None
     
@@ -1029,15 +1002,14 @@ class MobileClient:
                 try:
                     if verify:
                         # 获取操作前页面状态
-                        initial_xml = self.u2.dump_hierarchy(compressed=False)
-                        initial_length = len(initial_xml)
+                        initial_fp = self._page_fingerprint()
                     
                     self.u2.press(key.lower())
                     print(f"  ✅ 按键成功: {key}", file=sys.stderr)
                     
                     if verify:
                         # 检测页面变化
-                        page_changed = await self._verify_page_change(initial_length, timeout=2.0)
+                        page_changed = await self._verify_page_change(initial_fp, timeout=2.0)
                         return {
                             "success": page_changed,
                             "key": key,
@@ -1058,8 +1030,7 @@ class MobileClient:
             # 标准按键处理
             if verify:
                 # 获取操作前页面状态
-                initial_xml = self.u2.dump_hierarchy(compressed=False)
-                initial_length = len(initial_xml)
+                initial_fp = self._page_fingerprint()
             
             # 使用keycode按键 - uiautomator2使用shell命令
             try:
@@ -1074,7 +1045,7 @@ class MobileClient:
             
             if verify:
                 # 等待并检测页面变化
-                page_changed = await self._verify_page_change(initial_length, timeout=2.0)
+                page_changed = await self._verify_page_change(initial_fp, timeout=2.0)
                 
                 if page_changed:
                     print(f"  ✅ 按键成功且页面已变化: {key} (keycode={keycode})", file=sys.stderr)
@@ -1120,8 +1091,7 @@ class MobileClient:
         print(f"  🔍 智能搜索键：先尝试SEARCH键...", file=sys.stderr)
         
         # 获取初始页面状态
-        initial_xml = self.u2.dump_hierarchy(compressed=False)
-        initial_length = len(initial_xml)
+        initial_fp = self._page_fingerprint()
         
         # 方案1: 尝试 SEARCH 键 (keycode=84)
         try:
@@ -1129,7 +1099,7 @@ class MobileClient:
             print(f"  ⏳ 已发送SEARCH键，等待页面变化...", file=sys.stderr)
             
             # 检测页面变化
-            page_changed = await self._verify_page_change(initial_length, timeout=2.0)
+            page_changed = await self._verify_page_change(initial_fp, timeout=2.0)
             
             if page_changed:
                 print(f"  ✅ SEARCH键生效，页面已变化", file=sys.stderr)
@@ -1147,14 +1117,13 @@ class MobileClient:
                 
                 # 方案2: 尝试 ENTER 键 (keycode=66)
                 # 重新获取当前页面状态（因为可能有轻微变化）
-                current_xml = self.u2.dump_hierarchy(compressed=False)
-                current_length = len(current_xml)
+                current_fp = self._page_fingerprint()
                 
                 self.u2.shell('input keyevent 66')
                 print(f"  ⏳ 已发送ENTER键，等待页面变化...", file=sys.stderr)
                 
                 # 再次检测页面变化
-                page_changed_enter = await self._verify_page_change(current_length, timeout=2.0)
+                page_changed_enter = await self._verify_page_change(current_fp, timeout=2.0)
                 
                 if page_changed_enter:
                     print(f"  ✅ ENTER键生效，页面已变化", file=sys.stderr)
@@ -1181,12 +1150,39 @@ class MobileClient:
             print(f"  ❌ 搜索键执行失败: {e}", file=sys.stderr)
             return {"success": False, "reason": str(e)}
     
-    async def _verify_page_change(self, initial_length: int, timeout: float = None, change_threshold: float = None) -> bool:
+    def _page_events(self) -> Optional[PageEventMonitor]:
+        """获取可用的页面变化事件监视器，不可用时返回 None（调用方退回轮询）"""
+        if not DynamicConfig.page_events_enabled:
+            return None
+        if self.page_events is None:
+            if self.platform != "android" or self.u2 is None:
+                return None
+            self.page_events = PageEventMonitor(U2WindowUpdateEventSource(self.u2))
+        return self.page_events if self.page_events.start() else None
+    
+    def disconnect(self):
+        """断开设备连接：先停掉页面变化事件的后台长轮询，再断开设备"""
+        events, self.page_events = self.page_events, None
+        if events is not None:
+            events.stop()
+        self.hierarchy.invalidate("disconnect")
+        self.profile.invalidate("disconnect")
+        if self.device_manager is not None:
+            self.device_manager.disconnect()
+    
+    def _page_fingerprint(self):
+        """重新 dump 控件树并返回页面指纹（新快照同时供后续工具复用）"""
+        return self.hierarchy.get(max_age=0).fingerprint
+    
+    async def _verify_page_change(self, initial_fp, timeout: float = None, change_threshold: float = None) -> bool:
         """
         验证页面是否发生变化
         
+        按页面指纹对比（新增/消失/移动的节点占比），而不是 XML 长度，
+        内容变了但长度相同也能识别，时间、角标等零星文案变化不会误判。
+        
         Args:
-            initial_length: 初始页面XML长度
+            initial_fp: 操作前的页面指纹（PageFingerprint）
             timeout: 最大等待时间（秒），None则使用动态配置
             change_threshold: 变化阈值（百分比），None则使用动态配置
         
@@ -1200,26 +1196,46 @@ class MobileClient:
             change_threshold = DynamicConfig.page_change_threshold
         
         start_time = time.time()
+        self.last_page_diff = None
+        
+        # 有事件源时只在收到变化事件后才 dump，否则每100ms轮询一次
+        events = self._page_events()
         
         while time.time() - start_time < timeout:
-            await asyncio.sleep(0.1)  # 每100ms检查一次
+            if events is None:
+                await asyncio.sleep(0.1)  # 每100ms检查一次
+            # 先记下事件序号再 dump，dump 期间到达的事件不会漏掉
+            seq = events.seq if events is not None else 0
             
             try:
-                current_xml = self.u2.dump_hierarchy(compressed=False)
-                current_length = len(current_xml)
+                diff = initial_fp.diff(self._page_fingerprint())
+                self.last_page_diff = diff
                 
-                # 计算变化百分比
-                change_percent = abs(current_length - initial_length) / max(1, initial_length)
-                
-                if change_percent > change_threshold:
-                    print(f"  📊 页面变化检测: {change_percent*100:.1f}% (阈值: {change_threshold*100}%)", file=sys.stderr)
+                if diff.ratio > change_threshold:
+                    print(f"  📊 页面变化检测: {diff.summary()} (阈值: {change_threshold*100}%)", file=sys.stderr)
                     # 等待页面稳定（使用动态配置）
-                    await asyncio.sleep(DynamicConfig.wait_page_stable)
-                    print(f"  ⏳ 已等待页面稳定 {DynamicConfig.wait_page_stable}秒", file=sys.stderr)
+                    if events is not None and events.available:
+                        waited_start = time.time()
+                        await events.wait_for_quiet_async(DynamicConfig.page_stable_threshold,
+                                                          DynamicConfig.wait_page_stable)
+                        waited = time.time() - waited_start
+                    else:
+                        await asyncio.sleep(DynamicConfig.wait_page_stable)
+                        waited = DynamicConfig.wait_page_stable
+                    print(f"  ⏳ 已等待页面稳定 {waited:.2f}秒", file=sys.stderr)
                     return True
             except Exception as e:
                 print(f"  ⚠️  页面变化检测异常: {e}", file=sys.stderr)
                 pass
+            
+            if events is not None:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                if not await events.wait_for_event_async(seq, remaining):
+                    if events.available:
+                        break  # 超时前没有任何变化事件
+                    events = None  # 事件源失效，退回轮询
         
         print(f"  📊 页面变化检测: 未检测到明显变化（超时{timeout}秒）", file=sys.stderr)
         return False
@@ -1234,10 +1250,9 @@ class MobileClient:
         Returns:
             (x, y) 中心点坐标
         """
-        import re
-        match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-        if match:
-            x1, y1, x2, y2 = map(int, match.groups())
+        bounds = parse_bounds(bounds_str)
+        if bounds:
+            x1, y1, x2, y2 = bounds
             return ((x1 + x2) // 2, (y1 + y2) // 2)
         return (0, 0)
     
@@ -0,0 +1,182 @@
+"""
+非极大值抑制（NMS）- 去除重叠的检测框
+
+用于：
+1. 模板匹配：同一个 X 号在相邻位置/相邻尺度的重复命中（中心距离判重）
+2. SoM 标注：父子容器和子控件几乎重合的可点击框（IoU 判重）
+3. 弹窗候选：层层包裹、边界相同的候选容器
+
+说明：
+    按分数从高到低贪心保留，每保留一个框，用 NumPy 一次算出它与剩余所有框的 IoU / 中心距离，
+    批量剔除重复框，不再逐对比较 Python 字典。没有安装 NumPy 时退回等价的纯 Python 实现。
+
+用法:
+    keep = nms(boxes, scores, iou_threshold=0.5)
+    kept = [items[i] for i in keep]
+
+基准测试:
+    python core/nms.py
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 不是核心依赖（OpenCV 会带上）
+    np = None
+
+
+Box = Tuple[float, float, float, float]
+
+
+def nms(
+    boxes: Sequence[Box],
+    scores: Optional[Sequence[float]] = None,
+    iou_threshold: Optional[float] = 0.5,
+    center_ratio: Optional[float] = None,
+) -> List[int]:
+    """
+    非极大值抑制
+
+    Args:
+        boxes: 检测框 (x1, y1, x2, y2)
+        scores: 分数，越高越优先；None 表示 boxes 已按优先级排好序
+        iou_threshold: IoU 大于该值视为重复，None 表示不按 IoU 判重
+        center_ratio: 中心点 x、y 距离都小于 平均边长 * center_ratio 视为重复，None 表示不按中心距离判重
+
+    Returns:
+        保留的下标（按优先级从高到低；分数相同时保持原顺序）
+    """
+    if len(boxes) == 0:
+        return []
+    if np is None:
+        return _nms_python(boxes, scores, iou_threshold, center_ratio)
+
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if scores is None:
+        order = np.arange(len(b))
+    else:
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+
+    x1, y1, x2, y2 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    widths = x2 - x1
+    heights = y2 - y1
+    areas = widths * heights
+    sizes = widths + heights
+    cx = (x1 + x2) / 2
+    cy = (y1 + y2) / 2
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        if not rest.size:
+            break
+
+        duplicate = np.zeros(rest.size, dtype=bool)
+        if iou_threshold is not None:
+            iw = np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])
+            ih = np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])
+            inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+            union = areas[i] + areas[rest] - inter
+            duplicate |= inter > iou_threshold * np.maximum(union, 1e-9)
+        if center_ratio is not None:
+            limit = (sizes[i] + sizes[rest]) / 4 * center_ratio
+            duplicate |= (np.abs(cx[rest] - cx[i]) < limit) & (np.abs(cy[rest] - cy[i]) < limit)
+
+        order = rest[~duplicate]
+
+    return keep
+
+
+def _nms_python(boxes: Sequence[Box], scores: Optional[Sequence[float]],
+                iou_threshold: Optional[float], center_ratio: Optional[float]) -> List[int]:
+    """纯 Python 实现（无 NumPy 时使用，结果与向量化版本一致）"""
+    indices = list(range(len(boxes)))
+    if scores is not None:
+        indices.sort(key=lambda k: -scores[k])
+
+    keep = []
+    for k in indices:
+        ax1, ay1, ax2, ay2 = boxes[k]
+        duplicate = False
+        for j in keep:
+            bx1, by1, bx2, by2 = boxes[j]
+            if iou_threshold is not None:
+                iw = min(ax2, bx2) - max(ax1, bx1)
+                ih = min(ay2, by2) - max(ay1, by1)
+                inter = max(0, iw) * max(0, ih)
+                union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+                if inter > iou_threshold * max(union, 1e-9):
+                    duplicate = True
+                    break
+            if center_ratio is not None:
+                limit = ((ax2 - ax1) + (ay2 - ay1) + (bx2 - bx1) + (by2 - by1)) / 4 * center_ratio
+                if abs((ax1 + ax2) - (bx1 + bx2)) / 2 < limit and abs((ay1 + ay2) - (by1 + by2)) / 2 < limit:
+                    duplicate = True
+                    break
+        if not duplicate:
+            keep.append(k)
+    return keep
+
+
+# ==================== 基准测试 ====================
+
+def _legacy_template_nms(results: List[dict], overlap_thresh: float = 0.3) -> List[dict]:
+    """原 TemplateMatcher._non_max_suppression 实现（基准对照）"""
+    results = sorted(results, key=lambda x: x['confidence'], reverse=True)
+    kept = []
+    for result in results:
+        is_duplicate = False
+        for kept_result in kept:
+            dx = abs(result['x'] - kept_result['x'])
+            dy = abs(result['y'] - kept_result['y'])
+            avg_size = (result['width'] + result['height'] +
+                        kept_result['width'] + kept_result['height']) / 4
+            if dx < avg_size * overlap_thresh and dy < avg_size * overlap_thresh:
+                is_duplicate = True
+                break
+        if not is_duplicate:
+            kept.append(result)
+    return kept
+
+
+def _benchmark():
+    import random
+    import time
+
+    def make_hits(count: int, clusters: int, seed: int) -> List[dict]:
+        rng = random.Random(seed)
+        centers = [(rng.randint(50, 1390), rng.randint(50, 3150)) for _ in range(clusters)]
+        hits = []
+        for _ in range(count):
+            cx, cy = rng.choice(centers)
+            size = rng.choice([30, 40, 50, 60, 80])
+            hits.append({'x': cx + rng.randint(-6, 6), 'y': cy + rng.randint(-6, 6),
+                         'width': size, 'height': size, 'confidence': rng.uniform(0.6, 1.0)})
+        return hits
+
+    def timed(func, repeat: int) -> Tuple[float, object]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            value = func()
+        return (time.perf_counter() - start) / repeat * 1000, value
+
+    print(f"NumPy: {'可用' if np is not None else '不可用（纯 Python 实现）'}")
+    print(f"{'命中数':>8} {'簇数':>6} {'原实现(ms)':>12} {'nms(ms)':>10} {'加速':>8}  结果一致")
+    for count, clusters in [(200, 5), (1000, 20), (5000, 50), (5000, 500)]:
+        hits = make_hits(count, clusters, seed=count + clusters)
+        boxes = [(h['x'] - h['width'] / 2, h['y'] - h['height'] / 2,
+                  h['x'] + h['width'] / 2, h['y'] + h['height'] / 2) for h in hits]
+        scores = [h['confidence'] for h in hits]
+        repeat = 3 if count >= 5000 else 10
+
+        legacy_ms, legacy = timed(lambda: _legacy_template_nms(hits), repeat)
+        new_ms, keep = timed(lambda: nms(boxes, scores, iou_threshold=None, center_ratio=0.3), repeat)
+        same = [id(h) for h in legacy] == [id(hits[i]) for i in keep]
+        print(f"{count:>8} {clusters:>6} {legacy_ms:>12.2f} {new_ms:>10.2f} {legacy_ms / max(new_ms, 1e-6):>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    _benchmark()
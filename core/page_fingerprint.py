@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面指纹 - 基于控件树结构判断页面是否变化（替代 XML 长度比较）
+
+功能：
+1. 结构指纹（skeleton）：层级 + class + resource-id + 取整后的 bounds，文本变化不影响
+2. 文本指纹：text + content-desc，与结构指纹分开计算
+3. 增量对比：两个指纹都一致直接判定无变化；否则按节点对比，给出新增/消失/移动/改文案的节点
+
+说明：
+    XML 长度比较既不准（内容变了长度可能不变），又容易误判（时间、角标等小文案变化）。
+    指纹按"变化节点数 / 节点总数"计算变化比例，阈值语义与原来的长度百分比保持一致。
+
+用法:
+    before = client.hierarchy.get(max_age=0).fingerprint
+    ...  # 执行操作
+    after = client.hierarchy.get(max_age=0).fingerprint
+    diff = before.diff(after)
+    if diff.ratio > DynamicConfig.page_change_threshold:
+        print(diff.summary())
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.xml_parser import NodeTable, XMLParser
+
+
+# 节点身份：(class, resource-id, text, content-desc, 同身份出现序号)
+NodeKey = Tuple[str, str, str, str, int]
+
+
+class FingerprintDiff:
+    """两个页面指纹的差异"""
+
+    # to_dict() 中每类最多列出的节点数
+    MAX_REPORTED = 10
+
+    def __init__(self, added: List[NodeKey], removed: List[NodeKey], moved: List[NodeKey],
+                 retexted: List[NodeKey], total: int, structure_changed: bool, text_changed: bool,
+                 bounds: Optional[Dict[NodeKey, Tuple[int, int, int, int]]] = None):
+        self.added = added
+        self.removed = removed
+        self.moved = moved
+        # 位置和控件不变、只有文案变化的节点（记录新文案）
+        self.retexted = retexted
+        self.total = total
+        self.structure_changed = structure_changed
+        self.text_changed = text_changed
+        self._bounds = bounds or {}
+
+    @property
+    def changed_count(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.moved) + len(self.retexted)
+
+    @property
+    def ratio(self) -> float:
+        """变化比例（0-1），变化节点数 / 两个页面中较大的节点数"""
+        return min(1.0, self.changed_count / max(1, self.total))
+
+    @property
+    def changed(self) -> bool:
+        return self.changed_count > 0
+
+    def summary(self) -> str:
+        return (f"新增{len(self.added)} 消失{len(self.removed)} 移动{len(self.moved)} "
+                f"改文案{len(self.retexted)}（变化{self.ratio * 100:.1f}%）")
+
+    def _describe(self, key: NodeKey) -> Dict:
+        class_name, resource_id, text, desc, _ = key
+        info = {"class": class_name.rsplit('.', 1)[-1]}
+        if resource_id:
+            info["id"] = resource_id
+        if text:
+            info["text"] = text
+        if desc:
+            info["desc"] = desc
+        if key in self._bounds:
+            info["bounds"] = list(self._bounds[key])
+        return info
+
+    def to_dict(self) -> Dict:
+        limit = self.MAX_REPORTED
+        return {
+            "changed": self.changed,
+            "ratio": round(self.ratio, 4),
+            "structure_changed": self.structure_changed,
+            "text_changed": self.text_changed,
+            "added_count": len(self.added),
+            "removed_count": len(self.removed),
+            "moved_count": len(self.moved),
+            "retexted_count": len(self.retexted),
+            "added": [self._describe(k) for k in self.added[:limit]],
+            "removed": [self._describe(k) for k in self.removed[:limit]],
+            "moved": [self._describe(k) for k in self.moved[:limit]],
+            "retexted": [self._describe(k) for k in self.retexted[:limit]],
+        }
+
+
+class PageFingerprint:
+    """
+    单个控件树快照的页面指纹（只读）
+
+    只统计有 bounds 的节点；bounds 按 BOUNDS_GRID 像素取整，忽略动画中的细微抖动。
+    """
+
+    BOUNDS_GRID = 8
+
+    def __init__(self, table: NodeTable):
+        grid = self.BOUNDS_GRID
+        skeleton = hashlib.blake2b(digest_size=8)
+        text = hashlib.blake2b(digest_size=8)
+
+        # 节点身份 -> (取整后的 bounds, 原始 bounds)
+        self._nodes: Dict[NodeKey, Tuple[Tuple[int, int, int, int], Tuple[int, int, int, int]]] = {}
+        occurrences: Dict[Tuple[str, str, str, str], int] = {}
+
+        for node in table:
+            bounds = node.bounds
+            if not bounds:
+                continue
+            rounded = (bounds[0] // grid, bounds[1] // grid, bounds[2] // grid, bounds[3] // grid)
+            skeleton.update(f"{node.depth}|{node.class_name}|{node.resource_id}|{rounded}\n".encode())
+            text.update(f"{node.text}\x1f{node.content_desc}\n".encode())
+
+            identity = (node.class_name, node.resource_id, node.text, node.content_desc)
+            seq = occurrences.get(identity, 0)
+            occurrences[identity] = seq + 1
+            self._nodes[identity + (seq,)] = (rounded, bounds)
+
+        self.skeleton_hash = skeleton.hexdigest()
+        self.text_hash = text.hexdigest()
+
+    @classmethod
+    def from_xml(cls, xml: str) -> 'PageFingerprint':
+        return cls(XMLParser().parse_table(xml))
+
+    @property
+    def node_count(self) -> int:
+        return len(self._nodes)
+
+    def same_as(self, other: 'PageFingerprint') -> bool:
+        """结构和文本指纹都一致（O(1)，不需要逐节点对比）"""
+        return self.skeleton_hash == other.skeleton_hash and self.text_hash == other.text_hash
+
+    def diff(self, other: 'PageFingerprint') -> FingerprintDiff:
+        """
+        与之后的页面指纹对比
+
+        Args:
+            other: 之后的页面指纹
+
+        Returns:
+            FingerprintDiff（added/moved 使用 other 中的 bounds，removed 使用 self 中的 bounds）
+        """
+        total = max(self.node_count, other.node_count)
+        if self.same_as(other):
+            return FingerprintDiff([], [], [], [], total, False, False)
+
+        old_nodes = self._nodes
+        new_nodes = other._nodes
+        added = []
+        moved = []
+        bounds = {}
+        for key, (rounded, raw) in new_nodes.items():
+            old = old_nodes.get(key)
+            if old is None:
+                added.append(key)
+                bounds[key] = raw
+            elif old[0] != rounded:
+                moved.append(key)
+                bounds[key] = raw
+        removed = []
+        for key, (_, raw) in old_nodes.items():
+            if key not in new_nodes:
+                removed.append(key)
+                bounds[key] = raw
+
+        # 同一位置、同一控件消失又出现的，视为只改了文案（只算一个变化）
+        retexted = []
+        if added and removed:
+            slots: Dict[Tuple, List[NodeKey]] = {}
+            for key in removed:
+                slots.setdefault((key[0], key[1], old_nodes[key][0]), []).append(key)
+            still_added = []
+            for key in added:
+                candidates = slots.get((key[0], key[1], new_nodes[key][0]))
+                if candidates:
+                    candidates.pop(0)
+                    retexted.append(key)
+                else:
+                    still_added.append(key)
+            added = still_added
+            remaining = {k for keys in slots.values() for k in keys}
+            removed = [k for k in removed if k in remaining]
+
+        return FingerprintDiff(
+            added, removed, moved, retexted, total,
+            structure_changed=self.skeleton_hash != other.skeleton_hash,
+            text_changed=self.text_hash != other.text_hash,
+            bounds=bounds,
+        )
+
+    def __repr__(self):
+        return f"PageFingerprint(nodes={self.node_count}, skeleton={self.skeleton_hash}, text={self.text_hash})"
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+弹窗分析 - 基于控件树父子关系（而不是平铺的 bounds）识别弹窗
+
+功能：
+1. 子树聚合（SubtreeStats）：倒序遍历节点表一次（子节点先于父节点），得到每个节点子树的
+   节点数、可点击数、关闭按钮数、最大深度，以及排在它后面（绘制在它上层）的兄弟数
+2. 弹窗评分（PopupAnalyzer）：沿用原有的置信度规则，但"包含关闭按钮""遮罩层在弹窗之下"
+   "位于最上层"等判断改用树关系，整体线性于节点数
+3. 直接返回弹窗子树（PopupResult），关闭按钮搜索可以只看子树内的节点
+
+说明：
+    节点表按先序排列，节点 i 的子树恰好是 [i, i + size) 这一段连续下标。
+    子树聚合与屏幕尺寸无关，每个节点表只计算一次（subtree_stats，随节点表释放）。
+
+用法:
+    popup = PopupAnalyzer(table).detect(screen_width, screen_height)
+    if popup and popup.detected:
+        for node in popup.nodes(table):   # 弹窗子树
+            ...
+        popup.close_buttons               # 子树内 / 浮在弹窗上层的关闭按钮下标
+"""
+import threading
+import weakref
+from typing import List, Optional, Tuple
+
+from .spatial_index import table_index
+
+
+# 弹窗检测关键词
+DIALOG_CLASS_KEYWORDS = ['Dialog', 'Popup', 'Alert', 'Modal', 'BottomSheet', 'PopupWindow']
+DIALOG_ID_KEYWORDS = ['dialog', 'popup', 'alert', 'modal', 'bottom_sheet', 'overlay', 'mask']
+# 广告弹窗关键词（全屏广告、激励视频等）
+AD_POPUP_KEYWORDS = ['ad_close', 'ad_button', 'full_screen', 'interstitial', 'reward', 'close_icon', 'close_btn']
+
+# 置信度达到该值才返回弹窗（有强特征 / 没有强特征）
+STRONG_FEATURE_THRESHOLD = 0.7
+WEAK_FEATURE_THRESHOLD = 0.85
+
+
+def is_close_button(node) -> bool:
+    """resource-id 或文本带关闭特征的节点"""
+    resource_id = node.resource_id.lower()
+    return ('close' in resource_id or 'dismiss' in resource_id or 'cancel' in resource_id or
+            '×' in node.text or 'X' in node.text)
+
+
+class SubtreeStats:
+    """
+    每个节点的子树聚合（按节点下标存放的平行列表）
+
+    - size: 子树节点数（含自身），子树下标范围为 [i, i + size[i])
+    - clickable: 子树内可点击节点数
+    - close: 子树内关闭按钮数（含自身）
+    - max_depth: 子树内最大深度
+    - later_siblings: 排在后面的兄弟数（0 表示在兄弟中绘制在最上层）
+    """
+
+    def __init__(self, table):
+        nodes = table.nodes
+        count = len(nodes)
+        self.size = [1] * count
+        self.clickable = [0] * count
+        self.close = [0] * count
+        self.is_close = [False] * count
+        self.max_depth = [0] * count
+        self.later_siblings = [0] * count
+        children_seen = [0] * count
+
+        # 倒序 = 子节点先于父节点，一次遍历完成聚合
+        for node in reversed(nodes):
+            i = node.index
+            close = is_close_button(node)
+            self.is_close[i] = close
+            self.clickable[i] += node.clickable
+            self.close[i] += close
+            if node.depth > self.max_depth[i]:
+                self.max_depth[i] = node.depth
+
+            parent = node.parent
+            if parent >= 0:
+                self.size[parent] += self.size[i]
+                self.clickable[parent] += self.clickable[i]
+                self.close[parent] += self.close[i]
+                if self.max_depth[i] > self.max_depth[parent]:
+                    self.max_depth[parent] = self.max_depth[i]
+                # 倒序先遇到的是靠后的兄弟
+                self.later_siblings[i] = children_seen[parent]
+                children_seen[parent] += 1
+
+    def end(self, index: int) -> int:
+        """子树之后的第一个下标"""
+        return index + self.size[index]
+
+    def in_subtree(self, root: int, index: int) -> bool:
+        return root <= index < root + self.size[root]
+
+
+# 节点表 -> 子树聚合（节点表释放后自动移除）
+_table_stats: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_table_lock = threading.Lock()
+
+
+def subtree_stats(table) -> SubtreeStats:
+    """节点表（NodeTable）的子树聚合；同一节点表只计算一次"""
+    with _table_lock:
+        stats = _table_stats.get(table)
+    if stats is None:
+        stats = SubtreeStats(table)
+        with _table_lock:
+            stats = _table_stats.setdefault(table, stats)
+    return stats
+
+
+class PopupResult:
+    """弹窗检测结果（弹窗子树的根节点 + 置信度）"""
+
+    __slots__ = ('index', 'bounds', 'confidence', 'detected', 'depth', 'size', 'clickable_count',
+                 'close_buttons', 'class_name', 'resource_id')
+
+    def __init__(self, index: int, bounds: Tuple[int, int, int, int], confidence: float, detected: bool,
+                 depth: int, size: int, clickable_count: int, close_buttons: List[int],
+                 class_name: str, resource_id: str):
+        self.index = index
+        self.bounds = bounds
+        self.confidence = confidence
+        # 是否达到返回阈值（否则只是置信度最高的候选）
+        self.detected = detected
+        self.depth = depth
+        self.size = size
+        self.clickable_count = clickable_count
+        # 子树内的关闭按钮，以及浮在弹窗上层、落在弹窗范围内的关闭按钮（节点下标）
+        self.close_buttons = close_buttons
+        self.class_name = class_name
+        self.resource_id = resource_id
+
+    @property
+    def subtree(self) -> range:
+        """弹窗子树的节点下标范围"""
+        return range(self.index, self.index + self.size)
+
+    def nodes(self, table) -> list:
+        """弹窗子树的节点（先序）"""
+        return table.nodes[self.index:self.index + self.size]
+
+    def to_dict(self) -> dict:
+        return {
+            "bounds": list(self.bounds),
+            "confidence": round(self.confidence, 2),
+            "class": self.class_name.rsplit('.', 1)[-1],
+            "resource_id": self.resource_id,
+            "depth": self.depth,
+            "nodes": self.size,
+            "clickable": self.clickable_count,
+            "close_buttons": len(self.close_buttons),
+        }
+
+
+class PopupAnalyzer:
+    """在一个节点表上做弹窗分析（规则与原 _detect_popup_with_confidence 一致，关系判断改用控件树）"""
+
+    def __init__(self, table):
+        self.table = table
+        self.stats: SubtreeStats = subtree_stats(table)
+
+    def detect(self, screen_width: int, screen_height: int) -> Optional[PopupResult]:
+        """
+        找出最像弹窗的子树
+
+        Returns:
+            PopupResult（detected 表示是否达到阈值），没有任何候选时返回 None
+        """
+        table = self.table
+        stats = self.stats
+        nodes = table.nodes
+        screen_area = screen_width * screen_height
+        bounded = sum(1 for node in nodes if node.bounds)
+        if not bounded:
+            return None
+
+        # 关闭按钮、右上角 ImageView（即使 clickable="false"）各建一个小空间索引
+        spatial = table_index(table)
+        close_index = spatial.subset(i for i, close in enumerate(stats.is_close) if close)
+        top_right_index = spatial.subset(
+            node.index for node in nodes
+            if node.bounds and 'Image' in node.class_name and screen_width > 0 and screen_height > 0
+            and self._is_top_right_icon(node.bounds, screen_width, screen_height)
+        )
+
+        # 节点及其所有祖先都在兄弟中最上层 => 整棵子树绘制在最上层
+        on_top = [False] * len(nodes)
+        # 已出现的遮罩层里，子树最早结束的位置（之后的节点都在某个遮罩层之上，而不是在遮罩层内部）
+        mask_end = None
+
+        candidates = []
+        for node in nodes:
+            i = node.index
+            parent = node.parent
+            on_top[i] = stats.later_siblings[i] == 0 and (parent < 0 or on_top[parent])
+            if not node.bounds:
+                continue
+
+            x1, y1, x2, y2 = node.bounds
+            width, height = x2 - x1, y2 - y1
+            area_ratio = width * height / screen_area if screen_area > 0 else 0
+            class_name = node.class_name
+            resource_id = node.resource_id.lower()
+
+            # 检测遮罩层（大面积、几乎全屏、通常是 FrameLayout/View）
+            if area_ratio > 0.85 and width >= screen_width * 0.95:
+                if 'FrameLayout' in class_name or 'View' in class_name:
+                    end = stats.end(i)
+                    mask_end = end if mask_end is None else min(mask_end, end)
+
+            class_feature = any(kw in class_name for kw in DIALOG_CLASS_KEYWORDS)
+            id_feature = any(kw in resource_id for kw in DIALOG_ID_KEYWORDS)
+            ad_feature = any(kw in resource_id for kw in AD_POPUP_KEYWORDS)
+            has_strong_popup_feature = class_feature or id_feature or ad_feature
+
+            # 关闭按钮：子树内的（可以浮在 bounds 外），或落在范围内且绘制在它上层的
+            has_close_button_child = (stats.close[i] > stats.is_close[i] or
+                                      self._has_close_above(i, node.bounds, close_index))
+
+            has_top_right_close = False
+            if area_ratio > 0.9 and len(top_right_index):  # 全屏元素才检查
+                has_top_right_close = self._has_top_right_close(i, node.bounds, top_right_index)
+
+            # 【特殊处理】全屏广告页：如果面积 > 90% 但有关闭按钮或广告特征，也识别为弹窗
+            is_fullscreen_ad = area_ratio > 0.9 and (has_close_button_child or has_top_right_close or ad_feature)
+            if area_ratio > 0.9 and not is_fullscreen_ad:
+                continue
+
+            # 跳过太小的元素、状态栏区域
+            if area_ratio < 0.05 or y1 < 50:
+                continue
+
+            # 【非弹窗特征】底部导航栏、顶部搜索栏
+            if y2 > screen_height * 0.85:
+                if 'tab' in resource_id or 'Tab' in class_name or 'navigation' in resource_id:
+                    continue
+            if y1 < screen_height * 0.15:
+                if 'search' in resource_id or 'Search' in class_name:
+                    continue
+
+            # 【非弹窗特征】接近全屏的内容区域（视频播放器、内容列表等），真正的弹窗通常不超过 60%
+            if area_ratio > 0.6 and not has_strong_popup_feature:
+                continue
+
+            # 【非弹窗特征】子树内没有任何可交互元素、也没有关闭按钮（弹窗总要能点掉）
+            if not stats.clickable[i] and not has_close_button_child and not has_top_right_close:
+                continue
+
+            confidence = 0.0
+            if class_feature:
+                confidence += 0.5
+            if id_feature:
+                confidence += 0.4
+            if ad_feature:
+                confidence += 0.4
+            if has_close_button_child:
+                confidence += 0.3
+            if is_fullscreen_ad and has_top_right_close:
+                confidence += 0.4
+
+            has_strong_feature = (has_strong_popup_feature or has_close_button_child or
+                                  (is_fullscreen_ad and has_top_right_close))
+
+            # 【中等特征】居中显示；非全屏但有一定大小（没有强特征时降低权重）
+            is_centered_x = abs((x1 + x2) // 2 - screen_width / 2) < screen_width * 0.15
+            is_centered_y = abs((y1 + y2) // 2 - screen_height / 2) < screen_height * 0.25
+            if is_centered_x and is_centered_y:
+                confidence += 0.2 if has_strong_feature else 0.1
+            elif is_centered_x:
+                confidence += 0.1 if has_strong_feature else 0.05
+            if 0.15 < area_ratio < 0.75:
+                confidence += 0.15 if has_strong_feature else 0.08
+
+            # 【弱特征】绘制在最上层（自身和祖先都是最后一个兄弟），或 XML 顺序靠后
+            if on_top[i] or i > bounded * 0.5:
+                confidence += 0.1
+
+            # 【弱特征】在遮罩层之上（遮罩层是更早的兄弟分支，而不是自己的祖先）
+            if mask_end is not None and i >= mask_end:
+                confidence += 0.15
+
+            if confidence >= 0.3:
+                candidates.append((confidence, i, has_strong_popup_feature))
+
+        if not candidates:
+            return None
+
+        # 选择置信度最高的（同分取层级靠后的）；层层包裹、边界几乎相同的候选只保留优先的一个
+        from .nms import nms
+        candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        keep = nms([nodes[c[1]].bounds for c in candidates], iou_threshold=0.9)
+        confidence, index, strong = candidates[keep[0]]
+
+        node = nodes[index]
+        threshold = STRONG_FEATURE_THRESHOLD if strong else WEAK_FEATURE_THRESHOLD
+        return PopupResult(
+            index=index,
+            bounds=node.bounds,
+            confidence=confidence,
+            detected=confidence >= threshold,
+            depth=node.depth,
+            size=stats.size[index],
+            clickable_count=stats.clickable[index],
+            close_buttons=self._close_buttons(index, node.bounds, close_index),
+            class_name=node.class_name,
+            resource_id=node.resource_id,
+        )
+
+    # ==================== 内部实现 ====================
+
+    @staticmethod
+    def _is_top_right_icon(bounds, screen_width: int, screen_height: int) -> bool:
+        x1, y1, x2, y2 = bounds
+        return ((x1 + x2) // 2 / screen_width > 0.85 and (y1 + y2) // 2 / screen_height < 0.15 and
+                15 <= x2 - x1 <= 120 and 15 <= y2 - y1 <= 120)
+
+    def _has_close_above(self, index: int, bounds, close_index) -> bool:
+        # 范围内、先序在子树之后的关闭按钮（绘制在上层的浮动按钮；之前的被它盖住）
+        end = self.stats.end(index)
+        return any(j >= end for j in close_index.contained_in(bounds))
+
+    def _close_buttons(self, index: int, bounds, close_index) -> List[int]:
+        """弹窗子树内的关闭按钮 + 浮在弹窗上层的关闭按钮"""
+        stats = self.stats
+        end = stats.end(index)
+        found = []
+        if stats.close[index] > stats.is_close[index]:
+            found = [j for j in range(index + 1, end) if stats.is_close[j]]
+        found.extend(j for j in close_index.contained_in(bounds) if j >= end)
+        return found
+
+    def _has_top_right_close(self, index: int, bounds, top_right_index) -> bool:
+        ex1, ey1, ex2, ey2 = bounds
+        # 在当前元素范围内，或在元素右上角附近（左边缘、下边缘离元素右上角 50 像素内）
+        nearby = top_right_index.overlapping((ex2 - 50, ey1 - 170, ex2 + 170, ey1 + 50))
+        for j in top_right_index.contained_in(bounds) + nearby:
+            if j == index:
+                continue
+            ox1, oy1, ox2, oy2 = top_right_index.bounds(j)
+            if (ex1 <= ox1 and ey1 <= oy1 and ex2 >= ox2 and ey2 >= oy2) or \
+               (abs(ex2 - ox1) < 50 and abs(ey1 - oy2) < 50):
+                return True
+        return False
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截图流水线 - 截图直接进内存，裁剪/缩放/标注都在内存中完成
+
+功能：
+1. capture()：u2 / WDA 截图直接得到 PIL Image，不落临时文件
+2. encode()：整条流水线只编码一次（PNG / JPEG），得到 EncodedImage
+3. EncodedImage：可选写盘一次，也可直接返回 bytes / base64 给 MCP 层
+4. 缩放 + 编码提交到进程内共享的处理池（线程/进程可配置），所有设备的截图共用，
+   限制同时编码的图片数；进程模式下编码不占用 MCP 服务进程的 GIL。增量截图的多个变化区域先全部提交再取结果；
+   处理池关闭或异常时退回当前线程。可选缩放滤镜、WebP 输出、PNG 压缩级别
+5. StageTimer：记录 capture / decode / resize / encode / write 各阶段耗时
+6. ScreenshotCache：按原始帧精确摘要确认与上一张相同的画面，直接复用已编码/标注的结果
+7. changed_regions()：与上一帧分块对比，只返回变化区域的包围框（增量截图）
+
+说明：
+    旧流程是"截图写临时 PNG → PIL 重新打开 → 再编码写一次 → 删临时文件"，
+    每张截图多两次写盘和一次 PNG 解码。
+
+用法:
+    timer = StageTimer()
+    img = capture(client, timer=timer)
+    encoded = process(img, max_width=720, fmt="JPEG", quality=75, timer=timer)
+    pending = [submit_image(img.crop(box), fmt="PNG") for box in changed_regions(prev, img)]  # 多张并行
+    crops = [p.result(timer) for p in pending]
+    with timer.stage("write"):
+        path = encoded.save(screenshot_dir / "xxx.jpg")
+    timer.to_dict()   # {"capture": 120.3, "decode": 35.1, "resize": 8.2, "encode": 12.7, "write": 0.4, "total": ...}
+"""
+import base64
+import hashlib
+import io
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .dynamic_config import DynamicConfig
+
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+FILE_EXTENSIONS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WEBP": "webp",
+}
+
+# WebP 编码速度档位（0 最快，6 最慢但更小）
+WEBP_METHOD = 0
+
+
+class StageTimer:
+    """分阶段计时（毫秒），同名阶段累加"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def merge(self, timings: Dict[str, float]):
+        for name, ms in timings.items():
+            self.add(name, ms)
+
+    def to_dict(self) -> Dict[str, float]:
+        result = {name: round(ms, 1) for name, ms in self.timings.items()}
+        result["total"] = round((time.perf_counter() - self._start) * 1000, 1)
+        return result
+
+
+class EncodedImage:
+    """编码后的图片（只编码一次，写盘和 base64 共用同一份 bytes）"""
+
+    def __init__(self, data: bytes, fmt: str, width: int, height: int):
+        self.data = data
+        self.format = fmt
+        self.width = width
+        self.height = height
+        self.path: Optional[Path] = None
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES.get(self.format, "application/octet-stream")
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
+
+    def save(self, path: Union[str, Path]) -> Path:
+        """写盘（直接写已编码的 bytes，不再经过 PIL）"""
+        path = Path(path)
+        path.write_bytes(self.data)
+        self.path = path
+        return path
+
+
+def capture(client, ios_client=None, timer: Optional[StageTimer] = None):
+    """
+    截图到内存
+
+    优先取设备返回的原始字节（format='raw'），以便把传输和解码分开计时；
+    不支持时退回默认的 PIL Image 返回值。
+
+    Args:
+        client: MobileClient（Android 使用 client.u2）
+        ios_client: iOS 客户端（有则使用 ios_client.wda）
+        timer: 分阶段计时器（可选）
+
+    Returns:
+        PIL.Image.Image
+    """
+    timer = timer or StageTimer()
+    device = ios_client.wda if ios_client is not None else client.u2
+
+    with timer.stage("capture"):
+        try:
+            img = device.screenshot(format='raw')
+        except TypeError:
+            img = device.screenshot()
+
+    digest = None
+    if isinstance(img, (bytes, bytearray)):
+        with timer.stage("hash"):
+            digest = hashlib.blake2b(img, digest_size=16).digest()
+    with timer.stage("decode"):
+        if isinstance(img, (bytes, bytearray)):
+            from PIL import Image
+            img = Image.open(io.BytesIO(img))
+        img.load()
+    # 原始字节摘要只属于这一帧（copy/crop 得到的新图不会带上这个属性）
+    img._frame_digest = digest
+    return img
+
+
+def get_resample(name: str = "lanczos"):
+    """
+    缩放滤镜（兼容不同版本的 Pillow）
+
+    Args:
+        name: lanczos / bicubic / bilinear / nearest（reduce 模式使用 bilinear）
+    """
+    from PIL import Image
+    name = (name or "lanczos").upper()
+    if name == "REDUCE":
+        name = "BILINEAR"
+    resampling = getattr(Image, 'Resampling', None)
+    if resampling is not None and hasattr(resampling, name):
+        return getattr(resampling, name)
+    if hasattr(Image, name):
+        return getattr(Image, name)
+    return getattr(Image, 'ANTIALIAS', Image.BICUBIC)
+
+
+def resize_to_width(img, max_width: int, resample: str = "lanczos"):
+    """
+    按最大宽度等比缩放
+
+    resample="reduce" 时先用 Image.reduce() 做整数倍快速缩小，再用 BILINEAR 缩放到目标尺寸；
+    1080→720 这类非整数倍的情况直接 BILINEAR。
+    """
+    if not max_width or img.width <= max_width:
+        return img
+    size = (max_width, int(img.height * max_width / img.width))
+    if (resample or "").lower() == "reduce":
+        factor = img.width // max_width
+        if factor >= 2 and hasattr(img, 'reduce'):
+            img = img.reduce(factor)
+            if img.width == size[0]:
+                return img
+    return img.resize(size, get_resample(resample))
+
+
+def to_rgb(img):
+    """转换为 RGB（JPEG 不支持透明通道，透明部分填白色）"""
+    from PIL import Image
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert("RGB")
+    return img
+
+
+def normalize_format(fmt: str) -> str:
+    fmt = (fmt or "JPEG").upper()
+    return "JPEG" if fmt == "JPG" else fmt
+
+
+def encode(img, fmt: str = "JPEG", quality: int = 75,
+           png_compress_level: Optional[int] = None) -> EncodedImage:
+    """
+    编码图片（整条流水线只调用一次）
+
+    Args:
+        img: PIL Image
+        fmt: PNG / JPEG / WEBP
+        quality: JPEG / WebP 质量 1-100
+        png_compress_level: PNG 压缩级别 0-9，None 使用 DynamicConfig
+
+    Returns:
+        EncodedImage
+    """
+    fmt = normalize_format(fmt)
+
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img = to_rgb(img)
+        img.save(buffer, "JPEG", quality=quality)
+    elif fmt == "WEBP":
+        img.save(buffer, "WEBP", quality=quality, method=WEBP_METHOD)
+    elif fmt == "PNG":
+        if png_compress_level is None:
+            png_compress_level = DynamicConfig.screenshot_png_compress_level
+        img.save(buffer, "PNG", compress_level=png_compress_level)
+    else:
+        img.save(buffer, fmt)
+    return EncodedImage(buffer.getvalue(), fmt, img.width, img.height)
+
+
+def process_image(img, max_width: int = 0, resample: str = "lanczos", fmt: str = "JPEG",
+                  quality: int = 75, png_compress_level: Optional[int] = None
+                  ) -> Tuple[EncodedImage, Dict[str, float]]:
+    """
+    缩放 + 编码（在处理池中执行；模块级函数，进程池可以序列化）
+
+    Returns:
+        (EncodedImage, {"resize": ms, "encode": ms})
+    """
+    timer = StageTimer()
+    if max_width:
+        with timer.stage("resize"):
+            img = resize_to_width(img, max_width, resample)
+    with timer.stage("encode"):
+        encoded = encode(img, fmt, quality, png_compress_level)
+    return encoded, timer.timings
+
+
+# ==================== 处理池 ====================
+
+_pool: Optional[Executor] = None
+_pool_key: Optional[Tuple[str, int]] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[Executor]:
+    """
+    图片处理池（按 DynamicConfig 懒创建，配置变化后重建）
+
+    Returns:
+        Executor；screenshot_workers <= 0 时返回 None（在当前线程处理）
+    """
+    global _pool, _pool_key
+    mode = (DynamicConfig.screenshot_worker_mode or "thread").lower()
+    workers = int(DynamicConfig.screenshot_workers)
+    key = (mode, workers)
+
+    with _pool_lock:
+        if _pool is not None and _pool_key == key:
+            return _pool
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if workers > 0:
+            if mode == "process":
+                _pool = ProcessPoolExecutor(max_workers=workers)
+            else:
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot")
+        _pool_key = key
+        return _pool
+
+
+def process(img, max_width: int = 0, resample: Optional[str] = None, fmt: str = "JPEG",
+            quality: int = 75, png_compress_level: Optional[int] = None,
+            timer: Optional[StageTimer] = None) -> EncodedImage:
+    """
+    单张图片经处理池缩放 + 编码，等待结果（处理池不可用时在当前线程处理）
+
+    进程模式会序列化整张图片，换来编码不占用服务进程的 GIL；多设备同时截图时池的大小限制了并发编码数。
+
+    Args:
+        resample: 缩放滤镜，None 使用 DynamicConfig.screenshot_resample
+        png_compress_level: None 使用 DynamicConfig.screenshot_png_compress_level
+    """
+    return submit_image(img, max_width, resample, fmt, quality, png_compress_level).result(timer)
+
+
+def process_inline(img, max_width: int = 0, resample: Optional[str] = None, fmt: str = "JPEG",
+                   quality: int = 75, png_compress_level: Optional[int] = None,
+                   timer: Optional[StageTimer] = None) -> EncodedImage:
+    """
+    在当前线程缩放 + 编码（不经过处理池）
+
+    Args:
+        resample: 缩放滤镜，None 使用 DynamicConfig.screenshot_resample
+        png_compress_level: None 使用 DynamicConfig.screenshot_png_compress_level
+    """
+    return submit_image(img, max_width, resample, fmt, quality, png_compress_level, inline=True).result(timer)
+
+
+class PendingImage:
+    """提交到处理池的缩放 + 编码任务：调用方先提交全部图片，再依次取结果"""
+
+    def __init__(self, args: Tuple, future=None):
+        self._args = args
+        self._future = future
+        self._done: Optional[Tuple[EncodedImage, Dict[str, float]]] = None
+        if future is None:
+            self._done = process_image(*args)
+
+    def result(self, timer: Optional[StageTimer] = None) -> EncodedImage:
+        if self._done is None:
+            try:
+                self._done = self._future.result()
+            except Exception as e:
+                # 进程池崩溃等情况，退回当前线程
+                import sys
+                print(f"  ⚠️  图片处理池异常，改为同步处理: {e}", file=sys.stderr)
+                self._done = process_image(*self._args)
+        encoded, timings = self._done
+        if timer is not None:
+            timer.merge(timings)
+        return encoded
+
+
+def submit_image(img, max_width: int = 0, resample: Optional[str] = None, fmt: str = "JPEG",
+                 quality: int = 75, png_compress_level: Optional[int] = None,
+                 inline: bool = False) -> PendingImage:
+    """
+    提交缩放 + 编码任务（多张图片并行处理，如增量截图的各个变化区域）
+
+    处理池不可用（screenshot_workers <= 0）或 inline=True 时立即在当前线程处理。
+    进程池会序列化图片，只适合提交裁剪后的小图。
+
+    Args:
+        resample: 缩放滤镜，None 使用 DynamicConfig.screenshot_resample
+        png_compress_level: None 使用 DynamicConfig（进程池中读不到运行时修改的配置，这里先取出）
+    """
+    if resample is None:
+        resample = DynamicConfig.screenshot_resample
+    if png_compress_level is None:
+        png_compress_level = DynamicConfig.screenshot_png_compress_level
+    args = (img, max_width, resample, fmt, quality, png_compress_level)
+
+    pool = None if inline else get_pool()
+    if pool is None:
+        return PendingImage(args)
+    try:
+        return PendingImage(args, pool.submit(process_image, *args))
+    except Exception:
+        return PendingImage(args)  # 池已关闭（配置刚变化）等情况
+
+
+# ==================== 截图去重 ====================
+
+def frame_digest(img) -> bytes:
+    """
+    原始帧的精确摘要
+
+    capture() 拿到设备返回的原始字节时已顺带算好（几毫秒）；否则按解码后的像素计算。
+    """
+    digest = getattr(img, '_frame_digest', None)
+    if digest is None:
+        digest = hashlib.blake2b(img.tobytes(), digest_size=16).digest()
+        img._frame_digest = digest
+    return digest
+
+
+class CachedScreenshot:
+    """一次截图的可复用产物（已编码图片 + 不含输出路径的结果字段）"""
+
+    def __init__(self, digest: bytes, params: Tuple, encoded: EncodedImage,
+                 result: Dict[str, Any], filename: str, fingerprint=None):
+        self.digest = digest
+        self.params = params
+        self.encoded = encoded
+        self.result = result
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.timestamp = time.time()
+
+
+class ScreenshotCache:
+    """
+    截图去重缓存
+
+    每种截图（普通 / 网格 / SoM）只保留最近一张。新截图与它参数相同、原始帧精确摘要一致时才视为同一画面；
+    标注依赖控件树的截图（SoM、弹窗提示）还要求页面指纹一致。
+
+    不用感知哈希：缩到 16x16 后改一行文字、勾选框状态变化都可能完全相同，会把旧画面当成新画面返回。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, CachedScreenshot] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, kind: str, params: Tuple, digest: bytes, fingerprint=None) -> Optional[CachedScreenshot]:
+        """
+        查找可复用的截图
+
+        Args:
+            digest: 当前帧的精确摘要（frame_digest）
+            fingerprint: 标注依赖控件树时传当前页面指纹（PageFingerprint），否则为 None
+        """
+        if not DynamicConfig.screenshot_dedup:
+            return None
+        with self._lock:
+            entry = self._entries.get(kind)
+        if (entry is not None and entry.params == params
+                and entry.digest == digest
+                and self._same_page(entry.fingerprint, fingerprint)):
+            with self._lock:
+                self.hits += 1
+            return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, kind: str, params: Tuple, digest: bytes, encoded: EncodedImage,
+              result: Dict[str, Any], filename: str, fingerprint=None):
+        if not DynamicConfig.screenshot_dedup:
+            return
+        entry = CachedScreenshot(digest, params, encoded, dict(result), filename, fingerprint)
+        with self._lock:
+            self._entries[kind] = entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _same_page(cached, current) -> bool:
+        if cached is None and current is None:
+            return True
+        return cached is not None and current is not None and cached.same_as(current)
+
+
+# ==================== 增量截图（变化区域） ====================
+
+Box = Tuple[int, int, int, int]
+
+
+def changed_regions(previous, current, tile: int = 64, threshold: int = 24,
+                    max_regions: int = 4) -> List[Box]:
+    """
+    分块对比两帧，返回变化区域的包围框
+
+    1. 逐像素差值 → 灰度 → 二值化（差值 > threshold 视为变化，过滤编码噪声）
+    2. 只在整体变化范围内按 tile 分块，标记有变化像素的块
+    3. 相邻（8 邻域）的变化块合并为一个区域；区域过多时合并为一个整体包围框
+
+    Args:
+        previous: 上一帧（PIL Image，尺寸须与 current 相同）
+        current: 当前帧
+        tile: 分块边长（像素）
+        threshold: 像素差值阈值（0-255）
+        max_regions: 最多返回的区域数
+
+    Returns:
+        [(x1, y1, x2, y2), ...]，按面积从大到小；无变化返回 []
+    """
+    from PIL import ImageChops
+
+    diff = ImageChops.difference(previous.convert('RGB'), current.convert('RGB')).convert('L')
+    mask = diff.point(lambda v: 255 if v > threshold else 0)
+    overall = mask.getbbox()
+    if overall is None:
+        return []
+
+    width, height = current.size
+    c1, r1 = overall[0] // tile, overall[1] // tile
+    c2, r2 = (overall[2] - 1) // tile, (overall[3] - 1) // tile
+
+    changed = set()
+    for r in range(r1, r2 + 1):
+        for c in range(c1, c2 + 1):
+            box = (c * tile, r * tile, min(width, (c + 1) * tile), min(height, (r + 1) * tile))
+            if mask.crop(box).getbbox() is not None:
+                changed.add((r, c))
+
+    # 8 邻域连通的块合并为一个区域
+    regions = []
+    while changed:
+        stack = [changed.pop()]
+        min_r = max_r = stack[0][0]
+        min_c = max_c = stack[0][1]
+        while stack:
+            r, c = stack.pop()
+            min_r, max_r = min(min_r, r), max(max_r, r)
+            min_c, max_c = min(min_c, c), max(max_c, c)
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    neighbor = (r + dr, c + dc)
+                    if neighbor in changed:
+                        changed.remove(neighbor)
+                        stack.append(neighbor)
+        regions.append((min_c * tile, min_r * tile,
+                        min(width, (max_c + 1) * tile), min(height, (max_r + 1) * tile)))
+
+    if len(regions) > max_regions:
+        regions = [(min(b[0] for b in regions), min(b[1] for b in regions),
+                    max(b[2] for b in regions), max(b[3] for b in regions))]
+
+    regions.sort(key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True)
+    return regions
@@ -0,0 +1,175 @@
+"""
+控件空间索引 - 按屏幕网格分桶，快速回答"包含 / 被包含 / 重叠 / 点命中"查询
+
+用于：
+1. 弹窗检测：某个容器内是否有关闭按钮、全屏页右上角是否有 ImageView（不再两两比较所有元素）
+2. SoM 标注：编号框之间的嵌套关系
+3. click_by_som：点击点是否被嵌套的其他编号框盖住
+
+说明：
+    屏幕按固定大小的格子划分，每个框登记两次：
+    - 左上角所在的格子（"被包含"查询只需扫描查询框覆盖的格子）
+    - 覆盖到的所有格子（"包含 / 重叠 / 点命中"查询只需扫描相关格子）
+    候选再做一次精确比较。每个节点表只构建一次（table_index，随节点表释放）。
+
+用法:
+    spatial = table_index(snapshot.table)     # 整棵树（id 为节点下标），同 snapshot.spatial
+    inside = spatial.contained_in((0, 0, 1080, 600))
+    hits = spatial.at_point(540, 960)         # 按节点下标升序，最后一个在最上层
+    close_index = spatial.subset(close_ids)   # 只含部分节点的小索引
+"""
+
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+Box = Tuple[int, int, int, int]
+
+# 长边大约划分的格子数
+GRID_CELLS = 16
+
+# 格子最小边长（像素）
+MIN_CELL_SIZE = 32
+
+
+class SpatialIndex:
+    """框的网格索引（构建后只读，可在多线程间共享）"""
+
+    def __init__(self, items: Iterable[Tuple[int, Box]], cell_size: int = 0):
+        """
+        Args:
+            items: (id, (x1, y1, x2, y2)) 序列；id 由调用方决定（如节点下标、SoM 编号）
+            cell_size: 格子边长，0 表示按所有框的范围自动计算
+        """
+        self._boxes: Dict[int, Box] = {}
+        for item_id, box in items:
+            if box:
+                self._boxes[item_id] = box
+
+        extent_x = max((b[2] for b in self._boxes.values()), default=0)
+        extent_y = max((b[3] for b in self._boxes.values()), default=0)
+        self.cell_size = cell_size or max(MIN_CELL_SIZE, -(-max(extent_x, extent_y) // GRID_CELLS))
+        self._cols = max(1, -(-extent_x // self.cell_size))
+        self._rows = max(1, -(-extent_y // self.cell_size))
+
+        self._corners: Dict[Tuple[int, int], List[int]] = {}
+        self._covers: Dict[Tuple[int, int], List[int]] = {}
+        for item_id, (x1, y1, x2, y2) in self._boxes.items():
+            self._corners.setdefault(self._cell(x1, y1), []).append(item_id)
+            c1, r1 = self._cell(x1, y1)
+            c2, r2 = self._cell(x2, y2)
+            for r in range(r1, r2 + 1):
+                for c in range(c1, c2 + 1):
+                    self._covers.setdefault((c, r), []).append(item_id)
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._boxes
+
+    def bounds(self, item_id: int) -> Optional[Box]:
+        return self._boxes.get(item_id)
+
+    # ==================== 查询（结果均按 id 升序） ====================
+
+    def contained_in(self, box: Box) -> List[int]:
+        """完全落在 box 内（含边界重合）的框"""
+        bx1, by1, bx2, by2 = box
+        boxes = self._boxes
+        found = []
+        for cell in self._cells(box):
+            for item_id in self._corners.get(cell, ()):
+                x1, y1, x2, y2 = boxes[item_id]
+                if bx1 <= x1 and by1 <= y1 and x2 <= bx2 and y2 <= by2:
+                    found.append(item_id)
+        return sorted(found)
+
+    def any_contained_in(self, box: Box, exclude: Optional[int] = None) -> bool:
+        """是否有（除 exclude 外的）框完全落在 box 内，找到一个即返回"""
+        bx1, by1, bx2, by2 = box
+        boxes = self._boxes
+        for cell in self._cells(box):
+            for item_id in self._corners.get(cell, ()):
+                if item_id == exclude:
+                    continue
+                x1, y1, x2, y2 = boxes[item_id]
+                if bx1 <= x1 and by1 <= y1 and x2 <= bx2 and y2 <= by2:
+                    return True
+        return False
+
+    def containing(self, box: Box) -> List[int]:
+        """完全包住 box 的框"""
+        bx1, by1, bx2, by2 = box
+        boxes = self._boxes
+        found = []
+        for item_id in self._covers.get(self._cell(bx1, by1), ()):
+            x1, y1, x2, y2 = boxes[item_id]
+            if x1 <= bx1 and y1 <= by1 and bx2 <= x2 and by2 <= y2:
+                found.append(item_id)
+        return sorted(found)
+
+    def overlapping(self, box: Box) -> List[int]:
+        """与 box 有正面积交集的框"""
+        bx1, by1, bx2, by2 = box
+        boxes = self._boxes
+        found = set()
+        for cell in self._cells(box):
+            for item_id in self._covers.get(cell, ()):
+                if item_id in found:
+                    continue
+                x1, y1, x2, y2 = boxes[item_id]
+                if x1 < bx2 and bx1 < x2 and y1 < by2 and by1 < y2:
+                    found.add(item_id)
+        return sorted(found)
+
+    def at_point(self, x: int, y: int) -> List[int]:
+        """包含点 (x, y) 的框（左上闭、右下开）"""
+        boxes = self._boxes
+        found = []
+        for item_id in self._covers.get(self._cell(x, y), ()):
+            x1, y1, x2, y2 = boxes[item_id]
+            if x1 <= x < x2 and y1 <= y < y2:
+                found.append(item_id)
+        return sorted(found)
+
+    def subset(self, ids: Iterable[int]) -> "SpatialIndex":
+        """只包含部分框的新索引（沿用相同的格子大小）"""
+        return SpatialIndex(((i, self._boxes[i]) for i in ids if i in self._boxes), self.cell_size)
+
+    # ==================== 内部实现 ====================
+
+    def _cell(self, x: int, y: int) -> Tuple[int, int]:
+        # 超出范围（负坐标、屏幕外）的点归入边缘格子，精确比较时再过滤
+        col = min(max(int(x) // self.cell_size, 0), self._cols - 1)
+        row = min(max(int(y) // self.cell_size, 0), self._rows - 1)
+        return col, row
+
+    def _cells(self, box: Box) -> Iterable[Tuple[int, int]]:
+        c1, r1 = self._cell(box[0], box[1])
+        c2, r2 = self._cell(box[2], box[3])
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                yield c, r
+
+
+def build_index(boxes: Sequence[Optional[Box]]) -> SpatialIndex:
+    """按下标建索引（None 表示没有 bounds，跳过）"""
+    return SpatialIndex(enumerate(boxes))
+
+
+# 节点表 -> 整棵树的空间索引（节点表释放后自动移除）
+_table_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_table_lock = threading.Lock()
+
+
+def table_index(table) -> SpatialIndex:
+    """节点表（NodeTable）的空间索引，id 为节点下标；同一节点表只构建一次"""
+    with _table_lock:
+        index = _table_indexes.get(table)
+    if index is None:
+        index = build_index([node.bounds for node in table.nodes])
+        with _table_lock:
+            index = _table_indexes.setdefault(table, index)
+    return index
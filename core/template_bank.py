@@ -0,0 +1,417 @@
+"""
+模板预处理库 - 模板的灰度图和多尺度缩放图只计算一次
+
+功能：
+1. 每个模板预先生成灰度图和各尺度缩放图（可选边缘图），常驻内存
+2. 持久化到模板目录下的 .cache/bank.bin + bank.json，以内存映射方式加载，冷启动无需重新缩放
+3. 按文件 mtime/大小 + 内容哈希判断模板是否变化，添加/删除模板只更新对应条目
+
+说明：
+    bank.bin 只追加写入，删除或更新的条目留下的空洞超过有效数据量时整体压缩一次。
+    缓存目录不可写（如只读安装目录）时只在内存中保留，不影响匹配。
+
+用法:
+    bank = get_bank(template_dir, scales)
+    for entry in bank.entries():
+        for variant in entry.variants:
+            cv2.matchTemplate(gray_screen, variant.gray, cv2.TM_CCOEFF_NORMED)
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+# 支持的模板图片格式
+TEMPLATE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# 缩放后短于该尺寸的模板变体不生成（与匹配时的过滤条件一致）
+MIN_TEMPLATE_SIZE = 10
+
+
+class TemplateVariant:
+    """模板在某个尺度下的灰度图（及可选边缘图）"""
+
+    __slots__ = ('scale', 'gray', 'edges')
+
+    def __init__(self, scale: float, gray: np.ndarray, edges: Optional[np.ndarray] = None):
+        self.scale = scale
+        self.gray = gray
+        self.edges = edges
+
+    @property
+    def width(self) -> int:
+        return self.gray.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.gray.shape[0]
+
+
+def build_variants(template_gray: np.ndarray, scales: Sequence[float],
+                   with_edges: bool = False) -> List[TemplateVariant]:
+    """按尺度列表生成模板缩放图（跳过过小的尺度）"""
+    template_h, template_w = template_gray.shape[:2]
+    variants = []
+    for scale in scales:
+        new_w = int(template_w * scale)
+        new_h = int(template_h * scale)
+        if new_w < MIN_TEMPLATE_SIZE or new_h < MIN_TEMPLATE_SIZE:
+            continue
+        resized = cv2.resize(template_gray, (new_w, new_h))
+        edges = cv2.Canny(resized, 50, 150) if with_edges else None
+        variants.append(TemplateVariant(float(scale), resized, edges))
+    return variants
+
+
+class TemplateEntry:
+    """单个模板的预处理结果"""
+
+    def __init__(self, name: str, path: Path, mtime_ns: int, size: int, digest: str,
+                 gray: np.ndarray, variants: List[TemplateVariant]):
+        self.name = name
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.gray = gray
+        self.variants = variants
+        # 粗匹配用的二次缩放图（与截图尺寸有关，只在内存中缓存）
+        self.coarse_cache: Dict[Tuple[float, int, int], np.ndarray] = {}
+
+    def matches_stat(self, path: Path, stat: os.stat_result) -> bool:
+        return self.path == path and self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+
+class TemplateBank:
+    """
+    模板预处理库（线程安全）
+
+    entries() 每次只 stat 模板文件；文件未变化时直接返回内存中的条目，
+    进程首次加载时从内存映射的缓存文件读取，只有新增或修改的模板才重新计算。
+    """
+
+    VERSION = 1
+    CACHE_DIR = ".cache"
+    INDEX_FILE = "bank.json"
+    DATA_FILE = "bank.bin"
+
+    def __init__(self, template_dir, scales: Sequence[float], with_edges: bool = False,
+                 persist: bool = True):
+        self.template_dir = Path(template_dir)
+        self.scales = [float(s) for s in scales]
+        self.with_edges = with_edges
+        self.persist = persist
+        self.cache_dir = self.template_dir / self.CACHE_DIR
+
+        self._lock = threading.RLock()
+        self._entries: Dict[str, TemplateEntry] = {}
+        # 持久化索引：name -> {file, mtime_ns, size, digest, arrays: [...]}
+        self._records: Dict[str, Dict] = {}
+        self._data: Optional[np.memmap] = None
+        self._data_size = 0
+        self._index_loaded = False
+
+        self.stats = {"from_cache": 0, "built": 0, "removed": 0}
+
+    # ==================== 查询 ====================
+
+    def entries(self) -> List[TemplateEntry]:
+        """同步模板目录并返回所有模板（按名称排序，结果顺序稳定）"""
+        with self._lock:
+            self._sync()
+            return [self._entries[name] for name in sorted(self._entries)]
+
+    def get(self, name: str) -> Optional[TemplateEntry]:
+        with self._lock:
+            self._sync()
+            return self._entries.get(name)
+
+    # ==================== 增量更新 ====================
+
+    def update(self, name: str) -> Optional[TemplateEntry]:
+        """模板文件新增或被覆盖后调用，只重新计算这一个条目"""
+        with self._lock:
+            self._load_index()
+            self._entries.pop(name, None)
+            path = self._find_file(name)
+            entry = self._load_entry(name, path, verify=True) if path else None
+            if entry is None:
+                self._drop_record(name)
+            self._save_index()
+            return entry
+
+    def remove(self, name: str):
+        """模板文件删除后调用"""
+        with self._lock:
+            self._load_index()
+            self._entries.pop(name, None)
+            self._drop_record(name)
+            self._save_index()
+
+    # ==================== 内部实现 ====================
+
+    def _settings(self) -> Dict:
+        return {
+            "version": self.VERSION,
+            "scales": self.scales,
+            "edges": self.with_edges,
+            "min_size": MIN_TEMPLATE_SIZE,
+        }
+
+    def _scan(self) -> Dict[str, Path]:
+        files = {}
+        if not self.template_dir.exists():
+            return files
+        for file in self.template_dir.iterdir():
+            if file.is_file() and file.suffix.lower() in TEMPLATE_EXTENSIONS:
+                files.setdefault(file.stem, file)
+        return files
+
+    def _find_file(self, name: str) -> Optional[Path]:
+        for ext in TEMPLATE_EXTENSIONS:
+            path = self.template_dir / f"{name}{ext}"
+            if path.exists():
+                return path
+        return None
+
+    def _sync(self):
+        self._load_index()
+        files = self._scan()
+        changed = False
+
+        for name in list(self._entries):
+            if name not in files:
+                del self._entries[name]
+        for name in list(self._records):
+            if name not in files:
+                self._drop_record(name)
+                changed = True
+
+        for name, path in files.items():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entry = self._entries.get(name)
+            if entry is not None and entry.matches_stat(path, stat):
+                continue
+            record = self._records.get(name)
+            unchanged_on_disk = (record is not None and record["file"] == path.name
+                                 and record["mtime_ns"] == stat.st_mtime_ns
+                                 and record["size"] == stat.st_size)
+            self._entries.pop(name, None)
+            try:
+                loaded = self._load_entry(name, path, verify=not unchanged_on_disk)
+            except OSError:
+                continue  # 文件在扫描期间被删除或无法读取
+            if loaded is not None and not unchanged_on_disk:
+                changed = True
+
+        if changed:
+            self._save_index()
+
+    def _load_entry(self, name: str, path: Path, verify: bool) -> Optional[TemplateEntry]:
+        """
+        加载单个模板：缓存有效时从内存映射读取，否则读取图片重新计算
+
+        Args:
+            verify: 是否读取文件内容核对哈希（mtime/大小变化或显式更新时）
+        """
+        stat = path.stat()
+        record = self._records.get(name)
+        data = None
+        digest = record["digest"] if record else ""
+
+        if verify or record is None:
+            data = path.read_bytes()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+
+        if record is not None and record["digest"] == digest:
+            entry = self._entry_from_record(name, path, stat, record)
+            if entry is not None:
+                # 内容没变（只是 touch 过），更新文件信息即可
+                record.update({"file": path.name, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+                self._entries[name] = entry
+                self.stats["from_cache"] += 1
+                return entry
+
+        if data is None:
+            data = path.read_bytes()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            self._drop_record(name)
+            return None
+
+        from .template_matcher import to_gray
+        gray = np.ascontiguousarray(to_gray(image))
+        variants = build_variants(gray, self.scales, self.with_edges)
+        entry = TemplateEntry(name, path, stat.st_mtime_ns, stat.st_size, digest, gray, variants)
+        self._entries[name] = entry
+        self.stats["built"] += 1
+
+        self._drop_record(name)
+        if self.persist:
+            self._records[name] = {
+                "file": path.name,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "digest": digest,
+                "arrays": self._append_arrays(entry),
+            }
+        return entry
+
+    def _entry_from_record(self, name: str, path: Path, stat: os.stat_result,
+                           record: Dict) -> Optional[TemplateEntry]:
+        if self._data is None:
+            return None
+        gray = None
+        variants = {}
+        for item in record["arrays"]:
+            array = self._view(item["offset"], item["shape"])
+            if array is None:
+                return None
+            if item["kind"] == "gray":
+                gray = array
+            elif item["kind"] == "scaled":
+                variants[item["scale"]] = TemplateVariant(item["scale"], array)
+            elif item["kind"] == "edges" and item["scale"] in variants:
+                variants[item["scale"]].edges = array
+        if gray is None:
+            return None
+        ordered = [variants[s] for s in self.scales if s in variants]
+        return TemplateEntry(name, path, stat.st_mtime_ns, stat.st_size, record["digest"], gray, ordered)
+
+    def _view(self, offset: int, shape: List[int]) -> Optional[np.ndarray]:
+        count = int(shape[0]) * int(shape[1])
+        if offset + count > self._data_size:
+            return None
+        return self._data[offset:offset + count].reshape(shape[0], shape[1])
+
+    def _drop_record(self, name: str):
+        if self._records.pop(name, None) is not None:
+            self.stats["removed"] += 1
+
+    # ==================== 持久化 ====================
+
+    def _index_path(self) -> Path:
+        return self.cache_dir / self.INDEX_FILE
+
+    def _data_path(self) -> Path:
+        return self.cache_dir / self.DATA_FILE
+
+    def _load_index(self):
+        if self._index_loaded:
+            return
+        self._index_loaded = True
+        if not self.persist:
+            return
+        try:
+            index = json.loads(self._index_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if index.get("settings") != self._settings():
+            return  # 尺度等参数变了，缓存整体作废
+        self._records = index.get("entries", {})
+        self._map_data()
+
+    def _map_data(self):
+        path = self._data_path()
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        self._data_size = size
+        self._data = np.memmap(path, dtype=np.uint8, mode='r') if size else None
+
+    def _append_arrays(self, entry: TemplateEntry) -> List[Dict]:
+        """把条目的所有数组追加到 bank.bin，返回索引记录（写入失败时改为仅内存缓存）"""
+        arrays = [("gray", None, entry.gray)]
+        for variant in entry.variants:
+            arrays.append(("scaled", variant.scale, variant.gray))
+            if variant.edges is not None:
+                arrays.append(("edges", variant.scale, variant.edges))
+
+        items = []
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._data_path(), 'ab') as f:
+                offset = f.tell()
+                for kind, scale, array in arrays:
+                    buffer = np.ascontiguousarray(array, dtype=np.uint8)
+                    f.write(buffer.tobytes())
+                    items.append({"kind": kind, "scale": scale, "offset": offset,
+                                  "shape": [int(buffer.shape[0]), int(buffer.shape[1])]})
+                    offset += buffer.size
+        except OSError as e:
+            print(f"  ⚠️  模板缓存不可写，仅在内存中缓存: {e}", file=sys.stderr)
+            self.persist = False
+            return []
+        self._map_data()
+        return items
+
+    def _save_index(self):
+        if not self.persist:
+            return
+        self._compact_if_needed()
+        index = {"settings": self._settings(), "entries": self._records}
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._index_path().with_suffix(".tmp")
+            tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self._index_path())
+        except OSError as e:
+            print(f"  ⚠️  模板缓存索引写入失败: {e}", file=sys.stderr)
+
+    def _compact_if_needed(self):
+        """删除/更新留下的空洞超过有效数据量时重写 bank.bin"""
+        live = sum(int(item["shape"][0]) * int(item["shape"][1])
+                   for record in self._records.values() for item in record["arrays"])
+        if self._data_size - live <= max(live, 1 << 20):
+            return
+
+        # 先把有效数据读出来，再重写文件（内存中的条目仍引用旧映射，不受影响）
+        chunks = []
+        for record in self._records.values():
+            for item in record["arrays"]:
+                array = self._view(item["offset"], item["shape"])
+                if array is not None:
+                    chunks.append((item, np.array(array)))
+        offsets = []
+        try:
+            tmp = self._data_path().with_suffix(".tmp")
+            with open(tmp, 'wb') as f:
+                offset = 0
+                for _, array in chunks:
+                    f.write(array.tobytes())
+                    offsets.append(offset)
+                    offset += array.size
+            os.replace(tmp, self._data_path())
+        except OSError:
+            return  # 压缩失败不影响使用（如 Windows 上文件仍被映射）
+        for (item, _), offset in zip(chunks, offsets):
+            item["offset"] = offset
+        self._map_data()
+
+
+# 进程内共享：同一模板目录和尺度只保留一份（TemplateMatcher 每次调用都会新建）
+_BANKS: Dict[Tuple, TemplateBank] = {}
+_BANKS_LOCK = threading.Lock()
+
+
+def get_bank(template_dir, scales: Sequence[float], with_edges: bool = False) -> TemplateBank:
+    """获取模板目录对应的共享模板库"""
+    key = (str(Path(template_dir).resolve()), tuple(float(s) for s in scales), with_edges)
+    with _BANKS_LOCK:
+        bank = _BANKS.get(key)
+        if bank is None:
+            bank = TemplateBank(template_dir, scales, with_edges)
+            _BANKS[key] = bank
+        return bank
@@ -0,0 +1,303 @@
+"""
+模板库索引 - 每个模板一份紧凑描述（感知哈希 + 小尺寸归一化缩略图），用于去重和淘汰
+
+功能：
+1. 新模板查重：一次矩阵乘法算出与所有模板缩略图的相关系数，不再逐个读图、缩放、匹配
+2. 近似重复合并：相似度过高的模板聚成一组，只保留命中最多的一个（命中数合并过去）
+3. 命中统计 + 淘汰：记录每个模板的命中次数和最近命中时间，超过上限时优先删除从未命中的自动学习模板
+
+说明：
+    描述从模板库（template_bank.py）已加载的灰度图计算，保存在 .cache/index.json 一个文件里；
+    模板内容哈希变化时才重新计算。
+
+用法:
+    index = TemplateIndex(bank)
+    novel, nearest, similarity = index.is_novel(gray_crop)
+    index.record_hit("x_circle")
+"""
+
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+# 缩略图边长（16x16 = 256 维）
+THUMB_SIZE = 16
+
+# 缩略图相关系数 >= 该值视为同一个模板
+NOVELTY_SIMILARITY = 0.85
+
+# 感知哈希汉明距离 <= 该值也视为同一个模板
+PHASH_DUPLICATE_DISTANCE = 4
+
+# 自动学习模板的文件名前缀（只有这类模板会被淘汰）
+AUTO_TEMPLATE_PREFIX = "auto_"
+
+# 查重时按这些比例取查询图的中心区域分别比较（缩略图对位置敏感，裁剪留白不同也能对上）
+QUERY_CROP_RATIOS = (1.0, 0.9, 0.8, 0.7)
+
+
+def describe(gray: np.ndarray) -> Tuple[int, np.ndarray]:
+    """
+    计算模板描述
+
+    Returns:
+        (64 位 dHash, THUMB_SIZE x THUMB_SIZE 的 uint8 缩略图)
+    """
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    phash = int(np.packbits(bits).view('>u8')[0])
+    thumb = cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+    return phash, np.ascontiguousarray(thumb, dtype=np.uint8)
+
+
+def center_crops(gray: np.ndarray) -> List[np.ndarray]:
+    """按 QUERY_CROP_RATIOS 取中心区域"""
+    height, width = gray.shape[:2]
+    crops = []
+    for ratio in QUERY_CROP_RATIOS:
+        mh, mw = int(height * (1 - ratio) / 2), int(width * (1 - ratio) / 2)
+        crop = gray[mh:height - mh, mw:width - mw]
+        if crop.shape[0] >= 9 and crop.shape[1] >= 9:
+            crops.append(crop)
+    return crops or [gray]
+
+
+def normalize(thumb: np.ndarray) -> np.ndarray:
+    """缩略图去均值、单位化（点积即相关系数）"""
+    vector = thumb.astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class TemplateIndex:
+    """模板库索引（线程安全，依附于一个 TemplateBank）"""
+
+    FILE_NAME = "index.json"
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.path = bank.cache_dir / self.FILE_NAME
+
+        self._lock = threading.RLock()
+        # name -> {digest, phash, thumb(base64), hits, last_hit, added}
+        self._records: Dict[str, Dict] = {}
+        self._loaded = False
+
+        # 查重用的矩阵（按 _names 顺序，每行一个单位化缩略图）
+        self._names: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._hashes: Optional[np.ndarray] = None
+
+    # ==================== 查询 ====================
+
+    def is_novel(self, gray: np.ndarray,
+                 threshold: float = NOVELTY_SIMILARITY) -> Tuple[bool, Optional[str], float]:
+        """
+        判断裁剪出的按钮图是否是模板库里没有的新样式
+
+        Args:
+            gray: 灰度图
+            threshold: 缩略图相关系数达到该值即认为已存在
+
+        Returns:
+            (是否新样式, 最相似的模板名, 相似度)
+        """
+        with self._lock:
+            self._sync()
+            if not self._names:
+                return True, None, 0.0
+
+            phash, _ = describe(gray)
+            queries = np.vstack([normalize(describe(crop)[1]) for crop in center_crops(gray)])
+            similarities = (self._matrix @ queries.T).max(axis=1)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                return False, self._names[best], float(similarities[best])
+
+            # 缩略图不够像，但感知哈希几乎一样（如整体亮度不同），也算已存在
+            distances = [bin(int(h) ^ phash).count('1') for h in self._hashes]
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= PHASH_DUPLICATE_DISTANCE:
+                return False, self._names[nearest], float(similarities[nearest])
+
+            return True, self._names[best], float(similarities[best])
+
+    def stats(self) -> List[Dict]:
+        """每个模板的命中统计（按命中数降序）"""
+        with self._lock:
+            self._sync()
+            items = [{"name": name, "hits": r["hits"], "last_hit": r["last_hit"], "added": r["added"]}
+                     for name, r in self._records.items()]
+            return sorted(items, key=lambda x: (-x["hits"], x["name"]))
+
+    # ==================== 更新 ====================
+
+    def record_hit(self, name: str):
+        """模板匹配成功（被用来点击）时调用"""
+        with self._lock:
+            self._sync()
+            record = self._records.get(name)
+            if record is None:
+                return
+            record["hits"] += 1
+            record["last_hit"] = time.time()
+            self._save()
+
+    def transfer_hits(self, source: str, target: str):
+        """合并近似重复模板时，把被删除模板的命中数转给保留的模板"""
+        with self._lock:
+            src, dst = self._records.get(source), self._records.get(target)
+            if src and dst:
+                dst["hits"] += src["hits"]
+                dst["last_hit"] = max(dst["last_hit"], src["last_hit"])
+
+    def refresh(self):
+        """模板增删后调用，重新同步描述"""
+        with self._lock:
+            self._sync()
+
+    # ==================== 合并 / 淘汰计划（由 TemplateMatcher 执行删除） ====================
+
+    def plan_merges(self, similarity: float = 0.92) -> List[Tuple[str, List[str]]]:
+        """
+        近似重复聚类：按 (命中数降序, 加入时间) 贪心，每组保留第一个
+
+        Returns:
+            [(保留的模板, [要合并删除的模板, ...]), ...]
+        """
+        with self._lock:
+            self._sync()
+            if len(self._names) < 2:
+                return []
+
+            position = {name: i for i, name in enumerate(self._names)}
+            order = sorted(self._names, key=lambda n: (-self._records[n]["hits"], self._records[n]["added"], n))
+            similarities = self._matrix @ self._matrix.T
+
+            merged = set()
+            plan = []
+            for keep in order:
+                if keep in merged:
+                    continue
+                row = similarities[position[keep]]
+                duplicates = [name for name in order
+                              if name != keep and name not in merged
+                              and name.startswith(AUTO_TEMPLATE_PREFIX)
+                              and row[position[name]] >= similarity]
+                if duplicates:
+                    merged.update(duplicates)
+                    merged.add(keep)
+                    plan.append((keep, duplicates))
+            return plan
+
+    def plan_prune(self, max_templates: int, protect: Sequence[str] = ()) -> List[str]:
+        """
+        超过上限时要淘汰的自动学习模板：先淘汰从未命中的（最早加入的优先），再按最近命中时间
+
+        Args:
+            max_templates: 模板数上限
+            protect: 不参与淘汰的模板（如刚学到、还没机会命中的模板）
+
+        Returns:
+            要删除的模板名列表
+        """
+        with self._lock:
+            self._sync()
+            excess = len(self._records) - max(0, max_templates)
+            if excess <= 0:
+                return []
+            candidates = [name for name in self._records
+                          if name.startswith(AUTO_TEMPLATE_PREFIX) and name not in protect]
+            candidates.sort(key=lambda n: (self._records[n]["hits"] > 0,
+                                           self._records[n]["last_hit"] or self._records[n]["added"]))
+            return candidates[:excess]
+
+    # ==================== 内部实现 ====================
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._records = data.get("templates", {})
+        except (OSError, ValueError):
+            self._records = {}
+
+    def _sync(self):
+        """与模板库对齐：新增/内容变化的模板重新计算描述，已删除的移除"""
+        self._load()
+        entries = {entry.name: entry for entry in self.bank.entries()}
+        changed = False
+
+        for name in list(self._records):
+            if name not in entries:
+                del self._records[name]
+                changed = True
+
+        now = time.time()
+        for name, entry in entries.items():
+            record = self._records.get(name)
+            if record is not None and record.get("digest") == entry.digest:
+                continue
+            phash, thumb = describe(entry.gray)
+            self._records[name] = {
+                "digest": entry.digest,
+                "phash": phash,
+                "thumb": base64.b64encode(thumb.tobytes()).decode("ascii"),
+                "hits": record["hits"] if record else 0,
+                "last_hit": record["last_hit"] if record else 0.0,
+                "added": record["added"] if record else now,
+            }
+            changed = True
+
+        if changed or self._matrix is None:
+            self._build_matrix()
+        if changed:
+            self._save()
+
+    def _build_matrix(self):
+        self._names = sorted(self._records)
+        if not self._names:
+            self._matrix = np.zeros((0, THUMB_SIZE * THUMB_SIZE), np.float32)
+            self._hashes = np.zeros(0, np.uint64)
+            return
+        rows = []
+        for name in self._names:
+            thumb = np.frombuffer(base64.b64decode(self._records[name]["thumb"]), np.uint8)
+            rows.append(normalize(thumb))
+        self._matrix = np.vstack(rows)
+        self._hashes = np.array([self._records[name]["phash"] for name in self._names], dtype=np.uint64)
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"version": 1, "templates": self._records}), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"  ⚠️  模板索引写入失败: {e}", file=sys.stderr)
+
+
+# 进程内共享：每个模板库一份索引
+_INDEXES: Dict[int, TemplateIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(bank) -> TemplateIndex:
+    """获取模板库对应的共享索引"""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(id(bank))
+        if index is None:
+            index = TemplateIndex(bank)
+            _INDEXES[id(bank)] = index
+        return index
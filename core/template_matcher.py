@@ -4,24 +4,189 @@ OpenCV 模板匹配器 - 用于精确识别广告弹窗X号
 1. 收集常见X号样式建立模板库
 2. 多尺度匹配解决分辨率差异
 3. 返回精确坐标，点击准确率高
+4. 金字塔由粗到精匹配：先在缩小的截图上找候选位置和尺度，再只在候选附近的小窗口内全分辨率精匹配
+5. 模板灰度图和多尺度缩放图预先计算并持久化（见 template_bank.py），匹配时不再重复缩放
+6. 按 (模板, 尺度) 分片并行匹配（cv2.matchTemplate 会释放 GIL），结果按固定顺序合并，与串行一致
+7. 区域先验：优先只在弹窗四角/底部、屏幕右上角/底部中间和历史点击位置附近搜索，找不到再全屏搜索
+8. 模板索引：新模板查重、近似重复合并、按命中数淘汰，模板库大小有上限（见 template_index.py）
 """
 
+import math
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 from pathlib import Path
 
 
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """BGR / BGRA / 灰度图统一转为灰度图（不使用透明通道）"""
+    if len(image.shape) == 3:
+        if image.shape[2] == 4:  # BGRA
+            return cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def find_peaks(result: np.ndarray, threshold: float, neighborhood: int,
+               max_peaks: int = 0) -> List[Tuple[int, int, float]]:
+    """
+    在 matchTemplate 结果图中提取局部极大值（向量化，不逐像素遍历）
+    
+    Args:
+        result: matchTemplate 结果图
+        threshold: 最低分数
+        neighborhood: 局部极大值的邻域边长（像素）
+        max_peaks: 最多返回的峰值数（按分数取前 N 个，0 表示不限制）
+        
+    Returns:
+        [(x, y, score), ...]，按分数从高到低
+    """
+    mask = result >= threshold
+    if not mask.any():
+        return []
+    
+    size = max(3, neighborhood | 1)
+    dilated = cv2.dilate(result, np.ones((size, size), np.uint8))
+    ys, xs = np.nonzero(mask & (result >= dilated))
+    scores = result[ys, xs]
+    
+    if max_peaks and len(scores) > max_peaks:
+        top = np.argpartition(-scores, max_peaks - 1)[:max_peaks]
+        ys, xs, scores = ys[top], xs[top], scores[top]
+    
+    order = np.argsort(-scores, kind='stable')
+    return [(int(xs[i]), int(ys[i]), float(scores[i])) for i in order]
+
+
+def shrink(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    缩小到粗匹配尺寸并做轻度平滑
+
+    细线条（1-2px）的模板缩小后，截图与模板的采样相位不同会让粗匹配分数掉到放宽阈值以下，
+    两边都平滑后对相位不敏感，避免漏掉全分辨率下能匹配上的位置。
+    """
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (5, 5), 0)
+
+
+class ScreenPyramid:
+    """
+    截图灰度金字塔（每张截图只转换/缩放一次，所有模板共用）
+    
+    coarse 为缩小到约 coarse_width 宽的灰度图，factor 为缩放比例；截图本身足够小时不缩放（factor=1）。
+    只搜索局部区域时传入整图的 factor，区域与整图使用同样的粗匹配比例。
+    """
+    
+    def __init__(self, screenshot: np.ndarray, coarse_width: int = 480, factor: Optional[float] = None):
+        self.gray = to_gray(screenshot)
+        height, width = self.gray.shape[:2]
+        if factor is None:
+            factor = coarse_width / float(width) if width else 1.0
+        self.factor = min(1.0, factor)
+        if self.factor < 1.0:
+            size = (max(1, int(round(width * self.factor))), max(1, int(round(height * self.factor))))
+            self.coarse = shrink(self.gray, size)
+        else:
+            self.coarse = self.gray
+    
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.gray.shape[:2]
+
+
+# 模板匹配线程池（进程内共享，按 worker 数分别保留）
+# 不在 worker 数变化时关闭旧线程池：其他线程可能正在向它提交任务
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers: int) -> Optional[ThreadPoolExecutor]:
+    """获取模板匹配线程池，workers <= 1 时返回 None（串行）"""
+    if workers <= 1:
+        return None
+    with _executor_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers,
+                                          thread_name_prefix=f"template-match-{workers}")
+            _executors[workers] = executor
+        return executor
+
+
+# 区域：(x1, y1, x2, y2)，取值为占截图宽高的比例（0-1）
+Region = Tuple[float, float, float, float]
+
+# 屏幕级先验：右上角（跳过/关闭）、底部中间（弹窗下方的圆形 X）
+SCREEN_PRIOR_REGIONS: List[Region] = [
+    (0.6, 0.0, 1.0, 0.3),
+    (0.3, 0.6, 0.7, 1.0),
+]
+
+
+def close_button_regions(
+    screen_width: int,
+    screen_height: int,
+    popup_bounds: Optional[Tuple[int, int, int, int]] = None,
+    points: Optional[List[Tuple[float, float]]] = None
+) -> List[Region]:
+    """
+    关闭按钮的优先搜索区域
+    
+    Args:
+        screen_width, screen_height: 屏幕尺寸（像素）
+        popup_bounds: 检测到的弹窗边界（像素），关闭按钮通常在它的上边两角或正下方
+        points: 历史成功点击位置（百分比坐标 0-100，与 click_by_percent 一致）
+        
+    Returns:
+        区域列表（比例坐标），已去掉被其他区域完全包含的区域
+    """
+    if screen_width <= 0 or screen_height <= 0:
+        return []
+    
+    boxes = []
+    if popup_bounds:
+        x1, y1, x2, y2 = popup_bounds
+        cx = (x1 + x2) / 2
+        # 角落区域边长：弹窗短边的 1/4，但不小于屏幕宽度的 8%
+        band = max(screen_width * 0.08, min(x2 - x1, y2 - y1) * 0.25)
+        boxes += [
+            (x2 - band * 1.5, y1 - band, x2 + band * 0.5, y1 + band),   # 右上角
+            (x1 - band * 0.5, y1 - band, x1 + band * 1.5, y1 + band),   # 左上角
+            (cx - band, y2 - band * 0.5, cx + band, y2 + band * 1.5),   # 正下方
+        ]
+    for x_pct, y_pct in points or []:
+        px, py = screen_width * x_pct / 100, screen_height * y_pct / 100
+        half_w, half_h = screen_width * 0.08, screen_height * 0.05
+        boxes.append((px - half_w, py - half_h, px + half_w, py + half_h))
+    
+    regions = [(x1 / screen_width, y1 / screen_height, x2 / screen_width, y2 / screen_height)
+               for x1, y1, x2, y2 in boxes]
+    regions += SCREEN_PRIOR_REGIONS
+    
+    clipped = []
+    for x1, y1, x2, y2 in regions:
+        box = (max(0.0, x1), max(0.0, y1), min(1.0, x2), min(1.0, y2))
+        if box[2] > box[0] and box[3] > box[1] and box not in clipped:
+            clipped.append(box)
+    
+    return [box for box in clipped
+            if not any(other != box and other[0] <= box[0] and other[1] <= box[1]
+                       and other[2] >= box[2] and other[3] >= box[3] for other in clipped)]
+
+
 class TemplateMatcher:
     """OpenCV 模板匹配器"""
     
-    def __init__(self, template_dir: Optional[str] = None):
+    def __init__(self, template_dir: Optional[str] = None, workers: Optional[int] = None):
         """
         初始化模板匹配器
         
         Args:
             template_dir: 模板目录路径，默认为 templates/close_buttons/
+            workers: 并行匹配线程数，None 使用 DynamicConfig.template_match_workers，0/1 为串行
         """
         if template_dir is None:
             # 默认模板目录：优先使用包内目录，其次使用项目根目录
@@ -50,8 +215,37 @@ class TemplateMatcher:
         # 匹配阈值（越高越严格）
         self.match_threshold = 0.75
         
+        # 金字塔匹配：粗匹配截图宽度、粗匹配阈值放宽量、每个尺度最多精匹配的候选数（超过则该尺度全分辨率匹配）
+        self.use_pyramid = True
+        self.coarse_width = 480
+        self.coarse_threshold_margin = 0.15
+        self.max_candidates = 20
+        # 粗匹配模板短边小于该值时细节损失太多，该尺度直接全分辨率匹配
+        self.min_coarse_template = 8
+        
         # 缓存加载的模板
         self._template_cache: Dict[str, np.ndarray] = {}
+        
+        # 模板预处理库（灰度 + 多尺度缩放，进程内共享并持久化到模板目录）
+        self._bank = None
+        self._index = None
+        
+        self.workers = workers
+    
+    @property
+    def bank(self):
+        if self._bank is None:
+            from .template_bank import get_bank
+            self._bank = get_bank(self.template_dir, self.scales)
+        return self._bank
+    
+    @property
+    def index(self):
+        """模板索引（查重 / 命中统计 / 淘汰）"""
+        if self._index is None:
+            from .template_index import get_index
+            self._index = get_index(self.bank)
+        return self._index
     
     def load_templates(self) -> List[Tuple[str, np.ndarray]]:
         """
@@ -89,7 +283,8 @@ class TemplateMatcher:
         self, 
         screenshot: np.ndarray, 
         template: np.ndarray,
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        pyramid: Optional[ScreenPyramid] = None
     ) -> List[Dict]:
         """
         单模板多尺度匹配
@@ -98,119 +293,238 @@ class TemplateMatcher:
             screenshot: 截图 (BGR格式)
             template: 模板图片
             threshold: 匹配阈值
+            pyramid: 截图金字塔（多个模板匹配同一截图时传入，避免重复转换）
             
         Returns:
             匹配结果列表
         """
         if threshold is None:
             threshold = self.match_threshold
+        if pyramid is None:
+            pyramid = ScreenPyramid(screenshot, self.coarse_width)
+        
+        # 处理模板（可能有透明通道）
+        # 注意：不使用 mask，因为 TM_CCOEFF_NORMED + mask 可能返回 INF
+        from .template_bank import build_variants
+        variants = build_variants(to_gray(template), self.scales)
+        return self.match_variants(variants, threshold, pyramid)
+    
+    def match_variants(
+        self,
+        variants: List,
+        threshold: float,
+        pyramid: ScreenPyramid,
+        coarse_cache: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        用预先缩放好的模板变体匹配截图
         
+        Args:
+            variants: TemplateVariant 列表（见 template_bank.build_variants）
+            threshold: 匹配阈值
+            pyramid: 截图金字塔
+            coarse_cache: 粗匹配模板缓存（模板库条目的 coarse_cache，跨调用复用）
+            
+        Returns:
+            匹配结果列表
+        """
         results = []
+        for variant in variants:
+            results.extend(self._match_variant(variant, threshold, pyramid, coarse_cache))
+        
+        # 非极大值抑制（去除重叠的检测框）
+        return self._non_max_suppression(results)
+    
+    def _match_variant(
+        self,
+        variant,
+        threshold: float,
+        pyramid: ScreenPyramid,
+        coarse_cache: Optional[Dict] = None
+    ) -> List[Dict]:
+        """单个尺度的模板匹配（未做 NMS），并行匹配的最小分片"""
+        resized_template = variant.gray
+        new_h, new_w = resized_template.shape[:2]
+        screen_h, screen_w = pyramid.shape
+        
+        # 跳过比截图还大的模板
+        if new_w > screen_w or new_h > screen_h:
+            return []
         
-        # 转灰度图
-        if len(screenshot.shape) == 3:
-            gray_screen = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        coarse_w = int(round(new_w * pyramid.factor))
+        coarse_h = int(round(new_h * pyramid.factor))
+        if (self.use_pyramid and pyramid.factor < 1.0
+                and min(coarse_w, coarse_h) >= self.min_coarse_template):
+            key = (variant.scale, coarse_w, coarse_h)
+            coarse_template = coarse_cache.get(key) if coarse_cache is not None else None
+            if coarse_template is None:
+                coarse_template = shrink(resized_template, (coarse_w, coarse_h))
+                if coarse_cache is not None:
+                    coarse_cache[key] = coarse_template
+            peaks = self._match_coarse_to_fine(pyramid, coarse_template, resized_template, threshold)
         else:
-            gray_screen = screenshot
+            peaks = self._match_full(pyramid.gray, resized_template, threshold)
+        
+        return [{
+            'x': int(x + new_w // 2),
+            'y': int(y + new_h // 2),
+            'width': int(new_w),
+            'height': int(new_h),
+            'scale': float(variant.scale),
+            'confidence': confidence,
+            'top_left': (int(x), int(y)),
+            'bottom_right': (int(x + new_w), int(y + new_h))
+        } for x, y, confidence in peaks]
+    
+    def match_entries(self, entries: List, threshold: float, pyramid: ScreenPyramid) -> List[Dict]:
+        """
+        用模板库条目匹配截图（按 模板×尺度 分片并行）
         
-        # 处理模板（可能有透明通道）
-        # 注意：不使用 mask，因为 TM_CCOEFF_NORMED + mask 可能返回 INF
-        if len(template.shape) == 3:
-            if template.shape[2] == 4:  # BGRA
-                template_gray = cv2.cvtColor(template[:, :, :3], cv2.COLOR_BGR2GRAY)
-            else:  # BGR
-                template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        各分片结果按 (模板顺序, 尺度顺序) 收集，每个模板单独 NMS 后再合并，
+        与串行执行的结果完全一致。
+        
+        Returns:
+            匹配结果列表（带 template 字段，未做跨模板 NMS）
+        """
+        workers = self.workers
+        if workers is None:
+            from .dynamic_config import DynamicConfig
+            workers = DynamicConfig.template_match_workers
+        
+        shards = [(entry, variant) for entry in entries for variant in entry.variants]
+        # 线程池按配置的 worker 数取（分片少时只是用不满，不为每种分片数单独建池）
+        executor = get_executor(int(workers)) if len(shards) > 1 else None
+        if executor is None:
+            shard_results = [self._match_variant(variant, threshold, pyramid, entry.coarse_cache)
+                             for entry, variant in shards]
         else:
-            template_gray = template
+            futures = [executor.submit(self._match_variant, variant, threshold, pyramid, entry.coarse_cache)
+                       for entry, variant in shards]
+            shard_results = [future.result() for future in futures]
         
-        template_h, template_w = template_gray.shape[:2]
+        per_template: Dict[str, List[Dict]] = {}
+        for (entry, _), results in zip(shards, shard_results):
+            per_template.setdefault(entry.name, []).extend(results)
         
-        # 多尺度匹配
-        for scale in self.scales:
-            # 缩放模板
-            new_w = int(template_w * scale)
-            new_h = int(template_h * scale)
-            
-            # 跳过太小或太大的模板
-            if new_w < 10 or new_h < 10:
-                continue
-            if new_w > gray_screen.shape[1] or new_h > gray_screen.shape[0]:
-                continue
-            
-            resized_template = cv2.resize(template_gray, (new_w, new_h))
-            
-            # 模板匹配
-            try:
-                result = cv2.matchTemplate(
-                    gray_screen, resized_template, 
-                    cv2.TM_CCOEFF_NORMED
-                )
-            except cv2.error:
+        all_matches = []
+        for entry in entries:
+            for match in self._non_max_suppression(per_template.get(entry.name, [])):
+                match['template'] = entry.name
+                all_matches.append(match)
+        return all_matches
+    
+    def _match(self, image: np.ndarray, template: np.ndarray) -> Optional[np.ndarray]:
+        """matchTemplate，失败或结果包含 INF/NAN 时返回 None"""
+        try:
+            result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        except cv2.error:
+            return None
+        if not np.isfinite(result).all():
+            return None
+        return result
+    
+    def _match_full(self, gray: np.ndarray, template: np.ndarray,
+                    threshold: float) -> List[Tuple[int, int, float]]:
+        """全分辨率整图匹配（截图很小或模板太小、无法粗匹配时使用）"""
+        result = self._match(gray, template)
+        if result is None:
+            return []
+        h, w = template.shape[:2]
+        return find_peaks(result, threshold, min(w, h) // 2)
+    
+    def _match_coarse_to_fine(self, pyramid: ScreenPyramid, coarse_template: np.ndarray,
+                              resized_template: np.ndarray,
+                              threshold: float) -> List[Tuple[int, int, float]]:
+        """
+        粗匹配找候选位置，再在每个候选附近的小窗口内全分辨率精匹配
+        
+        Returns:
+            [(左上角x, 左上角y, 置信度), ...]（全分辨率坐标）
+        """
+        result = self._match(pyramid.coarse, coarse_template)
+        if result is None:
+            return []
+        
+        # 多取一个用来判断是否被截断：候选超过上限时截断可能丢掉真实匹配，改为全分辨率整图匹配
+        candidates = find_peaks(result, threshold - self.coarse_threshold_margin,
+                                min(coarse_template.shape[:2]) // 2, self.max_candidates + 1)
+        if not candidates:
+            return []
+        if len(candidates) > self.max_candidates:
+            return self._match_full(pyramid.gray, resized_template, threshold)
+        
+        gray = pyramid.gray
+        screen_h, screen_w = gray.shape[:2]
+        new_h, new_w = resized_template.shape[:2]
+        # 粗匹配坐标的误差约为 1/factor 像素，再留一点余量
+        pad = int(math.ceil(2.0 / pyramid.factor)) + 2
+        
+        peaks = []
+        for cx, cy, _ in candidates:
+            fx = int(round(cx / pyramid.factor))
+            fy = int(round(cy / pyramid.factor))
+            x0, y0 = max(0, fx - pad), max(0, fy - pad)
+            x1, y1 = min(screen_w, fx + new_w + pad), min(screen_h, fy + new_h + pad)
+            if x1 - x0 < new_w or y1 - y0 < new_h:
                 continue
             
-            # 跳过包含 INF/NAN 的结果
-            if np.isinf(result).any() or np.isnan(result).any():
+            window = self._match(gray[y0:y1, x0:x1], resized_template)
+            if window is None:
                 continue
-            
-            # 找所有超过阈值的匹配点
-            locations = np.where(result >= threshold)
-            
-            for pt in zip(*locations[::-1]):  # (x, y)
-                confidence = float(result[pt[1], pt[0]])
-                center_x = int(pt[0] + new_w // 2)
-                center_y = int(pt[1] + new_h // 2)
-                
-                results.append({
-                    'x': center_x,
-                    'y': center_y,
-                    'width': int(new_w),
-                    'height': int(new_h),
-                    'scale': float(scale),
-                    'confidence': confidence,
-                    'top_left': (int(pt[0]), int(pt[1])),
-                    'bottom_right': (int(pt[0] + new_w), int(pt[1] + new_h))
-                })
-        
-        # 非极大值抑制（去除重叠的检测框）
-        results = self._non_max_suppression(results)
+            _, max_val, _, max_loc = cv2.minMaxLoc(window)
+            if max_val >= threshold:
+                peaks.append((x0 + max_loc[0], y0 + max_loc[1], float(max_val)))
         
-        return results
+        return peaks
     
     def _non_max_suppression(self, results: List[Dict], overlap_thresh: float = 0.3) -> List[Dict]:
         """
         非极大值抑制，去除重叠的检测框
+        
+        中心点 x、y 距离都小于平均边长 * overlap_thresh 视为重复（向量化实现见 nms.py）
         """
         if len(results) == 0:
             return []
         
-        # 按置信度排序
-        results = sorted(results, key=lambda x: x['confidence'], reverse=True)
-        
-        kept = []
-        for result in results:
-            is_duplicate = False
-            for kept_result in kept:
-                # 计算中心点距离
-                dx = abs(result['x'] - kept_result['x'])
-                dy = abs(result['y'] - kept_result['y'])
-                
-                # 如果中心点距离小于框的一半大小，认为是重复
-                avg_size = (result['width'] + result['height'] + 
-                           kept_result['width'] + kept_result['height']) / 4
-                
-                if dx < avg_size * overlap_thresh and dy < avg_size * overlap_thresh:
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                kept.append(result)
+        from .nms import nms
+        boxes = [(r['x'] - r['width'] / 2, r['y'] - r['height'] / 2,
+                  r['x'] + r['width'] / 2, r['y'] + r['height'] / 2) for r in results]
+        keep = nms(boxes, [r['confidence'] for r in results],
+                   iou_threshold=None, center_ratio=overlap_thresh)
+        return [results[i] for i in keep]
+    
+    def match_regions(self, entries: List, threshold: float, gray: np.ndarray,
+                      regions: List[Region]) -> List[Dict]:
+        """
+        只在指定区域内匹配（每个区域单独建金字塔，结果换算回整图坐标）
         
-        return kept
+        Returns:
+            匹配结果列表（带 template 字段，未做跨模板 NMS）
+        """
+        img_height, img_width = gray.shape[:2]
+        factor = self.coarse_width / float(img_width)
+        all_matches = []
+        for rx1, ry1, rx2, ry2 in regions:
+            x1, y1 = int(rx1 * img_width), int(ry1 * img_height)
+            x2, y2 = int(math.ceil(rx2 * img_width)), int(math.ceil(ry2 * img_height))
+            if x2 - x1 < 10 or y2 - y1 < 10:
+                continue
+            
+            pyramid = ScreenPyramid(np.ascontiguousarray(gray[y1:y2, x1:x2]), factor=factor)
+            for match in self.match_entries(entries, threshold, pyramid):
+                match['x'] += x1
+                match['y'] += y1
+                match['top_left'] = (match['top_left'][0] + x1, match['top_left'][1] + y1)
+                match['bottom_right'] = (match['bottom_right'][0] + x1, match['bottom_right'][1] + y1)
+                all_matches.append(match)
+        return all_matches
     
     def find_close_buttons(
         self, 
         screenshot_path: str,
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        regions: Optional[List[Region]] = None,
+        fallback: bool = True
     ) -> Dict:
         """
         在截图中查找所有关闭按钮
@@ -218,6 +532,8 @@ class TemplateMatcher:
         Args:
             screenshot_path: 截图路径
             threshold: 匹配阈值 (0-1)
+            regions: 优先搜索区域（比例坐标，见 close_button_regions），None 表示直接全屏搜索
+            fallback: 区域内没找到时是否再全屏搜索
             
         Returns:
             匹配结果
@@ -232,8 +548,8 @@ class TemplateMatcher:
         
         img_height, img_width = screenshot.shape[:2]
         
-        # 加载模板
-        templates = self.load_templates()
+        # 加载模板（预处理好的灰度 + 多尺度缩放图）
+        templates = self.bank.entries()
         if not templates:
             return {
                 "success": False,
@@ -242,13 +558,22 @@ class TemplateMatcher:
                 "tip": "添加常见X号截图到模板目录，命名如 x_circle.png, x_white.png 等"
             }
         
+        if threshold is None:
+            threshold = self.match_threshold
+        gray = to_gray(screenshot)
         all_matches = []
+        search_mode = "full"
         
-        for template_name, template in templates:
-            matches = self.match_single_template(screenshot, template, threshold)
-            for match in matches:
-                match['template'] = template_name
-                all_matches.append(match)
+        # 先只搜索先验区域
+        if regions:
+            all_matches = self.match_regions(templates, threshold, gray, regions)
+            search_mode = "regions"
+        
+        if not all_matches and (not regions or fallback):
+            # 灰度图和粗匹配图只计算一次，所有模板、所有线程共用
+            pyramid = ScreenPyramid(gray, self.coarse_width)
+            all_matches = self.match_entries(templates, threshold, pyramid)
+            search_mode = "full"
         
         # 按置信度排序
         all_matches = sorted(all_matches, key=lambda x: x['confidence'], reverse=True)
@@ -260,8 +585,9 @@ class TemplateMatcher:
             return {
                 "success": False,
                 "message": "未找到匹配的关闭按钮",
-                "templates_used": [t[0] for t in templates],
-                "threshold": threshold or self.match_threshold,
+                "templates_used": [entry.name for entry in templates],
+                "threshold": threshold,
+                "search_mode": search_mode,
                 "tip": "可能需要添加新的X号模板，或降低匹配阈值"
             }
         
@@ -272,6 +598,12 @@ class TemplateMatcher:
         
         best = all_matches[0]
         
+        # 命中统计（用于淘汰从不命中的模板），失败不影响匹配结果
+        try:
+            self.index.record_hit(best['template'])
+        except Exception:
+            pass
+        
         return {
             "success": True,
             "message": f"✅ 找到 {len(all_matches)} 个关闭按钮",
@@ -291,7 +623,89 @@ class TemplateMatcher:
                 }
                 for m in all_matches[:5]  # 最多返回5个
             ],
-            "image_size": {"width": img_width, "height": img_height}
+            "image_size": {"width": img_width, "height": img_height},
+            "search_mode": search_mode
+        }
+    
+    def learn_template(self, image: np.ndarray, threshold: Optional[float] = None,
+                       prefix: str = "auto_x") -> Dict:
+        """
+        自动学习：图片是新样式时保存为模板，并把模板库控制在上限以内
+        
+        Args:
+            image: 裁剪出的按钮图（BGR 或灰度）
+            threshold: 与已有模板的相似度达到该值即认为已存在，None 使用索引默认值
+            prefix: 模板名前缀（以 auto_ 开头的模板才会被淘汰）
+            
+        Returns:
+            {"success", "learned", "template_name", "nearest", "similarity", "pruned"}
+        """
+        import time
+        from .template_index import NOVELTY_SIMILARITY
+        
+        novel, nearest, similarity = self.index.is_novel(
+            to_gray(image), threshold if threshold is not None else NOVELTY_SIMILARITY
+        )
+        result = {
+            "success": True,
+            "learned": novel,
+            "template_name": None,
+            "nearest": nearest,
+            "similarity": round(similarity, 3),
+            "pruned": []
+        }
+        if not novel:
+            return result
+        
+        template_name = f"{prefix}_{time.strftime('%m%d_%H%M%S')}"
+        suffix = 1
+        while self.bank.get(template_name) is not None:  # 同一秒内学到多个模板
+            suffix += 1
+            template_name = f"{prefix}_{time.strftime('%m%d_%H%M%S')}_{suffix}"
+        if not cv2.imwrite(str(self.template_dir / f"{template_name}.png"), image):
+            return {"success": False, "error": f"模板保存失败: {template_name}"}
+        self.bank.update(template_name)
+        self.index.refresh()
+        
+        result["template_name"] = template_name
+        result["pruned"] = self.compact_library(merge=False, protect=[template_name])["pruned"]
+        return result
+    
+    def compact_library(self, max_templates: Optional[int] = None, merge: bool = True,
+                        similarity: float = 0.92, protect: Sequence[str] = ()) -> Dict:
+        """
+        整理模板库：合并近似重复的自动学习模板，超过上限时淘汰从未命中/最久未命中的
+        
+        Args:
+            max_templates: 模板数上限，None 使用 DynamicConfig.template_library_max
+            merge: 是否合并近似重复模板
+            similarity: 合并阈值（缩略图相关系数）
+            protect: 不参与淘汰的模板名
+            
+        Returns:
+            {"success", "merged": [[保留, [删除...]], ...], "pruned": [...], "count"}
+        """
+        if max_templates is None:
+            from .dynamic_config import DynamicConfig
+            max_templates = DynamicConfig.template_library_max
+        
+        merged = []
+        if merge:
+            for keep, duplicates in self.index.plan_merges(similarity):
+                for name in duplicates:
+                    self.index.transfer_hits(name, keep)
+                    self.delete_template(name)
+                merged.append([keep, duplicates])
+        
+        pruned = self.index.plan_prune(max_templates, protect)
+        for name in pruned:
+            self.delete_template(name)
+        
+        return {
+            "success": True,
+            "merged": merged,
+            "pruned": pruned,
+            "count": len(self.bank.entries())
         }
     
     def add_template(self, image_path: str, template_name: str) -> Dict:
@@ -314,8 +728,9 @@ class TemplateMatcher:
         output_path = self.template_dir / f"{template_name}.png"
         cv2.imwrite(str(output_path), img)
         
-        # 清除缓存
-        self._template_cache.clear()
+        # 只更新这一个模板的缓存
+        self._template_cache.pop(template_name, None)
+        self.bank.update(template_name)
         
         return {
             "success": True,
@@ -356,8 +771,9 @@ class TemplateMatcher:
         output_path = self.template_dir / f"{template_name}.png"
         cv2.imwrite(str(output_path), cropped)
         
-        # 清除缓存
-        self._template_cache.clear()
+        # 只更新这一个模板的缓存
+        self._template_cache.pop(template_name, None)
+        self.bank.update(template_name)
         
         return {
             "success": True,
@@ -378,13 +794,19 @@ class TemplateMatcher:
                 "template_dir": str(self.template_dir)
             }
         
+        try:
+            hits = {item["name"]: item["hits"] for item in self.index.stats()}
+        except Exception:
+            hits = {}
+        
         template_info = []
         for name, img in templates:
             h, w = img.shape[:2]
             template_info.append({
                 "name": name,
                 "size": f"{w}x{h}",
-                "path": str(self.template_dir / f"{name}.png")
+                "path": str(self.template_dir / f"{name}.png"),
+                "hits": hits.get(name, 0)
             })
         
         return {
@@ -402,6 +824,7 @@ class TemplateMatcher:
             if path.exists():
                 path.unlink()
                 self._template_cache.pop(template_name, None)
+                self.bank.update(template_name)  # 可能还有同名的其他格式文件
                 return {
                     "success": True,
                     "message": f"✅ 已删除模板: {template_name}"
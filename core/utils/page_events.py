@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面变化事件 - 订阅无障碍事件，替代 dump_hierarchy 轮询
+
+功能：
+1. U2WindowUpdateEventSource：通过 uiautomator2 服务的 waitForWindowUpdate 长轮询订阅窗口内容变化事件
+2. FakeEventSource：手动发送事件，用于测试和无设备调试
+3. PageEventMonitor：事件计数 + 条件变量，等待方阻塞到"有事件"或"安静一段时间"
+
+说明：
+    单次 dump 往往比 100ms 轮询间隔还长，轮询会让设备上的 UI 自动化服务一直满载。
+    有事件源时，等待逻辑只在收到变化事件后才 dump；事件源不可用（未就绪、服务端不支持、调用失败）时，
+    available 为 False，调用方自动退回原来的轮询方式。
+
+用法:
+    monitor = PageEventMonitor(U2WindowUpdateEventSource(client.u2))
+    seq = monitor.seq
+    ...  # 执行操作 / 检查页面
+    if monitor.wait_for_event(seq, timeout=2.0):
+        ...  # 页面有变化，再 dump 确认
+"""
+import asyncio
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+
+# 视为"页面可能变化"的无障碍事件
+PAGE_CHANGE_EVENTS = frozenset([
+    'TYPE_WINDOW_STATE_CHANGED',
+    'TYPE_WINDOW_CONTENT_CHANGED',
+    'TYPE_WINDOWS_CHANGED',
+    'TYPE_VIEW_SCROLLED',
+    'TYPE_VIEW_TEXT_CHANGED',
+])
+
+
+class PageEventSource:
+    """事件源基类：start() 之后把事件类型交给 callback"""
+
+    def __init__(self):
+        self.callback: Optional[Callable[[str], None]] = None
+
+    def start(self, callback: Callable[[str], None]) -> bool:
+        """启动事件源，返回是否启动成功"""
+        self.callback = callback
+        return True
+
+    def stop(self):
+        self.callback = None
+
+    @property
+    def alive(self) -> bool:
+        return self.callback is not None
+
+    def _emit(self, event_type: str):
+        callback = self.callback
+        if callback is not None:
+            callback(event_type)
+
+
+class FakeEventSource(PageEventSource):
+    """手动发送事件的事件源（测试用）"""
+
+    def emit(self, event_type: str = 'TYPE_WINDOW_CONTENT_CHANGED'):
+        self._emit(event_type)
+
+
+class U2WindowUpdateEventSource(PageEventSource):
+    """
+    基于 uiautomator2 服务端 waitForWindowUpdate 的事件源
+
+    后台线程循环发起长轮询 RPC：设备端用 uiautomator2 服务自己的 UiAutomation 连接等待
+    TYPE_WINDOW_CONTENT_CHANGED 事件，收到即返回并分发一次事件。不另开 UiAutomation 连接，
+    所以不会和 uiautomator2 服务互相踢掉（`adb shell uiautomator events` 会）。
+
+    启动不阻塞：第一次短探测 RPC 成功后才算就绪（ready），就绪前 alive 为 False，
+    调用方先按轮询处理。服务端不支持该方法、或连续多次调用失败时事件源失效，同样退回轮询。
+    两次长轮询之间只隔一次 HTTP 往返，这段时间内的事件会漏掉——页面持续变化时下一次长轮询
+    会立即返回，不影响"是否还在变化"的判断。
+    """
+
+    # 每次长轮询最长等待时间（秒）
+    LONG_POLL = 10.0
+
+    # 连续失败多少次认为事件源失效
+    MAX_ERRORS = 3
+
+    def __init__(self, u2):
+        super().__init__()
+        self.u2 = u2
+        self.ready = threading.Event()
+        self._failed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, callback: Callable[[str], None]) -> bool:
+        super().start(callback)
+        self._failed = False
+        self.ready.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="page-events", daemon=True)
+        self._thread.start()
+        return True
+
+    def wait_ready(self, timeout: float) -> bool:
+        """等待第一次探测完成（返回是否可用）"""
+        self.ready.wait(timeout)
+        return self.alive
+
+    @property
+    def alive(self) -> bool:
+        return self.callback is not None and self.ready.is_set() and not self._failed
+
+    def _wait_for_window_update(self, timeout: float) -> bool:
+        """设备端等待窗口内容变化，超时返回 False"""
+        call = getattr(self.u2, 'jsonrpc_call', None)
+        if call is not None:  # uiautomator2 3.x
+            return bool(call('waitForWindowUpdate', [None, int(timeout * 1000)], timeout=timeout + 5))
+        return bool(self.u2.jsonrpc.waitForWindowUpdate(None, int(timeout * 1000), http_timeout=timeout + 5))
+
+    def _poll_loop(self):
+        try:
+            self._wait_for_window_update(0)
+        except Exception as e:
+            print(f"  ⚠️  页面变化事件不可用（{e}），改用轮询", file=sys.stderr)
+            self._failed = True
+            self.ready.set()
+            return
+        self.ready.set()
+
+        errors = 0
+        while self.callback is not None:
+            try:
+                if self._wait_for_window_update(self.LONG_POLL):
+                    self._emit('TYPE_WINDOW_CONTENT_CHANGED')
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors >= self.MAX_ERRORS:
+                    print(f"  ⚠️  页面变化事件源已失效（{e}），改用轮询", file=sys.stderr)
+                    self._failed = True
+                    return
+                time.sleep(0.2)
+
+
+class PageEventMonitor:
+    """
+    页面变化事件监视器
+
+    seq 每收到一个页面变化事件加一。等待方先记下 seq，再检查页面，
+    然后等待 seq 变化——检查期间到达的事件也不会漏掉。
+    """
+
+    # 等待期间复查事件源是否仍可用的间隔（秒）
+    LIVENESS_INTERVAL = 0.2
+
+    def __init__(self, source: PageEventSource):
+        self.source = source
+        self.seq = 0
+        self.last_event_time = 0.0
+        self.last_event_type = ""
+        self._cond = threading.Condition()
+        self._started = False
+        self._start_failed = False
+
+    def start(self) -> bool:
+        """启动事件源（只尝试一次，失败后保持轮询模式）"""
+        if self._started:
+            return self.source.alive
+        if self._start_failed:
+            return False
+        if self.source.start(self._on_event):
+            self._started = True
+            return True
+        self._start_failed = True
+        return False
+
+    def stop(self):
+        self.source.stop()
+        self._started = False
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def available(self) -> bool:
+        return self._started and self.source.alive
+
+    def _on_event(self, event_type: str):
+        if event_type not in PAGE_CHANGE_EVENTS:
+            return
+        with self._cond:
+            self.seq += 1
+            self.last_event_time = time.time()
+            self.last_event_type = event_type
+            self._cond.notify_all()
+
+    # ==================== 同步等待 ====================
+
+    def wait_for_event(self, after_seq: int, timeout: float) -> bool:
+        """
+        等待 seq 超过 after_seq
+
+        Returns:
+            期间是否收到了页面变化事件
+        """
+        deadline = time.time() + max(0.0, timeout)
+        with self._cond:
+            while self.seq <= after_seq:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.available:
+                    return self.seq > after_seq
+                # 分段等待：事件源在后台失效时不会唤醒等待方，定期复查 available
+                self._cond.wait(min(remaining, self.LIVENESS_INTERVAL))
+            return True
+
+    def wait_for_quiet(self, quiet_period: float, timeout: float) -> bool:
+        """
+        等待连续 quiet_period 秒没有页面变化事件
+
+        Returns:
+            是否在 timeout 内安静下来
+        """
+        start = time.time()
+        deadline = start + max(0.0, timeout)
+        with self._cond:
+            while True:
+                now = time.time()
+                quiet_since = max(self.last_event_time, start)
+                if now - quiet_since >= quiet_period:
+                    return True
+                if now >= deadline or not self.available:
+                    return False
+                self._cond.wait(min(deadline, quiet_since + quiet_period, now + self.LIVENESS_INTERVAL) - now)
+
+    # ==================== 异步等待（不阻塞事件循环） ====================
+
+    async def wait_for_event_async(self, after_seq: int, timeout: float) -> bool:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.wait_for_event, after_seq, timeout)
+
+    async def wait_for_quiet_async(self, quiet_period: float, timeout: float) -> bool:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.wait_for_quiet, quiet_period, timeout)
@@ -8,6 +8,7 @@
 2. 元素出现等待
 3. 页面变化检测
 4. 操作后自动等待
+5. 有无障碍事件源时阻塞等待事件，只在页面真正变化后才 dump（见 page_events.py）
 """
 import asyncio
 import sys
@@ -21,7 +22,7 @@ class SmartWait:
     
     策略：
     1. 不使用固定等待时间，而是检测页面状态
-    2. 快速轮询（100ms一次），减少不必要的等待
+    2. 优先等待页面变化事件；事件源不可用时快速轮询（100ms一次）
     3. 最大等待时间保护
     """
     
@@ -39,13 +40,22 @@ class SmartWait:
         self.poll_interval = 0.1  # 轮询间隔100ms
         self.page_stable_threshold = 0.3  # 页面稳定阈值（连续300ms无变化认为稳定）
     
+    def _events(self):
+        """页面变化事件监视器（不可用时返回 None，退回轮询）"""
+        get_events = getattr(self.client, '_page_events', None)
+        return get_events() if get_events else None
+    
+    def _fingerprint(self):
+        """重新 dump 控件树并返回页面指纹（快照同时写入设备级缓存）"""
+        return self.client.hierarchy.get(max_age=0).fingerprint
+    
     async def wait_for_page_stable(self, timeout: float = None, element_threshold: int = 10) -> bool:
         """
         等待页面稳定（页面元素不再变化）
         
         Args:
             timeout: 最大等待时间（秒），None使用默认值
-            element_threshold: 元素变化阈值，元素数量变化小于此值认为稳定
+            element_threshold: 元素变化阈值，相邻两次新增/消失/移动的节点数不超过此值认为稳定
             
         Returns:
             是否稳定
@@ -58,15 +68,25 @@ class SmartWait:
         
         print(f"  ⏳ 等待页面稳定（最多{timeout}秒）...", file=sys.stderr)
         
+        # 有事件源：连续 page_stable_threshold 秒没有变化事件即认为稳定，无需 dump
+        events = self._events()
+        if events is not None:
+            if await events.wait_for_quiet_async(self.page_stable_threshold, timeout):
+                elapsed = time.time() - start_time
+                print(f"  ✅ 页面已稳定（耗时{elapsed:.2f}秒，事件）", file=sys.stderr)
+                return True
+            if events.available:
+                print(f"  ⏰ 等待超时（{timeout}秒），但继续执行", file=sys.stderr)
+                return False
+            # 事件源中途失效，剩余时间退回轮询
+        
         while time.time() - start_time < timeout:
             try:
-                # 获取当前页面快照（只获取元素数量，不解析详细内容）
-                xml = self.client.u2.dump_hierarchy(compressed=False)
-                current_snapshot = len(xml)  # 使用XML长度作为简单的页面状态标识
+                # 获取当前页面指纹（结构 + 文本）
+                current_snapshot = self._fingerprint()
                 
                 if last_snapshot is not None:
-                    change = abs(current_snapshot - last_snapshot)
-                    if change <= element_threshold:
+                    if last_snapshot.diff(current_snapshot).changed_count <= element_threshold:
                         stable_count += 1
                         if stable_count >= required_stable_count:
                             elapsed = time.time() - start_time
@@ -107,7 +127,11 @@ class SmartWait:
         
         print(f"  ⏳ 等待元素出现: {element_desc}（最多{timeout}秒）...", file=sys.stderr)
         
+        events = self._events()
+        
         while time.time() - start_time < timeout:
+            # 先记下事件序号再检查，检查期间到达的事件不会漏掉
+            seq = events.seq if events is not None else 0
             try:
                 if element_check():
                     elapsed = time.time() - start_time
@@ -117,7 +141,20 @@ class SmartWait:
                 # 忽略检查过程中的异常
                 pass
             
-            await asyncio.sleep(self.poll_interval)
+            if events is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            if await events.wait_for_event_async(seq, remaining):
+                # 页面有变化，缓存的控件树快照已过期
+                self.client.hierarchy.invalidate("page_event")
+            elif events.available:
+                break  # 超时前页面没有任何变化
+            else:
+                events = None  # 事件源失效，退回轮询
         
         print(f"  ⏰ 元素未出现（超时{timeout}秒）", file=sys.stderr)
         return False
@@ -136,22 +173,32 @@ class SmartWait:
         start_time = time.time()
         
         try:
-            # 获取初始页面状态
-            initial_xml = self.client.u2.dump_hierarchy(compressed=False)
-            initial_length = len(initial_xml)
+            events = self._events()
+            seq = events.seq if events is not None else 0
+            
+            # 获取初始页面指纹
+            initial_fp = self._fingerprint()
             
             while time.time() - start_time < timeout:
-                await asyncio.sleep(self.poll_interval)
+                if events is None:
+                    await asyncio.sleep(self.poll_interval)
+                else:
+                    # 阻塞等待变化事件，收到后才 dump
+                    remaining = timeout - (time.time() - start_time)
+                    if not await events.wait_for_event_async(seq, max(0.0, remaining)):
+                        if events.available:
+                            break
+                        events = None
+                        continue
+                    seq = events.seq
                 
                 try:
-                    current_xml = self.client.u2.dump_hierarchy(compressed=False)
-                    current_length = len(current_xml)
+                    diff = initial_fp.diff(self._fingerprint())
                     
-                    # 页面变化超过5%认为有变化
-                    change_percent = abs(current_length - initial_length) / max(1, initial_length)
-                    if change_percent > 0.05:
+                    # 变化节点超过5%认为有变化
+                    if diff.ratio > 0.05:
                         elapsed = time.time() - start_time
-                        print(f"  ✅ 页面已变化（耗时{elapsed:.2f}秒，变化{change_percent*100:.1f}%）", file=sys.stderr)
+                        print(f"  ✅ 页面已变化（耗时{elapsed:.2f}秒，{diff.summary()}）", file=sys.stderr)
                         # 继续等待页面稳定
                         await self.wait_for_page_stable(timeout=1.0)
                         return True
@@ -27,11 +27,15 @@ Mobile MCP Server - 统一入口
 """
 
 import asyncio
+import contextvars
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 # 添加项目根目录到 Python 路径
 # 支持两种运行方式：
@@ -52,7 +56,7 @@ except ImportError:
 
 # 尝试导入 MCP，处理可能的路径冲突
 try:
-    from mcp.types import Tool, TextContent
+    from mcp.types import Tool, TextContent, ImageContent
     from mcp.server import Server
     from mcp.server.stdio import stdio_server
 except ImportError:
@@ -87,6 +91,7 @@ except ImportError:
             
             Tool = mcp_types.Tool
             TextContent = mcp_types.TextContent
+            ImageContent = mcp_types.ImageContent
             Server = mcp_server_mod.Server
             stdio_server = mcp_stdio.stdio_server
             break
@@ -94,21 +99,208 @@ except ImportError:
         raise ImportError("Cannot find mcp package")
 
 
-class MobileMCPServer:
-    """Mobile MCP Server - 精简版"""
+# 不需要连接设备的工具：只读设备发现缓存和设备池状态，没有可用设备时也能调用
+DEVICELESS_TOOLS = {"mobile_list_devices"}
+
+# 不需要独占设备的工具：只读本地状态或只做连接检查，长操作进行中也能立即返回
+UNLOCKED_TOOLS = {
+    "mobile_check_connection",
+    "mobile_get_operation_history",
+    "mobile_open_new_chat",
+}
+
+# 按参数计算超时的工具（秒）：本身就要等待的工具，在等待时长之外再留出余量
+TOOL_TIMEOUTS = {
+    "mobile_wait": lambda args: float(args.get("seconds", 0)) + 30,
+    "mobile_get_toast": lambda args: float(args.get("timeout", 5.0)) + 30,
+    "mobile_assert_toast": lambda args: float(args.get("timeout", 5.0)) + 30,
+    "mobile_batch": lambda args: 60 + sum(
+        30 + float(a.get("seconds", 0) if a.get("action") == "wait" else 0)
+        for a in (args.get("actions") or [])
+    ),
+}
+
+
+# 排队等设备锁时检查取消标志的间隔（秒）
+LOCK_POLL_INTERVAL = 0.2
+
+# 不操作设备、由事件循环直接处理的工具
+SESSION_TOOLS = {"mobile_use_device"}
+
+# 每个工具都可带的 device_id 参数（多设备时指定目标设备）
+DEVICE_ID_PROPERTY = {"type": "string", "description": "设备ID（多设备时指定；不传则用当前会话绑定的设备）"}
+
+# 当前 MCP 会话绑定的设备：{"device_id": ...}
+# 每个 SSE 连接 / stdio 会话各自设置一份，请求处理任务会继承它
+_SESSION_BINDING: contextvars.ContextVar = contextvars.ContextVar("mcp_session_binding", default=None)
+
+
+class DeviceSession:
+    """设备池中的一台设备：客户端 + 工具 + 设备锁
     
-    def __init__(self):
+    首次调用时才连接；连接断开后下次调用自动重连。
+    lock 保证同一设备同一时间只执行一个工具，不同设备互不影响。
+    """
+    
+    def __init__(self, device_id: Optional[str]):
+        self.device_id = device_id  # None 表示自动选择第一台设备
+        self.platform: Optional[str] = None
         self.client = None
         self.tools = None
-        self._initialized = False
-        self._last_error = None  # 保存最后一次连接失败的错误
-        
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.calls = 0
+    
+    @property
+    def connected(self) -> bool:
+        return self.tools is not None
+    
+    def connected_device_id(self) -> Optional[str]:
+        """实际连接的设备ID（自动选择时由 DeviceManager 决定）"""
+        client = self.client
+        if client is None:
+            return self.device_id
+        manager = getattr(client, 'device_manager', None)
+        if manager is None and getattr(client, '_ios_client', None) is not None:
+            manager = getattr(client._ios_client, 'device_manager', None)
+        return getattr(manager, 'current_device_id', None) or self.device_id
+    
+    def to_dict(self) -> dict:
+        return {
+            "device_id": self.connected_device_id(),
+            "platform": self.platform,
+            "connected": self.connected,
+            "busy": self.lock.locked(),
+            "calls": self.calls,
+        }
+
+
+class MobileMCPServer:
+    """Mobile MCP Server - 精简版
+    
+    工具调用在线程池中执行（设备操作都是同步阻塞的），同一设备的调用按顺序串行，
+    事件循环只负责等待结果，慢操作不会阻塞 list_tools、SSE 心跳和其他会话。
+    
+    多设备：设备池按 device_id 延迟连接，每台设备一把锁，不同设备的调用并行执行。
+    目标设备依次取：调用参数 device_id > 当前会话绑定的设备 > 默认设备
+    （MOBILE_DEVICE_ID，未设置时自动选择第一台）。
+    """
+    
+    def __init__(self):
         # Token 优化配置
         try:
             from mobile_mcp.config import Config
             self._compact_desc = Config.COMPACT_TOOL_DESCRIPTION
-        except ImportError:
+            workers = Config.MCP_TOOL_WORKERS
+            self._tool_timeout = Config.MCP_TOOL_TIMEOUT
+            default_device = Config.DEFAULT_DEVICE_ID
+        except (ImportError, AttributeError):
             self._compact_desc = True  # 默认开启精简模式
+            workers = 8
+            self._tool_timeout = 120.0
+            default_device = os.getenv("MOBILE_DEVICE_ID", "auto")
+        
+        # 工具执行线程池
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="mcp-tool")
+        
+        # 设备池：device_id -> DeviceSession（"default" 为自动选择的设备，连接后也按实际ID登记）
+        self._sessions: Dict[str, DeviceSession] = {}
+        self._pool_guard = threading.Lock()
+        self._default_device_id: Optional[str] = None if default_device in ("", "auto") else default_device
+        
+        # 未设置会话绑定时（如直接调用 handle_tool_call）使用的绑定
+        self._fallback_binding: dict = {}
+    
+    # ==================== 设备池 ====================
+    
+    @property
+    def default_session(self) -> DeviceSession:
+        return self._get_session(None)
+    
+    @property
+    def client(self):
+        """默认设备的客户端（兼容单设备用法）"""
+        return self.default_session.client
+    
+    @property
+    def tools(self):
+        """默认设备的工具（兼容单设备用法）"""
+        return self.default_session.tools
+    
+    def _resolve_device_id(self, device_id: Optional[str]) -> Optional[str]:
+        """目标设备的实际ID：指定ID > 默认设备 > 设备发现缓存中的第一台 Android 设备
+        
+        自动选择时与 DeviceManager.connect 一样取 adb 列表的第一台，这样默认设备和按ID指定的
+        调用从一开始就落到同一个会话，不会各自连接一次。无法确定（iOS、发现服务不可用）时返回 None。
+        """
+        device_id = device_id or self._default_device_id
+        if device_id:
+            return device_id
+        if self._detect_platform() != "android":
+            return None
+        discovery = self._get_discovery()
+        if discovery is None:
+            return None
+        try:
+            devices = discovery.devices("android")
+        except Exception:
+            return None
+        return devices[0].get('id') if devices else None
+    
+    def _get_session(self, device_id: Optional[str]) -> DeviceSession:
+        """获取设备会话（按实际设备ID登记，不存在则创建，连接延迟到第一次调用）"""
+        device_id = self._resolve_device_id(device_id)
+        key = device_id or "default"
+        with self._pool_guard:
+            session = self._sessions.get(key)
+            if session is None:
+                session = DeviceSession(device_id)
+                self._sessions[key] = session
+            return session
+    
+    def _register_connected(self, session: DeviceSession) -> DeviceSession:
+        """自动选择的设备连接后按实际ID登记，之后指定该ID的调用共用同一个会话和锁
+        
+        Returns:
+            该设备在池中的会话（已按ID单独登记过时返回已有会话）
+        """
+        actual_id = session.connected_device_id()
+        if session.device_id is not None or not actual_id:
+            return session
+        with self._pool_guard:
+            existing = self._sessions.setdefault(actual_id, session)
+            if existing is not session:
+                # 该设备已按ID单独登记过：默认设备改用已有会话，避免两把锁操作同一台设备
+                self._sessions.pop("default", None)
+            if self._default_device_id is None:
+                self._default_device_id = actual_id
+        return existing
+    
+    @staticmethod
+    def _release_client(session: DeviceSession):
+        """丢弃会话上的客户端（重复连接、重连时释放旧的那个，连同它的页面事件轮询线程）"""
+        client = session.client
+        session.client = None
+        session.tools = None
+        disconnect = getattr(client, 'disconnect', None)
+        if disconnect is None:
+            disconnect = getattr(getattr(client, 'device_manager', None), 'disconnect', None)
+        if disconnect is not None:
+            try:
+                disconnect()
+            except Exception:
+                pass
+    
+    def list_sessions(self) -> List[dict]:
+        """设备池状态（按实际设备去重）"""
+        with self._pool_guard:
+            sessions = list({id(s): s for s in self._sessions.values()}.values())
+        return [s.to_dict() for s in sessions]
+    
+    def _current_binding(self) -> dict:
+        binding = _SESSION_BINDING.get()
+        return self._fallback_binding if binding is None else binding
     
     @staticmethod
     def format_response(result) -> str:
@@ -117,21 +309,48 @@ class MobileMCPServer:
             return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
         return str(result)
     
-    async def initialize(self):
-        """延迟初始化设备连接"""
-        # 如果已成功初始化，检查连接是否仍然有效
-        if self._initialized and self.tools is not None:
-            # 验证设备连接是否仍然有效
-            if self._is_connection_valid():
-                return
-            else:
-                # 连接已失效，重置状态
-                print("⚠️ 检测到设备连接已断开，正在重新连接...", file=sys.stderr)
-                self._initialized = False
-                self.client = None
-                self.tools = None
+    def screenshot_response(self, result: dict):
+        """截图结果：带 base64 时直接返回图片内容（增量截图每个区域一张），其余字段仍以文本返回"""
+        contents = []
+        if isinstance(result, dict):
+            for item in [result] + list(result.get("regions") or []):
+                if item.get("image_base64"):
+                    data = item.pop("image_base64")
+                    mime_type = item.pop("mime_type", "image/jpeg")
+                    contents.append(ImageContent(type="image", data=data, mimeType=mime_type))
+        contents.append(TextContent(type="text", text=self.format_response(result)))
+        return contents
+    
+    async def initialize(self, session: Optional[DeviceSession] = None):
+        """延迟初始化设备连接（默认设备，或设备池中的指定设备）"""
+        session = session or self.default_session
+        if session.tools is None:
+            self._open_client(session)
+            return
         
-        platform = self._detect_platform()
+        # 已成功初始化：检查连接是否仍然有效（后台健康探测刚通过时不再访问设备）
+        discovery = self._get_discovery()
+        if discovery is not None and discovery.is_healthy(session.connected_device_id()):
+            return
+        # 连接检查和重连都要访问设备：有工具正在执行（持有设备锁）说明连接正在使用，
+        # 不检查也不替换它正在用的客户端
+        if not session.lock.acquire(blocking=False):
+            return
+        try:
+            if self._is_connection_valid(session.client):
+                return
+            # 连接已失效，释放旧客户端后重连
+            print(f"⚠️ 检测到设备 {session.connected_device_id() or ''} 连接已断开，正在重新连接...", file=sys.stderr)
+            if discovery is not None:
+                discovery.detach_client(session.connected_device_id())
+            self._release_client(session)
+            self._open_client(session)
+        finally:
+            session.lock.release()
+    
+    def _open_client(self, session: DeviceSession):
+        """创建客户端并登记到设备池（调用方持有 connect_lock）"""
+        platform = self._detect_platform(session.device_id)
         
         try:
             # 尝试导入，如果失败会抛出 ImportError
@@ -148,62 +367,96 @@ class MobileMCPServer:
                 from mobile_mcp.core.mobile_client import MobileClient
                 from mobile_mcp.core.basic_tools_lite import BasicMobileToolsLite
             
-            self.client = MobileClient(platform=platform)
-            self.tools = BasicMobileToolsLite(self.client)
-            self._initialized = True  # 只在成功时标记
-            print(f"📱 已连接到 {platform.upper()} 设备", file=sys.stderr)
+            session.client = MobileClient(device_id=session.device_id, platform=platform)
+            session.tools = BasicMobileToolsLite(session.client)
+            session.platform = platform
+            session.last_error = None
+            if self._register_connected(session) is not session:
+                print(f"🔁 设备 {session.connected_device_id()} 已在设备池中，改用已有会话", file=sys.stderr)
+                self._release_client(session)
+                return
+            discovery = self._get_discovery()
+            if discovery is not None:
+                discovery.attach_client(session.connected_device_id(), session.client, session.lock)
+            print(f"📱 已连接到 {platform.upper()} 设备 {session.connected_device_id() or ''}", file=sys.stderr)
         except Exception as e:
             error_msg = str(e)
             print(f"⚠️ 设备连接失败: {error_msg}，下次调用时将重试", file=sys.stderr)
-            self.client = None
-            self.tools = None
-            self._last_error = error_msg  # 保存错误信息
-            # 不设置 _initialized = True，下次调用会重试
+            session.client = None
+            session.tools = None
+            session.last_error = error_msg  # 保存错误信息
+            # 不保留连接，下次调用会重试
     
-    def _is_connection_valid(self) -> bool:
+    @staticmethod
+    def _is_connection_valid(client) -> bool:
         """检查设备连接是否仍然有效"""
         try:
-            if self.client is None:
+            if client is None:
                 return False
             
             # Android: 检查 u2 连接
-            if hasattr(self.client, 'u2') and self.client.u2:
+            if hasattr(client, 'u2') and client.u2:
                 # 尝试获取设备信息，如果失败说明连接断开
-                self.client.u2.info
+                # 有设备信息缓存时按 TTL 复用（不是每次调用都发一次 info 请求），读取失败再强制刷新确认
+                profile = getattr(client, 'profile', None)
+                if profile is None:
+                    client.u2.info
+                    return True
+                try:
+                    profile.get()
+                except Exception:
+                    profile.refresh()
                 return True
             
             # iOS: 检查 wda 连接
-            if hasattr(self.client, 'wda') and self.client.wda:
-                self.client.wda.status()
+            if hasattr(client, 'wda') and client.wda:
+                client.wda.status()
                 return True
             
             # iOS (通过 _ios_client)
-            if hasattr(self.client, '_ios_client') and self.client._ios_client:
-                if hasattr(self.client._ios_client, 'wda') and self.client._ios_client.wda:
-                    self.client._ios_client.wda.status()
+            if hasattr(client, '_ios_client') and client._ios_client:
+                if hasattr(client._ios_client, 'wda') and client._ios_client.wda:
+                    client._ios_client.wda.status()
                     return True
             
             return False
         except Exception:
             return False
     
-    def _detect_platform(self) -> str:
-        """自动检测设备平台"""
+    def _detect_platform(self, device_id: Optional[str] = None) -> str:
+        """自动检测设备平台（指定 device_id 时判断该设备是否为 iOS 设备）"""
         platform = os.getenv("MOBILE_PLATFORM", "").lower()
         if platform in ["android", "ios"]:
             return platform
         
-        # 尝试检测 iOS 设备
-        try:
-            from mobile_mcp.core.ios_device_manager_wda import IOSDeviceManagerWDA
-            ios_manager = IOSDeviceManagerWDA()
-            if ios_manager.list_devices():
-                return "ios"
-        except:
-            pass
+        # 尝试检测 iOS 设备（读设备发现缓存，服务启动时已在后台扫描）
+        discovery = self._get_discovery()
+        if discovery is not None and discovery.platform_of(device_id) == "ios":
+            return "ios"
         
         return "android"
     
+    @staticmethod
+    def _get_discovery():
+        """进程内共享的设备发现服务（导入失败时返回 None）"""
+        try:
+            from mobile_mcp.core.device_discovery import get_discovery
+        except ImportError:
+            project_root = Path(__file__).parent.parent
+            if str(project_root) not in sys.path:
+                sys.path.insert(0, str(project_root))
+            try:
+                from mobile_mcp.core.device_discovery import get_discovery
+            except ImportError:
+                return None
+        return get_discovery()
+    
+    def start_discovery(self):
+        """服务启动时在后台开始扫描设备（不阻塞启动）"""
+        discovery = self._get_discovery()
+        if discovery is not None:
+            discovery.start()
+    
     def get_tools(self):
         """注册 MCP 工具"""
         tools = []
@@ -252,7 +505,9 @@ class MobileMCPServer:
                     "compress": {"type": "boolean", "description": "是否压缩", "default": True},
                     "crop_x": {"type": "integer", "description": "裁剪中心 X"},
                     "crop_y": {"type": "integer", "description": "裁剪中心 Y"},
-                    "crop_size": {"type": "integer", "description": "裁剪大小"}
+                    "crop_size": {"type": "integer", "description": "裁剪大小"},
+                    "inline": {"type": "boolean", "description": "直接返回图片内容(不写文件)", "default": False},
+                    "diff": {"type": "boolean", "description": "只返回与上一帧相比变化的区域(带crop_offset)", "default": False}
                 },
                 "required": []
             }
@@ -281,7 +536,13 @@ class MobileMCPServer:
         tools.append(Tool(
             name="mobile_screenshot_with_som",
             description=desc_som,
-            inputSchema={"type": "object", "properties": {}, "required": []}
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "inline": {"type": "boolean", "description": "直接返回图片内容(不写文件)", "default": False}
+                },
+                "required": []
+            }
         ))
         
         tools.append(Tool(
@@ -303,7 +564,8 @@ class MobileMCPServer:
                 "type": "object",
                 "properties": {
                     "grid_size": {"type": "integer", "description": "网格间距(px),默认100"},
-                    "show_popup_hints": {"type": "boolean", "description": "显示弹窗提示"}
+                    "show_popup_hints": {"type": "boolean", "description": "显示弹窗提示"},
+                    "inline": {"type": "boolean", "description": "直接返回图片内容(不写文件)", "default": False}
                 },
                 "required": []
             }
@@ -650,6 +912,16 @@ class MobileMCPServer:
             inputSchema={"type": "object", "properties": {}, "required": []}
         ))
         
+        tools.append(Tool(
+            name="mobile_use_device",
+            description="🔀 切换当前会话的设备（多设备）。之后不带 device_id 的调用都发往该设备；不传则恢复默认设备。",
+            inputSchema={
+                "type": "object",
+                "properties": {"device_id": {"type": "string", "description": "设备ID（见 mobile_list_devices）"}},
+                "required": []
+            }
+        ))
+        
         # ==================== 辅助工具 ====================
         if compact:
             desc_find_close = "🔍 查找关闭按钮（只找不点）。返回坐标和推荐的点击命令。"
@@ -737,6 +1009,48 @@ class MobileMCPServer:
             }
         ))
         
+        # ==================== 批量执行 ====================
+        tools.append(Tool(
+            name="mobile_batch",
+            description="📦 批量执行多步操作（一次调用，共用控件树，只在页面变化后重新读取）。\n"
+                       "动作: click_by_text(text,position,verify) / input_text_by_id(resource_id,text) / "
+                       "swipe(direction) / press_key(key) / wait(seconds) / assert_text(text,exists)\n"
+                       "守卫: if_text 有该文本才执行，unless_text 有该文本则跳过；optional 失败不中断。\n"
+                       "返回每步 ok/耗时，失败时带 msg。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "actions": {
+                        "type": "array",
+                        "description": "按顺序执行的动作",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "action": {"type": "string", "enum": ["click_by_text", "input_text_by_id", "swipe",
+                                                                      "press_key", "wait", "assert_text"]},
+                                "text": {"type": "string"},
+                                "position": {"type": "string"},
+                                "verify": {"type": "string"},
+                                "resource_id": {"type": "string"},
+                                "direction": {"type": "string", "enum": ["up", "down", "left", "right"]},
+                                "y_percent": {"type": "number"},
+                                "distance_percent": {"type": "number"},
+                                "key": {"type": "string"},
+                                "seconds": {"type": "number"},
+                                "exists": {"type": "boolean", "description": "assert_text: false 表示断言不存在"},
+                                "if_text": {"type": "string", "description": "守卫：页面有该文本才执行"},
+                                "unless_text": {"type": "string", "description": "守卫：页面有该文本则跳过"},
+                                "optional": {"type": "boolean", "description": "失败不中断后续动作"}
+                            },
+                            "required": ["action"]
+                        }
+                    },
+                    "stop_on_failure": {"type": "boolean", "description": "失败时停止（默认 true）", "default": True}
+                },
+                "required": ["actions"]
+            }
+        ))
+        
         # ==================== Toast 检测（仅 Android）====================
         tools.append(Tool(
             name="mobile_start_toast_watch",
@@ -886,17 +1200,191 @@ class MobileMCPServer:
             }
         ))
         
+        # 所有工具都可通过 device_id 指定目标设备
+        for tool in tools:
+            tool.inputSchema.setdefault("properties", {}).setdefault("device_id", DEVICE_ID_PROPERTY)
+        
         return tools
     
+    def _get_tool_timeout(self, name: str, arguments: dict) -> float:
+        """工具超时（秒）"""
+        compute = TOOL_TIMEOUTS.get(name)
+        if compute is not None:
+            try:
+                return max(self._tool_timeout, compute(arguments))
+            except (TypeError, ValueError):
+                pass
+        return self._tool_timeout
+    
     async def handle_tool_call(self, name: str, arguments: dict):
-        """处理工具调用"""
-        await self.initialize()
+        """处理工具调用（在线程池中执行，超时或被取消时立即返回）"""
+        arguments = dict(arguments or {})
+        device_id = arguments.pop("device_id", None) or None
+        
+        if name in SESSION_TOOLS:
+            return await self._handle_session_tool(name, device_id)
+        
+        if device_id is None:
+            device_id = self._current_binding().get("device_id")
+        
+        timeout = self._get_tool_timeout(name, arguments)
+        cancelled = threading.Event()
+        started = threading.Event()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._call_tool_sync, name, arguments, device_id,
+                                      cancelled, started, timeout)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            cancelled.set()
+            if started.is_set():
+                print(f"⏱️ {name} 超时（{timeout:.0f}s），设备操作将在后台结束", file=sys.stderr)
+                hint = "设备操作仍在后台执行，同一设备的下一次调用会等待它结束"
+            else:
+                hint = "设备正忙（前一个操作尚未结束），本次调用已取消，未执行"
+            return [TextContent(type="text", text=self.format_response({
+                "success": False,
+                "error": f"⏱️ {name} 超时（{timeout:.0f}s）",
+                "hint": hint
+            }))]
+        except asyncio.CancelledError:
+            # 客户端取消：还在排队（等线程或等设备锁）的调用不再执行
+            cancelled.set()
+            raise
+    
+    async def _handle_session_tool(self, name: str, device_id: Optional[str]):
+        """会话级工具：绑定当前会话的设备，并连接检查一次"""
+        binding = self._current_binding()
+        if device_id:
+            binding["device_id"] = device_id
+        else:
+            binding.pop("device_id", None)
+        contents = await self.handle_tool_call("mobile_check_connection", {"device_id": device_id})
+        bound = device_id or self._default_device_id or "默认设备"
+        return [TextContent(type="text", text=f"🔀 当前会话已切换到: {bound}")] + list(contents)
+    
+    def _list_devices(self):
+        """列出设备（读设备发现缓存 + 设备池状态，不连接设备）"""
+        discovery = self._get_discovery()
+        try:
+            if discovery is None:
+                raise RuntimeError("设备发现服务不可用")
+            platform = self._detect_platform()
+            devices = discovery.devices(platform)
+            result = {
+                "success": True,
+                "platform": platform,
+                "devices": devices,
+                "count": len(devices),
+                "cache_age": discovery.stats()["age"],
+            }
+        except Exception as e:
+            result = {"success": False, "message": f"❌ 获取设备列表失败: {e}"}
+        result["pool"] = self.list_sessions()
+        return [TextContent(type="text", text=self.format_response(result))]
+    
+    @staticmethod
+    def _acquire_lock(lock: threading.Lock, cancelled: threading.Event, deadline: float) -> bool:
+        """限时获取锁：每隔 LOCK_POLL_INTERVAL 检查一次取消标志，超时或被取消返回 False"""
+        while not cancelled.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if lock.acquire(timeout=min(LOCK_POLL_INTERVAL, remaining)):
+                if cancelled.is_set():
+                    lock.release()
+                    return False
+                return True
+        return False
+    
+    def _busy_response(self, name: str, session: DeviceSession, cancelled: threading.Event):
+        """排队等锁期间超时或被取消：不再执行，直接返回"""
+        if cancelled.is_set():
+            return [TextContent(type="text", text=f"⚠️ {name} 已取消（排队期间超时或被取消）")]
+        return [TextContent(type="text", text=self.format_response({
+            "success": False,
+            "error": f"⏳ 设备 {session.connected_device_id() or '默认设备'} 正忙，{name} 未执行",
+            "hint": "前一个操作尚未结束，请稍后重试"
+        }))]
+    
+    def _connect(self, session: DeviceSession, cancelled: threading.Event, deadline: float) -> bool:
+        """限时获取连接锁并初始化（已连接时只做连接检查），拿不到锁返回 False"""
+        if not self._acquire_lock(session.connect_lock, cancelled, deadline):
+            return False
+        try:
+            asyncio.run(self.initialize(session))
+        finally:
+            session.connect_lock.release()
+        return True
+    
+    def _call_tool_sync(self, name: str, arguments: dict, device_id: Optional[str],
+                        cancelled: threading.Event, started: threading.Event, timeout: float):
+        """线程池中执行：连接设备 -> 获取设备锁 -> 执行工具（每次调用一个独立的事件循环）
         
-        if not self.tools:
+        等锁最多 timeout 秒，期间被取消（调用超时或客户端取消）立即放弃，不会在之后补执行。
+        """
+        if cancelled.is_set():
+            return [TextContent(type="text", text=f"⚠️ {name} 已取消")]
+        if name in DEVICELESS_TOOLS:
+            started.set()
+            return self._list_devices()
+        deadline = time.monotonic() + timeout
+        
+        session = self._get_session(device_id)
+        if not self._connect(session, cancelled, deadline):
+            return self._busy_response(name, session, cancelled)
+        # 自动选择的设备连接后可能并入了已有会话
+        pooled = self._get_session(session.connected_device_id() or device_id)
+        if pooled is not session:
+            session = pooled
+            if not self._connect(session, cancelled, deadline):
+                return self._busy_response(name, session, cancelled)
+        
+        if name in UNLOCKED_TOOLS:
+            started.set()
+            return asyncio.run(self._dispatch_tool(name, arguments, session))
+        
+        if not self._acquire_lock(session.lock, cancelled, deadline):
+            return self._busy_response(name, session, cancelled)
+        try:
+            started.set()
+            session.calls += 1
+            tools = session.tools
+            if tools is not None:
+                tools.take_wait_report()  # 丢弃上一次调用遗留的等待统计
+            contents = asyncio.run(self._dispatch_tool(name, arguments, session))
+            return self._attach_wait_report(contents, tools)
+        finally:
+            session.lock.release()
+    
+    def _attach_wait_report(self, contents, tools):
+        """把本次调用操作后的实际等待时间（自适应等待）附加到 JSON 结果的 wait 字段"""
+        report = tools.take_wait_report() if tools is not None else None
+        if not report:
+            return contents
+        for item in reversed(contents):
+            text = getattr(item, 'text', None)
+            if not isinstance(text, str) or not text.startswith('{'):
+                continue
+            try:
+                data = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                data["wait"] = report
+                item.text = self.format_response(data)
+                break
+        return contents
+    
+    async def _dispatch_tool(self, name: str, arguments: dict, session: DeviceSession):
+        """执行工具（分发到该设备的 BasicMobileToolsLite）"""
+        tools = session.tools
+        if not tools:
             # 提供详细的错误信息和解决方案
-            error_detail = self._last_error or "未知错误"
+            error_detail = session.last_error or "未知错误"
+            device_hint = f"（设备 {session.device_id}）" if session.device_id else ""
             help_msg = (
-                f"❌ 设备连接失败\n\n"
+                f"❌ 设备连接失败{device_hint}\n\n"
                 f"错误详情: {error_detail}\n\n"
                 f"🔧 解决方案:\n"
                 f"1. 检查 USB 连接: adb devices\n"
@@ -911,37 +1399,45 @@ class MobileMCPServer:
         try:
             # 截图
             if name == "mobile_take_screenshot":
-                result = self.tools.take_screenshot(
+                inline = arguments.get("inline", False)
+                result = tools.take_screenshot(
                     description=arguments.get("description", ""),
                     compress=arguments.get("compress", True),
                     crop_x=arguments.get("crop_x", 0),
                     crop_y=arguments.get("crop_y", 0),
-                    crop_size=arguments.get("crop_size", 0)
+                    crop_size=arguments.get("crop_size", 0),
+                    save=not inline,
+                    return_base64=inline,
+                    diff=arguments.get("diff", False)
                 )
-                return [TextContent(type="text", text=self.format_response(result))]
+                return self.screenshot_response(result)
             
             elif name == "mobile_get_screen_size":
-                result = self.tools.get_screen_size()
+                result = tools.get_screen_size()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_screenshot_with_grid":
-                result = self.tools.take_screenshot_with_grid(
+                inline = arguments.get("inline", False)
+                result = tools.take_screenshot_with_grid(
                     grid_size=arguments.get("grid_size", 100),
-                    show_popup_hints=arguments.get("show_popup_hints", False)
+                    show_popup_hints=arguments.get("show_popup_hints", False),
+                    save=not inline,
+                    return_base64=inline
                 )
-                return [TextContent(type="text", text=self.format_response(result))]
+                return self.screenshot_response(result)
             
             elif name == "mobile_screenshot_with_som":
-                result = self.tools.take_screenshot_with_som()
-                return [TextContent(type="text", text=self.format_response(result))]
+                inline = arguments.get("inline", False)
+                result = tools.take_screenshot_with_som(save=not inline, return_base64=inline)
+                return self.screenshot_response(result)
             
             elif name == "mobile_click_by_som":
-                result = self.tools.click_by_som(arguments["index"])
+                result = tools.click_by_som(arguments["index"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 点击
             elif name == "mobile_click_at_coords":
-                result = self.tools.click_at_coords(
+                result = tools.click_at_coords(
                     arguments["x"], 
                     arguments["y"],
                     arguments.get("image_width", 0),
@@ -954,7 +1450,7 @@ class MobileMCPServer:
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_click_by_text":
-                result = self.tools.click_by_text(
+                result = tools.click_by_text(
                     arguments["text"],
                     position=arguments.get("position"),
                     verify=arguments.get("verify")
@@ -962,33 +1458,33 @@ class MobileMCPServer:
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_click_by_id":
-                result = self.tools.click_by_id(
+                result = tools.click_by_id(
                     arguments["resource_id"],
                     arguments.get("index", 0)
                 )
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_click_by_percent":
-                result = self.tools.click_by_percent(arguments["x_percent"], arguments["y_percent"])
+                result = tools.click_by_percent(arguments["x_percent"], arguments["y_percent"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 长按
             elif name == "mobile_long_press_by_id":
-                result = self.tools.long_press_by_id(
+                result = tools.long_press_by_id(
                     arguments["resource_id"],
                     arguments.get("duration", 1.0)
                 )
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_long_press_by_text":
-                result = self.tools.long_press_by_text(
+                result = tools.long_press_by_text(
                     arguments["text"],
                     arguments.get("duration", 1.0)
                 )
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_long_press_by_percent":
-                result = self.tools.long_press_by_percent(
+                result = tools.long_press_by_percent(
                     arguments["x_percent"],
                     arguments["y_percent"],
                     arguments.get("duration", 1.0)
@@ -996,7 +1492,7 @@ class MobileMCPServer:
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_long_press_at_coords":
-                result = self.tools.long_press_at_coords(
+                result = tools.long_press_at_coords(
                     arguments["x"],
                     arguments["y"],
                     arguments.get("duration", 1.0),
@@ -1011,16 +1507,16 @@ class MobileMCPServer:
             
             # 输入
             elif name == "mobile_input_text_by_id":
-                result = self.tools.input_text_by_id(arguments["resource_id"], arguments["text"])
+                result = tools.input_text_by_id(arguments["resource_id"], arguments["text"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_input_at_coords":
-                result = self.tools.input_at_coords(arguments["x"], arguments["y"], arguments["text"])
+                result = tools.input_at_coords(arguments["x"], arguments["y"], arguments["text"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 导航
             elif name == "mobile_swipe":
-                result = await self.tools.swipe(
+                result = await tools.swipe(
                     arguments["direction"],
                     y=arguments.get("y"),
                     y_percent=arguments.get("y_percent"),
@@ -1030,7 +1526,7 @@ class MobileMCPServer:
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_drag_progress_bar":
-                result = await self.tools.drag_progress_bar(
+                result = await tools.drag_progress_bar(
                     direction=arguments.get("direction", "right"),
                     distance_percent=arguments.get("distance_percent", 30.0),
                     y_percent=arguments.get("y_percent"),
@@ -1039,46 +1535,42 @@ class MobileMCPServer:
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_press_key":
-                result = await self.tools.press_key(arguments["key"])
+                result = await tools.press_key(arguments["key"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_wait":
-                result = self.tools.wait(arguments["seconds"])
+                result = tools.wait(arguments["seconds"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_hide_keyboard":
-                result = await self.tools.hide_keyboard()
+                result = await tools.hide_keyboard()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 应用管理
             elif name == "mobile_launch_app":
-                result = await self.tools.launch_app(arguments["package_name"])
+                result = await tools.launch_app(arguments["package_name"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_terminate_app":
-                result = self.tools.terminate_app(arguments["package_name"])
+                result = tools.terminate_app(arguments["package_name"])
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_list_apps":
-                result = self.tools.list_apps(arguments.get("filter", ""))
+                result = tools.list_apps(arguments.get("filter", ""))
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 设备管理
-            elif name == "mobile_list_devices":
-                result = self.tools.list_devices()
-                return [TextContent(type="text", text=self.format_response(result))]
-            
             elif name == "mobile_check_connection":
-                result = self.tools.check_connection()
+                result = tools.check_connection()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 辅助
             elif name == "mobile_list_elements":
-                result = self.tools.list_elements()
+                result = tools.list_elements()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_find_close_button":
-                result = self.tools.find_close_button()
+                result = tools.find_close_button()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_close_popup":
@@ -1089,29 +1581,37 @@ class MobileMCPServer:
                     popup_bounds = tuple(popup_bounds)
                 elif popup_bounds:
                     popup_bounds = None  # 格式不正确，忽略
-                result = self.tools.close_popup(
+                result = tools.close_popup(
                     popup_detected=popup_detected,
                     popup_bounds=popup_bounds
                 )
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_assert_text":
-                result = self.tools.assert_text(arguments["text"])
+                result = tools.assert_text(arguments["text"])
+                return [TextContent(type="text", text=self.format_response(result))]
+            
+            # 批量执行
+            elif name == "mobile_batch":
+                result = await tools.run_batch(
+                    arguments.get("actions") or [],
+                    stop_on_failure=arguments.get("stop_on_failure", True)
+                )
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # Toast 检测（仅 Android）
             elif name == "mobile_start_toast_watch":
-                result = self.tools.start_toast_watch()
+                result = tools.start_toast_watch()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_get_toast":
                 timeout = arguments.get("timeout", 5.0)
                 reset_first = arguments.get("reset_first", False)
-                result = self.tools.get_toast(timeout=timeout, reset_first=reset_first)
+                result = tools.get_toast(timeout=timeout, reset_first=reset_first)
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_assert_toast":
-                result = self.tools.assert_toast(
+                result = tools.assert_toast(
                     expected_text=arguments["expected_text"],
                     timeout=arguments.get("timeout", 5.0),
                     contains=arguments.get("contains", True)
@@ -1120,15 +1620,15 @@ class MobileMCPServer:
             
             # 脚本生成
             elif name == "mobile_get_operation_history":
-                result = self.tools.get_operation_history(arguments.get("limit"))
+                result = tools.get_operation_history(arguments.get("limit"))
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_clear_operation_history":
-                result = self.tools.clear_operation_history()
+                result = tools.clear_operation_history()
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_generate_test_script":
-                result = self.tools.generate_test_script(
+                result = tools.generate_test_script(
                     arguments["test_name"],
                     arguments["package_name"],
                     arguments["filename"]
@@ -1137,7 +1637,7 @@ class MobileMCPServer:
             
             # 智能关闭广告弹窗
             elif name == "mobile_close_ad":
-                result = self.tools.close_ad_popup(auto_learn=True)
+                result = tools.close_ad_popup(auto_learn=True)
                 return [TextContent(type="text", text=self.format_response(result))]
             
             # 模板匹配（精简版）
@@ -1145,9 +1645,9 @@ class MobileMCPServer:
                 click = arguments.get("click", True)
                 threshold = arguments.get("threshold", 0.75)
                 if click:
-                    result = self.tools.template_click_close(threshold=threshold)
+                    result = tools.template_click_close(threshold=threshold)
                 else:
-                    result = self.tools.template_match_close(threshold=threshold)
+                    result = tools.template_match_close(threshold=threshold)
                 return [TextContent(type="text", text=self.format_response(result))]
             
             elif name == "mobile_template_add":
@@ -1155,7 +1655,7 @@ class MobileMCPServer:
                 # 判断使用哪种方式
                 if "x_percent" in arguments and "y_percent" in arguments:
                     # 百分比方式
-                    result = self.tools.template_add_by_percent(
+                    result = tools.template_add_by_percent(
                         arguments["x_percent"],
                         arguments["y_percent"],
                         arguments.get("size", 80),
@@ -1163,7 +1663,7 @@ class MobileMCPServer:
                     )
                 elif "screenshot_path" in arguments:
                     # 像素方式
-                    result = self.tools.template_add(
+                    result = tools.template_add(
                         arguments["screenshot_path"],
                         arguments["x"],
                         arguments["y"],
@@ -1178,7 +1678,7 @@ class MobileMCPServer:
             # Cursor 会话管理
             elif name == "mobile_open_new_chat":
                 message = arguments.get("message", "继续执行飞书用例")
-                result = self.tools.open_new_chat(message)
+                result = tools.open_new_chat(message)
                 return [TextContent(type="text", text=self.format_response(result))]
             
             else:
@@ -1212,7 +1712,9 @@ async def async_main_stdio():
 
     print("🚀 Mobile MCP Server 启动中... [stdio 模式]", file=sys.stderr)
     print("📱 支持 Android / iOS", file=sys.stderr)
+    server.start_discovery()
 
+    _SESSION_BINDING.set({})
     async with stdio_server() as (read_stream, write_stream):
         await mcp_server.run(read_stream, write_stream, mcp_server.create_initialization_options())
 
@@ -1222,6 +1724,7 @@ def run_sse_server(host: str = "0.0.0.0", port: int = 3100):
 
     通过 HTTP 提供 SSE 端点，供远程 Backend 连接。
     端点: GET /sse (事件流) + POST /messages (工具调用)
+    多设备: GET /sse?device_id=xxx 将该连接绑定到指定设备（也可用 mobile_use_device 切换）
     """
     from mcp.server.sse import SseServerTransport
     from starlette.applications import Starlette
@@ -1234,6 +1737,9 @@ def run_sse_server(host: str = "0.0.0.0", port: int = 3100):
 
     async def handle_sse(request):
         from starlette.responses import Response
+        # 每个 SSE 连接一份设备绑定，该连接的请求处理任务都会继承
+        device_id = request.query_params.get("device_id")
+        _SESSION_BINDING.set({"device_id": device_id} if device_id else {})
         async with sse.connect_sse(request.scope, request.receive, request._send) as streams:
             await mcp_server.run(streams[0], streams[1], mcp_server.create_initialization_options())
         return Response()
@@ -1247,6 +1753,7 @@ def run_sse_server(host: str = "0.0.0.0", port: int = 3100):
 
     print(f"🚀 Mobile MCP Server 启动中... [SSE 模式] http://{host}:{port}/sse", file=sys.stderr)
     print("📱 支持 Android / iOS", file=sys.stderr)
+    server.start_discovery()
     uvicorn.run(starlette_app, host=host, port=port)
 
 
@@ -0,0 +1,81 @@
+"""
+单元测试公共夹具：源码路径、假设备（u2 / 控件树）
+
+不连接真实设备：FakeU2 返回预置的控件树 XML 并统计 dump 次数，
+FakeClient 只提供工具和服务需要的最少属性。
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+import mobile_mcp.core  # noqa: E402  源码运行时的包转发（mobile_mcp.core -> core/）
+from mobile_mcp.core.dynamic_config import DynamicConfig  # noqa: E402
+from mobile_mcp.core.hierarchy_snapshot import HierarchySnapshotService  # noqa: E402
+
+
+def make_xml(*texts, rotation: int = 0, width: int = 1080) -> str:
+    """按文案生成一页控件树（每个文案一个 TextView，纵向排列）"""
+    nodes = []
+    for i, text in enumerate(texts):
+        top = 200 + i * 120
+        nodes.append(
+            f'<node index="{i}" text="{text}" resource-id="com.app:id/item_{i}" '
+            f'class="android.widget.TextView" package="com.app" content-desc="" '
+            f'clickable="true" enabled="true" focusable="true" '
+            f'bounds="[0,{top}][{width},{top + 100}]" />'
+        )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="{rotation}">'
+        f'<node index="0" text="" resource-id="" class="android.widget.FrameLayout" package="com.app" '
+        f'content-desc="" clickable="false" enabled="true" focusable="false" bounds="[0,0][{width},2400]">'
+        + "".join(nodes) + '</node></hierarchy>'
+    )
+
+
+class FakeU2:
+    """只实现 dump_hierarchy / info / click 的假 uiautomator2 设备"""
+
+    def __init__(self, xml: str = ""):
+        self.xml = xml or make_xml("首页")
+        self.dumps = 0
+        self.info_calls = 0
+        self.clicks = []
+
+    def dump_hierarchy(self, compressed: bool = False):
+        self.dumps += 1
+        return self.xml
+
+    @property
+    def info(self):
+        self.info_calls += 1
+        return {"displayWidth": 1080, "displayHeight": 2400, "displayRotation": 0,
+                "displaySizeDpX": 411, "sdkInt": 33}
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+
+
+class FakeClient:
+    """MobileClient 的最小替身：platform / u2 / hierarchy"""
+
+    def __init__(self, xml: str = ""):
+        self.platform = "android"
+        self.u2 = FakeU2(xml)
+        self.hierarchy = HierarchySnapshotService(self)
+
+
+@pytest.fixture(autouse=True)
+def _reset_dynamic_config():
+    """每个测试后恢复动态配置默认值（测试会调整 TTL、开关等）"""
+    yield
+    DynamicConfig.reset()
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
@@ -0,0 +1,159 @@
+"""
+自适应等待：分位数、上限、观察，以及操作前后控件树快照的先后顺序
+"""
+import threading
+import time
+
+from mobile_mcp.core.adaptive_wait import AdaptiveWaitEngine, SettleStats
+from mobile_mcp.core.basic_tools_lite import BasicMobileToolsLite
+from mobile_mcp.core.dynamic_config import DynamicConfig
+
+from .conftest import FakeClient, make_xml
+
+
+def engine_with_samples(client, samples, action="click", package="com.app"):
+    engine = AdaptiveWaitEngine(client)
+    stats = SettleStats()
+    for s in samples:
+        stats.add(s)
+    engine._stats[(package, action)] = stats
+    return engine
+
+
+# ==================== 分位数 / 上限 ====================
+
+def test_quantiles():
+    stats = SettleStats()
+    for i in range(1, 11):
+        stats.add(i / 10)
+    assert stats.quantile(0.9) == 0.9
+    assert stats.quantile(0.5) == 0.5
+    assert stats.quantile(1.0) == 1.0
+    assert SettleStats().quantile(0.9) == 0.0
+
+
+def test_learned_wait_needs_min_samples():
+    DynamicConfig.adaptive_wait_min_samples = 5
+    engine = engine_with_samples(FakeClient(), [0.02] * 4)
+    assert engine.learned_wait("click", "com.app") is None
+    engine._stats[("com.app", "click")].add(0.02)
+    assert engine.learned_wait("click", "com.app") == 0.02
+
+
+def test_settle_uses_learned_wait_without_dumping(client):
+    DynamicConfig.adaptive_wait_explore_every = 0
+    engine = engine_with_samples(client, [0.02] * 10)
+    start = time.time()
+    waited = engine.settle("click", 0.5, package="com.app", before=client.hierarchy.get().fingerprint)
+    assert waited == 0.02
+    assert time.time() - start < 0.2
+    assert client.u2.dumps == 1  # 只有取 before 的那一次
+
+
+def test_settle_never_exceeds_upper(client):
+    DynamicConfig.adaptive_wait_explore_every = 0
+    engine = engine_with_samples(client, [0.4] * 10)
+    assert engine.settle("click", 0.05, package="com.app") == 0.05
+
+
+def test_settle_disabled_waits_upper(client):
+    DynamicConfig.adaptive_wait_enabled = False
+    engine = engine_with_samples(client, [0.01] * 10)
+    start = time.time()
+    assert engine.settle("click", 0.1, package="com.app") == 0.1
+    assert time.time() - start >= 0.1
+
+
+def test_settle_without_before_or_samples_waits_upper(client):
+    engine = AdaptiveWaitEngine(client)
+    assert engine.settle("click", 0.05) == 0.05
+    assert engine.stats()["observations"] == 0
+
+
+# ==================== 观察 ====================
+
+def test_observe_records_time_until_page_changes(client):
+    DynamicConfig.page_stable_threshold = 0.05
+    before = client.hierarchy.get().fingerprint
+    engine = AdaptiveWaitEngine(client)
+
+    def change():
+        client.u2.xml = make_xml("设置")
+    threading.Timer(0.1, change).start()
+
+    waited = engine.settle("click", 1.0, package="com.app", before=before)
+    stats = engine.stats()["actions"]["com.app:click"]
+    assert 0.1 <= waited < 0.5
+    assert stats["samples"] == 1 and stats["censored"] == 0
+    assert 80 <= stats["p50_ms"] <= 250
+    # 观察时 dump 的快照就是操作后的页面，留给随后的读取
+    assert [n.text for n in client.hierarchy.peek().table if n.text] == ["设置"]
+
+
+def test_observe_unchanged_page_is_censored_at_upper(client):
+    before = client.hierarchy.get().fingerprint
+    engine = AdaptiveWaitEngine(client)
+    waited = engine.settle("click", 0.2, package="com.app", before=before)
+    stats = engine.stats()["actions"]["com.app:click"]
+    assert 0.2 <= waited < 0.3
+    assert stats["censored"] == 1 and stats["p50_ms"] == 200
+
+
+# ==================== 操作前后的快照顺序 ====================
+
+def make_tools(client):
+    client.waits = AdaptiveWaitEngine(client)
+    tools = BasicMobileToolsLite(client)
+    tools.target_package = "com.app"
+    return tools
+
+
+def test_observation_snapshot_survives_record_click(client):
+    DynamicConfig.page_stable_threshold = 0.05
+    tools = make_tools(client)
+    client.hierarchy.get()
+
+    tools._invalidate_hierarchy('click')  # 操作前：记下操作前的页面并失效
+    client.u2.xml = make_xml("设置")       # 点击生效
+    tools._settle('click', 1.0)
+    dumps = client.u2.dumps
+    tools._record_click('text', '首页')
+
+    # 操作后的页面不会被当成"操作前"暂存，也不会因为记录操作被丢弃
+    assert tools._pre_action_snapshot is None
+    assert tools._get_page_texts(10) == ["设置"]
+    assert client.u2.dumps == dumps
+    assert client.waits.stats()["observations"] == 1
+
+
+def test_settle_invalidates_when_caller_did_not(client):
+    tools = make_tools(client)
+    before = client.hierarchy.get()
+    client.u2.xml = make_xml("设置")
+    tools._settle('click', 0.1)
+    # 缓存里的操作前快照已失效，之后的读取拿到的是新页面
+    assert client.hierarchy.peek(max_age=float('inf')) is not before
+    assert tools._get_page_texts(10) == ["设置"]
+
+
+def test_stale_snapshot_is_not_used_as_before(client):
+    DynamicConfig.hierarchy_snapshot_ttl = 0.05
+    tools = make_tools(client)
+    client.hierarchy.get()
+    time.sleep(0.08)
+    tools._invalidate_hierarchy('click')
+    assert tools._pre_action_snapshot is None
+
+
+def test_unparsed_snapshot_is_fingerprinted_only_when_observing(client):
+    DynamicConfig.adaptive_wait_explore_every = 0
+    tools = make_tools(client)
+    stats = client.waits._stats[("com.app", "click")] = SettleStats()
+    for _ in range(10):
+        stats.add(0.01)
+    snapshot = client.hierarchy.get()
+
+    tools._invalidate_hierarchy('click')
+    tools._settle('click', 0.5)
+    # 按学到的时间等待，没有为操作前的快照解析节点表
+    assert not snapshot.is_parsed
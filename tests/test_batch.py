@@ -0,0 +1,106 @@
+"""
+批量执行：守卫条件、失败处理、参数检查、共用控件树快照（dump 次数）
+"""
+import asyncio
+
+from mobile_mcp.core.adaptive_wait import SettleStats
+from mobile_mcp.core.dynamic_config import DynamicConfig
+
+from .conftest import make_xml
+from .test_click_by_text import make_tools
+
+
+def batch_tools(*pages):
+    """快速点击 + 已学到的等待时间：每次点击只在查找时 dump 一次"""
+    DynamicConfig.fast_click = True
+    DynamicConfig.adaptive_wait_explore_every = 0
+    tools, client = make_tools(*pages)
+    stats = client.waits._stats[("com.app", "click")] = SettleStats()
+    for _ in range(10):
+        stats.add(0.01)
+    return tools, client
+
+
+def run(tools, actions, **kwargs):
+    return asyncio.run(tools.run_batch(actions, **kwargs))
+
+
+def test_read_only_actions_and_guards_share_one_dump():
+    tools, client = batch_tools(make_xml("首页", "设置"), make_xml("账号", "隐私"))
+    result = run(tools, [
+        {"action": "assert_text", "text": "首页"},
+        {"action": "assert_text", "text": "弹窗", "exists": False},
+        {"action": "click_by_text", "text": "关闭", "if_text": "弹窗"},
+        {"action": "click_by_text", "text": "设置", "unless_text": "弹窗"},
+        {"action": "assert_text", "text": "账号"},
+        {"action": "click_by_text", "text": "隐私", "unless_text": "账号"},
+    ])
+    assert result["success"] and result["completed"] == result["total"] == 6
+    assert [r["ok"] for r in result["results"]] == [True] * 6
+    assert result["results"][2]["skipped"] == "无'弹窗'"
+    assert result["results"][5]["skipped"] == "有'账号'"
+    assert "skipped" not in result["results"][3]
+    assert client.u2.clicks == [(540, 370)]
+    # 点击前一份快照，点击后一份
+    assert result["dumps"] == 2 == client.u2.dumps
+
+
+def test_stop_on_failure():
+    actions = [
+        {"action": "assert_text", "text": "不存在"},
+        {"action": "assert_text", "text": "首页"},
+    ]
+    tools, _ = batch_tools(make_xml("首页"))
+    result = run(tools, actions)
+    assert not result["success"] and result["completed"] == 1 and result["total"] == 2
+    assert result["results"][0]["msg"] == "文本'不存在' 不存在"
+
+    result = run(tools, actions, stop_on_failure=False)
+    assert not result["success"] and result["completed"] == 2
+    assert [r["ok"] for r in result["results"]] == [False, True]
+
+
+def test_optional_failure_does_not_stop():
+    tools, _ = batch_tools(make_xml("首页"))
+    result = run(tools, [
+        {"action": "assert_text", "text": "广告", "optional": True},
+        {"action": "assert_text", "text": "首页"},
+    ])
+    assert result["success"] and result["completed"] == 2
+    assert [r["ok"] for r in result["results"]] == [False, True]
+
+
+def test_wait_invalidates_snapshot():
+    tools, client = batch_tools(make_xml("首页"))
+    result = run(tools, [
+        {"action": "assert_text", "text": "首页"},
+        {"action": "wait", "seconds": 0},
+        {"action": "assert_text", "text": "首页"},
+    ])
+    assert result["success"] and result["dumps"] == 2 == client.u2.dumps
+
+
+def test_missing_required_fields_reported_clearly():
+    tools, client = batch_tools(make_xml("首页"))
+    result = run(tools, [
+        {"action": "click_by_text", "if_text": "首页"},
+        {"action": "input_text_by_id", "text": "abc"},
+        {"action": "swipe"},
+        {"action": "press_key", "key": None},
+        {"action": "tap", "text": "首页"},
+        {"text": "首页"},
+        {"action": "wait", "seconds": 0},
+    ], stop_on_failure=False)
+    messages = [r.get("msg") for r in result["results"]]
+    assert messages[:4] == [
+        "click_by_text 缺少必填参数: text",
+        "input_text_by_id 缺少必填参数: resource_id",
+        "swipe 缺少必填参数: direction",
+        "press_key 缺少必填参数: key",
+    ]
+    assert messages[4].startswith("不支持的动作: tap，可用: click_by_text")
+    assert messages[5].startswith("不支持的动作: (未指定)")
+    assert messages[6] is None and result["results"][6]["ok"]
+    assert not result["success"]
+    # 参数无效的动作不执行、也不检查守卫
+    assert client.u2.dumps == 0 and client.u2.clicks == []
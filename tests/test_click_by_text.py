@@ -0,0 +1,91 @@
+"""
+click_by_text 快速模式：点快照中控件的中心，点击后的页面文本不额外 dump
+"""
+from mobile_mcp.core.adaptive_wait import AdaptiveWaitEngine, SettleStats
+from mobile_mcp.core.basic_tools_lite import BasicMobileToolsLite
+from mobile_mcp.core.dynamic_config import DynamicConfig
+
+from .conftest import FakeClient, FakeU2, make_xml
+
+
+class PagingU2(FakeU2):
+    """点击后切换到下一页"""
+
+    def __init__(self, *pages):
+        super().__init__(pages[0])
+        self.pages = list(pages[1:])
+
+    def click(self, x, y):
+        super().click(x, y)
+        if self.pages:
+            self.xml = self.pages.pop(0)
+
+
+def make_tools(*pages):
+    client = FakeClient()
+    client.u2 = PagingU2(*pages)
+    client.waits = AdaptiveWaitEngine(client)
+    tools = BasicMobileToolsLite(client)
+    tools.target_package = "com.app"
+    return tools, client
+
+
+def test_fast_click_reads_texts_from_settle_observation():
+    DynamicConfig.page_stable_threshold = 0.05
+    tools, client = make_tools(make_xml("首页", "设置"), make_xml("账号", "隐私"))
+
+    result = tools.click_by_text("设置", fast=True)
+    assert result["success"] and sorted(result["page_texts"]) == ["账号", "隐私"]
+    assert client.u2.clicks == [(540, 370)]
+    assert client.waits.stats()["observations"] == 1
+    # 摘要直接命中观察时 dump 的快照
+    assert client.hierarchy.stats()["hits"] == 1
+
+
+def test_fast_click_with_learned_wait_skips_texts():
+    DynamicConfig.adaptive_wait_explore_every = 0
+    tools, client = make_tools(make_xml("首页", "设置"), make_xml("账号"))
+    stats = client.waits._stats[("com.app", "click")] = SettleStats()
+    for _ in range(10):
+        stats.add(0.01)
+
+    result = tools.click_by_text("设置", fast=True)
+    assert result["success"] and "page_texts" not in result
+    assert client.u2.dumps == 1  # 只有查找时的一次
+
+
+class SelectorU2(PagingU2):
+    """支持 u2(text=...) 选择器"""
+
+    def __init__(self, *pages):
+        super().__init__(*pages)
+        self.selected = []
+
+    def __call__(self, **selector):
+        u2 = self
+
+        class Element:
+            def exists(self, timeout=0):
+                return True
+
+            def click(self):
+                u2.selected.append(selector)
+                if u2.pages:
+                    u2.xml = u2.pages.pop(0)
+
+        return Element()
+
+
+def test_default_click_uses_selector_and_returns_texts():
+    DynamicConfig.page_stable_threshold = 0.05
+    DynamicConfig.adaptive_wait_explore_every = 0
+    tools, client = make_tools(make_xml("首页", "设置"))
+    client.u2 = SelectorU2(make_xml("首页", "设置"), make_xml("账号"))
+    stats = client.waits._stats[("com.app", "click")] = SettleStats()
+    for _ in range(10):
+        stats.add(0.01)
+
+    result = tools.click_by_text("设置")
+    assert client.u2.selected == [{"text": "设置"}] and client.u2.clicks == []
+    # 按学到的时间等待、没有观察快照时也返回 page_texts
+    assert result["success"] and result["page_texts"] == ["账号"]
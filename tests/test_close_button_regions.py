@@ -0,0 +1,139 @@
+"""
+关闭按钮搜索区域：区域裁剪/包含去重、区域匹配坐标换算、按应用学习的位置先验
+"""
+import cv2
+import pytest
+
+from mobile_mcp.core.basic_tools_lite import BasicMobileToolsLite
+from mobile_mcp.core.dynamic_config import DynamicConfig
+from mobile_mcp.core.template_matcher import SCREEN_PRIOR_REGIONS, TemplateMatcher, close_button_regions
+
+from .conftest import FakeClient
+from .test_template_matcher import background, plant, x_template
+
+W, H = 1080, 2400
+
+
+def inside(box):
+    return all(0.0 <= v <= 1.0 for v in box) and box[2] > box[0] and box[3] > box[1]
+
+
+def test_regions_without_hints_are_screen_priors():
+    assert close_button_regions(W, H) == SCREEN_PRIOR_REGIONS
+    assert close_button_regions(0, H, (0, 0, 10, 10)) == []
+
+
+def test_regions_clipped_to_screen():
+    # 贴着屏幕右上角的弹窗：角落区域超出屏幕的部分被裁掉
+    regions = close_button_regions(W, H, (600, 0, W, 500), points=[(99.0, 99.0)])
+    assert all(inside(box) for box in regions)
+    assert any(box[2] == 1.0 and box[1] == 0.0 for box in regions)
+    assert any(box[2] == 1.0 and box[3] == 1.0 for box in regions)
+
+
+def test_regions_contained_in_another_are_dropped():
+    # 历史位置 (90%, 10%) 的小框完全落在屏幕右上角先验 (0.6-1.0, 0-0.3) 内，不再单独搜索
+    assert close_button_regions(W, H, points=[(90.0, 10.0)]) == SCREEN_PRIOR_REGIONS
+
+    # 左上角的位置不被包含，保留；重复的位置只保留一个
+    regions = close_button_regions(W, H, points=[(10.0, 10.0), (10.0, 10.0)])
+    assert len(regions) == 3
+    assert pytest.approx(regions[0]) == (0.02, 0.05, 0.18, 0.15)
+    for box in regions:
+        assert not any(other != box and other[0] <= box[0] and other[1] <= box[1]
+                       and other[2] >= box[2] and other[3] >= box[3] for other in regions)
+
+
+def test_popup_corner_regions():
+    regions = close_button_regions(W, H, (140, 800, 940, 1600))
+    band = max(W * 0.08, 800 * 0.25)
+    right_top = ((940 - band * 1.5) / W, (800 - band) / H, (940 + band * 0.5) / W, (800 + band) / H)
+    assert pytest.approx(regions[0]) == right_top
+    # 正下方区域落在屏幕底部中间的先验内，被去掉
+    assert len(regions) == 4 and regions[2:] == SCREEN_PRIOR_REGIONS
+
+
+def test_match_regions_translates_to_screen_coordinates(tmp_path):
+    cv2.imwrite(str(tmp_path / "x.png"), x_template())
+    shot = background()
+    plant(shot, x_template(), 1.0, 900, 150)
+    matcher = TemplateMatcher(template_dir=str(tmp_path), workers=0)
+    entries = matcher.bank.entries()
+
+    matches = matcher.match_regions(entries, matcher.match_threshold, shot, [(0.6, 0.0, 1.0, 0.3)])
+    best = max(matches, key=lambda m: m['confidence'])
+    assert best['top_left'] == (900, 150) and best['bottom_right'] == (964, 214)
+    assert (best['x'], best['y']) == (932, 182) and best['template'] == "x"
+
+    # 区域左上角不在原点时同样换算；不包含目标的区域、过小的区域没有结果
+    matches = matcher.match_regions(entries, matcher.match_threshold, shot, [(0.5, 0.05, 0.95, 0.2)])
+    assert max(matches, key=lambda m: m['confidence'])['top_left'] == (900, 150)
+    assert matcher.match_regions(entries, matcher.match_threshold, shot, [(0.0, 0.5, 0.5, 1.0)]) == []
+    assert matcher.match_regions(entries, matcher.match_threshold, shot, [(0.9, 0.1, 0.901, 0.2)]) == []
+
+
+# ==================== 按应用学习的位置先验 ====================
+
+def make_tools(package="com.app"):
+    tools = BasicMobileToolsLite(FakeClient())
+    tools._get_current_package = lambda: package
+    return tools
+
+
+def close_click(tools, x, y):
+    tools._record_click('percent', f"({x}%, {y}%)", x, y)
+    tools._remember_close_click()
+
+
+def prior_points(tools, monkeypatch):
+    seen = []
+    import mobile_mcp.core.template_matcher as tm
+
+    def record(screen_width, screen_height, popup_bounds=None, points=None):
+        seen.append(list(points))
+        return []
+
+    monkeypatch.setattr(tm, "close_button_regions", record)
+    tools._close_button_regions(W, H, popup_bounds=(0, 0, 0, 0))
+    return seen[-1]
+
+
+def test_remember_close_click_marks_last_click():
+    tools = make_tools()
+    tools._record_operation('swipe', direction='up')
+    tools._remember_close_click()
+    assert 'purpose' not in tools.operation_history[-1]
+
+    close_click(tools, 90.0, 8.0)
+    assert tools.operation_history[-1]['purpose'] == 'close_popup'
+    assert tools.operation_history[-1]['package'] == "com.app"
+
+
+def test_learned_priors_are_per_app(monkeypatch):
+    tools = make_tools()
+    close_click(tools, 90.0, 8.0)
+    tools._get_current_package = lambda: "com.other"
+    close_click(tools, 50.0, 80.0)
+    assert prior_points(tools, monkeypatch) == [(50.0, 80.0)]
+    tools._get_current_package = lambda: "com.app"
+    assert prior_points(tools, monkeypatch) == [(90.0, 8.0)]
+
+
+def test_priors_capped_per_app(monkeypatch):
+    DynamicConfig.close_button_priors = {"com.app": [[10.0, 10.0]]}
+    DynamicConfig.close_button_priors_max = 4
+    tools = make_tools()
+    for i in range(20):
+        close_click(tools, 50.0 + i * 2, 90.0)
+    close_click(tools, 88.5, 90.0)  # 与上一次的位置重合，只算一次
+
+    points = prior_points(tools, monkeypatch)
+    assert points == [(10.0, 10.0), (88.5, 90.0), (86.0, 90.0), (84.0, 90.0)]
+
+
+def test_configured_priors_truncated_on_load():
+    DynamicConfig.update({"ad_handling": {
+        "close_button_priors_max": 2,
+        "close_button_priors": {"com.app": [[1, 1], [2, 2], [3, 3]], "com.b": [[5, 5]]},
+    }})
+    assert DynamicConfig.close_button_priors == {"com.app": [[1, 1], [2, 2]], "com.b": [[5, 5]]}
@@ -0,0 +1,66 @@
+"""
+设备发现：健康探测与设备锁
+"""
+import asyncio
+import threading
+import time
+
+from mobile_mcp.core import device_discovery
+from mobile_mcp.core.device_discovery import DeviceDiscoveryService
+
+
+class ProbeProfile:
+    def __init__(self):
+        self.refreshes = 0
+
+    def refresh(self):
+        self.refreshes += 1
+
+
+class ProbeClient:
+    platform = "android"
+
+    def __init__(self):
+        self.profile = ProbeProfile()
+
+
+def test_probe_holds_device_lock():
+    client = ProbeClient()
+    lock = threading.Lock()
+    healthy, _ = DeviceDiscoveryService._probe_client(client, lock)
+    assert healthy and client.profile.refreshes == 1
+    assert not lock.locked()
+
+
+def test_probe_skips_busy_device(monkeypatch):
+    monkeypatch.setattr(device_discovery, "PROBE_LOCK_TIMEOUT", 0.05)
+    client = ProbeClient()
+    lock = threading.Lock()
+    lock.acquire()
+    start = time.time()
+    assert DeviceDiscoveryService._probe_client(client, lock) is None
+    assert time.time() - start < 0.5
+    assert client.profile.refreshes == 0
+    lock.release()
+
+
+def test_busy_probe_keeps_previous_health(monkeypatch):
+    monkeypatch.setattr(device_discovery, "PROBE_LOCK_TIMEOUT", 0.05)
+    discovery = DeviceDiscoveryService()
+    lock = threading.Lock()
+    discovery.attach_client("SER1", ProbeClient(), lock)
+
+    found = {"SER1": {"id": "SER1", "platform": "android"}}
+    asyncio.run(discovery._probe(found))
+    assert found["SER1"]["healthy"] is True
+    discovery._devices = found
+    checked_at = found["SER1"]["checked_at"]
+
+    lock.acquire()
+    try:
+        again = {"SER1": {"id": "SER1", "platform": "android"}}
+        asyncio.run(discovery._probe(again))
+    finally:
+        lock.release()
+    assert again["SER1"]["healthy"] is True
+    assert again["SER1"]["checked_at"] == checked_at
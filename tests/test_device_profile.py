@@ -0,0 +1,83 @@
+"""
+设备信息缓存：TTL、旋转 / 切换 App 失效、省下的请求次数
+"""
+import time
+
+from mobile_mcp.core.device_profile import DeviceProfileService
+from mobile_mcp.core.dynamic_config import DynamicConfig
+
+from .conftest import FakeClient, FakeU2, make_xml
+
+
+class AppU2(FakeU2):
+    """带前台应用的假设备"""
+
+    def __init__(self):
+        super().__init__()
+        self.package = "com.app"
+        self.app_calls = 0
+
+    def app_current(self):
+        self.app_calls += 1
+        return {"package": self.package}
+
+
+def make_profile():
+    client = FakeClient()
+    client.u2 = AppU2()
+    return DeviceProfileService(client), client.u2
+
+
+def test_display_info_reused_within_ttl():
+    profile, u2 = make_profile()
+    first = profile.get()
+    assert profile.get() is first and profile.screen_size() == (1080, 2400)
+    assert profile.get().density == 420
+    assert u2.info_calls == 1
+    stats = profile.stats()
+    assert stats["rpcs"] == 1 and stats["avoided_rpcs"] == 3
+
+
+def test_ttl_expiry_and_forced_refresh():
+    DynamicConfig.device_profile_ttl = 0.05
+    profile, u2 = make_profile()
+    first = profile.get()
+    time.sleep(0.08)
+    assert profile.get() is not first and u2.info_calls == 2
+    profile.refresh()
+    assert u2.info_calls == 3 and profile.stats()["refreshes"] == 3
+
+
+def test_rotation_invalidates_display_info():
+    profile, u2 = make_profile()
+    profile.get()
+    profile.observe_hierarchy(make_xml("首页", rotation=0))
+    profile.get()
+    assert u2.info_calls == 1
+
+    profile.observe_hierarchy(make_xml("首页", rotation=1))
+    profile.get()
+    assert u2.info_calls == 2
+    assert profile.stats()["last_invalidate_reason"] == "rotation"
+
+    profile.notify("orientation")
+    profile.get()
+    assert u2.info_calls == 3
+
+
+def test_app_switch_invalidates_package_only():
+    profile, u2 = make_profile()
+    profile.get()
+    assert profile.current_package() == "com.app"
+    assert profile.current_package() == "com.app" and u2.app_calls == 1
+
+    u2.package = "com.other"
+    profile.notify("launch_app")
+    assert profile.current_package() == "com.other" and u2.app_calls == 2
+    # 显示信息不受切换 App 影响
+    profile.get()
+    assert u2.info_calls == 1
+    stats = profile.stats()
+    assert stats["invalidations"] == 1 and stats["last_invalidate_reason"] == "launch_app"
+    assert stats["rpcs"] == u2.info_calls + u2.app_calls
+    assert stats["avoided_rpcs"] == 2
@@ -0,0 +1,79 @@
+"""
+元素索引：精确 / 包含查询与逐节点扫描结果一致
+"""
+from xml.sax.saxutils import quoteattr
+
+from mobile_mcp.core.element_index import ElementIndex
+from mobile_mcp.utils.xml_parser import XMLParser
+
+NODES = [
+    # (text, content-desc, resource-id, class)
+    ("登录", "", "com.app:id/btn_login", "android.widget.Button"),
+    ("", "登录", "com.app:id/icon_login", "android.widget.ImageView"),
+    ("立即登录领取", "", "com.app:id/banner", "android.widget.TextView"),
+    ("ab-bc", "", "", "android.widget.TextView"),
+    ("确定", "确定按钮", "com.app:id/ok", "android.widget.Button"),
+    ("确定", "", "com.app:id/ok", "android.widget.Button"),
+    ("", "", "com.app:id/container", "android.widget.FrameLayout"),
+    ("a", "x", "", "android.widget.TextView"),
+]
+
+
+def build_table():
+    children = "".join(
+        f'<node index="{i}" text={quoteattr(text)} content-desc={quoteattr(desc)} resource-id="{rid}" '
+        f'class="{cls}" clickable="true" bounds="[0,{i * 100}][1080,{i * 100 + 90}]" />'
+        for i, (text, desc, rid, cls) in enumerate(NODES)
+    )
+    xml = (f'<hierarchy rotation="0"><node index="0" text="" content-desc="" resource-id="" '
+           f'class="android.widget.FrameLayout" bounds="[0,0][1080,2400]">{children}</node></hierarchy>')
+    return XMLParser().parse_table(xml)
+
+
+def scan(table, text, exact_match=True):
+    """逐节点扫描的参考实现（索引引入前的查找语义）"""
+    exact, contains = [], []
+    for node in table:
+        if exact_match and (node.text == text or node.content_desc == text):
+            exact.append((node.index, 'text' if node.text == text else 'description'))
+        elif text in node.text or text in node.content_desc:
+            contains.append((node.index, 'textContains' if text in node.text else 'descriptionContains'))
+    return exact + contains
+
+
+def test_find_matches_linear_scan():
+    table = build_table()
+    index = ElementIndex(table)
+    for query in ["登录", "确定", "领取", "立即登录领取", "ab", "abc", "b-b", "a", "x", "不存在", "确定按钮"]:
+        for exact in (True, False):
+            got = [(n.index, attr) for n, attr in index.find(query, exact_match=exact)]
+            assert got == scan(table, query, exact), (query, exact)
+
+
+def test_exact_lookups():
+    index = ElementIndex(build_table())
+    assert [n.text for n in index.find_by_text("确定")] == ["确定", "确定"]
+    assert [n.resource_id for n in index.find_by_desc("登录")] == ["com.app:id/icon_login"]
+    assert len(index.find_by_resource_id("com.app:id/ok")) == 2
+    assert index.find_by_resource_id("com.app:id/missing") == []
+    assert len(index.find_by_class("android.widget.Button")) == 3
+
+
+def test_bigram_candidates_are_verified():
+    index = ElementIndex(build_table())
+    # "ab-bc" 同时含有 "ab" 和 "bc" 两个二元组，但不含 "abc"
+    assert index.find_text_contains("abc") == []
+    assert [n.text for n in index.find_text_contains("b-b")] == ["ab-bc"]
+
+
+def test_single_char_and_empty_queries():
+    table = build_table()
+    index = ElementIndex(table)
+    assert [n.text for n in index.find_text_contains("a")] == ["ab-bc", "a"]
+    assert len(index.find_text_contains("")) == len(table)
+
+
+def test_nodes_carry_parsed_bounds():
+    index = ElementIndex(build_table())
+    node = index.find_by_resource_id("com.app:id/btn_login")[0]
+    assert node.bounds == (0, 0, 1080, 90) and node.center == (540, 45)
@@ -0,0 +1,97 @@
+"""
+控件树快照服务：TTL、失效、压缩/非压缩分开缓存、懒解析
+"""
+import time
+
+from mobile_mcp.core.dynamic_config import DynamicConfig
+
+from .conftest import make_xml
+
+
+def test_get_reuses_snapshot_within_ttl(client):
+    first = client.hierarchy.get()
+    assert client.hierarchy.get() is first
+    assert client.u2.dumps == 1
+    stats = client.hierarchy.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_ttl_expiry_and_forced_refresh(client):
+    DynamicConfig.hierarchy_snapshot_ttl = 0.05
+    first = client.hierarchy.get()
+    time.sleep(0.08)
+    assert client.hierarchy.get() is not first
+    assert client.u2.dumps == 2
+    client.hierarchy.get(max_age=0)
+    assert client.u2.dumps == 3
+    client.hierarchy.get(max_age=float("inf"))
+    assert client.u2.dumps == 3
+
+
+def test_invalidate_drops_all_snapshots(client):
+    client.hierarchy.get()
+    client.hierarchy.get(compressed=True)
+    assert client.u2.dumps == 2
+
+    client.u2.xml = make_xml("设置")
+    client.hierarchy.invalidate("click")
+    assert client.hierarchy.peek() is None and client.hierarchy.peek(compressed=True) is None
+    assert [n.text for n in client.hierarchy.get().table if n.text] == ["设置"]
+    stats = client.hierarchy.stats()
+    assert stats["invalidations"] == 1 and stats["last_invalidate_reason"] == "click"
+
+    # 没有快照时失效不计数
+    client.hierarchy.invalidate("swipe")
+    client.hierarchy.invalidate("swipe")
+    assert client.hierarchy.stats()["invalidations"] == 2
+
+
+def test_compressed_and_plain_cached_separately(client):
+    plain = client.hierarchy.get()
+    compressed = client.hierarchy.get(compressed=True)
+    assert plain is not compressed and compressed.compressed
+    assert client.hierarchy.get(compressed=True) is compressed
+
+
+def test_peek_respects_ttl_and_does_not_count(client):
+    DynamicConfig.hierarchy_snapshot_ttl = 0.05
+    assert client.hierarchy.peek() is None
+    snapshot = client.hierarchy.get()
+    assert client.hierarchy.peek() is snapshot
+    time.sleep(0.08)
+    assert client.hierarchy.peek() is None
+    assert client.hierarchy.peek(max_age=float("inf")) is snapshot
+    stats = client.hierarchy.stats()
+    assert stats["hits"] == 0 and stats["misses"] == 1
+
+
+def test_views_are_lazy_and_shared(client):
+    snapshot = client.hierarchy.get()
+    assert not snapshot.is_parsed
+    table = snapshot.table
+    assert snapshot.is_parsed and snapshot.table is table
+    assert snapshot.index is snapshot.index
+    assert snapshot.fingerprint is snapshot.fingerprint
+    assert [e["text"] for e in snapshot.elements if e.get("text")] == ["首页"]
+
+
+def test_client_snapshot_reads_shared_hierarchy(client):
+    # MobileClient.snapshot 不再单独缓存：操作后快照失效，下一次读取到的就是新页面
+    import asyncio
+    from mobile_mcp.core.mobile_client import MobileClient
+    from mobile_mcp.utils.xml_formatter import XMLFormatter
+
+    client.xml_formatter = XMLFormatter()
+    before = asyncio.run(MobileClient.snapshot(client))
+    assert "首页" in before
+    assert asyncio.run(MobileClient.snapshot(client)) == before
+    assert client.u2.dumps == 1
+
+    client.u2.xml = make_xml("设置")
+    client.hierarchy.invalidate("click")
+    after = asyncio.run(MobileClient.snapshot(client))
+    assert "设置" in after and "首页" not in after
+    assert client.u2.dumps == 2
+
+    asyncio.run(MobileClient.snapshot(client, use_cache=False))
+    assert client.u2.dumps == 3
@@ -0,0 +1,282 @@
+"""
+MCP Server 设备池：设备锁排队、会话路由
+
+不连接真实设备：initialize / _dispatch_tool 换成只记录调用的替身。
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("mcp")
+
+from mcp_tools import mcp_server  # noqa: E402
+from mcp_tools.mcp_server import MobileMCPServer  # noqa: E402
+
+
+class FakeTools:
+    def take_wait_report(self):
+        return None
+
+
+class FakeServer(MobileMCPServer):
+    """initialize 只标记已连接；工具执行按 arguments["seconds"] 占用设备"""
+
+    def __init__(self):
+        super().__init__()
+        self.executed = []
+        self.initialized = []
+
+    async def initialize(self, session=None):
+        session = session or self.default_session
+        self.initialized.append(session.device_id)
+        if session.tools is None:
+            session.client = object()
+            session.tools = FakeTools()
+            session.platform = "android"
+
+    async def _dispatch_tool(self, name, arguments, session):
+        time.sleep(arguments.get("seconds", 0))
+        self.executed.append((name, session.device_id))
+        return [mcp_server.TextContent(type="text", text=self.format_response({"success": True}))]
+
+
+def call(server, name, device_id="A", timeout=5.0, cancelled=None, **arguments):
+    return server._call_tool_sync(name, arguments, device_id, cancelled or threading.Event(),
+                                  threading.Event(), timeout)
+
+
+# ==================== 设备锁 ====================
+
+def test_busy_device_returns_error_instead_of_running_later():
+    server = FakeServer()
+    worker = threading.Thread(target=call, args=(server, "mobile_wait"), kwargs={"seconds": 0.6})
+    worker.start()
+    time.sleep(0.1)
+
+    start = time.time()
+    contents = call(server, "mobile_click_by_text", timeout=0.2)
+    assert time.time() - start < 0.5
+    assert "正忙" in contents[0].text
+    worker.join()
+    # 排队超时的调用不会在设备空闲后补执行
+    assert server.executed == [("mobile_wait", "A")]
+
+
+def test_cancel_while_queued_stops_waiting():
+    server = FakeServer()
+    worker = threading.Thread(target=call, args=(server, "mobile_wait"), kwargs={"seconds": 0.6})
+    worker.start()
+    time.sleep(0.1)
+
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    start = time.time()
+    contents = call(server, "mobile_click_by_text", timeout=5.0, cancelled=cancelled)
+    assert time.time() - start < mcp_server.LOCK_POLL_INTERVAL + 0.3
+    assert "已取消" in contents[0].text
+    worker.join()
+    assert [name for name, _ in server.executed] == ["mobile_wait"]
+
+
+def test_different_devices_run_in_parallel():
+    server = FakeServer()
+    threads = [threading.Thread(target=call, args=(server, "mobile_wait", device), kwargs={"seconds": 0.3})
+               for device in ("A", "B")]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.time() - start < 0.55
+    assert sorted(server.executed) == [("mobile_wait", "A"), ("mobile_wait", "B")]
+
+
+def test_handle_tool_call_timeout_releases_queue():
+    server = FakeServer()
+    server._tool_timeout = 0.3
+
+    async def run():
+        first = asyncio.create_task(server.handle_tool_call("mobile_wait", {"device_id": "A", "seconds": 0.6}))
+        await asyncio.sleep(0.05)
+        second = await server.handle_tool_call("mobile_click_by_text", {"device_id": "A"})
+        await first
+        return second
+
+    contents = asyncio.run(run())
+    # 事件循环侧超时和线程侧等锁超时先到哪个都行，关键是不执行
+    assert '"success":false' in contents[0].text
+    time.sleep(0.4)
+    assert [name for name, _ in server.executed] == ["mobile_wait"]
+
+
+# ==================== 设备池路由 ====================
+
+class FakeDiscovery:
+    def __init__(self, serials=()):
+        self.serials = list(serials)
+        self.attached = {}
+
+    def devices(self, platform=None):
+        return [{"id": s, "platform": "android"} for s in self.serials]
+
+    def platform_of(self, device_id=None):
+        return "android" if device_id in self.serials else None
+
+    def is_healthy(self, device_id, max_age=None):
+        return False
+
+    def attach_client(self, device_id, client, lock=None):
+        self.attached[device_id] = client
+
+    def stats(self):
+        return {"age": 0.0}
+
+    def detach_client(self, device_id):
+        self.attached.pop(device_id, None)
+
+
+class FakeManager:
+    def __init__(self, device_id):
+        self.current_device_id = device_id
+        self.disconnected = False
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    """真实 initialize + 假 MobileClient：自动选择时连接 adb 列表第一台 SER1"""
+    from mobile_mcp.core import basic_tools_lite, mobile_client
+
+    created = []
+
+    class FakeMobileClient:
+        def __init__(self, device_id=None, platform="android"):
+            self.device_manager = FakeManager(device_id or "SER1")
+            created.append(self)
+
+    monkeypatch.setattr(mobile_client, "MobileClient", FakeMobileClient)
+    monkeypatch.setattr(basic_tools_lite, "BasicMobileToolsLite", lambda client: FakeTools())
+    monkeypatch.setattr(MobileMCPServer, "_is_connection_valid", staticmethod(lambda client: True))
+    monkeypatch.delenv("MOBILE_PLATFORM", raising=False)
+
+    discovery = FakeDiscovery(["SER1", "SER2"])
+    server = MobileMCPServer()
+    server._default_device_id = None
+    monkeypatch.setattr(server, "_get_discovery", lambda: discovery)
+    return server, discovery, created
+
+
+def test_default_and_explicit_share_one_session(routing):
+    server, discovery, created = routing
+    explicit = server._get_session("SER1")
+    assert server._get_session(None) is explicit
+
+    asyncio.run(server.initialize(explicit))
+    asyncio.run(server.initialize(server._get_session(None)))
+    assert len(created) == 1
+    assert discovery.attached["SER1"] is explicit.client
+
+
+def test_duplicate_default_connection_is_released(routing):
+    server, discovery, created = routing
+    explicit = server._get_session("SER1")
+    asyncio.run(server.initialize(explicit))
+
+    # 发现缓存还没有这台设备：默认会话只能先连接，连接后才知道是同一台
+    discovery.serials = []
+    default = server._get_session(None)
+    assert default is not explicit
+    asyncio.run(server.initialize(default))
+
+    assert default.client is None and created[1].device_manager.disconnected
+    assert discovery.attached["SER1"] is explicit.client
+    assert server._get_session(None) is explicit
+    assert len(server.list_sessions()) == 1
+
+
+def test_call_routes_default_to_existing_session(routing):
+    server, discovery, created = routing
+    explicit = server._get_session("SER1")
+    discovery.serials = []
+
+    dispatched = []
+
+    async def dispatch(name, arguments, session):
+        dispatched.append(session)
+        return [mcp_server.TextContent(type="text", text="{}")]
+
+    server._dispatch_tool = dispatch
+    call(server, "mobile_click_by_text", device_id=None)
+    assert dispatched == [explicit] and explicit.connected
+    assert [c.device_manager.disconnected for c in created] == [True, False]
+
+
+def test_other_device_gets_own_session(routing):
+    server, _, _ = routing
+    assert server._get_session("SER2") is not server._get_session(None)
+    assert server._get_session(None).device_id == "SER1"
+
+
+def test_list_devices_does_not_connect(routing):
+    server, discovery, created = routing
+    contents = call(server, "mobile_list_devices", device_id=None)
+    assert created == []
+    assert server._sessions == {} or not any(s.connected for s in server._sessions.values())
+    text = contents[0].text
+    assert '"count":2' in text and '"pool"' in text
+
+
+def test_connected_client_is_attached_with_device_lock(routing, monkeypatch):
+    server, discovery, _ = routing
+    locks = {}
+    monkeypatch.setattr(discovery, "attach_client",
+                        lambda device_id, client, lock=None: locks.setdefault(device_id, lock))
+    session = server._get_session("SER2")
+    asyncio.run(server.initialize(session))
+    assert locks["SER2"] is session.lock
+
+
+def test_connection_check_skipped_while_device_busy(routing, monkeypatch):
+    server, discovery, created = routing
+    session = server._get_session("SER1")
+    asyncio.run(server.initialize(session))
+    checks = []
+    monkeypatch.setattr(MobileMCPServer, "_is_connection_valid",
+                        staticmethod(lambda client: checks.append(client) or False))
+
+    # 另一个工具正在执行：不访问设备，也不替换它正在用的客户端
+    with session.lock:
+        asyncio.run(server.initialize(session))
+    assert checks == [] and session.client is created[0]
+
+    # 空闲时才检查；连接失效则释放旧客户端后重连
+    asyncio.run(server.initialize(session))
+    assert checks == [created[0]]
+    assert created[0].device_manager.disconnected
+    assert session.client is created[1] and discovery.attached["SER1"] is created[1]
+    assert not session.lock.locked()
+
+
+def test_connection_check_reuses_cached_profile():
+    from mobile_mcp.core.device_profile import DeviceProfileService
+    from .conftest import FakeClient, FakeU2
+
+    client = FakeClient()
+    client.profile = DeviceProfileService(client)
+    for _ in range(3):
+        assert MobileMCPServer._is_connection_valid(client)
+    assert client.u2.info_calls == 1
+
+    class DeadU2(FakeU2):
+        @property
+        def info(self):
+            raise ConnectionError("device offline")
+
+    # 缓存过期后读取失败（连接断开）判为失效
+    client.u2 = DeadU2()
+    client.profile.invalidate("test")
+    assert not MobileMCPServer._is_connection_valid(client)
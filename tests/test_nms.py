@@ -0,0 +1,53 @@
+"""
+非极大值抑制：向量化实现与逐对比较的参考实现结果一致
+"""
+import random
+
+import pytest
+
+from mobile_mcp.core import nms as nms_module
+from mobile_mcp.core.nms import _legacy_template_nms, _nms_python, nms
+
+
+def make_boxes(count, seed):
+    rng = random.Random(seed)
+    centers = [(rng.randint(50, 1000), rng.randint(50, 2000)) for _ in range(max(count // 8, 1))]
+    boxes, scores = [], []
+    for _ in range(count):
+        cx, cy = rng.choice(centers)
+        cx, cy = cx + rng.randint(-10, 10), cy + rng.randint(-10, 10)
+        w, h = rng.choice([20, 40, 60, 120]), rng.choice([20, 40, 60, 120])
+        boxes.append((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2))
+        # 分数取少量离散值，覆盖同分时保持原顺序
+        scores.append(rng.choice([0.6, 0.7, 0.8, 0.9]))
+    return boxes, scores
+
+
+@pytest.mark.parametrize("iou, center", [(0.5, None), (0.1, None), (None, 0.3), (0.5, 0.3)])
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_matches_python(seed, iou, center):
+    if nms_module.np is None:
+        pytest.skip("需要 NumPy")
+    boxes, scores = make_boxes(200, seed)
+    for s in (scores, None):
+        assert nms(boxes, s, iou, center) == _nms_python(boxes, s, iou, center)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_center_mode_matches_legacy_template_nms(seed):
+    boxes, scores = make_boxes(150, seed)
+    hits = [{'x': (x1 + x2) / 2, 'y': (y1 + y2) / 2, 'width': x2 - x1, 'height': y2 - y1,
+             'confidence': score} for (x1, y1, x2, y2), score in zip(boxes, scores)]
+    legacy = [id(h) for h in _legacy_template_nms(hits)]
+    keep = nms(boxes, scores, iou_threshold=None, center_ratio=0.3)
+    assert legacy == [id(hits[i]) for i in keep]
+
+
+def test_iou_threshold_edges():
+    boxes = [(0, 0, 100, 100), (0, 0, 100, 50), (200, 200, 300, 300)]
+    # 第二个框与第一个 IoU 恰为 0.5，不大于阈值则保留
+    assert nms(boxes, [0.9, 0.8, 0.7], iou_threshold=0.5) == [0, 1, 2]
+    assert nms(boxes, [0.9, 0.8, 0.7], iou_threshold=0.4) == [0, 2]
+    assert nms(boxes, [0.1, 0.8, 0.7], iou_threshold=0.4) == [1, 2]
+    assert nms(boxes, iou_threshold=None, center_ratio=None) == [0, 1, 2]
+    assert nms([]) == []
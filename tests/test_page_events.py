@@ -0,0 +1,234 @@
+"""
+页面变化事件：用 FakeEventSource 驱动 SmartWait 和 MobileClient._verify_page_change
+
+重点验证"有事件才 dump"：没有事件时不再按 100ms 轮询 dump_hierarchy。
+"""
+import asyncio
+import threading
+import time
+
+from mobile_mcp.core.dynamic_config import DynamicConfig
+from mobile_mcp.core.mobile_client import MobileClient
+from mobile_mcp.core.utils.page_events import FakeEventSource, PageEventMonitor, U2WindowUpdateEventSource
+from mobile_mcp.core.utils.smart_wait import SmartWait
+
+from .conftest import FakeClient, make_xml
+
+
+class EventClient(FakeClient):
+    """带假事件源的客户端（SmartWait 通过 _page_events() 取监视器）"""
+
+    def __init__(self, xml: str = ""):
+        super().__init__(xml)
+        self.source = FakeEventSource()
+        self.page_events = PageEventMonitor(self.source)
+
+    def _page_events(self):
+        return self.page_events if self.page_events.start() else None
+
+
+def later(delay: float, action):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def change_page(client, *texts):
+    def action():
+        client.u2.xml = make_xml(*texts)
+        client.source.emit()
+    return action
+
+
+# ==================== wait_for_page_stable ====================
+
+def test_page_stable_waits_for_quiet_without_dumping():
+    client = EventClient()
+    wait = SmartWait(client)
+    wait.page_stable_threshold = 0.15
+
+    # 前 0.2 秒持续有事件，之后安静
+    for i in range(5):
+        later(0.04 * i, client.source.emit)
+    start = time.time()
+    assert asyncio.run(wait.wait_for_page_stable(timeout=2.0)) is True
+    elapsed = time.time() - start
+    assert 0.3 <= elapsed < 1.0
+    assert client.u2.dumps == 0
+
+
+def test_page_stable_times_out_while_events_keep_coming():
+    client = EventClient()
+    wait = SmartWait(client)
+    wait.page_stable_threshold = 0.2
+    stop = threading.Event()
+
+    def keep_emitting():
+        while not stop.is_set():
+            client.source.emit()
+            time.sleep(0.05)
+
+    threading.Thread(target=keep_emitting, daemon=True).start()
+    try:
+        assert asyncio.run(wait.wait_for_page_stable(timeout=0.5)) is False
+    finally:
+        stop.set()
+    assert client.u2.dumps == 0
+
+
+def test_page_stable_default_threshold_unchanged():
+    import inspect
+    assert inspect.signature(SmartWait.wait_for_page_stable).parameters["element_threshold"].default == 10
+
+
+# ==================== wait_for_element_appear ====================
+
+def test_element_appear_checks_only_after_event():
+    client = EventClient(make_xml("加载中"))
+    wait = SmartWait(client)
+
+    def check():
+        return any(n.text == "完成" for n in client.hierarchy.get().table)
+
+    later(0.2, change_page(client, "完成"))
+    assert asyncio.run(wait.wait_for_element_appear(check, timeout=2.0)) is True
+    # 一次初始检查 + 事件后一次检查（轮询模式下 0.2 秒约 3 次）
+    assert client.u2.dumps == 2
+
+
+def test_element_appear_gives_up_without_events():
+    client = EventClient(make_xml("加载中"))
+    wait = SmartWait(client)
+    checks = []
+
+    def check():
+        checks.append(time.time())
+        return False
+
+    assert asyncio.run(wait.wait_for_element_appear(check, timeout=0.3)) is False
+    assert len(checks) == 1
+
+
+def test_element_appear_falls_back_to_polling_when_source_dies():
+    client = EventClient(make_xml("加载中"))
+    wait = SmartWait(client)
+    checks = []
+
+    def check():
+        checks.append(time.time())
+        return len(checks) >= 3
+
+    later(0.05, client.source.stop)
+    assert asyncio.run(wait.wait_for_element_appear(check, timeout=2.0)) is True
+    assert len(checks) == 3
+
+
+# ==================== MobileClient._verify_page_change ====================
+
+def make_mobile_client(xml: str):
+    fake = EventClient(xml)
+    mobile = MobileClient.__new__(MobileClient)
+    mobile.platform = "android"
+    mobile.u2 = fake.u2
+    mobile.hierarchy = fake.hierarchy
+    mobile.hierarchy.client = mobile
+    mobile.page_events = fake.page_events
+    mobile.last_page_diff = None
+    return mobile, fake
+
+
+def test_verify_page_change_dumps_after_event():
+    DynamicConfig.wait_page_stable = 0.3
+    DynamicConfig.page_stable_threshold = 0.05
+    mobile, fake = make_mobile_client(make_xml("首页", "推荐"))
+    initial_fp = mobile.hierarchy.get(max_age=0).fingerprint
+    dumps_before = fake.u2.dumps
+
+    later(0.2, change_page(fake, "设置", "账号", "隐私", "关于"))
+    assert asyncio.run(mobile._verify_page_change(initial_fp, timeout=2.0, change_threshold=0.05)) is True
+    assert mobile.last_page_diff is not None and mobile.last_page_diff.ratio > 0.05
+    # 进入时 dump 一次（还没变化），事件到达后再 dump 一次
+    assert fake.u2.dumps - dumps_before == 2
+
+
+def test_verify_page_change_no_event_no_polling():
+    mobile, fake = make_mobile_client(make_xml("首页"))
+    initial_fp = mobile.hierarchy.get(max_age=0).fingerprint
+    dumps_before = fake.u2.dumps
+
+    start = time.time()
+    assert asyncio.run(mobile._verify_page_change(initial_fp, timeout=0.4, change_threshold=0.05)) is False
+    assert time.time() - start >= 0.35
+    assert fake.u2.dumps - dumps_before == 1
+
+
+def test_verify_page_change_ignores_event_without_change():
+    DynamicConfig.page_stable_threshold = 0.05
+    mobile, fake = make_mobile_client(make_xml("首页"))
+    initial_fp = mobile.hierarchy.get(max_age=0).fingerprint
+
+    later(0.1, fake.source.emit)  # 有事件但页面没变（如光标闪烁）
+    assert asyncio.run(mobile._verify_page_change(initial_fp, timeout=0.4, change_threshold=0.05)) is False
+
+
+# ==================== U2WindowUpdateEventSource ====================
+
+class RpcU2:
+    """假 uiautomator2 3.x：jsonrpc_call('waitForWindowUpdate') 按脚本返回"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.updates = threading.Semaphore(0)
+        self.calls = 0
+
+    def jsonrpc_call(self, method, params=None, timeout=10):
+        assert method == "waitForWindowUpdate"
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("method not found")
+        wait_ms = params[1]
+        return self.updates.acquire(timeout=min(wait_ms / 1000, 0.2)) if wait_ms else False
+
+
+def test_u2_source_start_does_not_block_and_becomes_ready():
+    u2 = RpcU2()
+    monitor = PageEventMonitor(U2WindowUpdateEventSource(u2))
+    start = time.time()
+    assert monitor.start() is True
+    assert time.time() - start < 0.05
+    assert monitor.source.wait_ready(1.0) is True
+    assert monitor.available
+
+    seq = monitor.seq
+    u2.updates.release()
+    assert monitor.wait_for_event(seq, timeout=1.0) is True
+    monitor.stop()
+
+
+def test_u2_source_unsupported_falls_back():
+    monitor = PageEventMonitor(U2WindowUpdateEventSource(RpcU2(fail=True)))
+    monitor.start()
+    assert monitor.source.wait_ready(1.0) is False
+    assert not monitor.available
+    assert monitor.wait_for_event(monitor.seq, timeout=1.0) is False
+
+
+def test_disconnect_stops_polling_thread():
+    from mobile_mcp.core.device_profile import DeviceProfileService
+
+    DynamicConfig.page_events_enabled = True
+    fake = FakeClient()
+    mobile = MobileClient.__new__(MobileClient)
+    mobile.platform = "android"
+    mobile.u2 = RpcU2()
+    mobile.page_events = None
+    mobile.hierarchy = fake.hierarchy
+    mobile.profile = DeviceProfileService(mobile)
+    mobile.device_manager = None
+
+    monitor = mobile._page_events()
+    assert monitor is not None and monitor.source.wait_ready(1.0)
+    thread = monitor.source._thread
+    mobile.disconnect()
+    thread.join(1.0)
+    assert not thread.is_alive() and mobile.page_events is None
@@ -0,0 +1,63 @@
+"""
+页面指纹：same_as 与增量对比
+"""
+from mobile_mcp.core.page_fingerprint import PageFingerprint
+
+from .conftest import make_xml
+
+
+def fp(xml: str) -> PageFingerprint:
+    return PageFingerprint.from_xml(xml)
+
+
+def shift(xml: str, dy: int) -> str:
+    """整页内容下移 dy 像素（只改控件 bounds，不动根节点）"""
+    for i in range(10):
+        top = 200 + i * 120
+        xml = xml.replace(f'bounds="[0,{top}][1080,{top + 100}]"',
+                          f'bounds="[0,{top + dy}][1080,{top + 100 + dy}]"')
+    return xml
+
+
+def test_same_as_identical_pages():
+    a, b = fp(make_xml("首页", "推荐")), fp(make_xml("首页", "推荐"))
+    assert a.same_as(b) and b.same_as(a)
+    assert not a.diff(b).changed and a.diff(b).ratio == 0
+
+
+def test_same_as_ignores_sub_grid_jitter():
+    base = make_xml("首页", "推荐")
+    assert fp(base).same_as(fp(shift(base, 3)))        # 同一 8px 格内
+    assert not fp(base).same_as(fp(shift(base, 40)))   # 真正移动
+
+
+def test_text_change_breaks_same_as_but_keeps_structure():
+    a, b = fp(make_xml("首页", "推荐")), fp(make_xml("首页", "关注"))
+    assert not a.same_as(b)
+    diff = a.diff(b)
+    assert diff.text_changed and not diff.structure_changed
+    assert len(diff.retexted) == 1 and not diff.added and not diff.removed
+    assert diff.to_dict()["retexted"][0]["text"] == "关注"
+
+
+def test_diff_counts_added_removed_and_moved():
+    before = fp(make_xml("首页", "推荐"))
+    after = fp(make_xml("首页", "推荐", "设置"))
+    diff = before.diff(after)
+    assert len(diff.added) == 1 and diff.structure_changed
+    assert diff.to_dict()["added"][0]["bounds"] == [0, 440, 1080, 540]
+
+    moved = before.diff(fp(shift(make_xml("首页", "推荐"), 40)))
+    assert len(moved.moved) == 2 and not moved.added and not moved.removed
+    assert moved.ratio == 2 / 3
+
+
+def test_rotation_or_size_change_is_a_change():
+    assert not fp(make_xml("首页")).same_as(fp(make_xml("首页", width=720)))
+
+
+def test_duplicate_texts_are_distinguished():
+    a = fp(make_xml("商品", "商品"))
+    b = fp(make_xml("商品"))
+    assert a.node_count == 3 and b.node_count == 2
+    assert len(a.diff(b).removed) == 1
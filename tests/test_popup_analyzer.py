@@ -0,0 +1,191 @@
+"""
+弹窗分析：与改用控件树之前的平铺 bounds 检测（_detect_popup_with_confidence 原实现）对照
+"""
+from mobile_mcp.core.popup_analyzer import PopupAnalyzer, subtree_stats
+from mobile_mcp.utils.xml_parser import XMLParser
+
+W, H = 1080, 2400
+
+
+def node(cls, rid="", bounds=(0, 0, W, H), *children, text="", clickable=False):
+    x1, y1, x2, y2 = bounds
+    return (f'<node text="{text}" resource-id="{rid}" class="android.widget.{cls}" content-desc="" '
+            f'clickable="{str(clickable).lower()}" bounds="[{x1},{y1}][{x2},{y2}]">'
+            + "".join(children) + '</node>')
+
+
+def page(*children):
+    return XMLParser().parse_table('<hierarchy rotation="0">' + node("FrameLayout", "", (0, 0, W, H), *children)
+                                   + '</hierarchy>')
+
+
+def legacy_detect(table, screen_width=W, screen_height=H):
+    """原实现：平铺元素 + bounds 包含关系判断（只保留影响结果的规则）"""
+    screen_area = screen_width * screen_height
+    elements = [n for n in table if n.bounds]
+    if not elements:
+        return None, 0
+
+    def is_close(n):
+        rid = n.resource_id.lower()
+        return 'close' in rid or 'dismiss' in rid or 'cancel' in rid or '×' in n.text or 'X' in n.text
+
+    def contains(outer, inner):
+        return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+    def top_right(n):
+        x1, y1, x2, y2 = n.bounds
+        return ('Image' in n.class_name and (x1 + x2) // 2 / screen_width > 0.85
+                and (y1 + y2) // 2 / screen_height < 0.15 and 15 <= x2 - x1 <= 120 and 15 <= y2 - y1 <= 120)
+
+    class_kw = ['Dialog', 'Popup', 'Alert', 'Modal', 'BottomSheet', 'PopupWindow']
+    id_kw = ['dialog', 'popup', 'alert', 'modal', 'bottom_sheet', 'overlay', 'mask']
+    ad_kw = ['ad_close', 'ad_button', 'full_screen', 'interstitial', 'reward', 'close_icon', 'close_btn']
+
+    candidates = []
+    mask_idx = None
+    for e in elements:
+        x1, y1, x2, y2 = e.bounds
+        width, height = x2 - x1, y2 - y1
+        area_ratio = width * height / screen_area
+        cls, rid = e.class_name, e.resource_id.lower()
+        if area_ratio > 0.85 and width >= screen_width * 0.95 and ('FrameLayout' in cls or 'View' in cls):
+            mask_idx = e.index
+        c_feat, i_feat, a_feat = (any(k in cls for k in class_kw), any(k in rid for k in id_kw),
+                                  any(k in rid for k in ad_kw))
+        strong_popup = c_feat or i_feat or a_feat
+        close_child = any(is_close(o) and o.index != e.index and contains(e.bounds, o.bounds) for o in elements)
+        tr_close = area_ratio > 0.9 and any(
+            top_right(o) and o.index != e.index and (
+                contains(e.bounds, o.bounds) or (abs(x2 - o.bounds[0]) < 50 and abs(y1 - o.bounds[3]) < 50))
+            for o in elements)
+        fullscreen_ad = area_ratio > 0.9 and (close_child or tr_close or a_feat)
+        if area_ratio > 0.9 and not fullscreen_ad:
+            continue
+        if area_ratio < 0.05 or y1 < 50:
+            continue
+        if y2 > screen_height * 0.85 and ('tab' in rid or 'Tab' in cls or 'navigation' in rid):
+            continue
+        if y1 < screen_height * 0.15 and ('search' in rid or 'Search' in cls):
+            continue
+        if area_ratio > 0.6 and not strong_popup:
+            continue
+
+        confidence = 0.5 * c_feat + 0.4 * i_feat + 0.4 * a_feat + 0.3 * close_child
+        if fullscreen_ad and tr_close:
+            confidence += 0.4
+        strong = strong_popup or close_child or (fullscreen_ad and tr_close)
+        centered_x = abs((x1 + x2) // 2 - screen_width / 2) < screen_width * 0.15
+        centered_y = abs((y1 + y2) // 2 - screen_height / 2) < screen_height * 0.25
+        if centered_x and centered_y:
+            confidence += 0.2 if strong else 0.1
+        elif centered_x:
+            confidence += 0.1 if strong else 0.05
+        if 0.15 < area_ratio < 0.75:
+            confidence += 0.15 if strong else 0.08
+        if e.index > len(elements) * 0.5:
+            confidence += 0.1
+        if mask_idx is not None and e.index > mask_idx:
+            confidence += 0.15
+        if confidence >= 0.3:
+            candidates.append((confidence, e.index, strong_popup))
+
+    if not candidates:
+        return None, 0
+    from mobile_mcp.core.nms import nms
+    candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+    keep = nms([table[c[1]].bounds for c in candidates], iou_threshold=0.9)
+    confidence, index, strong = candidates[keep[0]]
+    if confidence >= (0.7 if strong else 0.85):
+        return table[index].bounds, confidence
+    return None, confidence
+
+
+def detect(table):
+    popup = PopupAnalyzer(table).detect(W, H)
+    if popup is None:
+        return None, 0
+    return (popup.bounds if popup.detected else None), popup.confidence
+
+
+# ==================== 样例页面 ====================
+
+HOME = page(
+    node("LinearLayout", "com.app:id/search_bar", (0, 80, W, 200), node("EditText", "", (40, 100, 900, 180))),
+    node("RecyclerView", "com.app:id/feed", (0, 200, W, 2200),
+         *[node("TextView", "", (0, 200 + i * 300, W, 480 + i * 300), text=f"内容{i}", clickable=True)
+           for i in range(6)]),
+    node("LinearLayout", "com.app:id/tab_bar", (0, 2200, W, H),
+         *[node("TextView", "", (i * 270, 2200, (i + 1) * 270, H), text=t, clickable=True)
+           for i, t in enumerate(["首页", "发现", "消息", "我的"])]),
+)
+
+DIALOG = page(
+    node("RecyclerView", "com.app:id/feed", (0, 200, W, 2200),
+         node("TextView", "", (0, 200, W, 500), text="内容", clickable=True)),
+    node("FrameLayout", "com.app:id/dialog_container", (140, 800, 940, 1600),
+         node("TextView", "", (180, 840, 800, 920), text="新版本可用"),
+         node("Button", "", (180, 1400, 900, 1520), text="立即更新", clickable=True),
+         node("ImageView", "com.app:id/iv_close", (860, 820, 920, 880), clickable=True)),
+)
+
+BOTTOM_SHEET = page(
+    node("RecyclerView", "com.app:id/feed", (0, 200, W, 2200)),
+    node("View", "com.app:id/mask", (0, 0, W, H)),
+    node("LinearLayout", "com.app:id/bottom_sheet", (0, 1500, W, 2350),
+         node("TextView", "", (40, 1540, 1040, 1640), text="分享到"),
+         node("TextView", "", (40, 2200, 1040, 2320), text="取消", clickable=True)),
+)
+
+FULLSCREEN_AD = page(
+    node("FrameLayout", "com.app:id/interstitial_root", (0, 60, W, H),
+         node("ImageView", "com.app:id/ad_image", (0, 200, W, 2200), clickable=True),
+         node("ImageView", "com.app:id/iv_skip", (980, 80, 1040, 140))),
+)
+
+
+def test_detects_same_popup_as_flat_bounds_version():
+    for table in (HOME, DIALOG, BOTTOM_SHEET, FULLSCREEN_AD):
+        assert detect(table)[0] == legacy_detect(table)[0]
+    assert detect(HOME)[0] is None
+    assert detect(DIALOG)[0] == (140, 800, 940, 1600)
+    assert detect(BOTTOM_SHEET)[0] == (0, 1500, W, 2350)
+    assert detect(FULLSCREEN_AD)[0] == (0, 60, W, H)
+
+
+def test_mask_bonus_only_for_earlier_branch():
+    # 原实现把全屏根布局也当遮罩层，几乎每个节点都 +0.15；现在只有遮罩层是更早的兄弟分支才加分
+    assert abs(legacy_detect(DIALOG)[1] - detect(DIALOG)[1] - 0.15) < 1e-9
+    assert abs(legacy_detect(BOTTOM_SHEET)[1] - detect(BOTTOM_SHEET)[1]) < 1e-9
+
+
+def test_floating_close_button_in_subtree_counts():
+    # 关闭按钮浮在卡片 bounds 外（右上角），原实现按 bounds 包含关系判断不到
+    table = page(
+        node("LinearLayout", "com.app:id/card", (140, 900, 940, 1500),
+             node("Button", "", (180, 1380, 900, 1480), text="领取", clickable=True),
+             node("ImageView", "com.app:id/btn_close", (900, 840, 960, 900), clickable=True)),
+    )
+    popup = PopupAnalyzer(table).detect(W, H)
+    assert popup.index == 2 and popup.close_buttons == [4]
+    assert popup.confidence > legacy_detect(table)[1]
+
+
+def test_subtree_without_clickable_or_close_is_skipped():
+    # 行为变化：子树内既没有可点击元素也没有关闭按钮的节点不再作为候选（原实现会识别为弹窗）
+    table = page(
+        node("FrameLayout", "", (0, 200, W, 2200)),
+        node("LinearLayout", "com.app:id/dialog_tip", (140, 900, 940, 1500),
+             node("TextView", "", (180, 1000, 900, 1100), text="加载中")),
+    )
+    assert legacy_detect(table)[0] == (140, 900, 940, 1500)
+    assert detect(table)[0] is None
+
+
+def test_subtree_stats_cached_per_table():
+    stats = subtree_stats(DIALOG)
+    assert subtree_stats(DIALOG) is stats
+    assert stats.size[1] == len(DIALOG) - 1
+    # 弹窗容器：3 个子节点，2 个可点击，1 个关闭按钮
+    assert (stats.size[4], stats.clickable[4], stats.close[4]) == (4, 2, 1)
+    assert stats.later_siblings[2] == 1 and stats.later_siblings[4] == 0
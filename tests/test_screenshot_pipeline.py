@@ -0,0 +1,243 @@
+"""
+截图流水线：内存编码、处理池、阶段计时、去重缓存
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from mobile_mcp.core import screenshot_pipeline
+from mobile_mcp.core.dynamic_config import DynamicConfig
+from mobile_mcp.core.page_fingerprint import PageFingerprint
+from mobile_mcp.core.screenshot_pipeline import (
+    PendingImage, ScreenshotCache, StageTimer, capture, changed_regions, encode, frame_digest, get_pool,
+    process, process_inline, resize_to_width, submit_image,
+)
+
+from .conftest import FakeClient, FakeU2, make_xml
+
+
+def make_frame(label: str = "首页", size=(1080, 2400), color=(240, 240, 240)):
+    img = Image.new("RGB", size, color)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([100, 300, 980, 500], fill=(30, 120, 220))
+    draw.text((120, 350), label, fill=(255, 255, 255))
+    return img
+
+
+# ==================== 编码 / 缩放 ====================
+
+def test_process_inline_resizes_and_records_stages():
+    timer = StageTimer()
+    encoded = process_inline(make_frame(), max_width=720, fmt="JPEG", quality=75, timer=timer)
+    assert (encoded.width, encoded.height) == (720, 1600)
+    assert encoded.mime_type == "image/jpeg"
+    assert encoded.data[:2] == b"\xff\xd8"
+    timings = timer.to_dict()
+    assert {"resize", "encode", "total"} <= set(timings)
+
+
+def test_webp_and_png_formats():
+    img = make_frame(size=(200, 100))
+    assert encode(img, "WEBP").mime_type == "image/webp"
+    png = encode(img, "png", png_compress_level=0)
+    assert png.format == "PNG" and png.data[:4] == b"\x89PNG"
+
+
+def test_reduce_resample_hits_target_size():
+    img = make_frame(size=(1440, 2560))
+    assert resize_to_width(img, 720, "reduce").size == (720, 1280)
+    assert resize_to_width(img, 1000, "reduce").size == (1000, 1777)
+    assert resize_to_width(img, 2000, "reduce") is img
+
+
+# ==================== 处理池 ====================
+
+def test_submit_image_runs_in_pool_and_matches_inline():
+    DynamicConfig.screenshot_workers = 2
+    DynamicConfig.screenshot_worker_mode = "thread"
+    crops = [make_frame(str(i), size=(300, 200)) for i in range(4)]
+
+    pending = [submit_image(c, fmt="PNG") for c in crops]
+    assert all(p._future is not None for p in pending)
+    timer = StageTimer()
+    pooled = [p.result(timer) for p in pending]
+    inline = [process_inline(c, fmt="PNG") for c in crops]
+    assert [e.data for e in pooled] == [e.data for e in inline]
+    assert "encode" in timer.to_dict()
+
+
+def test_single_image_encodes_in_pool(monkeypatch):
+    DynamicConfig.screenshot_workers = 2
+    DynamicConfig.screenshot_worker_mode = "thread"
+    threads = []
+    real = screenshot_pipeline.process_image
+
+    def record(*args):
+        threads.append(threading.current_thread().name)
+        return real(*args)
+
+    monkeypatch.setattr(screenshot_pipeline, "process_image", record)
+    timer = StageTimer()
+    encoded = process(make_frame(), max_width=720, timer=timer)
+    assert encoded.width == 720 and threads[0].startswith("screenshot")
+    assert {"resize", "encode"} <= set(timer.to_dict())
+
+
+def test_single_image_falls_back_when_pool_is_closed(monkeypatch):
+    closed = ThreadPoolExecutor(max_workers=1)
+    closed.shutdown()
+    monkeypatch.setattr(screenshot_pipeline, "get_pool", lambda: closed)
+    frame = make_frame(size=(200, 100))
+    assert process(frame, fmt="PNG").data == process_inline(frame, fmt="PNG").data
+
+
+def test_inline_never_uses_pool():
+    DynamicConfig.screenshot_workers = 2
+    job = submit_image(make_frame(size=(100, 100)), fmt="PNG", inline=True)
+    assert job._future is None and job._done is not None
+
+
+def test_zero_workers_processes_immediately():
+    DynamicConfig.screenshot_workers = 0
+    assert get_pool() is None
+    job = submit_image(make_frame(size=(100, 100)), fmt="PNG")
+    assert isinstance(job, PendingImage) and job._future is None
+
+
+# ==================== 去重缓存 ====================
+
+def cache_entry(cache, kind, img, fingerprint=None, params=()):
+    digest = frame_digest(img)
+    cache.store(kind, params, digest, encode(img, "PNG"), {"success": True}, "x.png", fingerprint)
+    return digest
+
+
+def test_cache_hits_only_on_identical_frame():
+    cache = ScreenshotCache()
+    frame = make_frame("首页")
+    cache_entry(cache, "plain", frame)
+    assert cache.lookup("plain", (), frame_digest(frame.copy())) is not None
+    assert cache.lookup("plain", (1,), frame_digest(frame.copy())) is None  # 参数不同
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_cache_rejects_single_pixel_change():
+    cache = ScreenshotCache()
+    frame = make_frame("首页")
+    cache_entry(cache, "plain", frame)
+
+    changed = frame.copy()
+    ImageDraw.Draw(changed).point((500, 1200), fill=(0, 0, 0))
+    assert cache.lookup("plain", (), frame_digest(changed)) is None
+
+
+def test_cache_requires_same_page_fingerprint():
+    cache = ScreenshotCache()
+    frame = make_frame("首页")
+    page = PageFingerprint.from_xml(make_xml("首页", "推荐"))
+    cache_entry(cache, "som", frame, page)
+
+    assert cache.lookup("som", (), frame_digest(frame), PageFingerprint.from_xml(make_xml("首页", "推荐"))) is not None
+    assert cache.lookup("som", (), frame_digest(frame), PageFingerprint.from_xml(make_xml("首页", "设置"))) is None
+    assert cache.lookup("som", (), frame_digest(frame)) is None  # 拿不到当前控件树时不复用
+
+
+def test_cache_disabled():
+    DynamicConfig.screenshot_dedup = False
+    cache = ScreenshotCache()
+    frame = make_frame()
+    cache_entry(cache, "plain", frame)
+    assert cache.lookup("plain", (), frame_digest(frame)) is None
+
+
+class RawDevice:
+    def __init__(self, img):
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        self.raw = buf.getvalue()
+
+    def screenshot(self, format=None):
+        return self.raw
+
+
+class RawClient:
+    def __init__(self, img):
+        self.u2 = RawDevice(img)
+
+
+def test_capture_digest_is_per_frame():
+    frame = make_frame()
+    timer = StageTimer()
+    first = capture(RawClient(frame), timer=timer)
+    second = capture(RawClient(frame))
+    assert "hash" in timer.to_dict()
+    assert frame_digest(first) == frame_digest(second)
+    # 标注用的副本不会继承原始帧的摘要
+    assert getattr(first.copy(), "_frame_digest", None) is None
+
+
+# ==================== 增量截图 ====================
+
+def test_changed_regions_none_when_identical():
+    frame = make_frame()
+    assert changed_regions(frame, frame.copy()) == []
+
+
+def test_changed_regions_separate_and_tile_aligned():
+    before = make_frame()
+    after = before.copy()
+    draw = ImageDraw.Draw(after)
+    draw.rectangle([10, 10, 100, 100], fill=(0, 0, 0))
+    draw.rectangle([700, 2000, 900, 2300], fill=(0, 0, 0))
+    regions = changed_regions(before, after, tile=64)
+    assert regions == [(640, 1984, 960, 2304), (0, 0, 128, 128)]
+
+
+def test_changed_regions_merge_when_too_many():
+    before = make_frame()
+    after = before.copy()
+    draw = ImageDraw.Draw(after)
+    for i in range(5):
+        draw.rectangle([10, 10 + i * 400, 40, 40 + i * 400], fill=(0, 0, 0))
+    assert changed_regions(before, after, tile=64, max_regions=4) == [(0, 0, 64, 1664)]
+
+
+def test_changed_regions_ignore_noise_below_threshold():
+    before = make_frame()
+    after = before.copy()
+    ImageDraw.Draw(after).rectangle([0, 0, 50, 50], fill=(250, 250, 250))  # 与底色相差 10
+    assert changed_regions(before, after, threshold=24) == []
+
+
+class ScreenU2(FakeU2):
+    """按顺序返回预置的截图"""
+
+    def __init__(self, *frames):
+        super().__init__()
+        self.frames = list(frames)
+
+    def screenshot(self, format=None):
+        img = self.frames.pop(0) if len(self.frames) > 1 else self.frames[0]
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        return buf.getvalue()
+
+
+def test_diff_without_previous_frame_keeps_crop():
+    from mobile_mcp.core.basic_tools_lite import BasicMobileToolsLite
+
+    client = FakeClient()
+    client.u2 = ScreenU2(make_frame(), make_frame(), make_frame(size=(720, 1600)))
+    tools = BasicMobileToolsLite(client)
+
+    first = tools.take_screenshot(crop_x=540, crop_y=400, crop_size=200, save=False, diff=True)
+    assert first["success"] and first["diff"] == "no_previous_frame"
+    assert (first["image_width"], first["crop_offset_x"], first["crop_offset_y"]) == (200, 440, 300)
+
+    second = tools.take_screenshot(save=False, diff=True)
+    assert second["changed"] is False and "diff" not in second
+
+    resized = tools.take_screenshot(save=False, diff=True)
+    assert resized["diff"] == "size_changed" and resized["image_width"] == 720
@@ -0,0 +1,89 @@
+"""
+空间索引：包含 / 被包含 / 重叠 / 点命中查询与暴力比较结果一致
+"""
+import random
+
+from mobile_mcp.core.spatial_index import SpatialIndex, build_index
+
+
+def random_box(rng, width=1080, height=2400):
+    x1, y1 = rng.randint(-50, width), rng.randint(-50, height)
+    return x1, y1, x1 + rng.choice([0, 1, 40, 200, width]), y1 + rng.choice([0, 1, 40, 300, height])
+
+
+def make_boxes(seed, count=300):
+    rng = random.Random(seed)
+    boxes = [random_box(rng) for _ in range(count)]
+    # 重复框、没有 bounds 的节点
+    boxes[10] = boxes[11]
+    boxes[20] = None
+    return rng, boxes
+
+
+def brute(boxes, predicate):
+    return [i for i, b in enumerate(boxes) if b and predicate(b)]
+
+
+def test_queries_match_brute_force():
+    for seed in range(5):
+        rng, boxes = make_boxes(seed)
+        index = build_index(boxes)
+        assert len(index) == len(boxes) - 1 and 20 not in index
+        queries = [random_box(rng) for _ in range(100)] + [b for b in boxes[:30] if b]
+        for qx1, qy1, qx2, qy2 in queries:
+            assert index.contained_in((qx1, qy1, qx2, qy2)) == brute(
+                boxes, lambda b: qx1 <= b[0] and qy1 <= b[1] and b[2] <= qx2 and b[3] <= qy2)
+            assert index.containing((qx1, qy1, qx2, qy2)) == brute(
+                boxes, lambda b: b[0] <= qx1 and b[1] <= qy1 and qx2 <= b[2] and qy2 <= b[3])
+            assert index.overlapping((qx1, qy1, qx2, qy2)) == brute(
+                boxes, lambda b: b[0] < qx2 and qx1 < b[2] and b[1] < qy2 and qy1 < b[3])
+        for _ in range(200):
+            x, y = rng.randint(-100, 1200), rng.randint(-100, 2600)
+            assert index.at_point(x, y) == brute(
+                boxes, lambda b: b[0] <= x < b[2] and b[1] <= y < b[3])
+
+
+def test_any_contained_in_and_exclude():
+    index = SpatialIndex([(1, (0, 0, 500, 500)), (2, (400, 20, 480, 100))])
+    assert index.any_contained_in((0, 0, 500, 500))
+    assert index.any_contained_in((0, 0, 500, 500), exclude=1)
+    assert index.any_contained_in((0, 0, 500, 500), exclude=2)
+    assert not index.any_contained_in((0, 0, 300, 300))
+    assert not SpatialIndex([(1, (0, 0, 500, 500))]).any_contained_in((0, 0, 500, 500), exclude=1)
+
+
+def test_subset_keeps_cell_size_and_bounds():
+    _, boxes = make_boxes(0)
+    index = build_index(boxes)
+    small = index.subset([1, 2, 20, 999])
+    assert len(small) == 2 and small.cell_size == index.cell_size
+    assert small.bounds(1) == boxes[1] and small.bounds(3) is None
+    x, y = boxes[1][:2]
+    assert small.at_point(x, y) == [i for i in (1, 2) if boxes[i][0] <= x < boxes[i][2] and boxes[i][1] <= y < boxes[i][3]]
+
+
+def test_empty_index():
+    index = build_index([])
+    assert len(index) == 0 and index.at_point(0, 0) == [] and index.overlapping((0, 0, 10, 10)) == []
+
+
+def test_table_index_built_once_per_table():
+    import gc
+    import weakref
+
+    from mobile_mcp.core.spatial_index import table_index
+    from mobile_mcp.utils.xml_parser import XMLParser
+
+    from .conftest import make_xml
+
+    table = XMLParser().parse_table(make_xml("首页", "推荐"))
+    index = table_index(table)
+    assert table_index(table) is index
+    assert index.at_point(540, 250) == [1, 2]  # 根布局 + 第一项
+    assert not hasattr(table, "spatial")
+
+    # 缓存不延长节点表的生命周期
+    ref = weakref.ref(table)
+    del table
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,161 @@
+"""
+模板预处理库：bank.json / bank.bin 持久化、增量更新、删除与压缩
+"""
+import json
+import os
+
+import cv2
+import numpy as np
+
+from mobile_mcp.core.template_bank import TemplateBank
+
+SCALES = [1.0, 2.0]
+
+
+def image(seed: int, size: int = 40) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (size, size)).astype(np.uint8)
+
+
+def write(template_dir, name: str, array: np.ndarray):
+    cv2.imwrite(str(template_dir / f"{name}.png"), array)
+
+
+def arrays(entry):
+    return [entry.gray] + [v.gray for v in entry.variants]
+
+
+def same_entry(a, b) -> bool:
+    return (a.digest == b.digest and [v.scale for v in a.variants] == [v.scale for v in b.variants]
+            and all(np.array_equal(x, y) for x, y in zip(arrays(a), arrays(b))))
+
+
+def index(template_dir) -> dict:
+    return json.loads((template_dir / ".cache" / "bank.json").read_text(encoding="utf-8"))
+
+
+def test_cold_load_from_cache_files(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    write(tmp_path, "x_b", image(2))
+    first = TemplateBank(tmp_path, SCALES)
+    built = first.entries()
+    assert first.stats["built"] == 2
+    assert (tmp_path / ".cache" / "bank.bin").exists()
+    assert sorted(index(tmp_path)["entries"]) == ["x_a", "x_b"]
+
+    # 新进程：从内存映射读取，不重新解码/缩放
+    cold = TemplateBank(tmp_path, SCALES)
+    loaded = cold.entries()
+    assert cold.stats == {"from_cache": 2, "built": 0, "removed": 0}
+    assert [e.name for e in loaded] == ["x_a", "x_b"]
+    assert all(same_entry(a, b) for a, b in zip(built, loaded))
+    assert isinstance(loaded[0].gray, np.memmap)
+    assert loaded[0].variants[1].gray.shape == (80, 80)
+
+
+def test_changed_settings_invalidate_cache(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    TemplateBank(tmp_path, SCALES).entries()
+    other = TemplateBank(tmp_path, [1.0])
+    other.entries()
+    assert other.stats["built"] == 1 and len(other.get("x_a").variants) == 1
+
+
+def test_update_after_file_rewritten(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    write(tmp_path, "x_b", image(2))
+    bank = TemplateBank(tmp_path, SCALES)
+    bank.entries()
+    untouched = bank.get("x_b")
+
+    write(tmp_path, "x_a", image(3))
+    entry = bank.update("x_a")
+    assert np.array_equal(entry.gray, image(3))
+    assert bank.stats["built"] == 3
+    assert bank.get("x_b") is untouched
+
+    cold = TemplateBank(tmp_path, SCALES)
+    assert np.array_equal(cold.get("x_a").gray, image(3))
+    assert cold.stats["built"] == 0
+
+
+def test_rewrite_detected_by_stat_without_update(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    bank = TemplateBank(tmp_path, SCALES)
+    bank.entries()
+    write(tmp_path, "x_a", image(4))
+    stat = (tmp_path / "x_a.png").stat()
+    os.utime(tmp_path / "x_a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert np.array_equal(bank.get("x_a").gray, image(4))
+
+
+def test_touch_without_content_change_reuses_cache(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    TemplateBank(tmp_path, SCALES).entries()
+    stat = (tmp_path / "x_a.png").stat()
+    os.utime(tmp_path / "x_a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    cold = TemplateBank(tmp_path, SCALES)
+    cold.entries()
+    assert cold.stats["from_cache"] == 1 and cold.stats["built"] == 0
+    assert index(tmp_path)["entries"]["x_a"]["mtime_ns"] == stat.st_mtime_ns + 10 ** 9
+
+
+def test_remove(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    write(tmp_path, "x_b", image(2))
+    bank = TemplateBank(tmp_path, SCALES)
+    bank.entries()
+
+    (tmp_path / "x_a.png").unlink()
+    bank.remove("x_a")
+    assert [e.name for e in bank.entries()] == ["x_b"]
+    assert list(index(tmp_path)["entries"]) == ["x_b"]
+    assert [e.name for e in TemplateBank(tmp_path, SCALES).entries()] == ["x_b"]
+
+
+def test_compaction_rewrites_offsets(tmp_path):
+    # 600x600 模板 + 2 倍尺度：每次写入约 1.8MB，覆盖两次后空洞超过有效数据量，触发压缩
+    write(tmp_path, "x_keep", image(1, 100))
+    write(tmp_path, "x_big", image(2, 600))
+    bank = TemplateBank(tmp_path, SCALES)
+    bank.entries()
+    keep_offsets = [item["offset"] for item in index(tmp_path)["entries"]["x_keep"]["arrays"]]
+
+    for seed in (3, 4):
+        write(tmp_path, "x_big", image(seed, 600))
+        bank.update("x_big")
+
+    records = index(tmp_path)["entries"]
+    live = sum(a["shape"][0] * a["shape"][1] for r in records.values() for a in r["arrays"])
+    assert (tmp_path / ".cache" / "bank.bin").stat().st_size == live
+    items = sorted((a["offset"], a["shape"][0] * a["shape"][1]) for r in records.values() for a in r["arrays"])
+    assert items[0][0] == 0 and all(o + n == nxt for (o, n), (nxt, _) in zip(items, items[1:]))
+    assert [a["offset"] for a in records["x_keep"]["arrays"]] != keep_offsets
+
+    cold = TemplateBank(tmp_path, SCALES)
+    assert np.array_equal(cold.get("x_keep").gray, image(1, 100))
+    assert np.array_equal(cold.get("x_big").gray, image(4, 600))
+    assert np.array_equal(cold.get("x_big").variants[1].gray, bank.get("x_big").variants[1].gray)
+    assert cold.stats["built"] == 0
+
+
+def test_persist_false_keeps_cache_in_memory(tmp_path):
+    write(tmp_path, "x_a", image(1))
+    bank = TemplateBank(tmp_path, SCALES, persist=False)
+    assert np.array_equal(bank.get("x_a").gray, image(1))
+    bank.update("x_a")
+    bank.remove("x_a")
+    assert not (tmp_path / ".cache").exists()
+
+
+def test_unwritable_cache_falls_back_to_memory(tmp_path, capsys):
+    # 缓存目录无法创建（只读安装目录）：自动改为仅内存缓存，匹配照常可用
+    write(tmp_path, "x_a", image(1))
+    write(tmp_path, "x_b", image(2))
+    (tmp_path / ".cache").write_text("not a directory")
+    bank = TemplateBank(tmp_path, SCALES)
+    entries = bank.entries()
+    assert [e.name for e in entries] == ["x_a", "x_b"]
+    assert np.array_equal(entries[1].gray, image(2))
+    assert bank.persist is False
+    assert "仅在内存中缓存" in capsys.readouterr().err
@@ -0,0 +1,175 @@
+"""
+模板库索引：新样式判断、近似重复合并、命中统计与淘汰（会删除模板目录里的文件）
+"""
+import cv2
+import numpy as np
+import pytest
+
+from mobile_mcp.core.dynamic_config import DynamicConfig
+from mobile_mcp.core.template_bank import TemplateBank
+from mobile_mcp.core.template_index import TemplateIndex
+from mobile_mcp.core.template_matcher import TemplateMatcher
+
+
+def icon(seed: int, size: int = 64) -> np.ndarray:
+    """互不相似的按钮图（模糊后的随机图案）"""
+    noise = np.random.default_rng(seed).integers(0, 256, (size, size)).astype(np.uint8)
+    return cv2.normalize(cv2.GaussianBlur(noise, (0, 0), 3), None, 0, 255, cv2.NORM_MINMAX)
+
+
+def near_copy(image: np.ndarray, seed: int = 99) -> np.ndarray:
+    noisy = image.astype(np.int16) + np.random.default_rng(seed).normal(0, 4, image.shape)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def write(template_dir, name: str, image: np.ndarray):
+    cv2.imwrite(str(template_dir / f"{name}.png"), image)
+
+
+def files(template_dir):
+    return sorted(p.stem for p in template_dir.glob("*.png"))
+
+
+@pytest.fixture
+def library(tmp_path):
+    """两个内置模板 + 若干自动学习模板"""
+    write(tmp_path, "x_circle", icon(1))
+    write(tmp_path, "x_square", icon(2))
+    for i in range(3, 8):
+        write(tmp_path, f"auto_x_{i}", icon(i))
+    return tmp_path
+
+
+def make_index(template_dir) -> TemplateIndex:
+    return TemplateIndex(TemplateBank(template_dir, [1.0]))
+
+
+def set_usage(index: TemplateIndex, name: str, hits: int = 0, last_hit: float = 0.0, added: float = 0.0):
+    index.refresh()
+    index._records[name].update({"hits": hits, "last_hit": last_hit, "added": added})
+
+
+# ==================== 新样式判断 ====================
+
+def test_empty_library_everything_is_novel(tmp_path):
+    assert make_index(tmp_path).is_novel(icon(1)) == (True, None, 0.0)
+
+
+def test_is_novel(library):
+    index = make_index(library)
+    novel, nearest, similarity = index.is_novel(icon(4))
+    assert (novel, nearest) == (False, "auto_x_4") and similarity > 0.99
+
+    # 亮度不同、带噪声、四周多留了白边的同一按钮都算已存在
+    assert index.is_novel(cv2.add(icon(1), 30))[:2] == (False, "x_circle")
+    assert index.is_novel(near_copy(icon(2)))[:2] == (False, "x_square")
+    padded = cv2.copyMakeBorder(icon(5), 5, 5, 5, 5, cv2.BORDER_CONSTANT, value=128)
+    assert index.is_novel(padded)[:2] == (False, "auto_x_5")
+
+    novel, nearest, similarity = index.is_novel(icon(50))
+    assert novel and nearest is not None and similarity < 0.85
+
+
+# ==================== 合并 ====================
+
+def test_plan_merges_keeps_most_hit_and_only_merges_auto(library):
+    write(library, "auto_x_dup", near_copy(icon(3)))
+    write(library, "x_circle_copy", near_copy(icon(1)))   # 内置模板之间的重复不合并
+    index = make_index(library)
+    set_usage(index, "auto_x_3", hits=1, last_hit=10.0)
+    set_usage(index, "auto_x_dup", hits=5, last_hit=20.0)
+
+    assert index.plan_merges() == [("auto_x_dup", ["auto_x_3"])]
+
+
+def test_transfer_hits(library):
+    index = make_index(library)
+    set_usage(index, "auto_x_3", hits=2, last_hit=30.0)
+    set_usage(index, "auto_x_4", hits=3, last_hit=10.0)
+    index.transfer_hits("auto_x_3", "auto_x_4")
+    hits = {item["name"]: item for item in index.stats()}
+    assert hits["auto_x_4"]["hits"] == 5 and hits["auto_x_4"]["last_hit"] == 30.0
+    index.transfer_hits("missing", "auto_x_4")
+    assert index.stats()[0] == hits["auto_x_4"]
+
+
+def test_compact_library_merges_duplicates(library):
+    write(library, "auto_x_dup", near_copy(icon(6)))
+    matcher = TemplateMatcher(template_dir=str(library))
+    set_usage(matcher.index, "auto_x_6", hits=4, last_hit=10.0)
+    set_usage(matcher.index, "auto_x_dup", hits=1, last_hit=50.0)
+
+    result = matcher.compact_library(max_templates=100)
+    assert result["merged"] == [["auto_x_6", ["auto_x_dup"]]] and result["pruned"] == []
+    assert "auto_x_dup" not in files(library)
+    record = next(item for item in matcher.index.stats() if item["name"] == "auto_x_6")
+    assert record["hits"] == 5 and record["last_hit"] == 50.0
+
+
+# ==================== 命中统计 / 淘汰 ====================
+
+def test_record_hit_persists(library):
+    index = make_index(library)
+    index.record_hit("x_circle")
+    index.record_hit("x_circle")
+    index.record_hit("not_a_template")
+    assert make_index(library).stats()[0]["name"] == "x_circle"
+    assert make_index(library).stats()[0]["hits"] == 2
+
+
+def test_prune_never_hit_first_then_least_recent(library):
+    index = make_index(library)
+    set_usage(index, "auto_x_3", hits=0, added=2.0)
+    set_usage(index, "auto_x_4", hits=0, added=1.0)
+    set_usage(index, "auto_x_5", hits=9, last_hit=100.0, added=0.5)
+    set_usage(index, "auto_x_6", hits=1, last_hit=300.0, added=0.5)
+    set_usage(index, "auto_x_7", hits=4, last_hit=200.0, added=0.5)
+
+    assert index.plan_prune(7) == []
+    assert index.plan_prune(4) == ["auto_x_4", "auto_x_3", "auto_x_5"]
+    # 上限比内置模板还少时也只淘汰自动学习的模板
+    assert index.plan_prune(0) == ["auto_x_4", "auto_x_3", "auto_x_5", "auto_x_7", "auto_x_6"]
+
+
+def test_compact_library_deletes_auto_files_never_bundled(library):
+    matcher = TemplateMatcher(template_dir=str(library))
+    for name, hits in [("auto_x_3", 0), ("auto_x_4", 6), ("auto_x_5", 0), ("auto_x_6", 2), ("auto_x_7", 1)]:
+        set_usage(matcher.index, name, hits=hits, last_hit=float(hits), added=1.0)
+
+    result = matcher.compact_library(max_templates=4, merge=False)
+    assert sorted(result["pruned"]) == ["auto_x_3", "auto_x_5", "auto_x_7"]
+    assert files(library) == ["auto_x_4", "auto_x_6", "x_circle", "x_square"]
+    assert result["count"] == 4
+
+    result = matcher.compact_library(max_templates=1, merge=False)
+    assert files(library) == ["x_circle", "x_square"]
+    assert [e.name for e in matcher.bank.entries()] == ["x_circle", "x_square"]
+
+
+def test_learn_template_saves_novel_and_prunes(library):
+    DynamicConfig.template_library_max = 7
+    matcher = TemplateMatcher(template_dir=str(library))
+
+    known = matcher.learn_template(near_copy(icon(1)))
+    assert known["learned"] is False and known["nearest"] == "x_circle"
+    assert len(files(library)) == 7
+
+    learned = matcher.learn_template(icon(60))
+    assert learned["learned"] and learned["template_name"].startswith("auto_x_")
+    assert learned["template_name"] in files(library)
+    # 新模板之外最早加入、从未命中的自动学习模板被淘汰
+    assert len(learned["pruned"]) == 1 and learned["pruned"][0] != learned["template_name"]
+    assert len(files(library)) == 7 and {"x_circle", "x_square"} <= set(files(library))
+    assert matcher.learn_template(icon(60))["learned"] is False
+
+
+def test_learned_template_not_pruned_right_away(library):
+    # 其他自动学习模板都命中过时，刚学到的模板（0 次命中）也不能被立刻淘汰
+    DynamicConfig.template_library_max = 7
+    matcher = TemplateMatcher(template_dir=str(library))
+    for i in range(3, 8):
+        set_usage(matcher.index, f"auto_x_{i}", hits=1, last_hit=float(i))
+
+    learned = matcher.learn_template(icon(70))
+    assert learned["pruned"] == ["auto_x_3"]
+    assert learned["template_name"] in files(library)
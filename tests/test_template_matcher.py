@@ -0,0 +1,185 @@
+"""
+模板匹配：金字塔粗到精匹配与全分辨率匹配对照
+"""
+import cv2
+import numpy as np
+import pytest
+
+from mobile_mcp.core.template_bank import build_variants
+from mobile_mcp.core.template_matcher import ScreenPyramid, TemplateMatcher, shrink
+
+W, H = 1080, 2400
+# 各尺度的模板放在截图的不同位置（左上角）
+PLANTED = {0.6: (900, 100), 1.0: (100, 600), 1.5: (500, 1300), 2.0: (200, 2000)}
+
+
+def x_template(size: int = 64) -> np.ndarray:
+    """圆圈里的 X 号"""
+    template = np.full((size, size), 230, np.uint8)
+    c = size // 2
+    cv2.circle(template, (c, c), c - 4, 40, 3)
+    cv2.line(template, (size // 4, size // 4), (size - size // 4, size - size // 4), 40, 4)
+    cv2.line(template, (size - size // 4, size // 4), (size // 4, size - size // 4), 40, 4)
+    return template
+
+
+def background(seed: int = 0) -> np.ndarray:
+    """有纹理的截图背景（模糊后的随机噪声）"""
+    noise = np.random.default_rng(seed).integers(0, 256, (H, W)).astype(np.uint8)
+    return cv2.normalize(cv2.GaussianBlur(noise, (0, 0), 6), None, 60, 200, cv2.NORM_MINMAX)
+
+
+def plant(screen: np.ndarray, template: np.ndarray, scale: float, x: int, y: int):
+    resized = cv2.resize(template, (int(template.shape[1] * scale), int(template.shape[0] * scale)))
+    screen[y:y + resized.shape[0], x:x + resized.shape[1]] = resized
+
+
+@pytest.fixture(scope="module")
+def screen():
+    shot = background()
+    for scale, (x, y) in PLANTED.items():
+        plant(shot, x_template(), scale, x, y)
+    return shot
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    return TemplateMatcher(template_dir=str(tmp_path), workers=0)
+
+
+def coarse_to_fine(matcher, pyramid, variant, threshold):
+    size = (int(round(variant.width * pyramid.factor)), int(round(variant.height * pyramid.factor)))
+    coarse = shrink(variant.gray, size)
+    return matcher._match_coarse_to_fine(pyramid, coarse, variant.gray, threshold)
+
+
+def same_peaks(a, b):
+    a, b = sorted(a), sorted(b)
+    return (len(a) == len(b)
+            and all(abs(p[0] - q[0]) <= 1 and abs(p[1] - q[1]) <= 1 and abs(p[2] - q[2]) < 1e-3
+                    for p, q in zip(a, b)))
+
+
+def test_coarse_to_fine_matches_full_resolution(matcher, screen):
+    pyramid = ScreenPyramid(screen, matcher.coarse_width)
+    assert pyramid.factor < 1
+    found = {}
+    for variant in build_variants(x_template(), matcher.scales):
+        full = matcher._match_full(pyramid.gray, variant.gray, matcher.match_threshold)
+        fine = coarse_to_fine(matcher, pyramid, variant, matcher.match_threshold)
+        assert same_peaks(fine, full), variant.scale
+        for x, y, _ in fine:
+            found[variant.scale] = (x, y)
+    assert found == PLANTED
+
+
+def test_match_variants_same_with_and_without_pyramid(matcher, screen):
+    variants = build_variants(x_template(), matcher.scales)
+    pyramid = ScreenPyramid(screen, matcher.coarse_width)
+    fast = matcher.match_variants(variants, matcher.match_threshold, pyramid)
+    matcher.use_pyramid = False
+    slow = matcher.match_variants(variants, matcher.match_threshold, pyramid)
+    key = lambda m: (m['top_left'], m['scale'])
+    assert sorted(map(key, fast)) == sorted(map(key, slow))
+    assert sorted(m['top_left'] for m in fast) == sorted(PLANTED.values())
+
+
+def test_thin_strokes_survive_coarse_margin(matcher):
+    # 1px 线条的模板：缩小后的采样相位随位置变化，粗匹配分数不能掉到放宽阈值以下
+    thin = np.full((40, 40), 230, np.uint8)
+    cv2.line(thin, (8, 8), (31, 31), 40, 1)
+    cv2.line(thin, (31, 8), (8, 31), 40, 1)
+    variant = build_variants(thin, [1.0])[0]
+    for offset in range(5):
+        shot = background(1)
+        plant(shot, thin, 1.0, 301 + offset, 901 + offset)
+        pyramid = ScreenPyramid(shot, matcher.coarse_width)
+        full = matcher._match_full(pyramid.gray, variant.gray, matcher.match_threshold)
+        assert len(full) == 1
+        assert same_peaks(coarse_to_fine(matcher, pyramid, variant, matcher.match_threshold), full), offset
+
+
+def test_more_candidates_than_limit_falls_back_to_full(matcher):
+    # 同一尺度出现的真实匹配多于 max_candidates 时不能因截断而漏掉
+    shot = background(3)
+    positions = [(40 + col * 120, 200 + row * 120) for row in range(6) for col in range(8)]
+    for x, y in positions:
+        plant(shot, x_template(), 1.0, x, y)
+    pyramid = ScreenPyramid(shot, matcher.coarse_width)
+    variant = build_variants(x_template(), [1.0])[0]
+
+    assert len(positions) > matcher.max_candidates
+    fine = coarse_to_fine(matcher, pyramid, variant, matcher.match_threshold)
+    assert sorted((x, y) for x, y, _ in fine) == sorted(positions)
+
+
+def test_explicit_zero_threshold_is_not_replaced(matcher, tmp_path, monkeypatch):
+    cv2.imwrite(str(tmp_path / "x.png"), x_template())
+    shot = tmp_path / "shot.png"
+    cv2.imwrite(str(shot), background()[:300, :300])
+    seen = []
+    original = matcher.match_entries
+
+    def record(entries, threshold, pyramid):
+        seen.append(threshold)
+        return original(entries, threshold, pyramid)
+
+    monkeypatch.setattr(matcher, "match_entries", record)
+    monkeypatch.setattr(matcher, "_non_max_suppression", lambda results, *a, **k: results[:1])
+    matcher.find_close_buttons(str(shot), threshold=0.0)
+    matcher.find_close_buttons(str(shot))
+    assert seen == [0.0, matcher.match_threshold]
+
+
+def library(tmp_path):
+    """模板目录：X 号模板及其变形（细线、方框里的 X）"""
+    cv2.imwrite(str(tmp_path / "x_circle.png"), x_template())
+    cv2.imwrite(str(tmp_path / "x_small.png"), x_template(40))
+    boxed = x_template()
+    cv2.rectangle(boxed, (2, 2), (61, 61), 40, 2)
+    cv2.imwrite(str(tmp_path / "x_boxed.png"), boxed)
+
+
+def test_parallel_and_serial_results_identical(tmp_path, screen):
+    library(tmp_path)
+    serial = TemplateMatcher(template_dir=str(tmp_path), workers=0)
+    parallel = TemplateMatcher(template_dir=str(tmp_path), workers=4)
+    entries = serial.bank.entries()
+    pyramid = ScreenPyramid(screen, serial.coarse_width)
+
+    expected = serial.match_entries(entries, serial.match_threshold, pyramid)
+    assert expected
+    for _ in range(2):
+        assert parallel.match_entries(entries, serial.match_threshold, pyramid) == expected
+
+
+def test_worker_count_change_does_not_break_running_calls(tmp_path, screen):
+    # 不同 worker 数的调用并发进行：旧线程池不能被关闭（cannot schedule new futures after shutdown）
+    import threading
+    from mobile_mcp.core.template_matcher import get_executor
+
+    library(tmp_path)
+    entries = TemplateMatcher(template_dir=str(tmp_path)).bank.entries()
+    pyramid = ScreenPyramid(screen[:700], 480)
+    errors = []
+
+    def run(workers):
+        matcher = TemplateMatcher(template_dir=str(tmp_path), workers=workers)
+        try:
+            for _ in range(3):
+                matcher.match_entries(entries, matcher.match_threshold, pyramid)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in (2, 3, 4, 2, 3, 4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert get_executor(3) is get_executor(3) and get_executor(1) is None
+
+    # 确定性复现：拿到线程池后 worker 数变化，原线程池仍可提交
+    executor = get_executor(2)
+    get_executor(5)
+    assert executor.submit(int, "7").result() == 7
@@ -0,0 +1,93 @@
+"""
+节点表：先序顺序、父子关系、bounds 预解析，以及与旧版元素列表的兼容
+"""
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from mobile_mcp.utils.xml_parser import XMLParser, parse_bounds
+
+XML = (
+    '<hierarchy rotation="0">'
+    '<node index="0" text="" resource-id="" class="android.widget.FrameLayout" bounds="[0,0][1080,2400]">'
+    '<node index="0" text="标题" resource-id="com.app:id/title" class="android.widget.TextView" '
+    'bounds="[0,0][1080,120]" />'
+    '<node index="1" text="" resource-id="com.app:id/list" class="android.widget.LinearLayout" '
+    'scrollable="true" bounds="[0,120][1080,2400]">'
+    '<node index="0" text="第一项" resource-id="" class="android.widget.TextView" clickable="true" '
+    'bounds="[0,120][1080,220]" />'
+    '<node index="1" text="" resource-id="" class="android.widget.EditText" focusable="true" '
+    'bounds="bad" />'
+    '</node>'
+    '</node>'
+    '</hierarchy>'
+)
+
+
+def test_table_follows_preorder():
+    table = XMLParser().parse_table(XML)
+    root = ET.fromstring(XML)
+    assert [n.class_name for n in table] == [e.get('class', '') for e in root.iter()]
+    assert [(n.parent, n.depth) for n in table] == [(-1, 0), (0, 1), (1, 2), (1, 2), (3, 3), (3, 3)]
+    assert table.children(3) == [4, 5]
+    assert table.children(2) == []
+
+
+def test_bounds_and_flags_are_precomputed():
+    table = XMLParser().parse_table(XML)
+    title, item, edit = table[2], table[4], table[5]
+    assert title.bounds == (0, 0, 1080, 120) and title.center == (540, 60)
+    assert (item.width, item.height) == (1080, 100) and item.clickable
+    assert edit.bounds is None and edit.center is None and edit.editable and edit.focusable
+    assert table[3].scrollable and table[3].enabled
+
+
+def test_class_names_are_shared():
+    table = XMLParser().parse_table(XML)
+    assert table.classes.count("android.widget.TextView") == 1
+    assert table[2].class_id == table[4].class_id
+    assert table[2].class_name is table[4].class_name
+
+
+def test_to_elements_matches_legacy_format():
+    elements = XMLParser().parse(XML)
+    assert [e['text'] or e['resource_id'] for e in elements] == [
+        "标题", "com.app:id/list", "第一项", ""]
+    title = elements[0]
+    assert (title['x'], title['y'], title['width'], title['height']) == (0, 0, 1080, 120)
+    assert title['class_name'] == "TextView" and title['depth'] == 2
+    assert (elements[3]['x'], elements[3]['width']) == (0, 0)
+
+
+def test_parse_bounds_and_errors():
+    assert parse_bounds("[1,2][3,4]") == (1, 2, 3, 4)
+    assert parse_bounds("") is None and parse_bounds("[1,2]") is None
+    assert len(XMLParser().parse_table("  ")) == 0
+    with pytest.raises(ValueError):
+        XMLParser().parse_table("<hierarchy><node></hierarchy>")
+
+
+# ==================== 流式解析 ====================
+
+def test_iter_nodes_matches_table_for_any_chunk_size():
+    table = XMLParser().parse_table(XML)
+    expected = [(n.index, n.parent, n.depth, n.text, n.bounds) for n in table]
+    for chunk in (7, 64, 1 << 16):
+        streamed = [(n.index, n.parent, n.depth, n.text, n.bounds)
+                    for n in XMLParser().iter_nodes(XML, chunk_size=chunk)]
+        assert streamed == expected
+
+
+def test_iter_nodes_stops_early():
+    seen = []
+    for node in XMLParser().iter_nodes(XML + "<<<not xml", chunk_size=16):
+        seen.append(node.text)
+        if node.text == "标题":
+            break
+    assert seen[-1] == "标题" and len(seen) == 3
+
+
+def test_iter_nodes_reports_parse_errors():
+    assert list(XMLParser().iter_nodes("")) == []
+    with pytest.raises(ValueError):
+        list(XMLParser().iter_nodes("<hierarchy><node></hierarchy>"))
@@ -2,11 +2,14 @@
 移动端工具模块
 """
 
-from .xml_parser import XMLParser
+from .xml_parser import XMLParser, NodeTable, UINode, parse_bounds
 from .xml_formatter import XMLFormatter
 
 __all__ = [
     'XMLParser',
+    'NodeTable',
+    'UINode',
+    'parse_bounds',
     'XMLFormatter',
 ]
 
@@ -6,112 +6,333 @@ XML解析器 - 解析UIAutomator2的XML结构
 功能：
 1. 解析XML格式的页面结构
 2. 提取元素属性（text, resource-id, class, bounds等）
-3. 构建元素树结构
+3. 构建紧凑节点表（NodeTable），bounds 只解析一次，所有工具共用
+4. 流式解析（iter_nodes），边解析边产出节点，定位到目标即可提前停止
 """
+import sys
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 import re
 
 
+# 预编译 bounds 正则，格式如 "[100,200][300,400]"
+BOUNDS_PATTERN = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
+
+
+def parse_bounds(bounds_str: str) -> Optional[Tuple[int, int, int, int]]:
+    """
+    解析 bounds 字符串
+
+    Args:
+        bounds_str: 格式如 "[100,200][300,400]"
+
+    Returns:
+        (x1, y1, x2, y2)，格式不正确返回 None
+    """
+    if not bounds_str:
+        return None
+    match = BOUNDS_PATTERN.match(bounds_str)
+    if not match:
+        return None
+    x1, y1, x2, y2 = match.groups()
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+class UINode:
+    """
+    节点表中的单个节点（__slots__ 紧凑存储）
+
+    index 与 root.iter() 的先序遍历顺序一致，也与 u2 选择器的下标顺序一致。
+    """
+
+    __slots__ = (
+        'index', 'parent', 'depth',
+        'text', 'resource_id', 'content_desc', 'class_id', 'class_name',
+        'bounds_str', 'bounds',
+        'clickable', 'focusable', 'scrollable', 'enabled',
+    )
+
+    def __init__(self, index: int, parent: int, depth: int, text: str, resource_id: str,
+                 content_desc: str, class_id: int, class_name: str, bounds_str: str,
+                 bounds: Optional[Tuple[int, int, int, int]], clickable: bool,
+                 focusable: bool, scrollable: bool, enabled: bool):
+        self.index = index
+        self.parent = parent
+        self.depth = depth
+        self.text = text
+        self.resource_id = resource_id
+        self.content_desc = content_desc
+        self.class_id = class_id
+        self.class_name = class_name
+        self.bounds_str = bounds_str
+        self.bounds = bounds
+        self.clickable = clickable
+        self.focusable = focusable
+        self.scrollable = scrollable
+        self.enabled = enabled
+
+    @property
+    def short_class(self) -> str:
+        """简化类名（android.widget.TextView -> TextView）"""
+        return self.class_name.rsplit('.', 1)[-1] if self.class_name else ''
+
+    @property
+    def center(self) -> Optional[Tuple[int, int]]:
+        if not self.bounds:
+            return None
+        x1, y1, x2, y2 = self.bounds
+        return (x1 + x2) // 2, (y1 + y2) // 2
+
+    @property
+    def width(self) -> int:
+        return self.bounds[2] - self.bounds[0] if self.bounds else 0
+
+    @property
+    def height(self) -> int:
+        return self.bounds[3] - self.bounds[1] if self.bounds else 0
+
+    @property
+    def editable(self) -> bool:
+        """是否输入框（dump 里没有 editable 属性，按控件类型判断）"""
+        return 'EditText' in self.class_name
+
+    def __repr__(self):
+        return (f"UINode({self.index}, class={self.short_class!r}, text={self.text!r}, "
+                f"desc={self.content_desc!r}, id={self.resource_id!r}, bounds={self.bounds})")
+
+
+class NodeTable:
+    """
+    紧凑节点表（先序遍历顺序，包含所有节点）
+
+    - 字符串属性经过 intern，类名额外映射为 class_id
+    - 通过 parent 下标表示树结构，倒序遍历即可得到"子节点先于父节点"的后序处理顺序
+    """
+
+    def __init__(self):
+        self.nodes: List[UINode] = []
+        self.classes: List[str] = []
+        self._class_ids: Dict[str, int] = {}
+        self._children: Optional[List[List[int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __getitem__(self, index: int) -> UINode:
+        return self.nodes[index]
+
+    def append(self, attrib: Dict[str, str], parent: int, depth: int) -> int:
+        """追加一个节点，返回其下标"""
+        intern = sys.intern
+        class_name = attrib.get('class', '')
+        class_id = self._class_ids.get(class_name)
+        if class_id is None:
+            class_name = intern(class_name)
+            class_id = len(self.classes)
+            self.classes.append(class_name)
+            self._class_ids[class_name] = class_id
+        else:
+            class_name = self.classes[class_id]
+
+        bounds_str = attrib.get('bounds', '')
+        index = len(self.nodes)
+        self.nodes.append(UINode(
+            index=index,
+            parent=parent,
+            depth=depth,
+            text=attrib.get('text', ''),
+            resource_id=intern(attrib.get('resource-id', '')),
+            content_desc=attrib.get('content-desc', ''),
+            class_id=class_id,
+            class_name=class_name,
+            bounds_str=bounds_str,
+            bounds=parse_bounds(bounds_str),
+            clickable=attrib.get('clickable', 'false') == 'true',
+            focusable=attrib.get('focusable', 'false') == 'true',
+            scrollable=attrib.get('scrollable', 'false') == 'true',
+            enabled=attrib.get('enabled', 'true') == 'true',
+        ))
+        return index
+
+    def children(self, index: int) -> List[int]:
+        """子节点下标列表（首次调用时一次性构建）"""
+        if self._children is None:
+            children = [[] for _ in self.nodes]
+            for node in self.nodes:
+                if node.parent >= 0:
+                    children[node.parent].append(node.index)
+            self._children = children
+        return self._children[index]
+
+    def to_elements(self) -> List[Dict]:
+        """
+        转换为旧版元素字典列表（只保留有意义的元素：有文本、resource-id或可交互）
+        """
+        elements = []
+        for node in self.nodes:
+            if not (node.text or node.resource_id or node.clickable or node.focusable):
+                continue
+            element = {
+                'text': node.text,
+                'resource_id': node.resource_id,
+                'class': node.class_name,
+                'content_desc': node.content_desc,
+                'bounds': node.bounds_str,
+                'clickable': node.clickable,
+                'focusable': node.focusable,
+                'scrollable': node.scrollable,
+                'enabled': node.enabled,
+                'depth': node.depth,
+            }
+            if node.bounds_str:
+                if node.bounds:
+                    x1, y1, x2, y2 = node.bounds
+                    element['x'] = x1
+                    element['y'] = y1
+                    element['width'] = x2 - x1
+                    element['height'] = y2 - y1
+                else:
+                    element['x'] = element['y'] = element['width'] = element['height'] = 0
+            element['class_name'] = node.short_class
+            elements.append(element)
+        return elements
+
+
 class XMLParser:
     """
     XML解析器
-    
+
     用法:
         parser = XMLParser()
-        elements = parser.parse(xml_string)
+        elements = parser.parse(xml_string)      # 旧版字典列表
+        table = parser.parse_table(xml_string)   # 紧凑节点表
+        for node in parser.iter_nodes(xml_string):  # 流式解析，可提前 break
+            ...
     """
     
+    # 流式解析每次喂给解析器的字符数
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     def parse(self, xml_string: str) -> List[Dict]:
         """
         解析XML字符串
-        
+
         Args:
             xml_string: XML格式的字符串
-            
+
         Returns:
             元素列表，每个元素包含属性信息
         """
+        return self.parse_table(xml_string).to_elements()
+
+    def parse_table(self, xml_string: str) -> NodeTable:
+        """
+        解析XML字符串为紧凑节点表
+
+        Args:
+            xml_string: XML格式的字符串
+
+        Returns:
+            NodeTable（空字符串返回空表）
+        """
         try:
             # 确保xml_string是字符串类型
             if not isinstance(xml_string, str):
                 xml_string = str(xml_string)
-            
-            # 如果xml_string为空或无效，返回空列表
+
+            # 如果xml_string为空或无效，返回空表
             if not xml_string or not xml_string.strip():
-                return []
-            
+                return NodeTable()
+
             root = ET.fromstring(xml_string)
-            elements = []
-            self._parse_node(root, elements, depth=0)
-            return elements
+            return self.build_table(root)
         except ET.ParseError as e:
             raise ValueError(f"XML解析失败: {e}")
         except Exception as e:
             raise ValueError(f"XML解析异常: {e}, xml_string类型: {type(xml_string)}, 前100字符: {str(xml_string)[:100]}")
-    
-    def _parse_node(self, node: ET.Element, elements: List[Dict], depth: int = 0):
+
+    def build_table(self, root: ET.Element) -> NodeTable:
         """
-        递归解析节点
-        
+        从已解析的 ElementTree 构建节点表（显式栈迭代，深层 WebView 不会触发递归上限）
+
         Args:
-            node: XML节点
-            elements: 元素列表（输出）
-            depth: 当前深度
+            root: XML根节点
+
+        Returns:
+            NodeTable，节点顺序与 root.iter() 一致
         """
-        # 提取节点属性
-        element = {
-            'text': node.get('text', ''),
-            'resource_id': node.get('resource-id', ''),
-            'class': node.get('class', ''),
-            'content_desc': node.get('content-desc', ''),
-            'bounds': node.get('bounds', ''),
-            'clickable': node.get('clickable', 'false') == 'true',
-            'focusable': node.get('focusable', 'false') == 'true',
-            'scrollable': node.get('scrollable', 'false') == 'true',
-            'enabled': node.get('enabled', 'true') == 'true',
-            'depth': depth,
-        }
-        
-        # 解析bounds坐标
-        if element['bounds']:
-            bounds = self._parse_bounds(element['bounds'])
-            element['x'] = bounds.get('x', 0)
-            element['y'] = bounds.get('y', 0)
-            element['width'] = bounds.get('width', 0)
-            element['height'] = bounds.get('height', 0)
-        
-        # 提取类名（简化）
-        if element['class']:
-            class_parts = element['class'].split('.')
-            element['class_name'] = class_parts[-1] if class_parts else ''
-        else:
-            element['class_name'] = ''
-        
-        # 只添加有意义的元素（有文本、resource-id或可交互）
-        if (element['text'] or 
-            element['resource_id'] or 
-            element['clickable'] or 
-            element['focusable']):
-            elements.append(element)
-        
-        # 递归处理子节点
-        for child in node:
-            self._parse_node(child, elements, depth + 1)
+        table = NodeTable()
+        stack = [(root, -1, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            index = table.append(node.attrib, parent, depth)
+            # 逆序入栈，保证出栈顺序为先序遍历
+            for child in reversed(node):
+                stack.append((child, index, depth + 1))
+        return table
+
+    def iter_nodes(self, xml_string: str, chunk_size: Optional[int] = None) -> Iterator[UINode]:
+        """
+        流式解析XML，按先序逐个产出节点
+
+        基于 XMLPullParser 分块增量解析：节点在 start 事件时即产出，
+        调用方找到目标后 break 即可停止解析剩余内容；已结束的子树会被清空，
+        峰值内存远低于先完整构建 ElementTree。
+
+        Args:
+            xml_string: XML格式的字符串
+            chunk_size: 每次喂给解析器的字符数
+
+        Yields:
+            UINode（index/parent/depth 与 build_table 的结果一致）
+        """
+        if not isinstance(xml_string, str):
+            xml_string = str(xml_string)
+        if not xml_string or not xml_string.strip():
+            return
+
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        table = NodeTable()
+        stack: List[int] = []
+
+        def drain():
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    parent = stack[-1] if stack else -1
+                    index = table.append(elem.attrib, parent, len(stack))
+                    stack.append(index)
+                    yield table.nodes[index]
+                else:
+                    stack.pop()
+                    # 属性已拷贝到节点表，释放已结束的子树
+                    elem.clear()
+
+        try:
+            for pos in range(0, len(xml_string), chunk_size):
+                parser.feed(xml_string[pos:pos + chunk_size])
+                yield from drain()
+            parser.close()
+            yield from drain()
+        except ET.ParseError as e:
+            raise ValueError(f"XML解析失败: {e}")
     
     def _parse_bounds(self, bounds_str: str) -> Dict:
         """
         解析bounds字符串
-        
+
         Args:
             bounds_str: 格式如 "[100,200][300,400]"
-            
+
         Returns:
             包含x, y, width, height的字典
         """
-        match = re.match(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]', bounds_str)
-        if match:
-            x1, y1, x2, y2 = map(int, match.groups())
+        bounds = parse_bounds(bounds_str)
+        if bounds:
+            x1, y1, x2, y2 = bounds
             return {
                 'x': x1,
                 'y': y1,
@@ -119,4 +340,3 @@ class XMLParser:
                 'height': y2 - y1,
             }
         return {'x': 0, 'y': 0, 'width': 0, 'height': 0}
-